@@ -0,0 +1,2 @@
+# This file is intentionally empty.
+# It marks the directory as a Python package.
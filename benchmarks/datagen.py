@@ -0,0 +1,120 @@
+"""Генерация тестовых баз данных заданного размера для бенчмарков"""
+import os
+import random
+from datetime import datetime, timedelta
+
+from PIL import Image
+from sqlalchemy import insert
+
+from core.database import (init_db, Property, PropertyPhoto, Tenant, Contract, Payment,
+                           Maintenance, PropertyStatus, ContractStatus, PaymentStatus)
+
+PAYMENTS_PER_CONTRACT = 12
+
+
+def make_photo(path):
+    """Создает небольшую фотографию-заглушку, на которую ссылаются карточки объектов"""
+    if not os.path.exists(path):
+        Image.new('RGB', (640, 480), (120, 140, 160)).save(path, 'JPEG', quality=80)
+    return path
+
+
+def generate_database(db_path, scale, seed=42):
+    """Создает базу с scale объектами, арендаторами и 2*scale договорами.
+
+    Даты строятся относительно сегодняшнего дня, чтобы календарь и отчеты
+    за текущий период всегда попадали на данные.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = init_db(f'sqlite:///{db_path}')
+    rng = random.Random(seed)
+    today = datetime.now().date()
+    now = datetime.now()
+    photo_path = make_photo(os.path.join(os.path.dirname(db_path), 'bench_photo.jpg'))
+
+    properties = [{
+        'id': i,
+        'name': f"Помещение {i}",
+        'address': f"г. Москва, ул. Тестовая, д. {i}",
+        'area': rng.uniform(20, 500),
+        'floor': rng.randint(1, 20),
+        'status': PropertyStatus.RENTED if i % 3 else PropertyStatus.AVAILABLE,
+        'description': f"Описание помещения {i}",
+        'created_at': now,
+        'updated_at': now,
+    } for i in range(1, scale + 1)]
+
+    photos = [{
+        'property_id': i,
+        'file_path': photo_path,
+        'description': "",
+        'is_main': 1,
+        'created_at': now,
+    } for i in range(1, scale + 1)]
+
+    tenants = [{
+        'id': i,
+        'name': f"ООО Арендатор {i}",
+        'legal_info': f"ИНН {7700000000 + i}",
+        'contact_info': f"tenant{i}@example.com",
+        'created_at': now,
+        'updated_at': now,
+    } for i in range(1, scale + 1)]
+
+    contracts = []
+    payments = []
+    for i in range(1, 2 * scale + 1):
+        start = today - timedelta(days=rng.randint(30, 700))
+        end = start + timedelta(days=365)
+        rent = round(rng.uniform(10000, 300000), 2)
+        contracts.append({
+            'id': i,
+            'property_id': (i - 1) % scale + 1,
+            'tenant_id': rng.randint(1, scale),
+            'start_date': start,
+            'end_date': end,
+            'rent_amount': rent,
+            'deposit': rent,
+            'area': rng.uniform(20, 200),
+            'status': ContractStatus.ACTIVE if end >= today else ContractStatus.EXPIRED,
+            'created_at': now,
+            'updated_at': now,
+        })
+        for month in range(PAYMENTS_PER_CONTRACT):
+            due = start + timedelta(days=30 * month)
+            if due < today - timedelta(days=30):
+                status = PaymentStatus.PAID if rng.random() < 0.9 else PaymentStatus.OVERDUE
+            else:
+                status = PaymentStatus.PENDING
+            paid_on = due + timedelta(days=rng.randint(-3, 10)) if status == PaymentStatus.PAID else None
+            payments.append({
+                'contract_id': i,
+                'amount': rent,
+                'due_date': due,
+                'payment_date': paid_on,
+                'status': status,
+                'description': f"Платеж {month + 1}",
+                'created_at': now,
+                'updated_at': now,
+            })
+
+    maintenance = [{
+        'property_id': rng.randint(1, scale),
+        'date': today + timedelta(days=rng.randint(-30, 60)),
+        'description': "Плановое обслуживание",
+        'status': 'planned',
+        'cost': rng.uniform(1000, 50000),
+        'created_at': now,
+        'updated_at': now,
+    } for _ in range(max(1, scale // 5))]
+
+    with engine.begin() as conn:
+        conn.execute(insert(Property), properties)
+        conn.execute(insert(PropertyPhoto), photos)
+        conn.execute(insert(Tenant), tenants)
+        conn.execute(insert(Contract), contracts)
+        conn.execute(insert(Payment), payments)
+        conn.execute(insert(Maintenance), maintenance)
+    engine.dispose()
+    return db_path
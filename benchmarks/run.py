@@ -0,0 +1,433 @@
+"""Бенчмарки горячих путей чтения всех экранов.
+
+Каждый путь запускается в отдельном процессе на копии сгенерированной базы,
+чтобы пиковый RSS и состояние сессии не зависели от соседних замеров.
+
+Рост времени, запросов и пикового RSS больше порога и абсолютного допуска
+NOISE считается регрессией; медленные пути перед этим перемеряются. Время и память зависят от машины, на которой
+записан baseline.json; на другой машине --queries-only сравнивает только
+число запросов.
+
+Запуск:
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.run
+    python -m benchmarks.run --sizes 50 200 --update-baseline
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+RESULTS_FILE = os.path.join(ROOT, 'benchmarks', 'results.json')
+
+DEFAULT_SIZES = [25, 100, 400]
+DEFAULT_THRESHOLD = 0.25
+# Прогонов на путь: берется минимальное время, это сглаживает шум планировщика
+DEFAULT_REPEAT = 3
+# Абсолютные допуски, ниже которых разница считается шумом
+NOISE = {
+    'wall_time': 0.02,
+    'queries': 0,
+    'peak_rss_mb': 10.0,
+}
+# Размер портфеля для моделирования Монте-Карло: договоры базы повторяются до этого числа,
+# чтобы память и время замерялись на реальном объеме, а не на маленькой тестовой базе
+SIMULATION_CONTRACTS = 10000
+# Сколько раз перемерять пути, ставшие медленнее baseline, прежде чем считать это регрессией
+RECHECKS = 2
+# Максимальное число SQL-запросов на один вызов пути независимо от размера базы.
+# Превышение означает N+1 (запрос на строку) и считается ошибкой так же, как регрессия.
+QUERY_BUDGETS = {
+    'properties.load_properties': 2,  # список и, в фоне, главные фотографии видимых карточек
+    'properties.card_photos': 2,  # список и главные фотографии первого блока
+    'contracts.load_contracts': 1,
+    'payments.load_payments': 2,
+    'reports.rental_payments': 1,
+    'reports.overdue_payments': 1,
+    'reports.occupancy': 1,
+    'reports.financial': 1,
+    'reports.aging_tenants': 1,
+    'analytics.monthly_income': 1,
+    'analytics.occupancy': 1,
+    'analytics.top_tenants': 1,
+    'analytics.payment_dynamics': 1,
+    'analytics.cash_flow_forecast': 4,
+    'analytics.simulation': 6,  # договоры и оценка параметров модели по истории
+    'search.global': 2,
+    'lookup.contracts': 1,
+    'dialogs.contract_dialog': 2,
+    'calendar.update_calendar_colors': 3,
+    'calendar.export_to_ical': 3,
+}
+
+
+def _period(widget):
+    return widget.start_date.date().toPyDate(), widget.end_date.date().toPyDate()
+
+
+def _properties(session):
+    from ui.property_widget import PropertyWidget
+    with mock.patch.object(PropertyWidget, 'load_properties'):
+        widget = PropertyWidget(session)
+    return widget.load_properties
+
+
+def _card_photos(session):
+    from ui.property_cards import PropertyCardModel, CardRole
+    model = PropertyCardModel(session)
+
+    def call():
+        # Первый показ карточек: главные фотографии блока - одним фоновым запросом
+        model.load()
+        model.prefetch(0, 0)
+        model.wait()
+        return model.index(0).data(CardRole)
+    return call
+
+
+def _contracts(session):
+    from ui.contract_widget import ContractWidget
+    with mock.patch.object(ContractWidget, 'load_contracts'):
+        widget = ContractWidget(session)
+    return widget.load_contracts
+
+
+def _payments(session):
+    from ui.payments_widget import PaymentsWidget
+    with mock.patch.object(PaymentsWidget, 'load_payments'):
+        widget = PaymentsWidget(session)
+    return widget.load_payments
+
+
+def _report(method, with_period):
+    def build(session):
+        from ui.reports_widget import ReportsWidget
+        with mock.patch.object(ReportsWidget, 'update_report'):
+            widget = ReportsWidget(session)
+        args = _period(widget) if with_period else ()
+        return lambda: getattr(widget, method)(*args)
+    return build
+
+
+def _aging(level):
+    def build(session):
+        from core.aging import invalidate_aging_cache
+        from ui.reports_widget import ReportsWidget
+        with mock.patch.object(ReportsWidget, 'update_report'):
+            widget = ReportsWidget(session)
+        as_of = widget.end_date.date().toPyDate()
+
+        def call():
+            # Замеряется расчет, а не попадание в кэш
+            invalidate_aging_cache()
+            widget.show_aging_report(level, as_of)
+        return call
+    return build
+
+
+def _analytics(method, with_period):
+    def build(session):
+        from ui.analytics_widget import AnalyticsWidget
+        with mock.patch.object(AnalyticsWidget, 'update_analytics'):
+            widget = AnalyticsWidget(session)
+        args = _period(widget) if with_period else ()
+        return lambda: getattr(widget, method)(*args)
+    return build
+
+
+def _forecast(horizon):
+    def build(session):
+        from ui.analytics_widget import AnalyticsWidget
+        with mock.patch.object(AnalyticsWidget, 'update_analytics'):
+            widget = AnalyticsWidget(session)
+        return lambda: widget.show_cash_flow_forecast(horizon)
+    return build
+
+
+def _simulation(contracts):
+    def build(session):
+        import numpy as np
+        from core import simulation
+        from core.forecast import ForecastInputs
+        from core.session_manager import read_connection
+        load_inputs = simulation.load_inputs
+
+        def portfolio(conn, today):
+            inputs = load_inputs(conn, today)
+            index = np.resize(np.arange(len(inputs)), contracts) if len(inputs) else []
+            return ForecastInputs(np.arange(len(index)), inputs.start_dates[index], inputs.end_dates[index],
+                                  inputs.rents[index], inputs.indexation[index], inputs.property_ids[index])
+
+        def call():
+            with mock.patch.object(simulation, 'load_inputs', portfolio), read_connection(session) as conn:
+                simulation.simulate_portfolio(conn)
+        return call
+    return build
+
+
+def _search(query):
+    def build(session):
+        from ui.search_widget import GlobalSearchBar
+        widget = GlobalSearchBar(session)
+        widget.search_edit.blockSignals(True)
+        widget.search_edit.setText(query)
+        return widget.run_search
+    return build
+
+
+def _lookup(query):
+    def build(session):
+        from core.list_queries import CONTRACT_LOOKUP
+        from ui.lookup_combo import LookupCombo
+        widget = LookupCombo(session, CONTRACT_LOOKUP)
+        widget.lineEdit().setText(query)
+        return widget.run_search
+    return build
+
+
+def _contract_dialog(session):
+    from ui.contract_widget import ContractDialog
+    return lambda: ContractDialog(session)
+
+
+def _calendar_colors(session):
+    from ui.calendar_widget import CalendarWidget
+    with mock.patch.object(CalendarWidget, 'update_calendar_colors'):
+        widget = CalendarWidget(session)
+    return widget.update_calendar_colors
+
+
+def _calendar_ical(session):
+    from ui.calendar_widget import CalendarWidget, QFileDialog, QMessageBox
+    with mock.patch.object(CalendarWidget, 'update_calendar_colors'):
+        widget = CalendarWidget(session)
+    target = os.path.join(tempfile.mkdtemp(), 'calendar.ics')
+
+    def call():
+        with mock.patch.object(QFileDialog, 'getSaveFileName', return_value=(target, '')), \
+                mock.patch.object(QMessageBox, 'information'):
+            widget.export_to_ical()
+    return call
+
+
+PATHS = {
+    'properties.load_properties': _properties,
+    'properties.card_photos': _card_photos,
+    'contracts.load_contracts': _contracts,
+    'payments.load_payments': _payments,
+    'reports.rental_payments': _report('show_rental_payments_report', True),
+    'reports.overdue_payments': _report('show_overdue_payments_report', False),
+    'reports.occupancy': _report('show_occupancy_report', False),
+    'reports.financial': _report('show_financial_report', True),
+    'reports.aging_tenants': _aging('tenant'),
+    'analytics.monthly_income': _analytics('show_monthly_income', True),
+    'analytics.occupancy': _analytics('show_occupancy_analytics', False),
+    'analytics.top_tenants': _analytics('show_top_tenants', True),
+    'analytics.payment_dynamics': _analytics('show_payment_dynamics', True),
+    'analytics.cash_flow_forecast': _forecast(60),
+    'analytics.simulation': _simulation(SIMULATION_CONTRACTS),
+    'search.global': _search("Арендатор 1"),
+    'lookup.contracts': _lookup("Арендатор"),
+    'dialogs.contract_dialog': _contract_dialog,
+    'calendar.update_calendar_colors': _calendar_colors,
+    'calendar.export_to_ical': _calendar_ical,
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class QueryCounter:
+    """Считает SQL-запросы, прошедшие через движок"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def run_worker(path, db_path, repeat):
+    """Замеряет один путь в текущем процессе и возвращает метрики"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('QT_API', 'pyqt6')
+    from PyQt6.QtCore import QThreadPool
+    from PyQt6.QtWidgets import QApplication
+    from sqlalchemy import event
+    from core.database import init_db, Session
+    from core.query_guard import enable_strict_loading
+
+    app = QApplication.instance() or QApplication([])
+    engine = init_db(f'sqlite:///{db_path}')
+    # Неявная ленивая загрузка связи в замеряемом пути сразу роняет воркер
+    enable_strict_loading(Session)
+    session = Session(bind=engine)
+    call = PATHS[path](session)
+
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        # Каждый прогон начинается с пустой identity map, как после перезапуска экрана
+        session.expunge_all()
+        counter.count = 0
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+        # Фоновые загрузки экрана (фотографии карточек) не входят во время, но их запросы
+        # считаются: иначе число запросов зависело бы от того, успел ли поток начать работу
+        QThreadPool.globalInstance().waitForDone()
+        queries = counter.count
+
+    session.close()
+    engine.dispose()
+    app.processEvents()
+    return {
+        'wall_time': min(timings),
+        'queries': queries,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+    }
+
+
+def run_suite(sizes, paths, repeat):
+    """Генерирует базы нужных размеров и прогоняет по ним все пути"""
+    from benchmarks.datagen import generate_database
+
+    results = {path: {} for path in paths}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            source = generate_database(os.path.join(tmp, f'bench_{size}.db'), size)
+            for path in paths:
+                # Некоторые экраны пишут в базу при загрузке, поэтому каждый замер - на свежей копии
+                db_copy = os.path.join(tmp, 'run.db')
+                shutil.copyfile(source, db_copy)
+                proc = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.run', '--worker', path, db_copy,
+                     '--repeat', str(repeat)],
+                    cwd=tmp, capture_output=True, text=True,
+                    env=dict(os.environ, PYTHONPATH=ROOT, QT_QPA_PLATFORM='offscreen')
+                )
+                if proc.returncode != 0:
+                    raise RuntimeError(f"{path} (size={size}) завершился с ошибкой:\n{proc.stderr}")
+                metrics = json.loads(proc.stdout.strip().splitlines()[-1])
+                results[path][str(size)] = metrics
+                print(f"{path:<34} {size:>6}  {metrics['wall_time'] * 1000:>10.1f} ms  "
+                      f"{metrics['queries']:>7} q  {metrics['peak_rss_mb']:>8.1f} MB", flush=True)
+    return results
+
+
+def find_regressions(results, baseline, threshold, metrics=tuple(NOISE)):
+    regressions = []
+    for path, by_size in results.items():
+        for size, by_metric in by_size.items():
+            base = baseline.get(path, {}).get(size)
+            if not base:
+                continue
+            for metric in metrics:
+                current, previous = by_metric[metric], base[metric]
+                if current > previous * (1 + threshold) and current - previous > NOISE[metric]:
+                    regressions.append((path, size, metric, previous, current))
+    return regressions
+
+
+def recheck(results, regressions, repeat):
+    """Перемеряет пути с ростом времени или памяти; в results остается лучший замер каждой метрики.
+
+    Разовый всплеск нагрузки на машине замедляет один прогон, настоящая регрессия - все.
+    """
+    suspects = {}
+    for path, size, metric, _, _ in regressions:
+        if metric != 'queries':
+            suspects.setdefault(int(size), set()).add(path)
+    for size, paths in sorted(suspects.items()):
+        again = run_suite([size], sorted(paths), repeat)
+        for path in paths:
+            best, fresh = results[path][str(size)], again[path][str(size)]
+            for metric in ('wall_time', 'peak_rss_mb'):
+                best[metric] = min(best[metric], fresh[metric])
+
+
+def find_budget_violations(results):
+    violations = []
+    for path, by_size in results.items():
+        budget = QUERY_BUDGETS.get(path)
+        if budget is None:
+            continue
+        for size, metrics in by_size.items():
+            if metrics['queries'] > budget:
+                violations.append(f"{path} size={size}: {metrics['queries']} запросов при лимите {budget}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки экранов системы управления арендой")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="количество объектов в сгенерированных базах")
+    parser.add_argument('--paths', nargs='+', choices=sorted(PATHS), default=list(PATHS))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="число прогонов, берется минимальное время")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимый относительный рост метрик (0.25 = 25%%)")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--queries-only', action='store_true',
+                        help="сравнивать с baseline только число запросов (baseline записан на другой машине)")
+    parser.add_argument('--worker', nargs=2, metavar=('PATH', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker[0], args.worker[1], args.repeat)))
+        return 0
+
+    results = run_suite(args.sizes, args.paths, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    violations = find_budget_violations(results)
+    if violations:
+        print("Превышен лимит SQL-запросов:")
+        for line in violations:
+            print(f"  {line}")
+        return 1
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Базовые значения записаны в {args.baseline}")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    metrics = ('queries',) if args.queries_only else tuple(NOISE)
+    regressions = find_regressions(results, baseline, args.threshold, metrics)
+    for _ in range(RECHECKS):
+        if all(metric == 'queries' for _, _, metric, _, _ in regressions):
+            break
+        print("Повторный замер путей, ставших медленнее:")
+        recheck(results, regressions, args.repeat)
+        regressions = find_regressions(results, baseline, args.threshold, metrics)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if regressions:
+        print("Обнаружены регрессии производительности:")
+        for path, size, metric, previous, current in regressions:
+            print(f"  {path} size={size}: {metric} {previous} -> {current}")
+        return 1
+    print("Регрессий не обнаружено")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
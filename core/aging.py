@@ -0,0 +1,158 @@
+"""Задолженность по срокам просрочки (aging) по договорам, арендаторам и объектам.
+
+Суммы по корзинам 0-30/31-60/61-90/90+ дней считаются в базе одним
+агрегирующим запросом на уровне договоров, сводки по арендаторам и объектам
+собираются из него векторно (np.add.at). Отчет кэшируется по дате расчета
+и сбрасывается при любой записи в платежи, договоры, арендаторов или объекты.
+"""
+import weakref
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select, func, case, literal
+from sqlalchemy.orm import Session
+
+from core.database import Payment, Contract, Tenant, Property, PaymentStatus
+
+# (нижняя граница дней просрочки, верхняя граница или None, подпись)
+BUCKETS = (
+    (1, 30, "0-30"),
+    (31, 60, "31-60"),
+    (61, 90, "61-90"),
+    (91, None, "90+"),
+)
+LEVELS = {
+    'contract': "Договор",
+    'tenant': "Арендатор",
+    'property': "Объект",
+}
+_WATCHED_TABLES = ('payments', 'contracts', 'tenants', 'properties')
+
+_cache = weakref.WeakKeyDictionary()  # engine -> {as_of: AgingReport}
+
+
+class AgingRow:
+    __slots__ = ('key', 'name', 'buckets', 'total')
+
+    def __init__(self, key, name, buckets):
+        self.key = key
+        self.name = name
+        self.buckets = buckets
+        self.total = sum(buckets)
+
+
+class AgingReport:
+    """Задолженность на дату as_of, хранится по колонкам"""
+
+    def __init__(self, as_of, rows):
+        self.as_of = as_of
+        columns = list(zip(*rows)) if rows else [()] * (5 + len(BUCKETS))
+        self.contract_ids = np.array(columns[0], dtype=np.int64)
+        # Договор без арендатора группируется под ключом -1
+        self.tenant_ids = np.array([-1 if v is None else v for v in columns[1]], dtype=np.int64)
+        self.property_ids = np.array([-1 if v is None else v for v in columns[3]], dtype=np.int64)
+        self.names = {
+            'tenant': dict(zip(self.tenant_ids.tolist(), columns[2])),
+            'property': dict(zip(self.property_ids.tolist(), columns[4])),
+        }
+        self.amounts = np.array(columns[5:], dtype=np.float64).T.reshape(len(self.contract_ids), len(BUCKETS))
+
+    def __len__(self):
+        return len(self.contract_ids)
+
+    def totals(self):
+        return self.amounts.sum(axis=0)
+
+    def rollup(self, level='tenant'):
+        """Строки сводки по уровню, по убыванию общей задолженности"""
+        if level == 'contract':
+            keys, sums = self.contract_ids, self.amounts
+            names = {key: f"Договор №{key}" for key in keys.tolist()}
+        else:
+            ids = self.tenant_ids if level == 'tenant' else self.property_ids
+            keys, inverse = np.unique(ids, return_inverse=True)
+            sums = np.zeros((len(keys), len(BUCKETS)))
+            np.add.at(sums, inverse, self.amounts)
+            names = self.names[level]
+        order = np.argsort(-sums.sum(axis=1), kind='stable')
+        return [AgingRow(int(keys[i]), names.get(int(keys[i])) or "—", tuple(sums[i].tolist()))
+                for i in order]
+
+    def to_frame(self, level='tenant'):
+        labels = [label for _, _, label in BUCKETS]
+        rows = self.rollup(level)
+        frame = pd.DataFrame([[row.name, *row.buckets, row.total] for row in rows],
+                             columns=[LEVELS[level], *labels, "Итого"])
+        return frame.round(2)
+
+    def export(self, path, level=None):
+        """Сохраняет отчет: XLSX - все уровни на отдельных листах, CSV - один уровень"""
+        if path.lower().endswith('.csv'):
+            self.to_frame(level or 'tenant').to_csv(path, index=False, sep=';', encoding='utf-8-sig')
+            return
+        with pd.ExcelWriter(path) as writer:
+            for key, title in LEVELS.items():
+                if level is None or key == level:
+                    self.to_frame(key).to_excel(writer, sheet_name=title, index=False)
+
+
+def _engine_of(bind):
+    if isinstance(bind, Session):
+        return bind.get_bind()
+    return getattr(bind, 'engine', bind)
+
+
+def _invalidate_on_write(conn, cursor, statement, parameters, context, executemany):
+    # Проверяется текст запроса, чтобы ловить и ORM, и Core, и text()
+    if statement.lstrip()[:6].upper() not in ('INSERT', 'UPDATE', 'DELETE'):
+        return
+    # UPDATE без затронутых строк (например, пересчет статусов при открытии экрана) кэш не сбрасывает
+    if cursor.rowcount == 0:
+        return
+    lowered = statement.lower()
+    if any(table in lowered for table in _WATCHED_TABLES):
+        _cache.pop(conn.engine, None)
+
+
+def invalidate_aging_cache(bind=None):
+    if bind is None:
+        _cache.clear()
+    else:
+        _cache.pop(_engine_of(bind), None)
+
+
+def compute_aging(bind, as_of):
+    """Считает отчет одним запросом без кэша"""
+    days = func.julianday(literal(as_of)) - func.julianday(Payment.due_date)
+    bucket_sums = []
+    for low, high, _ in BUCKETS:
+        condition = days >= low if high is None else days.between(low, high)
+        bucket_sums.append(func.sum(case((condition, Payment.amount), else_=0.0)))
+    query = (
+        select(Contract.id, Contract.tenant_id, Tenant.name, Contract.property_id, Property.name,
+               *bucket_sums)
+        .select_from(Payment)
+        .join(Contract, Contract.id == Payment.contract_id)
+        .outerjoin(Tenant, Tenant.id == Contract.tenant_id)
+        .outerjoin(Property, Property.id == Contract.property_id)
+        .where(
+            Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.OVERDUE]),
+            Payment.due_date < as_of,
+            Payment.payment_date.is_(None),
+        )
+        .group_by(Contract.id)
+    )
+    return AgingReport(as_of, bind.execute(query).all())
+
+
+def get_aging(bind, as_of=None):
+    """Отчет на дату as_of (по умолчанию сегодня) из кэша или из базы"""
+    as_of = as_of or datetime.now().date()
+    engine = _engine_of(bind)
+    if not event.contains(engine, 'after_cursor_execute', _invalidate_on_write):
+        event.listen(engine, 'after_cursor_execute', _invalidate_on_write)
+    reports = _cache.setdefault(engine, {})
+    if as_of not in reports:
+        reports[as_of] = compute_aging(bind, as_of)
+    return reports[as_of]
@@ -0,0 +1,200 @@
+"""Архив: оплаченные платежи и завершенные договоры прошлых лет.
+
+Архив - отдельный файл <база>_archive.db (для rental.db - rental_archive.db)
+с той же схемой таблиц. Он подключается к каждому соединению через ATTACH
+как схема archive, поэтому перенос строк - это INSERT ... SELECT и DELETE в
+одной транзакции. Для редких отчетов за всю историю на каждом соединении
+создаются временные представления all_payments и all_contracts (UNION ALL
+рабочей и архивной таблицы).
+
+В архив переносятся:
+- платежи PAID, срок и дата оплаты которых раньше даты отсечки;
+- договоры EXPIRED/TERMINATED, закончившиеся раньше даты отсечки, у которых
+  не осталось рабочих платежей и нет документов, вместе с графиком платежей.
+Оплаченный платеж начисляет и гасит одну сумму, поэтому задолженность по
+договорам не меняется; начислено/оплачено в contract_balances после переноса
+считаются по рабочим платежам, как и в rebuild_balances().
+Перенос идет порциями по CHUNK_SIZE строк, каждая в своей короткой
+транзакции, так что приложение может писать в базу между порциями.
+"""
+import os
+import weakref
+from datetime import date
+
+from sqlalchemy import Table, MetaData, Column, create_engine, event, select, insert, delete, exists, func
+
+from core.database import Base, Payment, Contract, PaymentSchedule, ContractBalance, Document, \
+    PaymentStatus, ContractStatus
+from core.ledger import rebuild_balances
+from core.schema import ensure_schema
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVE_SUFFIX = '_archive'
+# Отсечка по умолчанию: начало года ARCHIVE_YEARS лет назад
+ARCHIVE_YEARS = 2
+CHUNK_SIZE = 500
+CLOSED_STATUSES = (ContractStatus.EXPIRED, ContractStatus.TERMINATED)
+# Представление со всей историей для каждой архивируемой таблицы
+HISTORY_VIEWS = {Payment.__table__: 'all_payments', Contract.__table__: 'all_contracts'}
+
+_attached = weakref.WeakSet()
+
+
+def _copy(table, name=None, schema=None):
+    """Описание таблицы с теми же колонками под другим именем или в другой схеме"""
+    return Table(name or table.name, MetaData(),
+                 *[Column(column.name, column.type, primary_key=column.primary_key) for column in table.columns],
+                 schema=schema)
+
+
+_archive_tables = {table: _copy(table, schema=ARCHIVE_SCHEMA) for table in Base.metadata.sorted_tables}
+_history_tables = {table: _copy(table, name=name) for table, name in HISTORY_VIEWS.items()}
+
+
+class ArchiveResult:
+    """Итог переноса в архив"""
+    __slots__ = ('cutoff', 'payments', 'contracts')
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.payments = 0
+        self.contracts = 0
+
+
+def default_cutoff(today=None):
+    today = today or date.today()
+    return date(today.year - ARCHIVE_YEARS, 1, 1)
+
+
+def archive_file(db_path):
+    """Файл архива для файла базы: rental.db -> rental_archive.db"""
+    stem, extension = os.path.splitext(db_path)
+    return f"{stem}{ARCHIVE_SUFFIX}{extension or '.db'}"
+
+
+def archive_path(engine):
+    """Путь к файлу архива рядом с файлом базы; None для базы в памяти"""
+    database = engine.url.database
+    if engine.dialect.name != 'sqlite' or not database or database == ':memory:':
+        return None
+    return archive_file(database)
+
+
+def _view_sql(table, name):
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    return (f'CREATE TEMP VIEW IF NOT EXISTS {name} AS '
+            f'SELECT {columns} FROM main."{table.name}" '
+            f'UNION ALL SELECT {columns} FROM {ARCHIVE_SCHEMA}."{table.name}"')
+
+
+def attach_archive(engine, create=False):
+    """Подключает архив ко всем соединениям движка; возвращает True, если архив подключен.
+
+    Без create=True подключается только уже существующий файл архива.
+    """
+    if engine in _attached:
+        return True
+    path = archive_path(engine)
+    if path is None or (not create and not os.path.exists(path)):
+        return False
+    # Таблицы архива создаются и обновляются теми же миграциями отдельным соединением
+    archive_engine = create_engine(f"sqlite:///{path}")
+    ensure_schema(archive_engine, archive=True)
+    archive_engine.dispose()
+
+    @event.listens_for(engine, 'connect')
+    def _attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+        for table, name in HISTORY_VIEWS.items():
+            dbapi_connection.execute(_view_sql(table, name))
+
+    # Соединения, открытые до подключения архива, закрываются и открываются заново
+    engine.dispose()
+    _attached.add(engine)
+    return True
+
+
+def is_attached(engine):
+    return engine in _attached
+
+
+def history(engine, model):
+    """Таблица модели вместе с архивом (представление all_*), если архив подключен"""
+    table = model.__table__
+    return _history_tables[table] if engine in _attached else table
+
+
+def _move(conn, table, condition):
+    """Переносит строки table, подходящие под condition, в такую же таблицу архива"""
+    columns = [column.name for column in table.columns]
+    conn.execute(insert(_archive_tables[table]).from_select(columns, select(table).where(condition)))
+    return conn.execute(delete(table).where(condition)).rowcount
+
+
+def _archive_payments(engine, cutoff, chunk_size):
+    """Переносит одну порцию платежей; возвращает число перенесенных"""
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(Payment.id, Payment.contract_id)
+            .where(Payment.status == PaymentStatus.PAID, Payment.due_date < cutoff,
+                   (Payment.payment_date.is_(None)) | (Payment.payment_date < cutoff))
+            .order_by(Payment.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return 0
+        moved = _move(conn, Payment.__table__, Payment.id.in_([row.id for row in rows]))
+        # Delete через Core не вызывает события сальдо, поэтому итоги пересчитываются здесь
+        rebuild_balances(conn, {row.contract_id for row in rows if row.contract_id is not None})
+    return moved
+
+
+def _archive_contracts(engine, cutoff, chunk_size):
+    """Переносит одну порцию договоров; возвращает число перенесенных"""
+    with engine.begin() as conn:
+        ids = conn.execute(
+            select(Contract.id)
+            .where(Contract.status.in_(CLOSED_STATUSES), Contract.end_date < cutoff,
+                   ~exists().where(Payment.contract_id == Contract.id),
+                   ~exists().where(Document.contract_id == Contract.id))
+            .order_by(Contract.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return 0
+        _move(conn, PaymentSchedule.__table__, PaymentSchedule.contract_id.in_(ids))
+        conn.execute(delete(ContractBalance).where(ContractBalance.contract_id.in_(ids)))
+        return _move(conn, Contract.__table__, Contract.id.in_(ids))
+
+
+def archive_old_records(engine, cutoff=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Переносит старые оплаченные платежи и завершенные договоры в архив; возвращает ArchiveResult.
+
+    progress(платежей, договоров) вызывается после каждой порции; False прерывает перенос
+    (уже перенесенные порции остаются в архиве).
+    """
+    result = ArchiveResult(cutoff or default_cutoff())
+    if not attach_archive(engine, create=True):
+        raise ValueError("Архив поддерживается только для файловой базы SQLite")
+    for step in (_archive_payments, _archive_contracts):
+        while True:
+            moved = step(engine, result.cutoff, chunk_size)
+            if not moved:
+                break
+            if step is _archive_payments:
+                result.payments += moved
+            else:
+                result.contracts += moved
+            if progress is not None and progress(result.payments, result.contracts) is False:
+                return result
+    return result
+
+
+def archive_counts(engine):
+    """Число строк в рабочих таблицах и в архиве: {таблица: (рабочих, в архиве)}"""
+    counts = {}
+    with engine.connect() as conn:
+        for table in HISTORY_VIEWS:
+            hot = conn.execute(select(func.count()).select_from(table)).scalar()
+            archived = conn.execute(select(func.count()).select_from(_archive_tables[table])).scalar() \
+                if engine in _attached else 0
+            counts[table.name] = (hot, archived)
+    return counts
@@ -0,0 +1,348 @@
+"""Резервные копии базы данных и файлов.
+
+Каждая копия - каталог backups/<ГГГГММДД_ЧЧММСС>/:
+- database.sqlite.gz - снимок базы, сжатый gzip;
+- archive.sqlite.gz - снимок архива старых платежей и договоров, если он есть;
+- files/ - фотографии и документы с сохранением путей;
+- manifest.json - контрольные суммы SHA-256, размеры и число строк в таблицах.
+
+База копируется через онлайн-API резервного копирования SQLite на отдельном
+соединении только для чтения, по PAGE_STEP страниц за шаг. Между шагами
+блокировка снимается, поэтому приложение может писать в базу во время
+копирования. Файлы копируются инкрементально: если файл не изменился с
+прошлой копии, в новой копии создается жесткая ссылка на него, и место он
+занимает один раз на все копии. Копия собирается в каталоге .partial и
+переименовывается только после записи manifest.json.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from core.database import Base
+from core.archive import archive_file
+from core.photo_store import STORE_DIR
+
+BACKUP_DIR = 'backups'
+DATABASE_ARCHIVE = 'database.sqlite.gz'
+# Сжатые снимки: ключ в manifest.json -> имя файла
+SNAPSHOTS = {'database': DATABASE_ARCHIVE, 'archive': 'archive.sqlite.gz'}
+FILES_DIR = 'files'
+MANIFEST = 'manifest.json'
+PARTIAL_SUFFIX = '.partial'
+STAMP_FORMAT = '%Y%m%d_%H%M%S'
+PAGE_STEP = 256
+MAX_RESTARTS = 3
+CHUNK_SIZE = 1024 * 1024
+# Хранение: последние копии, затем по одной на неделю и на месяц
+KEEP_LAST = 7
+KEEP_WEEKLY = 4
+KEEP_MONTHLY = 6
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupResult:
+    """Итог создания копии"""
+    __slots__ = ('path', 'database_size', 'archive_size', 'files', 'linked', 'copied_bytes')
+
+    def __init__(self, path, database_size, archive_size, files, linked, copied_bytes):
+        self.path = path
+        self.database_size = database_size
+        self.archive_size = archive_size
+        self.files = files  # файлов в копии
+        self.linked = linked  # из них не изменились и взяты из прошлой копии
+        self.copied_bytes = copied_bytes
+
+
+def database_path(engine):
+    """Путь к файлу базы SQLite по движку SQLAlchemy"""
+    if engine.dialect.name != 'sqlite' or not engine.url.database or engine.url.database == ':memory:':
+        raise BackupError("Резервное копирование поддерживается только для файловой базы SQLite")
+    return engine.url.database
+
+
+def _snapshot_dirs(root):
+    """Каталоги с файлами, которые входят в копию (миниатюры восстанавливаются сами)"""
+    dirs = [STORE_DIR]
+    photos = os.path.join(root, 'photos')
+    if os.path.isdir(photos):
+        dirs += [os.path.join('photos', name) for name in sorted(os.listdir(photos)) if name.startswith('property_')]
+    dirs += [name for name in sorted(os.listdir(root))
+             if name.startswith('documents_') and os.path.isdir(os.path.join(root, name))]
+    return dirs
+
+
+def _walk_files(root):
+    for top in _snapshot_dirs(root):
+        for directory, _, files in os.walk(os.path.join(root, top)):
+            for name in sorted(files):
+                if not name.startswith('.incoming-'):
+                    full = os.path.join(directory, name)
+                    yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_hashed(source, target):
+    """Копирует файл, считая SHA-256 по ходу копирования"""
+    digest = hashlib.sha256()
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+    shutil.copystat(source, target)
+    return digest.hexdigest()
+
+
+def _table_counts(connection):
+    existing = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {name: connection.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+            for name in sorted(Base.metadata.tables) if name in existing}
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """Завершенные копии, от старых к новым: [(время, путь)]"""
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        try:
+            created = datetime.strptime(name, STAMP_FORMAT)
+        except ValueError:
+            continue
+        if os.path.exists(os.path.join(backup_dir, name, MANIFEST)):
+            backups.append((created, os.path.join(backup_dir, name)))
+    return sorted(backups)
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _backup_database(db_path, target, progress):
+    """Снимок базы онлайн-API SQLite; возвращает число строк в таблицах.
+
+    Запись в базу с другого соединения начинает копирование заново. Если это
+    случилось больше MAX_RESTARTS раз, остаток копируется за один шаг: писатели
+    ждут его окончания, зато копирование гарантированно завершается.
+    """
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    snapshot = sqlite3.connect(target)
+    try:
+        state = {'copied': 0, 'restarts': 0}
+
+        def step(status, remaining, total):
+            copied = total - remaining
+            if copied < state['copied']:
+                state['restarts'] += 1
+                if state['restarts'] > MAX_RESTARTS:
+                    raise _Restarted
+            state['copied'] = copied
+            if progress is not None:
+                progress('database', copied, total)
+
+        try:
+            source.backup(snapshot, pages=PAGE_STEP, progress=step)
+        except _Restarted:
+            source.backup(snapshot, pages=-1)
+        return _table_counts(snapshot)
+    finally:
+        snapshot.close()
+        source.close()
+
+
+def create_backup(db_path, root='.', backup_dir=BACKUP_DIR, progress=None, now=None):
+    """Создает копию базы db_path и файлов из каталога root; возвращает BackupResult.
+
+    progress(этап, готово, всего) вызывается для этапов 'database' и 'files'.
+    """
+    now = now or datetime.now()
+    final_path = os.path.join(backup_dir, now.strftime(STAMP_FORMAT))
+    if os.path.exists(final_path):
+        raise BackupError(f"Копия {final_path} уже существует")
+    partial = final_path + PARTIAL_SUFFIX
+    os.makedirs(partial)
+    previous = list_backups(backup_dir)
+    previous_path = previous[-1][1] if previous else None
+    previous_files = read_manifest(previous_path)['files'] if previous_path else {}
+    try:
+        databases = {'database': _snapshot_database(db_path, partial, SNAPSHOTS['database'], progress)}
+        if os.path.exists(archive_file(db_path)):
+            databases['archive'] = _snapshot_database(archive_file(db_path), partial, SNAPSHOTS['archive'], progress)
+
+        sources = list(_walk_files(root))
+        files, linked, copied_bytes = {}, 0, 0
+        for done, (relative, full) in enumerate(sources, 1):
+            stat = os.stat(full)
+            target = os.path.join(partial, FILES_DIR, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            known = previous_files.get(relative)
+            digest = None
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                try:
+                    os.link(os.path.join(previous_path, FILES_DIR, relative), target)
+                    digest = known[2]
+                    linked += 1
+                except OSError:
+                    pass  # файловая система без жестких ссылок или файл прошлой копии удален
+            if digest is None:
+                digest = _copy_hashed(full, target)
+                copied_bytes += stat.st_size
+            files[relative] = [stat.st_size, stat.st_mtime_ns, digest]
+            if progress is not None:
+                progress('files', done, len(sources))
+
+        manifest = {'created': now.isoformat(timespec='seconds'), **databases, 'files': files}
+        with open(os.path.join(partial, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(partial, final_path)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return BackupResult(final_path, databases['database']['size'],
+                        os.path.getsize(os.path.join(final_path, DATABASE_ARCHIVE)), len(files), linked, copied_bytes)
+
+
+def _snapshot_database(db_path, partial, name, progress):
+    """Снимок базы в каталоге копии, сжатый gzip; возвращает запись для manifest.json"""
+    raw_path = os.path.join(partial, 'snapshot.sqlite')
+    tables = _backup_database(db_path, raw_path, progress)
+    size = os.path.getsize(raw_path)
+    target = os.path.join(partial, name)
+    with open(raw_path, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.remove(raw_path)
+    return {'file': name, 'size': size, 'sha256': _sha256(target), 'tables': tables}
+
+
+def _restore_database(path, database, target):
+    with gzip.open(os.path.join(path, database['file']), 'rb') as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _verify_database(path, database):
+    archive = os.path.join(path, database['file'])
+    if not os.path.exists(archive):
+        return [f"нет файла {database['file']}"]
+    if _sha256(archive) != database['sha256']:
+        return [f"контрольная сумма {database['file']} не совпадает"]
+    problems = []
+    handle, restored = tempfile.mkstemp(suffix='.sqlite')
+    os.close(handle)
+    try:
+        _restore_database(path, database, restored)
+        connection = sqlite3.connect(restored)
+        try:
+            result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != 'ok':
+                problems.append(f"{database['file']}: integrity_check: {result}")
+            counts = _table_counts(connection)
+        finally:
+            connection.close()
+        for table, expected in database['tables'].items():
+            if counts.get(table) != expected:
+                problems.append(f"{database['file']}: таблица {table}: {counts.get(table)} строк вместо {expected}")
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        problems.append(f"{database['file']} не восстанавливается: {e}")
+    finally:
+        os.remove(restored)
+    return problems
+
+
+def verify_backup(path, deep=True):
+    """Проверка восстановлением: возвращает список проблем (пустой - копия исправна).
+
+    База и архив распаковываются во временный файл, проверяется PRAGMA
+    integrity_check и сравнивается число строк в таблицах с manifest.json. deep=True сверяет
+    и контрольные суммы файлов, иначе только их наличие и размер.
+    """
+    problems = []
+    manifest = read_manifest(path)
+    for key in SNAPSHOTS:
+        if key in manifest:
+            problems += _verify_database(path, manifest[key])
+
+    for relative, (size, _, digest) in manifest['files'].items():
+        stored = os.path.join(path, FILES_DIR, relative)
+        if not os.path.exists(stored):
+            problems.append(f"нет файла {relative}")
+        elif os.path.getsize(stored) != size:
+            problems.append(f"размер {relative} не совпадает")
+        elif deep and _sha256(stored) != digest:
+            problems.append(f"контрольная сумма {relative} не совпадает")
+    return problems
+
+
+def restore_backup(path, db_path, root='.', overwrite=False):
+    """Восстанавливает базу и недостающие или измененные файлы; возвращает число восстановленных файлов.
+
+    Вызывается при закрытом приложении: файл базы заменяется целиком.
+    """
+    if os.path.exists(db_path) and not overwrite:
+        raise BackupError(f"Файл базы {db_path} уже существует")
+    problems = verify_backup(path, deep=True)
+    if problems:
+        raise BackupError("Копия повреждена: " + "; ".join(problems[:5]))
+    manifest = read_manifest(path)
+    targets = {'database': db_path, 'archive': archive_file(db_path)}
+    for key in SNAPSHOTS:
+        if key in manifest:
+            temp_path = targets[key] + '.restore'
+            _restore_database(path, manifest[key], temp_path)
+            os.replace(temp_path, targets[key])
+    restored = 0
+    for relative, (size, _, digest) in manifest['files'].items():
+        target = os.path.join(root, relative)
+        if os.path.exists(target) and os.path.getsize(target) == size and _sha256(target) == digest:
+            continue
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        shutil.copy2(os.path.join(path, FILES_DIR, relative), target)
+        restored += 1
+    return restored
+
+
+def apply_retention(backup_dir=BACKUP_DIR, keep_last=KEEP_LAST, keep_weekly=KEEP_WEEKLY,
+                    keep_monthly=KEEP_MONTHLY, now=None):
+    """Удаляет копии вне политики хранения; возвращает пути удаленных.
+
+    Остаются keep_last последних копий и самая новая копия каждой из последних
+    keep_weekly недель и keep_monthly месяцев. Недописанные копии старше суток удаляются.
+    """
+    now = now or datetime.now()
+    backups = list_backups(backup_dir)
+    keep = {path for _, path in backups[-keep_last:]} if keep_last else set()
+    weeks, months = {}, {}
+    for created, path in reversed(backups):
+        weeks.setdefault(created.isocalendar()[:2], path)
+        months.setdefault((created.year, created.month), path)
+    keep.update(list(weeks.values())[:keep_weekly])
+    keep.update(list(months.values())[:keep_monthly])
+
+    removed = [path for _, path in backups if path not in keep]
+    for path in removed:
+        shutil.rmtree(path)
+    for name in os.listdir(backup_dir) if os.path.isdir(backup_dir) else ():
+        partial = os.path.join(backup_dir, name)
+        if name.endswith(PARTIAL_SUFFIX) and \
+                datetime.fromtimestamp(os.path.getmtime(partial)) < now - timedelta(days=1):
+            shutil.rmtree(partial, ignore_errors=True)
+            removed.append(partial)
+    return removed
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey, Enum, Text, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey, Enum, Text, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
@@ -53,6 +53,30 @@ class PropertyPhoto(Base):
     # Отношения
     property = relationship("Property", back_populates="photos")
 
+    __table_args__ = (
+        # Сверка ссылок на файлы хранилища фотографий
+        Index('ix_property_photos_file_path', 'file_path'),
+        # Главная фотография объекта - первая запись индекса, число фотографий - по нему же
+        Index('ix_property_photos_property_main', property_id, is_main.desc(), id),
+    )
+
+class PhotoBlob(Base):
+    __tablename__ = 'photo_blobs'
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 содержимого файла
+    file_path = Column(String(500), unique=True)  # путь в хранилище, на него ссылаются property_photos.file_path
+    size = Column(Integer)
+    refcount = Column(Integer, default=0)  # сколько записей property_photos ссылаются на файл
+    created_at = Column(DateTime, default=datetime.now)
+
+class PhotoHash(Base):
+    __tablename__ = 'photo_hashes'
+
+    file_path = Column(String(500), primary_key=True)  # как в property_photos.file_path
+    phash = Column(Integer)  # перцептивные хэши (core/photo_duplicates.py), 64 бита со знаком
+    dhash = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
+
 class InventoryItem(Base):
     __tablename__ = 'inventory_items'
 
@@ -102,6 +126,27 @@ class Contract(Base):
     tenant = relationship("Tenant", back_populates="contracts")
     payments = relationship("Payment", back_populates="contract")
     documents = relationship("Document", back_populates="contract")
+    # Условия графика принадлежат договору и удаляются вместе с ним
+    schedule = relationship("PaymentSchedule", back_populates="contract", uselist=False,
+                            cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Фильтр списка договоров по статусу
+        Index('ix_contracts_status', 'status'),
+    )
+
+class PaymentSchedule(Base):
+    __tablename__ = 'payment_schedules'
+
+    contract_id = Column(Integer, ForeignKey('contracts.id'), primary_key=True)
+    billing = Column(String(20), default='anniversary')  # anniversary - в день начала договора, calendar - с 1-го числа месяца
+    prorate = Column(Integer, default=1)  # 1 - неполные месяцы оплачиваются пропорционально дням
+    indexation = Column(Float, default=0.0)  # ежегодная индексация (0.05 = 5% в год)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Отношения
+    contract = relationship("Contract", back_populates="schedule")
 
 class Payment(Base):
     __tablename__ = 'payments'
@@ -113,12 +158,31 @@ class Payment(Base):
     payment_date = Column(Date)
     status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
     description = Column(String(200))
+    scheduled = Column(Integer, default=0)  # 1 - платеж создан графиком платежей (core.schedule)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     # Отношения
     contract = relationship("Contract", back_populates="payments")
 
+    __table_args__ = (
+        # Поиск просроченных: status = 'PENDING' AND due_date < :today
+        Index('ix_payments_status_due_date', 'status', 'due_date'),
+        # Платежи договора: фильтр списка по найденным договорам, расчет сальдо
+        Index('ix_payments_contract_id', 'contract_id'),
+    )
+
+class ContractBalance(Base):
+    __tablename__ = 'contract_balances'
+
+    contract_id = Column(Integer, ForeignKey('contracts.id'), primary_key=True)
+    charged = Column(Float, default=0.0)  # начисления со сроком оплаты не позже accrued_on
+    scheduled = Column(Float, default=0.0)  # будущие начисления: срок оплаты позже accrued_on
+    paid = Column(Float, default=0.0)  # сумма оплаченных платежей
+    balance = Column(Float, default=0.0)  # задолженность: charged - paid
+    accrued_on = Column(Date)  # дата, на которую начисления разнесены по charged и scheduled
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class Maintenance(Base):
     __tablename__ = 'maintenance'
 
@@ -148,9 +212,35 @@ class Document(Base):
     # Отношения
     contract = relationship("Contract", back_populates="documents")
 
-def init_db():
-    engine = create_engine('sqlite:///rental.db')
-    Base.metadata.create_all(engine)
+    __table_args__ = (
+        # Сверка сформированных файлов с записями (core/file_gc.py)
+        Index('ix_documents_file_path', 'file_path'),
+    )
+
+class DatabaseMaintenanceLog(Base):
+    __tablename__ = 'db_maintenance_log'
+
+    id = Column(Integer, primary_key=True)
+    operation = Column(String(30))  # optimize, incremental_vacuum, vacuum, quick_check, integrity_check
+    started_at = Column(DateTime, default=datetime.now)
+    duration = Column(Float)  # секунды
+    result = Column(String(500))
+    # Состояние файла базы после операции (core/maintenance.py)
+    file_size = Column(Integer)
+    page_count = Column(Integer)
+    freelist_count = Column(Integer)
+
+def init_db(url='sqlite:///rental.db', progress=None):
+    engine = create_engine(url)
+    # Схема создается и обновляется миграциями; если версия базы актуальна, это одно чтение PRAGMA
+    from core.schema import ensure_schema
+    ensure_schema(engine, progress)
+    # Архив старых платежей и договоров подключается, если он уже создан
+    from core.archive import attach_archive
+    attach_archive(engine)
+    # Доступность индекса поиска проверяется сразу, а не при первой загрузке списка
+    from core.search import search_available
+    search_available(engine)
     return engine
 
 Session = sessionmaker() 
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""Сборка мусора в файловых хранилищах.
+
+Файлы на диске сверяются с базой: список файлов загружается во временную
+таблицу, а файлы без записи выбираются запросами NOT EXISTS по индексам
+photo_blobs (hash, file_path) и property_photos.file_path. Пути в базе
+записаны через os.path.join, поэтому каждый файл ищется и с '/', и с
+разделителем системы. Сформированные документы сверяются в Python: их пути
+бывают и относительными, и абсолютными, а в Windows регистр букв не важен.
+Проверяются:
+- хранилище фотографий photos/store и миниатюры photos/thumbs;
+- недописанные временные файлы .incoming-*;
+- файлы хранилища, на которые больше никто не ссылается;
+- старые каталоги photos/property_<id> и temp_photos;
+- папки пакетной генерации documents_* старше DOCUMENTS_RETENTION.
+Найденные файлы переносятся в карантин .quarantine/<время запуска>/ с
+сохранением пути (или удаляются сразу). Карантин старше QUARANTINE_RETENTION
+очищается при следующем запуске. Файлы моложе GRACE_PERIOD не трогаются:
+они могут принадлежать идущему импорту или открытому диалогу.
+"""
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from sqlalchemy import Table, MetaData, Column, Integer, String, select, insert, delete, exists, literal
+
+from core.database import PhotoBlob, PhotoHash, PropertyPhoto, Document
+from core.photo_store import STORE_DIR, THUMBS_DIR, thumbnail_path
+
+QUARANTINE_DIR = '.quarantine'
+LEGACY_PHOTOS_DIR = 'photos'
+LEGACY_TEMP_DIR = 'temp_photos'
+DOCUMENTS_PREFIX = 'documents_'
+GRACE_PERIOD = timedelta(hours=24)
+DOCUMENTS_RETENTION = timedelta(days=90)
+QUARANTINE_RETENTION = timedelta(days=30)
+STAMP_FORMAT = '%Y%m%d_%H%M%S'
+INSERT_BATCH = 5000
+
+CATEGORIES = {
+    'blob': "фотографии без ссылок",
+    'store': "файлы хранилища без записи",
+    'incoming': "недописанные файлы",
+    'thumbs': "миниатюры без фотографии",
+    'legacy': "старые фотографии без ссылок",
+    'documents': "сформированные документы",
+    'quarantine': "карантин с истекшим сроком",
+}
+
+_files = Table(
+    'gc_files', MetaData(),
+    Column('path', String, primary_key=True),
+    Column('category', String),
+    Column('key', String),  # значение, по которому ищется ссылка в базе
+    Column('native', String),  # key с разделителем каталогов системы
+    Column('size', Integer),
+    prefixes=['TEMPORARY'],
+)
+
+
+class Orphan:
+    __slots__ = ('category', 'path', 'size')
+
+    def __init__(self, category, path, size):
+        self.category = category
+        self.path = path
+        self.size = size
+
+
+class GcReport:
+    """Итог запуска: найденные файлы и освобожденное место"""
+
+    def __init__(self, quarantine=None):
+        self.orphans = []
+        self.quarantine = quarantine  # куда перенесены файлы; None - удалены
+        self.reclaimed = 0  # байт освобождено (удалено сразу или из карантина)
+        self.moved = 0  # байт перенесено в карантин
+        self.blobs = 0  # удалено записей photo_blobs
+        self.blob_paths = []  # записи photo_blobs, файлы которых убираются
+
+    def add(self, category, path, size):
+        self.orphans.append(Orphan(category, path, size))
+
+    def by_category(self):
+        totals = {}
+        for orphan in self.orphans:
+            count, size = totals.get(orphan.category, (0, 0))
+            totals[orphan.category] = (count + 1, size + orphan.size)
+        return totals
+
+    def lines(self):
+        lines = [f"{CATEGORIES[category]}: {count} ({size / 1024 / 1024:.1f} МБ)"
+                 for category, (count, size) in sorted(self.by_category().items())]
+        if self.moved:
+            lines.append(f"перенесено в карантин {self.quarantine}: {self.moved / 1024 / 1024:.1f} МБ")
+        lines.append(f"освобождено: {self.reclaimed / 1024 / 1024:.1f} МБ")
+        return lines
+
+
+def _scan(root, top, cutoff):
+    """Файлы каталога старше cutoff: (относительный путь через '/', размер)"""
+    cutoff = cutoff.timestamp()
+    pending = [top.replace(os.sep, '/')]
+    while pending:
+        relative = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(f"{relative}/{entry.name}")
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    if stat.st_mtime < cutoff:
+                        yield f"{relative}/{entry.name}", stat.st_size
+
+
+def _legacy_dirs(root):
+    dirs = [LEGACY_TEMP_DIR]
+    photos = os.path.join(root, LEGACY_PHOTOS_DIR)
+    if os.path.isdir(photos):
+        dirs += [os.path.join(LEGACY_PHOTOS_DIR, name) for name in sorted(os.listdir(photos))
+                 if name.startswith('property_')]
+    return dirs
+
+
+def _document_dirs(root, now):
+    dirs = []
+    for name in sorted(os.listdir(root)):
+        if name.startswith(DOCUMENTS_PREFIX) and os.path.isdir(os.path.join(root, name)):
+            try:
+                created = datetime.strptime(name[len(DOCUMENTS_PREFIX):], STAMP_FORMAT)
+            except ValueError:
+                continue  # папка создана не генератором документов
+            if created < now - DOCUMENTS_RETENTION:
+                dirs.append(name)
+    return dirs
+
+
+def _load_files(conn, root, now):
+    """Заполняет временную таблицу файлами-кандидатами; возвращает документы-кандидаты"""
+    cutoff = now - GRACE_PERIOD
+    rows = []
+    documents = []
+
+    def add(category, path, size, key=None):
+        key = key or path
+        rows.append({'path': path, 'category': category, 'key': key, 'native': key.replace('/', os.sep),
+                     'size': size})
+        if len(rows) >= INSERT_BATCH:
+            conn.execute(insert(_files), rows)
+            rows.clear()
+
+    for top in (STORE_DIR, THUMBS_DIR):
+        for path, size in _scan(root, top, cutoff):
+            name = path.rsplit('/', 1)[-1]
+            if name.startswith('.incoming-'):
+                add('incoming', path, size)
+            elif top == THUMBS_DIR:
+                add('thumbs', path, size, key=os.path.splitext(name)[0])
+            else:
+                add('store', path, size)
+    for top in _legacy_dirs(root):
+        for path, size in _scan(root, top, cutoff):
+            add('legacy', path, size)
+    for top in _document_dirs(root, now):
+        # Документы проверяются по возрасту папки, а не файлов
+        documents.extend(_scan(root, top, now))
+    if rows:
+        conn.execute(insert(_files), rows)
+    return documents
+
+
+def _referenced():
+    """Условие "на файл есть ссылка в базе" для каждой категории"""
+    paths = [_files.c.key, _files.c.native]
+    return {
+        'incoming': literal(False),
+        'store': exists().where(PhotoBlob.file_path.in_(paths)),
+        'thumbs': exists().where(PhotoBlob.hash == _files.c.key),
+        'legacy': exists().where(PropertyPhoto.file_path.in_(paths)),
+    }
+
+
+def _document_key(root, path):
+    """Путь документа для сравнения: абсолютный, с разделителем и регистром системы"""
+    path = path.replace('\\', os.sep).replace('/', os.sep)
+    return os.path.normcase(os.path.abspath(os.path.join(root, path)))
+
+
+def _document_keys(conn, root):
+    """Пути всех документов в базе; относительные пути считаются от root"""
+    return {_document_key(root, path) for path in conn.execute(
+        select(Document.file_path).where(Document.file_path.is_not(None))).scalars()}
+
+
+def find_orphans(session, root='.', now=None):
+    """Файлы без ссылок в базе и неиспользуемые записи photo_blobs (ничего не меняет)"""
+    now = now or datetime.now()
+    report = GcReport()
+    conn = session.connection()
+    _files.create(conn, checkfirst=True)
+    try:
+        documents = _load_files(conn, root, now)
+        for category, referenced in _referenced().items():
+            query = select(_files.c.path, _files.c.size).where(_files.c.category == category, ~referenced)
+            for path, size in conn.execute(query.order_by(_files.c.path)):
+                report.add(category, path, size)
+    finally:
+        _files.drop(conn)
+    if documents:
+        referenced = _document_keys(conn, root)
+        for path, size in sorted(documents):
+            if _document_key(root, path) not in referenced:
+                report.add('documents', path, size)
+
+    # Решают сами ссылки, а не refcount: счетчик мог отстать после записи через Core
+    blobs = conn.execute(select(PhotoBlob.file_path).where(
+        ~exists().where(PropertyPhoto.file_path == PhotoBlob.file_path),
+        PhotoBlob.created_at < now - GRACE_PERIOD,
+    ).order_by(PhotoBlob.file_path)).scalars().all()
+    for path in blobs:
+        for file_path in (path, thumbnail_path(path).replace(os.sep, '/')):
+            full = os.path.join(root, file_path)
+            if os.path.exists(full):
+                report.add('blob', file_path, os.path.getsize(full))
+    report.blob_paths = blobs
+    return report
+
+
+def _remove_empty_dirs(root, tops):
+    for top in tops:
+        base = os.path.join(root, top)
+        for directory, _, _ in os.walk(base, topdown=False):
+            if directory != base and not os.listdir(directory):
+                os.rmdir(directory)
+        if top not in (STORE_DIR, THUMBS_DIR) and os.path.isdir(base) and not os.listdir(base):
+            os.rmdir(base)
+
+
+def _expire_quarantine(root, now, report):
+    base = os.path.join(root, QUARANTINE_DIR)
+    if not os.path.isdir(base):
+        return
+    for name in sorted(os.listdir(base)):
+        try:
+            created = datetime.strptime(name, STAMP_FORMAT)
+        except ValueError:
+            continue
+        if created < now - QUARANTINE_RETENTION:
+            directory = os.path.join(base, name)
+            size = sum(os.path.getsize(os.path.join(parent, file))
+                       for parent, _, files in os.walk(directory) for file in files)
+            shutil.rmtree(directory)
+            report.add('quarantine', f"{QUARANTINE_DIR}/{name}", size)
+            report.reclaimed += size
+
+
+def collect_garbage(session, root='.', delete_files=False, dry_run=False, now=None):
+    """Находит и убирает файлы без ссылок; возвращает GcReport.
+
+    По умолчанию файлы переносятся в карантин, delete_files=True удаляет их сразу,
+    dry_run=True только составляет отчет.
+    """
+    now = now or datetime.now()
+    report = find_orphans(session, root, now)
+    if dry_run:
+        return report
+    if not delete_files:
+        report.quarantine = os.path.join(QUARANTINE_DIR, now.strftime(STAMP_FORMAT))
+    for orphan in report.orphans:
+        source = os.path.join(root, orphan.path)
+        if not os.path.exists(source):
+            continue
+        if delete_files:
+            os.remove(source)
+            report.reclaimed += orphan.size
+        else:
+            target = os.path.join(root, report.quarantine, orphan.path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+            report.moved += orphan.size
+    if report.blob_paths:
+        session.execute(delete(PhotoBlob).where(PhotoBlob.file_path.in_(report.blob_paths)))
+        report.blobs = len(report.blob_paths)
+    # Хэши файлов, которых больше нет ни в фотографиях, ни в хранилище
+    session.execute(delete(PhotoHash).where(
+        ~exists().where(PropertyPhoto.file_path == PhotoHash.file_path),
+        ~exists().where(PhotoBlob.file_path == PhotoHash.file_path),
+    ))
+    session.commit()
+
+    _remove_empty_dirs(root, [STORE_DIR, THUMBS_DIR] + _legacy_dirs(root)
+                       + [orphan.path.split('/', 1)[0] for orphan in report.orphans
+                          if orphan.category == 'documents'])
+    _expire_quarantine(root, now, report)
+    return report
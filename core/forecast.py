@@ -0,0 +1,221 @@
+"""Прогноз денежного потока по действующим договорам.
+
+Ожидаемые начисления считаются матрицей договоры × месяцы: до окончания
+договора - ставка с учетом ежегодной индексации, после окончания - та же
+ставка, умноженная на вероятность продления в степени числа прошедших сроков
+договора. Поступления получаются сверткой начислений с историческим
+распределением задержки оплаты в месяцах (неоплаченная доля - потери).
+Все расчеты векторные, из базы берется три агрегирующих запроса.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, case, cast, Integer, and_
+from sqlalchemy.orm import aliased
+
+from core.database import Contract, Payment, PaymentSchedule, ContractStatus, PaymentStatus
+
+DEFAULT_HORIZON = 12
+MAX_DELAY_MONTHS = 6
+HISTORY_MONTHS = 24
+RENEWAL_GAP_DAYS = 62  # новый договор на тот же объект и арендатора в этот срок считается продлением
+
+
+class ForecastInputs:
+    """Параметры действующих договоров в виде массивов"""
+
+    def __init__(self, contract_ids, start_dates, end_dates, rents, indexation, property_ids=()):
+        self.contract_ids = np.asarray(contract_ids, dtype=np.int64)
+        self.property_ids = np.asarray(property_ids, dtype=np.int64)
+        self.start_dates = np.asarray(start_dates, dtype='M8[D]')
+        self.end_dates = np.asarray(end_dates, dtype='M8[D]')
+        self.rents = np.asarray(rents, dtype=np.float64)
+        self.indexation = np.asarray(indexation, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.contract_ids)
+
+
+class Forecast:
+    """Помесячный прогноз: строки матриц - договоры, столбцы - месяцы"""
+
+    def __init__(self, months, contract_ids, committed, renewals, income, delays, renewal_probability):
+        self.months = months
+        self.contract_ids = contract_ids
+        self.committed = committed
+        self.renewals = renewals
+        self.income = income
+        self.delays = delays
+        self.renewal_probability = renewal_probability
+
+    @property
+    def charges(self):
+        return self.committed + self.renewals
+
+    def totals(self):
+        """(начисления по договорам, ожидаемые продления, поступления) по месяцам"""
+        return self.committed.sum(axis=0), self.renewals.sum(axis=0), self.income.sum(axis=0)
+
+    def to_frame(self):
+        committed, renewals, income = self.totals()
+        frame = pd.DataFrame({
+            "Месяц": np.datetime_as_string(self.months, unit='M'),
+            "По действующим договорам": committed,
+            "Ожидаемые продления": renewals,
+            "Ожидаемые поступления": income,
+            "Нарастающим итогом": np.cumsum(income),
+        })
+        return frame.round(2)
+
+    def contracts_frame(self):
+        """Ожидаемые поступления по каждому договору"""
+        frame = pd.DataFrame(self.income, columns=np.datetime_as_string(self.months, unit='M'))
+        frame.insert(0, "Договор", self.contract_ids)
+        return frame.round(2)
+
+    def export(self, path):
+        """XLSX - сводка и разбивка по договорам на отдельных листах, CSV - только сводка"""
+        if path.lower().endswith('.csv'):
+            self.to_frame().to_csv(path, index=False, sep=';', encoding='utf-8-sig')
+            return
+        with pd.ExcelWriter(path) as writer:
+            self.to_frame().to_excel(writer, sheet_name="Прогноз", index=False)
+            self.contracts_frame().to_excel(writer, sheet_name="По договорам", index=False)
+
+
+def _month_floor(value):
+    return np.datetime64(value, 'M')
+
+
+def load_inputs(conn, today):
+    """Действующие договоры со ставкой и индексацией из графика платежей"""
+    rows = conn.execute(
+        select(Contract.id, Contract.start_date, Contract.end_date, Contract.rent_amount,
+               PaymentSchedule.indexation, Contract.property_id)
+        .outerjoin(PaymentSchedule, PaymentSchedule.contract_id == Contract.id)
+        .where(Contract.status == ContractStatus.ACTIVE, Contract.end_date.isnot(None))
+    ).all()
+    if not rows:
+        return ForecastInputs([], [], [], [], [])
+    ids, starts, ends, rents, indexation, property_ids = zip(*rows)
+    return ForecastInputs(
+        ids, [start or today for start in starts], ends,
+        [rent or 0.0 for rent in rents], [rate or 0.0 for rate in indexation], property_ids,
+    )
+
+
+def delay_distribution(conn, today, max_delay=MAX_DELAY_MONTHS, history_months=HISTORY_MONTHS):
+    """Доля суммы платежей, поступающая через 0..max_delay месяцев после месяца срока.
+
+    Берутся платежи со сроком в окне истории, которое заканчивается за max_delay
+    месяцев до текущего, чтобы у них было время быть оплаченными. Сумма долей
+    меньше единицы на долю так и не оплаченных платежей. Без истории считается,
+    что все платится в срок.
+    """
+    window_end = _month_floor(today) - np.timedelta64(max_delay, 'M')
+    window_start = window_end - np.timedelta64(history_months, 'M')
+    window = (Payment.due_date >= window_start.astype('M8[D]').item(),
+              Payment.due_date < window_end.astype('M8[D]').item())
+
+    def _months(column):
+        return (cast(func.strftime('%Y', column), Integer) * 12
+                + cast(func.strftime('%m', column), Integer))
+
+    lag = _months(Payment.payment_date) - _months(Payment.due_date)
+    rows = conn.execute(
+        select(lag, func.sum(Payment.amount))
+        .where(*window, Payment.status == PaymentStatus.PAID, Payment.payment_date.isnot(None))
+        .group_by(lag)
+    ).all()
+    total = conn.execute(select(func.sum(Payment.amount)).where(*window)).scalar() or 0.0
+
+    delays = np.zeros(max_delay + 1)
+    if not total:
+        delays[0] = 1.0
+        return delays
+    for months, amount in rows:
+        # Досрочная оплата приходится на месяц срока, поздняя - на последний учитываемый месяц
+        delays[min(max(months or 0, 0), max_delay)] += amount or 0.0
+    return delays / total
+
+
+def renewal_rate(conn, today, gap_days=RENEWAL_GAP_DAYS):
+    """Доля завершившихся договоров, после которых тот же арендатор снял тот же объект"""
+    successor = aliased(Contract)
+    renewed = (
+        select(Contract.id, func.count(successor.id).label('successors'))
+        .outerjoin(successor, and_(
+            successor.property_id == Contract.property_id,
+            successor.tenant_id == Contract.tenant_id,
+            successor.id != Contract.id,
+            successor.start_date > Contract.start_date,
+            successor.start_date <= func.date(Contract.end_date, f'+{gap_days} days'),
+        ))
+        .where(Contract.end_date < today - timedelta(days=gap_days))
+        .group_by(Contract.id)
+        .subquery()
+    )
+    ended, renewals = conn.execute(
+        select(func.count(), func.sum(case((renewed.c.successors > 0, 1), else_=0)))
+    ).one()
+    return (renewals or 0) / ended if ended else 0.0
+
+
+def indexed_rates(inputs, months):
+    """Ставка каждого договора в каждом месяце с учетом индексации и признак начала аренды"""
+    start_month = inputs.start_dates.astype('M8[M]')[:, None]
+    elapsed = (np.asarray(months, dtype='M8[M]')[None, :] - start_month).astype(np.int64)
+    years = np.maximum(elapsed, 0) // 12
+    return inputs.rents[:, None] * (1 + inputs.indexation[:, None]) ** years, elapsed >= 0
+
+
+def spread_by_delay(charges, delays):
+    """Поступления по месяцам: начисления месяца m-k приходят с долей delays[k]"""
+    income = np.zeros_like(charges)
+    months = charges.shape[-1]
+    for lag, share in enumerate(delays):
+        if share and lag < months:
+            income[..., lag:] += share * charges[..., :months - lag]
+    return income
+
+
+def project(inputs, months, renewal_probability, delays):
+    """Матрицы начислений по сроку договора, продлений и поступлений"""
+    months = np.asarray(months, dtype='M8[M]')
+    start_month = inputs.start_dates.astype('M8[M]')[:, None]
+    end_month = inputs.end_dates.astype('M8[M]')[:, None]
+    grid = months[None, :]
+    rate, started = indexed_rates(inputs, months)
+
+    # После окончания договор продлевается на тот же срок с вероятностью renewal_probability
+    term = np.maximum((end_month - start_month).astype(np.int64) + 1, 1)
+    overrun = (grid - end_month).astype(np.int64)
+    cycles = np.where(overrun > 0, -(-overrun // term), 0)
+    probability = np.broadcast_to(np.asarray(renewal_probability, dtype=np.float64), (len(inputs),))[:, None]
+    survival = probability ** cycles
+
+    committed = np.where(started & (cycles == 0), rate, 0.0)
+    renewals = np.where(started & (cycles > 0), rate * survival, 0.0)
+
+    return committed, renewals, spread_by_delay(committed + renewals, delays)
+
+
+def forecast_cash_flow(conn, horizon=DEFAULT_HORIZON, today=None, renewal_probability=None,
+                       delays=None):
+    """Прогноз поступлений на horizon месяцев начиная с текущего.
+
+    renewal_probability и delays по умолчанию оцениваются по истории базы.
+    Начисления месяцев до текущего в свертку не входят, поэтому поступления
+    по уже выставленным платежам в прогноз не попадают.
+    """
+    today = today or datetime.now().date()
+    inputs = load_inputs(conn, today)
+    if renewal_probability is None:
+        renewal_probability = renewal_rate(conn, today)
+    if delays is None:
+        delays = delay_distribution(conn, today)
+    months = _month_floor(today) + np.arange(horizon).astype('m8[M]')
+    committed, renewals, income = project(inputs, months, renewal_probability, delays)
+    return Forecast(months, inputs.contract_ids, committed, renewals, income,
+                    np.asarray(delays), renewal_probability)
@@ -0,0 +1,401 @@
+"""Массовый импорт арендаторов, объектов, договоров и платежей из CSV/XLSX.
+
+Файл читается потоком: CSV - чанками pandas, XLSX - openpyxl в режиме read_only.
+Каждый чанк проверяется векторно, внешние ключи разрешаются по словарям,
+загруженным из базы один раз, а корректные строки вставляются пакетами через
+Core insert в одной транзакции. Некорректные строки пропускаются и попадают
+в отчет об ошибках с номером строки исходного файла.
+
+Колонки (заголовок в первой строке, регистр не важен):
+    tenants:    name*, legal_info, contact_info, id
+    properties: name*, address, area, floor, status, description, id
+    contracts:  property_id* | property*, tenant_id | tenant, start_date,
+                end_date*, rent_amount, deposit, area, status, id
+    payments:   contract_id*, amount*, due_date*, payment_date, status, description
+
+property и tenant - названия объекта и арендатора, если идентификаторы неизвестны.
+Даты - ГГГГ-ММ-ДД или ДД.ММ.ГГГГ, статусы - значение или имя перечисления.
+"""
+import csv
+import time
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import insert, select, literal, literal_column
+
+from core.database import (Tenant, Property, Contract, Payment,
+                           PropertyStatus, ContractStatus, PaymentStatus)
+from core.ledger import rebuild_balances
+
+DEFAULT_CHUNK_SIZE = 50000
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя импортировать целиком (нет обязательных колонок, неизвестный формат)"""
+
+
+class Field:
+    """Описание колонки импортируемого файла"""
+
+    def __init__(self, name, kind='str', required=False, enum=None, default=None, minimum=None):
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.enum = enum
+        self.default = default
+        self.minimum = minimum
+
+
+class Reference:
+    """Внешний ключ, задаваемый идентификатором или названием связанной записи"""
+
+    def __init__(self, column, model, name_column=None, name_attr='name', required=False):
+        self.column = column
+        self.model = model
+        self.name_column = name_column
+        self.name_attr = name_attr
+        self.required = required
+
+
+class ImportSpec:
+    def __init__(self, model, fields, references=()):
+        self.model = model
+        self.fields = fields
+        self.references = references
+
+
+SPECS = {
+    'tenants': ImportSpec(Tenant, [
+        Field('id', 'int'),
+        Field('name', required=True),
+        Field('legal_info'),
+        Field('contact_info'),
+    ]),
+    'properties': ImportSpec(Property, [
+        Field('id', 'int'),
+        Field('name', required=True),
+        Field('address'),
+        Field('area', 'float', minimum=0),
+        Field('floor', 'int'),
+        Field('status', 'enum', enum=PropertyStatus, default=PropertyStatus.AVAILABLE),
+        Field('description'),
+    ]),
+    'contracts': ImportSpec(Contract, [
+        Field('id', 'int'),
+        Field('start_date', 'date'),
+        Field('end_date', 'date', required=True),
+        Field('rent_amount', 'float', default=0.0, minimum=0),
+        Field('deposit', 'float', default=0.0, minimum=0),
+        Field('area', 'float', minimum=0),
+        Field('status', 'enum', enum=ContractStatus, default=ContractStatus.ACTIVE),
+    ], references=[
+        Reference('property_id', Property, name_column='property', required=True),
+        Reference('tenant_id', Tenant, name_column='tenant'),
+    ]),
+    'payments': ImportSpec(Payment, [
+        Field('amount', 'float', required=True, minimum=0),
+        Field('due_date', 'date', required=True),
+        Field('payment_date', 'date'),
+        Field('status', 'enum', enum=PaymentStatus),
+        Field('description'),
+    ], references=[
+        Reference('contract_id', Contract, required=True),
+    ]),
+}
+
+
+class ImportResult:
+    """Итог импорта одного файла"""
+
+    def __init__(self, entity, dry_run):
+        self.entity = entity
+        self.dry_run = dry_run
+        self.total = 0
+        self.imported = 0
+        self.errors = []  # (номер строки файла, колонка, сообщение)
+        self.elapsed = 0.0
+
+    @property
+    def skipped(self):
+        return len({line for line, _, _ in self.errors})
+
+    def write_errors(self, path):
+        """Сохраняет построчный отчет об ошибках в CSV (открывается в Excel)"""
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(["Строка", "Колонка", "Ошибка"])
+            writer.writerows(sorted(self.errors))
+
+    def summary(self):
+        action = "проверено" if self.dry_run else "импортировано"
+        return (f"{self.entity}: {action} {self.imported} из {self.total} строк, "
+                f"с ошибками {self.skipped}, {self.elapsed:.1f} с")
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, sheet=None):
+    """Читает CSV или XLSX чанками DataFrame со строковыми значениями.
+
+    Индекс чанка - сквозной номер строки данных (0 - первая строка после заголовка).
+    """
+    lower = path.lower()
+    if lower.endswith('.csv'):
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size,
+                             sep=_sniff_delimiter(path), encoding='utf-8-sig')
+        for chunk in reader:
+            yield _normalize(chunk)
+    elif lower.endswith(('.xlsx', '.xlsm')):
+        yield from _read_xlsx(path, chunk_size, sheet)
+    else:
+        raise ImportFormatError(f"Неподдерживаемый формат файла: {path}")
+
+
+def _sniff_delimiter(path):
+    # Excel в русской локали сохраняет CSV через точку с запятой
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        header = f.readline()
+    return max((',', ';', '\t'), key=header.count)
+
+
+def _normalize(frame):
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    return frame.apply(lambda column: column.str.strip())
+
+
+def _cell_to_str(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _read_xlsx(path, chunk_size, sheet):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = [_cell_to_str(value) for value in next(rows, ())]
+        width = len(header)
+        batch, positions = [], []
+        for position, row in enumerate(rows):
+            values = [_cell_to_str(value) for value in row[:width]]
+            # Пустые строки пропускаются, но номера строк в отчете остаются номерами листа
+            if not any(values):
+                continue
+            values.extend([''] * (width - len(values)))
+            batch.append(values)
+            positions.append(position)
+            if len(batch) >= chunk_size:
+                yield _normalize(pd.DataFrame(batch, columns=header, index=positions))
+                batch, positions = [], []
+        if batch:
+            yield _normalize(pd.DataFrame(batch, columns=header, index=positions))
+    finally:
+        workbook.close()
+
+
+class Importer:
+    """Импорт файла одной сущности (tenants, properties, contracts, payments)"""
+
+    def __init__(self, engine, entity, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+        if entity not in SPECS:
+            raise ImportFormatError(f"Неизвестная сущность: {entity}")
+        self.engine = engine
+        self.entity = entity
+        self.spec = SPECS[entity]
+        self.table = self.spec.model.__table__
+        self.int_columns = ({field.name for field in self.spec.fields if field.kind == 'int'}
+                            | {ref.column for ref in self.spec.references})
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+    def run(self, path, sheet=None):
+        result = ImportResult(self.entity, self.dry_run)
+        started = time.perf_counter()
+        statement = self._insert_statement()
+        touched_contracts = set()
+        with self.engine.begin() as conn:
+            self._load_lookups(conn)
+            for chunk in read_chunks(path, self.chunk_size, sheet):
+                if result.total == 0:
+                    self._check_columns(chunk.columns)
+                result.total += len(chunk)
+                valid, errors = self.validate(chunk)
+                result.errors.extend(errors)
+                if not valid.empty:
+                    if not self.dry_run:
+                        conn.execute(statement, self._to_records(valid))
+                        if self.entity == 'payments':
+                            touched_contracts.update(valid['contract_id'].astype(int).tolist())
+                    result.imported += len(valid)
+            if touched_contracts:
+                # Вставка через Core минует события маппера, сальдо пересчитывается одним запросом
+                rebuild_balances(conn, touched_contracts)
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def _insert_statement(self):
+        # Время создания одно на весь импорт и подставляется в SQL литералом,
+        # чтобы не форматировать datetime.now() для каждой из миллиона строк
+        now = datetime.now()
+        stamps = {column: literal(now, self.table.c[column].type).compile(
+                      dialect=self.engine.dialect, compile_kwargs={'literal_binds': True})
+                  for column in ('created_at', 'updated_at') if column in self.table.c}
+        return insert(self.table).values({column: literal_column(str(sql))
+                                          for column, sql in stamps.items()})
+
+    def _check_columns(self, columns):
+        missing = [field.name for field in self.spec.fields
+                   if field.required and field.name not in columns]
+        for ref in self.spec.references:
+            if ref.required and ref.column not in columns and ref.name_column not in columns:
+                missing.append(ref.column if not ref.name_column else f"{ref.column}/{ref.name_column}")
+        if missing:
+            raise ImportFormatError(f"В файле нет обязательных колонок: {', '.join(missing)}")
+
+    def _load_lookups(self, conn):
+        """Загружает идентификаторы и названия связанных записей одним запросом на таблицу"""
+        has_ids = any(field.name == 'id' for field in self.spec.fields)
+        self.existing_ids = set(conn.scalars(select(self.table.c.id))) if has_ids else set()
+        self.lookups = {}
+        for ref in self.spec.references:
+            table = ref.model.__table__
+            if not ref.name_column:
+                self.lookups[ref.column] = (set(conn.scalars(select(table.c.id))), {})
+                continue
+            rows = conn.execute(select(table.c.id, table.c[ref.name_attr])).all()
+            by_name = {}
+            for row_id, name in rows:
+                if name is None:
+                    continue
+                key = str(name).strip().lower()
+                # Неоднозначные названия отмечаются None и не разрешаются
+                by_name[key] = None if key in by_name else row_id
+            self.lookups[ref.column] = ({row_id for row_id, _ in rows}, by_name)
+        if self.entity == 'contracts':
+            self.property_areas = dict(conn.execute(select(Property.id, Property.area)).all())
+
+    def validate(self, chunk):
+        """Проверяет чанк и возвращает (DataFrame корректных строк, ошибки)"""
+        errors = []
+        bad = pd.Series(False, index=chunk.index)
+        out = pd.DataFrame(index=chunk.index)
+
+        def fail(mask, column, message):
+            for index in chunk.index[mask]:
+                errors.append((int(index) + 2, column, message))
+            bad[mask] = True
+
+        empty_column = pd.Series('', index=chunk.index)
+        for field in self.spec.fields:
+            raw = chunk[field.name] if field.name in chunk.columns else empty_column
+            empty = raw == ''
+            if field.required:
+                fail(empty, field.name, "обязательное поле не заполнено")
+            if field.kind == 'str':
+                length = getattr(self.table.c[field.name].type, 'length', None)
+                if length:
+                    fail(raw.str.len() > length, field.name, f"длиннее {length} символов")
+                value = raw.where(~empty, None)
+            elif field.kind in ('float', 'int'):
+                value = pd.to_numeric(raw.str.replace(' ', '').str.replace(',', '.'), errors='coerce')
+                fail(~empty & value.isna(), field.name, "не число")
+                if field.kind == 'int':
+                    fail(value.notna() & (value % 1 != 0), field.name, "не целое число")
+                if field.minimum is not None:
+                    fail(value < field.minimum, field.name, f"меньше {field.minimum}")
+            elif field.kind == 'date':
+                value = pd.Series(pd.NaT, index=chunk.index, dtype='datetime64[ns]')
+                for date_format in DATE_FORMATS:
+                    parsed = pd.to_datetime(raw, format=date_format, errors='coerce')
+                    value = value.fillna(parsed)
+                fail(~empty & value.isna(), field.name, "неверная дата")
+            else:
+                names = {}
+                for member in field.enum:
+                    names[member.name.lower()] = member.name
+                    names[member.value.lower()] = member.name
+                value = raw.str.lower().map(names)
+                fail(~empty & value.isna(), field.name, "неизвестный статус")
+            if field.default is not None:
+                default = field.default.name if field.kind == 'enum' else field.default
+                value = value.where(~empty, default)
+            out[field.name] = value
+
+        for ref in self.spec.references:
+            out[ref.column] = self._resolve(chunk, ref, fail)
+
+        if 'id' in out.columns:
+            ids = out['id']
+            fail(ids.notna() & ids.isin(self.existing_ids), 'id', "запись с таким id уже существует")
+            fail(ids.notna() & ids.duplicated(), 'id', "id повторяется в файле")
+        self._check_rows(out, fail)
+
+        valid = out[~bad]
+        if 'id' in valid.columns:
+            self.existing_ids.update(valid['id'].dropna().astype(int))
+            if valid['id'].isna().all():
+                valid = valid.drop(columns='id')
+        return valid, errors
+
+    def _resolve(self, chunk, ref, fail):
+        ids, by_name = self.lookups[ref.column]
+        raw_id = chunk[ref.column] if ref.column in chunk.columns else pd.Series('', index=chunk.index)
+        value = pd.to_numeric(raw_id, errors='coerce')
+        fail((raw_id != '') & value.isna(), ref.column, "не число")
+        fail(value.notna() & ~value.isin(ids), ref.column, "связанная запись не найдена")
+        if ref.name_column and ref.name_column in chunk.columns:
+            raw_name = chunk[ref.name_column]
+            by_id_missing = value.isna() & (raw_name != '')
+            key = raw_name.str.lower()
+            matched = key.map(by_name)
+            fail(by_id_missing & ~key.isin(by_name), ref.name_column, "связанная запись не найдена")
+            fail(by_id_missing & key.isin(by_name) & matched.isna(), ref.name_column,
+                 "название неоднозначно, укажите идентификатор")
+            value = value.where(~by_id_missing, matched)
+        if ref.required:
+            fail((raw_id == '') & value.isna() & ~self._named(chunk, ref), ref.column,
+                 "обязательное поле не заполнено")
+        return value
+
+    @staticmethod
+    def _named(chunk, ref):
+        if ref.name_column and ref.name_column in chunk.columns:
+            return chunk[ref.name_column] != ''
+        return pd.Series(False, index=chunk.index)
+
+    def _check_rows(self, out, fail):
+        """Проверки, затрагивающие несколько колонок строки"""
+        if self.entity == 'contracts':
+            fail(out['start_date'].notna() & out['end_date'].notna()
+                 & (out['start_date'] > out['end_date']),
+                 'end_date', "дата окончания раньше даты начала")
+            # Как и в форме договора, площадь по умолчанию берется из объекта
+            out['area'] = out['area'].fillna(out['property_id'].map(self.property_areas))
+        elif self.entity == 'payments':
+            paid = out['payment_date'].notna()
+            out['status'] = out['status'].where(
+                out['status'].notna(), paid.map({True: PaymentStatus.PAID.name,
+                                                 False: PaymentStatus.PENDING.name}))
+
+    def _to_records(self, frame):
+        # Колонки переводятся в списки Python целиком: это в разы быстрее DataFrame.to_dict()
+        columns = []
+        for column in frame.columns:
+            series = frame[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                series = series.dt.date
+            elif column in self.int_columns:
+                series = series.astype('Int64')
+            columns.append(series.astype(object).where(series.notna(), None).tolist())
+        names = list(frame.columns)
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def import_file(engine, entity, path, dry_run=False, chunk_size=DEFAULT_CHUNK_SIZE, sheet=None):
+    """Импортирует файл и возвращает ImportResult"""
+    return Importer(engine, entity, chunk_size=chunk_size, dry_run=dry_run).run(path, sheet=sheet)
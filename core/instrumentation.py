@@ -0,0 +1,197 @@
+"""Инструментирование SQL: счетчики и тайминги запросов в разрезе действий пользователя.
+
+Каждый запрос, прошедший через движок, приписывается текущему действию
+("navigate:payments", "edit_payment" и т.д.), которое задается контекстным
+менеджером action() или декоратором track_action(). Медленные запросы пишутся
+в ротируемый лог вместе с планом выполнения.
+"""
+import contextvars
+import heapq
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+IDLE_ACTION = "idle"
+LOG_FILE = os.path.join('logs', 'sql_profile.log')
+
+_current_action = contextvars.ContextVar('sql_action', default=IDLE_ACTION)
+_profiler = None
+
+logger = logging.getLogger('rental.sql')
+
+
+def current_action():
+    return _current_action.get()
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextmanager
+def action(name):
+    """Приписывает все запросы внутри блока действию name"""
+    token = _current_action.set(name)
+    profiler = _profiler
+    started = profiler.begin(name) if profiler else None
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.end(name, started)
+        _current_action.reset(token)
+
+
+def track_action(name):
+    """Декоратор для обработчиков Qt: выполняет метод внутри action(name).
+
+    Сигналы вроде clicked передают лишние аргументы (checked), поэтому
+    обертка отбрасывает позиционные аргументы, которые метод не принимает.
+    """
+    def decorator(func):
+        argcount = func.__code__.co_argcount
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with action(name):
+                return func(*args[:argcount], **kwargs)
+        return wrapper
+    return decorator
+
+
+class ActionStats:
+    """Накопленная статистика запросов одного действия"""
+
+    def __init__(self, name, top_n):
+        self.name = name
+        self.top_n = top_n
+        self.calls = 0
+        self.queries = 0
+        self.commits = 0
+        self.total_time = 0.0
+        self.slowest = []  # куча (время, порядковый номер, запрос, параметры)
+        self._seq = 0
+
+    def record(self, statement, parameters, elapsed):
+        self.queries += 1
+        self.total_time += elapsed
+        self._seq += 1
+        entry = (elapsed, self._seq, statement, parameters)
+        if len(self.slowest) < self.top_n:
+            heapq.heappush(self.slowest, entry)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def top(self):
+        return sorted(self.slowest, reverse=True)
+
+
+class QueryProfiler:
+    """Слушает события движка и собирает статистику по действиям"""
+
+    def __init__(self, engine, top_n=10, slow_ms=100, log_file=LOG_FILE):
+        self.engine = engine
+        self.top_n = top_n
+        self.slow_ms = slow_ms
+        self.stats = {}
+        self._explaining = False
+        self._setup_log(log_file)
+
+    def _setup_log(self, log_file):
+        if log_file and not logger.handlers:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def install(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(self.engine, 'commit', self._on_commit)
+        return self
+
+    def uninstall(self):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(self.engine, 'commit', self._on_commit)
+
+    def _action_stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ActionStats(name, self.top_n)
+        return stats
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        if self._explaining:
+            return
+        name = _current_action.get()
+        # Для executemany храним только первый набор параметров, этого достаточно для EXPLAIN
+        params = parameters[0] if executemany and parameters else parameters
+        self._action_stats(name).record(statement, params, elapsed)
+        if elapsed * 1000 >= self.slow_ms:
+            logger.warning("slow query action=%s time=%.1fms\n%s\nparams=%r\nplan:\n%s",
+                           name, elapsed * 1000, statement, params, self.explain(statement, params))
+
+    def _on_commit(self, conn):
+        self._action_stats(_current_action.get()).commits += 1
+
+    def begin(self, name):
+        stats = self._action_stats(name)
+        stats.calls += 1
+        return stats.queries, stats.commits, stats.total_time
+
+    def end(self, name, started):
+        stats = self._action_stats(name)
+        queries, commits, total_time = started
+        logger.info("action=%s queries=%d commits=%d time=%.1fms", name,
+                    stats.queries - queries, stats.commits - commits,
+                    (stats.total_time - total_time) * 1000)
+
+    def explain(self, statement, parameters):
+        """Возвращает EXPLAIN QUERY PLAN для SELECT-запроса в виде текста"""
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return ""
+        self._explaining = True
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+            return "\n".join(row[-1] for row in rows)
+        except Exception as e:
+            return f"<план недоступен: {e}>"
+        finally:
+            self._explaining = False
+
+    def snapshot(self):
+        """Статистика действий, отсортированная по суммарному времени"""
+        return sorted(self.stats.values(), key=lambda s: s.total_time, reverse=True)
+
+    def reset(self):
+        self.stats.clear()
+
+    def dump(self):
+        """Пишет в лог сводку по всем действиям с планами самых медленных запросов"""
+        for stats in self.snapshot():
+            logger.info("summary action=%s calls=%d queries=%d commits=%d time=%.1fms",
+                        stats.name, stats.calls, stats.queries, stats.commits, stats.total_time * 1000)
+            for elapsed, _, statement, params in stats.top():
+                logger.info("  %.1fms %s\n%s", elapsed * 1000, statement,
+                            self.explain(statement, params))
+
+
+def install_profiler(engine, **kwargs):
+    """Создает и подключает глобальный профилировщик для движка"""
+    global _profiler
+    if _profiler is not None:
+        _profiler.uninstall()
+    _profiler = QueryProfiler(engine, **kwargs).install()
+    return _profiler
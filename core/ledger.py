@@ -0,0 +1,245 @@
+"""Лицевой счет договора: сальдо и выписка с нарастающим итогом.
+
+Каждый платеж - начисление суммы на дату срока оплаты, а оплаченный платеж -
+еще и поступление на дату оплаты. Итоговое сальдо по договору хранится
+в contract_balances и поддерживается инкрементально событиями маппера Payment,
+поэтому акты сверки и списки читают его одной строкой. Массовые записи через
+Core (импорт, графики платежей) пересчитывают сальдо затронутых договоров
+через rebuild_balances(). Выписка за период строится одним запросом с оконной
+функцией SUM() OVER.
+
+График создает платежи на весь срок договора вперед, поэтому в задолженность
+(charged - paid) входят только платежи со сроком не позже accrued_on, а
+будущие копятся в scheduled. Раз в день (при запуске и вместе с переводом
+просроченных платежей) accrue_balances() переносит наступившие сроки из
+scheduled в charged.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import event, select, update, delete, insert, func, case, literal, union_all, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.database import Payment, Contract, ContractBalance, PaymentStatus
+
+CHARGE = 0
+RECEIPT = 1
+
+
+class LedgerEntry:
+    __slots__ = ('date', 'kind', 'payment_id', 'description', 'debit', 'credit', 'balance')
+
+    def __init__(self, date, kind, payment_id, description, debit, credit, balance):
+        self.date = date
+        self.kind = kind
+        self.payment_id = payment_id
+        self.description = description
+        self.debit = debit
+        self.credit = credit
+        self.balance = balance
+
+
+class Ledger:
+    """Выписка по договору за период с входящим и исходящим сальдо"""
+
+    def __init__(self, contract_id, start, end, opening, entries):
+        self.contract_id = contract_id
+        self.start = start
+        self.end = end
+        self.opening = opening
+        self.entries = entries
+        self.closing = entries[-1].balance if entries else opening
+
+    @property
+    def charged(self):
+        return sum(entry.debit for entry in self.entries)
+
+    @property
+    def paid(self):
+        return sum(entry.credit for entry in self.entries)
+
+
+def _paid_amount(amount, status):
+    return (amount or 0.0) if status == PaymentStatus.PAID else 0.0
+
+
+def _apply_delta(connection, contract_id, due_date, amount, paid):
+    """Добавляет к сальдо договора начисление amount со сроком due_date и оплату paid"""
+    if contract_id is None or (not amount and not paid):
+        return
+    today = date.today()
+    # Платеж без срока оплаты начислен сразу
+    due_date = due_date or date.min
+    accrued = amount if due_date <= today else 0.0
+    now = datetime.now()
+    statement = sqlite_insert(ContractBalance).values(
+        contract_id=contract_id, charged=accrued, scheduled=amount - accrued, paid=paid,
+        balance=accrued - paid, accrued_on=today, updated_at=now
+    )
+    # В существующей строке срок сравнивается с ее датой разнесения, а не с сегодняшней
+    due = case((ContractBalance.accrued_on >= due_date, amount), else_=0.0)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[ContractBalance.contract_id],
+        set_={
+            'charged': ContractBalance.charged + due,
+            'scheduled': ContractBalance.scheduled + amount - due,
+            'paid': ContractBalance.paid + paid,
+            'balance': ContractBalance.balance + due - paid,
+            'updated_at': now,
+        }
+    ))
+
+
+def _previous(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, key)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Старые значения нужны в after_update даже для атрибутов, истекших после commit()
+for _attribute in (Payment.contract_id, Payment.amount, Payment.status, Payment.due_date):
+    event.listen(_attribute, 'set', _keep_old_value, active_history=True)
+
+
+@event.listens_for(Payment, 'after_insert')
+def _payment_inserted(mapper, connection, target):
+    _apply_delta(connection, target.contract_id, target.due_date, target.amount or 0.0,
+                 _paid_amount(target.amount, target.status))
+
+
+@event.listens_for(Payment, 'after_update')
+def _payment_updated(mapper, connection, target):
+    state = inspect(target)
+    old_contract = _previous(state, 'contract_id')
+    old_due = _previous(state, 'due_date')
+    old_amount = _previous(state, 'amount') or 0.0
+    old_paid = _paid_amount(old_amount, _previous(state, 'status'))
+    new_amount = target.amount or 0.0
+    new_paid = _paid_amount(new_amount, target.status)
+    if old_contract == target.contract_id and old_due == target.due_date:
+        _apply_delta(connection, target.contract_id, target.due_date, new_amount - old_amount, new_paid - old_paid)
+    else:
+        _apply_delta(connection, old_contract, old_due, -old_amount, -old_paid)
+        _apply_delta(connection, target.contract_id, target.due_date, new_amount, new_paid)
+
+
+@event.listens_for(Payment, 'before_delete')
+def _payment_deleted(mapper, connection, target):
+    state = inspect(target)
+    amount = _previous(state, 'amount') or 0.0
+    _apply_delta(connection, _previous(state, 'contract_id'), _previous(state, 'due_date'), -amount,
+                 -_paid_amount(amount, _previous(state, 'status')))
+
+
+@event.listens_for(Contract, 'after_delete')
+def _contract_deleted(mapper, connection, target):
+    connection.execute(delete(ContractBalance).where(ContractBalance.contract_id == target.id))
+
+
+def rebuild_balances(conn, contract_ids=None, today=None):
+    """Пересчитывает сальдо по платежам на дату today (после массовых вставок через Core)"""
+    today = today or date.today()
+    paid = func.sum(case((Payment.status == PaymentStatus.PAID, Payment.amount), else_=0.0))
+    charged = func.sum(case((Payment.due_date > today, 0.0), else_=Payment.amount))
+    scheduled = func.sum(case((Payment.due_date > today, Payment.amount), else_=0.0))
+    totals = select(
+        Payment.contract_id, func.coalesce(charged, 0.0), func.coalesce(scheduled, 0.0), func.coalesce(paid, 0.0),
+        func.coalesce(charged, 0.0) - func.coalesce(paid, 0.0), literal(today), literal(datetime.now())
+    ).where(Payment.contract_id.isnot(None)).group_by(Payment.contract_id)
+    clear = delete(ContractBalance)
+    if contract_ids is not None:
+        contract_ids = list(contract_ids)
+        totals = totals.where(Payment.contract_id.in_(contract_ids))
+        clear = clear.where(ContractBalance.contract_id.in_(contract_ids))
+    conn.execute(clear)
+    conn.execute(insert(ContractBalance).from_select(
+        ['contract_id', 'charged', 'scheduled', 'paid', 'balance', 'accrued_on', 'updated_at'], totals
+    ))
+
+
+def accrue_balances(conn, today=None):
+    """Переносит в задолженность платежи, срок которых наступил после прошлого разнесения.
+
+    Пересчитываются только договоры с такими платежами; возвращает их число.
+    """
+    today = today or date.today()
+    stale = ContractBalance.accrued_on < today
+    if conn.execute(select(ContractBalance.contract_id).where(stale).limit(1)).first() is None:
+        return 0
+    contract_ids = conn.execute(
+        select(Payment.contract_id).distinct()
+        .join(ContractBalance, ContractBalance.contract_id == Payment.contract_id)
+        .where(Payment.due_date > ContractBalance.accrued_on, Payment.due_date <= today)
+    ).scalars().all()
+    if contract_ids:
+        rebuild_balances(conn, contract_ids, today)
+    conn.execute(update(ContractBalance).where(stale).values(accrued_on=today))
+    return len(contract_ids)
+
+
+def ensure_balances(conn):
+    """Заполняет contract_balances для базы, созданной до появления таблицы, и разносит наступившие сроки"""
+    has_balances = conn.execute(select(ContractBalance.contract_id).limit(1)).first()
+    has_payments = conn.execute(select(Payment.id).where(Payment.contract_id.isnot(None)).limit(1)).first()
+    if has_payments and not has_balances:
+        rebuild_balances(conn)
+    else:
+        accrue_balances(conn)
+
+
+def get_balance(conn, contract_id):
+    """Текущее сальдо договора: (начислено, оплачено, задолженность)"""
+    row = conn.execute(
+        select(ContractBalance.charged, ContractBalance.paid, ContractBalance.balance)
+        .where(ContractBalance.contract_id == contract_id)
+    ).first()
+    return tuple(row) if row else (0.0, 0.0, 0.0)
+
+
+def balances_by_tenant(conn):
+    """Сальдо по арендаторам: {tenant_id: (начислено, оплачено, задолженность)}"""
+    rows = conn.execute(
+        select(Contract.tenant_id, func.sum(ContractBalance.charged),
+               func.sum(ContractBalance.paid), func.sum(ContractBalance.balance))
+        .join(Contract, Contract.id == ContractBalance.contract_id)
+        .group_by(Contract.tenant_id)
+    ).all()
+    return {tenant_id: (charged, paid, balance) for tenant_id, charged, paid, balance in rows}
+
+
+def contract_ledger(conn, contract_id, start=None, end=None):
+    """Выписка по договору с нарастающим сальдо за период [start, end]"""
+    charges = select(
+        Payment.due_date.label('date'), literal(CHARGE).label('kind'), Payment.id.label('payment_id'),
+        Payment.description.label('description'),
+        Payment.amount.label('debit'), literal(0.0).label('credit')
+    ).where(Payment.contract_id == contract_id, Payment.due_date.isnot(None))
+    receipts = select(
+        Payment.payment_date, literal(RECEIPT), Payment.id, Payment.description,
+        literal(0.0), Payment.amount
+    ).where(Payment.contract_id == contract_id, Payment.status == PaymentStatus.PAID,
+            Payment.payment_date.isnot(None))
+    entries = union_all(charges, receipts).subquery()
+    running = func.sum(entries.c.debit - entries.c.credit).over(
+        order_by=(entries.c.date, entries.c.kind, entries.c.payment_id)
+    )
+    ledger = select(entries, running.label('balance')).subquery()
+    query = select(ledger).order_by(ledger.c.date, ledger.c.kind, ledger.c.payment_id)
+    if end is not None:
+        # Окно считается по всей истории во вложенном запросе, снаружи обрезается только конец периода
+        query = query.where(ledger.c.date <= end)
+    rows = conn.execute(query).all()
+
+    opening = 0.0
+    period = []
+    for row in rows:
+        entry = LedgerEntry(*row)
+        if start is not None and entry.date < start:
+            opening = entry.balance
+        else:
+            period.append(entry)
+    return Ledger(contract_id, start, end, opening, period)
@@ -0,0 +1,288 @@
+"""Запросы списков экранов с фильтрами и постраничной загрузкой.
+
+Фильтры экранов (строка поиска, статус, период, диапазон суммы) превращаются
+в условия WHERE по индексированным колонкам, текст ищется через индекс
+полнотекстового поиска search_index, а если он недоступен (SQLite без FTS5) -
+по началу слов в колонках таблиц (GLOB). Страницы выбираются по ключу
+(id > последнего загруженного), поэтому следующая страница стоит столько же,
+сколько первая, независимо от глубины прокрутки.
+
+Lookup - то же для выбора записи в диалогах: страница вариантов (id, подпись)
+по началу слов или номеру, без загрузки всех записей.
+"""
+import re
+
+from sqlalchemy import select, text, or_, and_, literal_column, table, column
+
+from core.database import Contract, Payment, Property, Tenant, ContractBalance
+from core.read_models import ContractRow, PaymentRow, TenantRow, PropertyRow
+from core.search import build_match, search_available
+
+PAGE_SIZE = 200
+
+
+class ListFilter:
+    """Значения фильтров экрана; None - фильтр не задан"""
+
+    def __init__(self, text=None, status=None, date_from=None, date_to=None,
+                 amount_min=None, amount_max=None):
+        self.text = (text or '').strip() or None
+        self.status = status
+        self.date_from = date_from
+        self.date_to = date_to
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+
+    def __eq__(self, other):
+        return isinstance(other, ListFilter) and self.__dict__ == other.__dict__
+
+    def __bool__(self):
+        return any(value is not None for value in self.__dict__.values())
+
+
+# Колонки, по которым ищутся записи без индекса поиска: те же тексты, что в search_index
+_TEXT_SOURCES = {
+    'tenant': (Tenant.id, (), (Tenant.name, Tenant.legal_info, Tenant.contact_info)),
+    'property': (Property.id, (), (Property.name, Property.address, Property.description)),
+    'contract': (Contract.id,
+                 ((Tenant, Tenant.id == Contract.tenant_id), (Property, Property.id == Contract.property_id)),
+                 (Tenant.name, Property.name, Property.address)),
+}
+
+
+# Граница слова для GLOB: любой символ, кроме букв и цифр (как разделители в search_index)
+_WORD_BOUNDARY = '[^0-9A-Za-zЁА-яё]'
+
+
+def _word_prefix(column, word):
+    """Колонка содержит слово, начинающееся с word.
+
+    lower() и LIKE в SQLite не различают регистр только латиницы, поэтому
+    слово ищется в написании как введено, строчными, с заглавной и прописными.
+    """
+    variants = dict.fromkeys((word, word.lower(), word.capitalize(), word.upper()))
+    return or_(*(pattern for variant in variants for pattern in (
+        column.op('GLOB')(f'{variant}*'), column.op('GLOB')(f'*{_WORD_BOUNDARY}{variant}*'))))
+
+
+def _text_ids(kind, query):
+    """Подзапрос id записей типа kind, в колонках которых есть все слова запроса (по началу слова)"""
+    key, joins, columns = _TEXT_SOURCES[kind]
+    statement = select(key)
+    for target, onclause in joins:
+        statement = statement.outerjoin(target, onclause)
+    words = re.findall(r'\w+', query)
+    return statement.where(and_(*(or_(*(_word_prefix(column, word) for column in columns)) for word in words)))
+
+
+def _matching_ids(kind, query, fts=True):
+    """Подзапрос id записей типа kind из индекса полнотекстового поиска или, без него, по колонкам таблиц"""
+    if not fts:
+        return _text_ids(kind, query)
+    return select(literal_column('ref_id')).select_from(text('search_index')).where(
+        text("search_index MATCH :match AND kind = :kind").bindparams(match=build_match(query), kind=kind)
+    )
+
+
+class ListQuery:
+    """Описание списка: колонки, ключ страниц и колонки, к которым применяются фильтры.
+
+    row_type - namedtuple из core.read_models с полями в порядке columns.
+    date_columns - одна колонка (дата попадает в период) или пара (начало, конец):
+    тогда запись подходит, если ее срок пересекается с периодом.
+    fts=False в conditions() и statement() - искать текст без индекса search_index
+    (см. core.search.search_available).
+    """
+
+    def __init__(self, columns, key, row_type, search_kind=None, status_column=None, date_columns=None,
+                 amount_column=None, joins=(), id_search=None):
+        self.columns = columns
+        self.row_type = row_type
+        self.key = key
+        self.search_kind = search_kind
+        self.status_column = status_column
+        self.date_columns = date_columns
+        self.amount_column = amount_column
+        self.joins = joins
+        self.id_search = id_search
+
+    def conditions(self, list_filter, fts=True):
+        conditions = []
+        if list_filter.text and build_match(list_filter.text):
+            text_condition = self.search_condition(list_filter.text, fts)
+            if text_condition is not None:
+                conditions.append(text_condition)
+        if list_filter.status is not None and self.status_column is not None:
+            conditions.append(self.status_column == list_filter.status)
+        if self.date_columns is not None:
+            start, end = (self.date_columns if isinstance(self.date_columns, tuple)
+                          else (self.date_columns, self.date_columns))
+            if list_filter.date_from is not None:
+                conditions.append(end >= list_filter.date_from)
+            if list_filter.date_to is not None:
+                conditions.append(start <= list_filter.date_to)
+        if self.amount_column is not None:
+            if list_filter.amount_min is not None:
+                conditions.append(self.amount_column >= list_filter.amount_min)
+            if list_filter.amount_max is not None:
+                conditions.append(self.amount_column <= list_filter.amount_max)
+        return conditions
+
+    def search_condition(self, query, fts=True):
+        kind, column = self.search_kind
+        condition = column.in_(_matching_ids(kind, query, fts))
+        # Номер записи ("123" или "№123") ищется и напрямую по первичному ключу
+        number = re.fullmatch(r'\s*№?\s*(\d+)\s*', query)
+        if number and self.id_search is not None:
+            condition = or_(condition, self.id_search == int(number.group(1)))
+        return condition
+
+    def statement(self, list_filter=None, after=None, limit=PAGE_SIZE, fts=True):
+        """Страница списка: limit строк с ключом больше after"""
+        statement = select(*self.columns)
+        for target, onclause in self.joins:
+            statement = statement.outerjoin(target, onclause)
+        conditions = self.conditions(list_filter, fts) if list_filter else []
+        if after is not None:
+            conditions.append(self.key > after)
+        if conditions:
+            statement = statement.where(and_(*conditions))
+        return statement.order_by(self.key).limit(limit)
+
+    def fetch_page(self, conn, list_filter=None, after=None, limit=PAGE_SIZE):
+        """(строки, есть ли следующая страница); первая колонка строки - ключ"""
+        rows = conn.execute(self.statement(list_filter, after, limit + 1, search_available(conn))).all()
+        # Строки хранятся в модели, пока открыт экран: namedtuple компактнее Row
+        return [self.row_type._make(row) for row in rows[:limit]], len(rows) > limit
+
+
+CONTRACTS = ListQuery(
+    row_type=ContractRow,
+    columns=(Contract.id, Property.address, Tenant.name, Contract.start_date, Contract.end_date,
+             Contract.rent_amount, Contract.deposit, Contract.status, ContractBalance.balance),
+    key=Contract.id,
+    # Задолженность - одна строка contract_balances по первичному ключу
+    joins=((Property, Property.id == Contract.property_id), (Tenant, Tenant.id == Contract.tenant_id),
+           (ContractBalance, ContractBalance.contract_id == Contract.id)),
+    search_kind=('contract', Contract.id),
+    id_search=Contract.id,
+    status_column=Contract.status,
+    date_columns=(Contract.start_date, Contract.end_date),
+    amount_column=Contract.rent_amount,
+)
+
+PAYMENTS = ListQuery(
+    row_type=PaymentRow,
+    columns=(Payment.id, Payment.contract_id, Payment.amount, Payment.due_date, Payment.payment_date,
+             Payment.status, Payment.description),
+    key=Payment.id,
+    # Платежи ищутся по договору: номер, арендатор, объект
+    search_kind=('contract', Payment.contract_id),
+    id_search=Payment.contract_id,
+    status_column=Payment.status,
+    date_columns=Payment.due_date,
+    amount_column=Payment.amount,
+)
+
+TENANTS = ListQuery(
+    row_type=TenantRow,
+    columns=(Tenant.id, Tenant.name, Tenant.contact_info),
+    key=Tenant.id,
+    search_kind=('tenant', Tenant.id),
+    id_search=Tenant.id,
+)
+
+PROPERTIES = ListQuery(
+    row_type=PropertyRow,
+    columns=(Property.id,),
+    key=Property.id,
+    search_kind=('property', Property.id),
+    status_column=Property.status,
+    amount_column=Property.area,
+)
+
+
+LOOKUP_PAGE_SIZE = 50
+
+
+_search_index = table('search_index', column('rowid'), column('ref_id'), column('kind'))
+
+
+class Lookup:
+    """Варианты выбора записи: id и подпись, поиск по индексу полнотекстового поиска.
+
+    columns - id записи и колонки, из которых format собирает подпись.
+    При поиске записи перебираются в порядке индекса (rowid = id * 8 + код типа,
+    то есть по id), поэтому страница вариантов для общего запроса вроде "ООО"
+    не требует выбрать все совпадения. Без индекса (SQLite без FTS5) записи
+    ищутся по колонкам таблиц, как в списках. Страницы - через limit/offset.
+    """
+
+    def __init__(self, kind, columns, format, joins=()):
+        self.kind = kind
+        self.columns = columns
+        self.format = format
+        self.joins = joins
+
+    @property
+    def key(self):
+        return self.columns[0]
+
+    def _statement(self, conditions, source=None, onclause=None):
+        statement = select(*self.columns)
+        if source is not None:
+            statement = statement.select_from(source).join(self.key.table, onclause)
+        for target, join_on in self.joins:
+            statement = statement.outerjoin(target, join_on)
+        if conditions:
+            statement = statement.where(and_(*conditions))
+        return statement
+
+    def _items(self, rows):
+        return [(row[0], self.format(*row)) for row in rows]
+
+    def fetch(self, conn, query=None, conditions=(), offset=0, limit=LOOKUP_PAGE_SIZE):
+        """([(id, подпись)], есть ли еще) для введенного текста"""
+        match = build_match(query) if query else None
+        if match and search_available(conn):
+            conditions = [
+                text("search_index MATCH :match").bindparams(match=match),
+                _search_index.c.kind == self.kind,
+                *conditions,
+            ]
+            statement = self._statement(conditions, _search_index, self.key == _search_index.c.ref_id)
+            statement = statement.order_by(_search_index.c.rowid)
+        elif match:
+            conditions = [self.key.in_(_text_ids(self.kind, query)), *conditions]
+            statement = self._statement(conditions).order_by(self.key)
+        else:
+            statement = self._statement(conditions).order_by(self.key)
+        rows = conn.execute(statement.offset(offset).limit(limit + 1)).all()
+        return self._items(rows[:limit]), len(rows) > limit
+
+    def fetch_ids(self, conn, ids, conditions=()):
+        """[(id, подпись)] для записей ids в том же порядке; записи, не подходящие под условия, пропускаются"""
+        if not ids:
+            return []
+        items = dict(self._items(conn.execute(self._statement([self.key.in_(ids), *conditions]))))
+        return [(record_id, items[record_id]) for record_id in ids if record_id in items]
+
+
+PROPERTY_LOOKUP = Lookup(
+    'property',
+    columns=(Property.id, Property.name, Property.address),
+    format=lambda id, name, address: " — ".join(part for part in (name, address) if part) or f"Объект №{id}",
+)
+
+TENANT_LOOKUP = Lookup(
+    'tenant',
+    columns=(Tenant.id, Tenant.name),
+    format=lambda id, name: name or f"Арендатор №{id}",
+)
+
+CONTRACT_LOOKUP = Lookup(
+    'contract',
+    columns=(Contract.id, Tenant.name, Property.address),
+    format=lambda id, tenant, address: f"Договор №{id} — {tenant or '—'} ({address or 'объект удален'})",
+    joins=((Property, Property.id == Contract.property_id), (Tenant, Tenant.id == Contract.tenant_id)),
+)
@@ -0,0 +1,185 @@
+"""Обслуживание файла базы SQLite.
+
+- optimize: PRAGMA optimize при закрытии приложения обновляет статистику
+  планировщика для таблиц, по которым были запросы; если статистики еще нет
+  совсем, выполняется ANALYZE. Время сбора ограничено ANALYSIS_LIMIT строк на индекс.
+- incremental_vacuum: возвращает свободные страницы файловой системе порциями
+  по VACUUM_STEP страниц, пока пользователь ничего не делает. Работает только
+  при auto_vacuum = INCREMENTAL: новые базы создаются так сразу, старые
+  переводятся одним полным VACUUM (full_vacuum).
+- quick_check: периодическая проверка структуры файла (без сверки индексов
+  с таблицами, поэтому быстрее integrity_check).
+Каждая операция записывается в db_maintenance_log вместе с размером файла,
+числом страниц и свободных страниц после нее.
+"""
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import OperationalError
+
+from core.database import DatabaseMaintenanceLog
+
+AUTO_VACUUM_INCREMENTAL = 2
+ANALYSIS_LIMIT = 1000
+VACUUM_STEP = 256
+# Доля свободных страниц, при которой в настройках предлагается полный VACUUM
+FREELIST_WARNING = 0.2
+QUICK_CHECK_INTERVAL = 86400  # секунды
+# Сколько секунд без ввода пользователя считается простоем
+IDLE_SECONDS = 120
+
+
+class DatabaseStats:
+    """Размер файла и распределение страниц"""
+    __slots__ = ('file_size', 'page_size', 'page_count', 'freelist_count', 'auto_vacuum', 'tables')
+
+    def __init__(self, file_size, page_size, page_count, freelist_count, auto_vacuum, tables):
+        self.file_size = file_size
+        self.page_size = page_size
+        self.page_count = page_count
+        self.freelist_count = freelist_count
+        self.auto_vacuum = auto_vacuum
+        self.tables = tables  # [(таблица или индекс, страниц, неиспользуемых байт)], если доступен dbstat
+
+    @property
+    def freelist_ratio(self):
+        return self.freelist_count / self.page_count if self.page_count else 0.0
+
+    @property
+    def incremental(self):
+        return self.auto_vacuum == AUTO_VACUUM_INCREMENTAL
+
+    def lines(self):
+        lines = [
+            f"размер файла: {self.file_size / 1024 / 1024:.1f} МБ "
+            f"({self.page_count} страниц по {self.page_size} байт)",
+            f"свободных страниц: {self.freelist_count} ({self.freelist_ratio:.1%})",
+            "инкрементальная очистка: " + ("включена" if self.incremental else "выключена"),
+        ]
+        for name, pages, unused in self.tables:
+            lines.append(f"  {name}: {pages} страниц, не занято {unused / 1024:.0f} КБ")
+        return lines
+
+
+def _pragma(conn, name):
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def _autocommit(engine):
+    # VACUUM не выполняется внутри транзакции, а PRAGMA проще держать вне ее
+    return engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def enable_auto_vacuum(engine):
+    """Включает auto_vacuum = INCREMENTAL для еще пустой базы SQLite"""
+    if engine.dialect.name != 'sqlite':
+        return
+    with _autocommit(engine) as conn:
+        if _pragma(conn, 'page_count') == 0:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+
+
+def database_stats(conn, top=10):
+    """Статистика файла базы; top - сколько самых больших таблиц и индексов перечислить"""
+    database = conn.engine.url.database
+    file_size = os.path.getsize(database) if database and os.path.exists(database) else 0
+    try:
+        tables = conn.exec_driver_sql(
+            "SELECT name, count(*), sum(unused) FROM dbstat WHERE aggregate = FALSE "
+            "GROUP BY name ORDER BY count(*) DESC LIMIT ?", (top,)
+        ).all() if top else []
+    except OperationalError:
+        tables = []  # SQLite собран без SQLITE_ENABLE_DBSTAT_VTAB
+    return DatabaseStats(file_size, _pragma(conn, 'page_size'), _pragma(conn, 'page_count'),
+                         _pragma(conn, 'freelist_count'), _pragma(conn, 'auto_vacuum'),
+                         [tuple(row) for row in tables])
+
+
+def _log(conn, operation, started, result):
+    stats = database_stats(conn, top=0)
+    conn.execute(insert(DatabaseMaintenanceLog).values(
+        operation=operation, started_at=started[0], duration=time.perf_counter() - started[1], result=result,
+        file_size=stats.file_size, page_count=stats.page_count, freelist_count=stats.freelist_count,
+    ))
+    return result
+
+
+def _start():
+    return datetime.now(), time.perf_counter()
+
+
+def optimize(engine):
+    """Обновляет статистику планировщика; возвращает 'analyze' или 'optimize'"""
+    with _autocommit(engine) as conn:
+        started = _start()
+        conn.exec_driver_sql(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        has_stats = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'").first()
+        if has_stats:
+            conn.exec_driver_sql("PRAGMA optimize")
+            operation = 'optimize'
+        else:
+            conn.exec_driver_sql("ANALYZE")
+            operation = 'analyze'
+        return _log(conn, operation, started, operation)
+
+
+def incremental_vacuum(engine, max_pages=None, step=VACUUM_STEP):
+    """Возвращает свободные страницы порциями по step (каждая - своя короткая транзакция).
+
+    max_pages ограничивает объем за один вызов; возвращает число освобожденных страниц.
+    """
+    freed = 0
+    with _autocommit(engine) as conn:
+        if _pragma(conn, 'auto_vacuum') != AUTO_VACUUM_INCREMENTAL:
+            return 0
+        started = _start()
+        free = _pragma(conn, 'freelist_count')
+        while free and (max_pages is None or freed < max_pages):
+            pages = min(step, free) if max_pages is None else min(step, free, max_pages - freed)
+            # sqlite3.execute делает один шаг PRAGMA (одна страница), executescript выполняет ее до конца
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({pages})")
+            remaining = _pragma(conn, 'freelist_count')
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+        if freed:
+            _log(conn, 'incremental_vacuum', started, f"освобождено страниц: {freed}")
+    return freed
+
+
+def full_vacuum(engine):
+    """Полная перепаковка файла; включает инкрементальную очистку. Блокирует базу на время работы"""
+    with _autocommit(engine) as conn:
+        started = _start()
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        return _log(conn, 'vacuum', started, 'ok')
+
+
+def check_integrity(engine, quick=True):
+    """quick_check (или полный integrity_check); возвращает список проблем, пустой - база исправна"""
+    operation = 'quick_check' if quick else 'integrity_check'
+    with _autocommit(engine) as conn:
+        started = _start()
+        rows = [row[0] for row in conn.exec_driver_sql(f"PRAGMA {operation}")]
+        problems = [] if rows == ['ok'] else rows
+        _log(conn, operation, started, 'ok' if not problems else "; ".join(problems)[:500])
+    return problems
+
+
+def last_run(conn, operation):
+    """Время последнего запуска операции или None"""
+    return conn.execute(
+        select(DatabaseMaintenanceLog.started_at).where(DatabaseMaintenanceLog.operation == operation)
+        .order_by(DatabaseMaintenanceLog.id.desc()).limit(1)
+    ).scalar()
+
+
+def maintenance_history(conn, limit=20):
+    return conn.execute(
+        select(DatabaseMaintenanceLog.__table__).order_by(DatabaseMaintenanceLog.id.desc()).limit(limit)
+    ).all()
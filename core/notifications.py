@@ -1,10 +1,20 @@
-from PyQt6.QtCore import QObject, QTimer, pyqtSignal
-from PyQt6.QtWidgets import QSystemTrayIcon, QMenu, QMessageBox
+from PyQt6.QtCore import QObject, QTimer, QEvent, pyqtSignal
+from PyQt6.QtWidgets import QSystemTrayIcon, QMenu, QMessageBox, QApplication
 from PyQt6.QtGui import QIcon
-from core.database import Payment, Contract, Property, PaymentStatus, Maintenance
+from core.database import Payment, Contract, Property, PaymentStatus, ContractStatus, Maintenance
+from core.sweeper import sweep_overdue
+from core.ledger import accrue_balances
+from core.file_gc import collect_garbage
+from core.session_manager import read_session, unit_of_work
+from core.maintenance import (incremental_vacuum, check_integrity, last_run, IDLE_SECONDS, QUICK_CHECK_INTERVAL,
+                              VACUUM_STEP)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.util import identity_key
 from datetime import datetime, timedelta
 import json
 import os
+import time
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -14,14 +24,21 @@ class NotificationManager(QObject):
     payment_reminder = pyqtSignal(str, str)  # title, message
     contract_expiry = pyqtSignal(str, str)   # title, message
     maintenance_reminder = pyqtSignal(str, str)  # title, message
+    payments_overdue = pyqtSignal(object)  # SweepResult - платежи, переведенные в OVERDUE
+    database_problem = pyqtSignal(str, str)  # title, message
 
-    def __init__(self, session):
+    def __init__(self, session, sessions=None):
         super().__init__()
         self.session = session
+        self.sessions = sessions  # SessionManager общей сессии; очищается в простое
         self.settings = self.load_settings()
+        self.last_input = time.monotonic()
+        QApplication.instance().installEventFilter(self)
         self.init_tray()
         self.init_timers()
         self.check_notifications()
+        # Первый перевод просроченных - после запуска цикла событий, когда сигналы уже подключены
+        QTimer.singleShot(0, self.sweep_overdue_payments)
 
     def init_tray(self):
         self.tray = QSystemTrayIcon()
@@ -59,6 +76,106 @@ class NotificationManager(QObject):
         self.maintenance_timer.timeout.connect(self.check_maintenance)
         self.maintenance_timer.start(86400000)  # 24 часа
 
+        # Таймер перевода просроченных платежей в OVERDUE (каждый час)
+        self.overdue_timer = QTimer()
+        self.overdue_timer.timeout.connect(self.sweep_overdue_payments)
+        self.overdue_timer.start(3600000)  # 1 час
+
+        # Таймер поиска файлов без ссылок (раз в день); в карантин - только если включено в настройках
+        self.gc_timer = QTimer()
+        self.gc_timer.timeout.connect(self.collect_file_garbage)
+        self.gc_timer.start(86400000)  # 24 часа
+
+        # Обслуживание файла базы в простое
+        self.db_maintenance_timer = QTimer()
+        self.db_maintenance_timer.timeout.connect(self.idle_database_maintenance)
+        self.db_maintenance_timer.timeout.connect(self.idle_session_cleanup)
+        self.db_maintenance_timer.start(300000)  # 5 минут
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.Type.KeyPress, QEvent.Type.MouseButtonPress, QEvent.Type.Wheel):
+            self.last_input = time.monotonic()
+        return False
+
+    def is_idle(self):
+        return time.monotonic() - self.last_input >= IDLE_SECONDS
+
+    def idle_database_maintenance(self):
+        if not self.is_idle():
+            return
+        engine = self.session.get_bind()
+        try:
+            if incremental_vacuum(engine, max_pages=VACUUM_STEP * 8):
+                # Следующая порция - после обработки накопившихся событий, если пользователь не вернулся
+                QTimer.singleShot(100, self.idle_database_maintenance)
+                return
+            with engine.connect() as conn:
+                checked = last_run(conn, 'quick_check')
+            if self.is_idle() and (checked is None or
+                                   (datetime.now() - checked).total_seconds() >= QUICK_CHECK_INTERVAL):
+                problems = check_integrity(engine)
+                if problems:
+                    self.database_problem.emit(
+                        "Ошибка в базе данных",
+                        "Проверка целостности нашла повреждения. Восстановите базу из резервной копии.\n"
+                        + "\n".join(problems[:5]))
+        except OperationalError as e:
+            # База занята другим процессом - попробуем в следующий раз
+            print(f"Обслуживание базы отложено: {str(e)}")
+
+    def idle_session_cleanup(self):
+        if self.sessions is None:
+            return
+        self.sessions.record_memory()
+        # Пока открыт диалог, он может держать объекты общей сессии с несохраненными правками
+        if self.is_idle() and QApplication.activeModalWidget() is None:
+            self.sessions.trim()
+
+    def sweep_overdue_payments(self):
+        # Своя транзакция: в общей сессии могут быть несохраненные правки открытого диалога
+        try:
+            with self.session.get_bind().begin() as conn:
+                result = sweep_overdue(conn)
+                # После полуночи наступившие сроки графика переходят в задолженность
+                accrue_balances(conn)
+        except OperationalError as e:
+            # База занята записью - переведем в следующий раз
+            print(f"Перевод просроченных платежей отложен: {str(e)}")
+            return
+        if result:
+            self.expire_swept(result)
+            self.payments_overdue.emit(result)
+
+    def expire_swept(self, result):
+        """Помечает устаревшими статусы переведенных платежей, загруженных в общую сессию"""
+        identity_map = self.session.identity_map
+        for payment_id in result.payment_ids:
+            obj = identity_map.get(identity_key(Payment, payment_id))
+            if obj is not None and obj not in self.session.dirty:
+                self.session.expire(obj, ['status', 'updated_at'])
+
+    def auto_file_cleanup(self):
+        return self.settings.get('files', {}).get('auto_cleanup', False)
+
+    def collect_file_garbage(self, move=None):
+        """Ищет файлы без ссылок; возвращает GcReport или None при ошибке.
+
+        По таймеру (move=None) файлы переносятся в карантин, только если это
+        включено в настройках, иначе составляется отчет. move=True - явный запуск
+        кнопкой в настройках.
+        """
+        move = self.auto_file_cleanup() if move is None else move
+        try:
+            with unit_of_work(self.session) as session:
+                report = collect_garbage(session, dry_run=not move)
+        except OSError as e:
+            print(f"Ошибка очистки файлов: {str(e)}")
+            return None
+        if report.orphans:
+            prefix = "Очистка файлов: " if move else "Найдены файлы без ссылок (не перемещены): "
+            print(prefix + "; ".join(report.lines()))
+        return report
+
     def load_settings(self):
         try:
             with open('notification_settings.json', 'r', encoding='utf-8') as f:
@@ -80,6 +197,9 @@ class NotificationManager(QObject):
                     'enable_sound': True,  # включить звуковые уведомления
                     'enable_popup': True,  # включить всплывающие уведомления
                     'enable_email': False  # включить email уведомления
+                },
+                'files': {
+                    'auto_cleanup': False  # ежедневно переносить файлы без ссылок в карантин
                 }
             }
 
@@ -95,124 +215,138 @@ class NotificationManager(QObject):
     def check_payment_reminders(self):
         # Проверяем платежи, срок оплаты которых наступает через 3 дня
         three_days_later = datetime.now().date() + timedelta(days=3)
-        upcoming_payments = self.session.query(Payment).filter(
-            Payment.due_date == three_days_later,
-            Payment.status == PaymentStatus.PENDING
-        ).all()
+        with read_session(self.session) as session:
+            upcoming_payments = session.query(Payment).filter(
+                Payment.due_date == three_days_later,
+                Payment.status == PaymentStatus.PENDING
+            ).all()
 
-        for payment in upcoming_payments:
-            title = "Напоминание об оплате"
-            message = f"Через 3 дня наступает срок оплаты по договору №{payment.contract.id}. " \
-                     f"Сумма: {payment.amount:.2f} ₽"
-            self.payment_reminder.emit(title, message)
+            for payment in upcoming_payments:
+                title = "Напоминание об оплате"
+                message = f"Через 3 дня наступает срок оплаты по договору №{payment.contract_id}. " \
+                         f"Сумма: {payment.amount:.2f} ₽"
+                self.payment_reminder.emit(title, message)
 
     def check_contract_expiry(self):
         # Проверяем договоры, которые истекают через 30 дней
         thirty_days_later = datetime.now().date() + timedelta(days=30)
-        expiring_contracts = self.session.query(Contract).filter(
-            Contract.end_date == thirty_days_later,
-            Contract.status == 'active'
-        ).all()
+        with read_session(self.session) as session:
+            expiring_contracts = session.query(Contract).options(
+                joinedload(Contract.tenant)
+            ).filter(
+                Contract.end_date == thirty_days_later,
+                Contract.status == ContractStatus.ACTIVE
+            ).all()
 
-        for contract in expiring_contracts:
-            title = "Истечение договора"
-            message = f"Договор №{contract.id} с {contract.tenant.name} истекает через 30 дней"
-            self.contract_expiry.emit(title, message)
+            for contract in expiring_contracts:
+                title = "Истечение договора"
+                message = f"Договор №{contract.id} с {contract.tenant.name} истекает через 30 дней"
+                self.contract_expiry.emit(title, message)
 
     def check_maintenance(self):
         # Проверяем необходимость технического обслуживания
-        properties = self.session.query(Property).filter(
-            Property.status == 'maintenance'
-        ).all()
+        with read_session(self.session) as session:
+            properties = session.query(Property).filter(
+                Property.status == 'maintenance'
+            ).all()
 
-        for property in properties:
-            title = "Техническое обслуживание"
-            message = f"Требуется техническое обслуживание объекта: {property.name}"
-            self.maintenance_reminder.emit(title, message)
+            for property in properties:
+                title = "Техническое обслуживание"
+                message = f"Требуется техническое обслуживание объекта: {property.name}"
+                self.maintenance_reminder.emit(title, message)
 
     def check_payments(self):
         today = datetime.now().date()
         
         # Получаем все ожидающие платежи
-        payments = self.session.query(Payment).filter(
-            Payment.status == PaymentStatus.PENDING
-        ).all()
+        with read_session(self.session) as session:
+            payments = session.query(Payment).options(
+                joinedload(Payment.contract).joinedload(Contract.tenant)
+            ).filter(
+                Payment.status == PaymentStatus.PENDING
+            ).all()
 
-        for payment in payments:
-            days_until_due = (payment.due_date - today).days
+            for payment in payments:
+                days_until_due = (payment.due_date - today).days
             
-            # Проверяем, нужно ли отправить напоминание
-            if days_until_due in self.settings['reminders']['payment_days']:
-                message = f"Напоминание: платеж по договору №{payment.contract.id} " \
-                         f"на сумму {payment.amount} руб. должен быть оплачен через {days_until_due} дней"
+                # Проверяем, нужно ли отправить напоминание
+                if days_until_due in self.settings['reminders']['payment_days']:
+                    message = f"Напоминание: платеж по договору №{payment.contract_id} " \
+                             f"на сумму {payment.amount} руб. должен быть оплачен через {days_until_due} дней"
                 
-                # Отправляем уведомление
-                if self.settings['reminders']['enable_popup']:
-                    self.payment_reminder.emit("Напоминание о платеже", message)
+                    # Отправляем уведомление
+                    if self.settings['reminders']['enable_popup']:
+                        self.payment_reminder.emit("Напоминание о платеже", message)
                 
-                # Отправляем email если включено
-                if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
-                    self.send_email(
-                        payment.contract.tenant.contact_info,
-                        "Напоминание о платеже",
-                        message
-                    )
+                    # Отправляем email если включено
+                    if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
+                        self.send_email(
+                            payment.contract.tenant.contact_info,
+                            "Напоминание о платеже",
+                            message
+                        )
 
     def check_contracts(self):
         today = datetime.now().date()
         
         # Получаем все активные договоры
-        contracts = self.session.query(Contract).filter(
-            Contract.status == 'active'
-        ).all()
+        with read_session(self.session) as session:
+            contracts = session.query(Contract).options(
+                joinedload(Contract.tenant)
+            ).filter(
+                Contract.status == ContractStatus.ACTIVE
+            ).all()
 
-        for contract in contracts:
-            days_until_end = (contract.end_date - today).days
+            for contract in contracts:
+                days_until_end = (contract.end_date - today).days
             
-            # Проверяем, нужно ли отправить уведомление
-            if days_until_end in self.settings['reminders']['contract_days']:
-                message = f"Договор №{contract.id} с {contract.tenant.name} " \
-                         f"истекает через {days_until_end} дней"
+                # Проверяем, нужно ли отправить уведомление
+                if days_until_end in self.settings['reminders']['contract_days']:
+                    message = f"Договор №{contract.id} с {contract.tenant.name} " \
+                             f"истекает через {days_until_end} дней"
                 
-                # Отправляем уведомление
-                if self.settings['reminders']['enable_popup']:
-                    self.contract_expiry.emit("Окончание договора", message)
+                    # Отправляем уведомление
+                    if self.settings['reminders']['enable_popup']:
+                        self.contract_expiry.emit("Окончание договора", message)
                 
-                # Отправляем email если включено
-                if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
-                    self.send_email(
-                        contract.tenant.contact_info,
-                        "Окончание договора",
-                        message
-                    )
+                    # Отправляем email если включено
+                    if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
+                        self.send_email(
+                            contract.tenant.contact_info,
+                            "Окончание договора",
+                            message
+                        )
 
     def check_maintenance(self):
         today = datetime.now().date()
         
         # Получаем все запланированные работы
-        maintenance = self.session.query(Maintenance).filter(
-            Maintenance.status == 'planned'
-        ).all()
+        with read_session(self.session) as session:
+            maintenance = session.query(Maintenance).options(
+                joinedload(Maintenance.property)
+            ).filter(
+                Maintenance.status == 'planned'
+            ).all()
 
-        for record in maintenance:
-            days_until_maintenance = (record.date - today).days
+            for record in maintenance:
+                days_until_maintenance = (record.date - today).days
             
-            # Проверяем, нужно ли отправить напоминание
-            if days_until_maintenance in self.settings['reminders']['maintenance_days']:
-                message = f"Напоминание: техобслуживание помещения {record.property.name} " \
-                         f"запланировано через {days_until_maintenance} дней"
+                # Проверяем, нужно ли отправить напоминание
+                if days_until_maintenance in self.settings['reminders']['maintenance_days']:
+                    message = f"Напоминание: техобслуживание помещения {record.property.name} " \
+                             f"запланировано через {days_until_maintenance} дней"
                 
-                # Отправляем уведомление
-                if self.settings['reminders']['enable_popup']:
-                    self.maintenance_reminder.emit("Техобслуживание", message)
+                    # Отправляем уведомление
+                    if self.settings['reminders']['enable_popup']:
+                        self.maintenance_reminder.emit("Техобслуживание", message)
                 
-                # Отправляем email если включено
-                if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
-                    self.send_email(
-                        "admin@example.com",  # Замените на реальный email администратора
-                        "Техобслуживание",
-                        message
-                    )
+                    # Отправляем email если включено
+                    if self.settings['reminders']['enable_email'] and self.settings['email']['enabled']:
+                        self.send_email(
+                            "admin@example.com",  # Замените на реальный email администратора
+                            "Техобслуживание",
+                            message
+                        )
 
     def send_email(self, to_email, subject, message):
         if not self.settings['email']['enabled']:
@@ -0,0 +1,218 @@
+"""Поиск похожих фотографий (пересжатых, уменьшенных копий одного снимка).
+
+Для каждого файла хранятся два 64-битных перцептивных хэша: pHash (знаки
+низкочастотных коэффициентов DCT картинки 32x32) и dHash (перепады яркости
+картинки 9x8). Похожие снимки отличаются в нескольких битах.
+
+Пары ищутся мультииндексом: хэш делится на PHASH_DISTANCE + 1 полос, и у
+двух хэшей с расстоянием не больше PHASH_DISTANCE хотя бы одна полоса
+совпадает. Кандидаты - хэши с одинаковым значением полосы; расстояния внутри
+таких групп считаются векторно в NumPy, так что полный перебор пар не нужен.
+Кандидаты подтверждаются расстоянием dHash.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageOps
+from sqlalchemy import select, exists, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.database import PhotoHash, PropertyPhoto, Property
+
+PHASH_DISTANCE = 6
+DHASH_DISTANCE = 12
+HASH_BATCH = 500
+# Предел элементов матрицы расстояний, считаемой за один раз
+BLOCK_ELEMENTS = 4_000_000
+
+_DCT_SIZE = 32
+_DCT = np.cos(np.pi * (2 * np.arange(_DCT_SIZE)[None, :] + 1) * np.arange(_DCT_SIZE)[:, None] / (2 * _DCT_SIZE))
+_POPCOUNT = np.array([bin(value).count('1') for value in range(1 << 16)], dtype=np.uint8)
+
+
+def _to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def phash(image):
+    pixels = np.asarray(image.convert('L').resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.BOX), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    # Постоянная составляющая (яркость) в медиану не входит
+    return _to_int(low > np.median(low[1:]))
+
+
+def dhash(image):
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hashes(image):
+    """(pHash, dHash) уже открытого изображения"""
+    return phash(image), dhash(image)
+
+
+def file_hashes(path):
+    """(pHash, dHash) файла; JPEG декодируется сразу в уменьшенном виде"""
+    with Image.open(path) as image:
+        image.draft('L', (64, 64))
+        return image_hashes(ImageOps.exif_transpose(image))
+
+
+def _signed(value):
+    # INTEGER в SQLite - знаковое 64-битное число
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def register_hashes(conn, rows):
+    """Сохраняет хэши [(путь, pHash, dHash)]; уже посчитанные не перезаписываются"""
+    if rows:
+        now = datetime.now()
+        conn.execute(sqlite_insert(PhotoHash).on_conflict_do_nothing(), [
+            {'file_path': path, 'phash': _signed(p), 'dhash': _signed(d), 'created_at': now}
+            for path, p, d in rows
+        ])
+
+
+def _hash_file(path):
+    try:
+        return (path, *file_hashes(path))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def update_hashes(session, progress=None, workers=None):
+    """Считает хэши фотографий, у которых их еще нет; возвращает число посчитанных"""
+    paths = session.execute(
+        select(PropertyPhoto.file_path).distinct()
+        .where(PropertyPhoto.file_path.is_not(None),
+               ~exists().where(PhotoHash.file_path == PropertyPhoto.file_path))
+    ).scalars().all()
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for start in range(0, len(paths), HASH_BATCH):
+            batch = paths[start:start + HASH_BATCH]
+            rows = [row for row in executor.map(_hash_file, batch) if row is not None]
+            register_hashes(session.connection(), rows)
+            session.commit()
+            done += len(rows)
+            if progress is not None and progress(start + len(batch), len(paths)) is False:
+                break
+    return done
+
+
+def _popcount(values):
+    return _POPCOUNT[values.view(np.uint16)].reshape(values.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _bands(distance):
+    """Полосы (сдвиг, маска), на которые делится 64-битный хэш"""
+    count = distance + 1
+    widths = [64 // count + (1 if i < 64 % count else 0) for i in range(count)]
+    bands, shift = [], 0
+    for width in widths:
+        bands.append((shift, (1 << width) - 1))
+        shift += width
+    return bands
+
+
+def _close_pairs(hashes, distance):
+    """Пары индексов (i < j) с расстоянием Хэмминга не больше distance"""
+    found = []
+    for shift, mask in _bands(distance):
+        keys = (hashes >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = order[start:end]
+            values = hashes[members]
+            block = max(1, BLOCK_ELEMENTS // len(members))
+            for first in range(0, len(members), block):
+                rows = values[first:first + block]
+                distances = _popcount(rows[:, None] ^ values[None, :])
+                i, j = np.nonzero(distances <= distance)
+                i += first
+                keep = i < j
+                found.append(np.stack([members[i[keep]], members[j[keep]]], axis=1))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.concatenate(found)
+    pairs = np.sort(pairs, axis=1)  # одна пара могла найтись в разных полосах в разном порядке
+    return np.unique(pairs, axis=0)
+
+
+def find_duplicates(conn, phash_distance=PHASH_DISTANCE, dhash_distance=DHASH_DISTANCE):
+    """Группы путей к похожим фотографиям (только к тем, на которые есть ссылки)"""
+    rows = conn.execute(
+        select(PhotoHash.file_path, PhotoHash.phash, PhotoHash.dhash)
+        .where(exists().where(PropertyPhoto.file_path == PhotoHash.file_path))
+        .order_by(PhotoHash.file_path)
+    ).all()
+    if len(rows) < 2:
+        return []
+    paths = [row.file_path for row in rows]
+    phashes = np.array([row.phash for row in rows], dtype=np.int64).view(np.uint64)
+    dhashes = np.array([row.dhash for row in rows], dtype=np.int64).view(np.uint64)
+
+    pairs = _close_pairs(phashes, phash_distance)
+    if len(pairs):
+        pairs = pairs[_popcount(dhashes[pairs[:, 0]] ^ dhashes[pairs[:, 1]]) <= dhash_distance]
+
+    # Объединение пар в группы (система непересекающихся множеств)
+    parent = list(range(len(paths)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.tolist():
+        parent[root(i)] = root(j)
+    groups = {}
+    for i in np.unique(pairs).tolist():
+        groups.setdefault(root(i), []).append(paths[i])
+    return sorted(groups.values(), key=lambda group: (-len(group), group[0]))
+
+
+def photo_usage(conn, paths):
+    """Где используются файлы: {путь: [(id объекта, название)]}"""
+    usage = {path: [] for path in paths}
+    for path, property_id, name in conn.execute(
+            select(PropertyPhoto.file_path, Property.id, Property.name)
+            .join(Property, Property.id == PropertyPhoto.property_id)
+            .where(PropertyPhoto.file_path.in_(list(paths)))
+            .order_by(Property.id)):
+        usage[path].append((property_id, name))
+    return usage
+
+
+def merge_duplicates(session, keep_path, paths):
+    """Перенаправляет фотографии на keep_path; возвращает пути, на которые больше нет ссылок.
+
+    Записи обновляются через ORM, чтобы события хранилища пересчитали ссылки.
+    Если у объекта после объединения две одинаковые фотографии, лишняя удаляется
+    (главная остается).
+    """
+    others = [path for path in paths if path != keep_path]
+    photos = session.query(PropertyPhoto).filter(PropertyPhoto.file_path.in_(others + [keep_path])).order_by(
+        PropertyPhoto.property_id, PropertyPhoto.is_main.desc(), PropertyPhoto.id).all()
+    seen = set()
+    for photo in photos:
+        if photo.property_id in seen:
+            session.delete(photo)
+            continue
+        seen.add(photo.property_id)
+        if photo.file_path != keep_path:
+            photo.file_path = keep_path
+    session.flush()
+    session.execute(delete(PhotoHash).where(PhotoHash.file_path.in_(others)))
+    session.commit()
+    return others
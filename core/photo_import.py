@@ -0,0 +1,147 @@
+"""Пакетный импорт фотографий.
+
+Каждый файл обрабатывается в пуле потоков (Pillow отпускает GIL на
+декодировании, масштабировании и сжатии): поворот по EXIF, уменьшение до
+MAX_SIDE по большей стороне, пересжатие в JPEG без метаданных и миниатюра
+THUMBNAIL_SIDE для списков. Исходный JPEG сохраняется как есть, если он уже
+не больше предела, не требует поворота и пересжатие его не уменьшает.
+Там же считаются перцептивные хэши для поиска похожих снимков. Записи в
+базу добавляются в вызывающем потоке одной транзакцией.
+"""
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image, ImageOps
+
+from core.database import PropertyPhoto
+from core.photo_duplicates import image_hashes, register_hashes
+from core.photo_store import STORE_DIR, THUMBS_DIR, put_stream, put_file, register_blob, thumbnail_path
+
+# Предел большей стороны фотографии после импорта
+MAX_SIDE = 2560
+JPEG_QUALITY = 82
+THUMBNAIL_SIDE = 320
+THUMBNAIL_QUALITY = 80
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+ORIENTATION_TAG = 0x0112
+# Как часто вызывается progress, пока файлы обрабатываются
+PROGRESS_INTERVAL = 0.1
+
+
+class ImportedPhoto:
+    """Результат обработки одного файла; error - текст ошибки, если файл не принят"""
+    __slots__ = ('source', 'digest', 'path', 'size', 'original_size', 'hashes', 'error')
+
+    def __init__(self, source, digest=None, path=None, size=0, original_size=0, hashes=None, error=None):
+        self.source = source
+        self.digest = digest
+        self.path = path
+        self.size = size
+        self.original_size = original_size
+        self.hashes = hashes  # (pHash, dHash)
+        self.error = error
+
+
+def find_images(folder):
+    """Файлы изображений в папке и вложенных папках, по порядку имен"""
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+    return found
+
+
+def _save_thumbnail(image, path, thumbs_dir):
+    target = thumbnail_path(path, thumbs_dir)
+    if os.path.exists(target):
+        return
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=os.path.dirname(target))
+    with os.fdopen(handle, 'wb') as temp:
+        thumbnail.save(temp, 'JPEG', quality=THUMBNAIL_QUALITY)
+    os.replace(temp_path, target)
+
+
+def prepare_photo(source, max_side=MAX_SIDE, quality=JPEG_QUALITY,
+                  store_dir=STORE_DIR, thumbs_dir=THUMBS_DIR):
+    """Обрабатывает файл и кладет результат в хранилище (без записи в базу)"""
+    try:
+        original_size = os.path.getsize(source)
+        with Image.open(source) as image:
+            source_format = image.format
+            source_dimensions = image.size
+            # Для JPEG декодер сразу уменьшает изображение кратно 1/2..1/8
+            image.draft('RGB', (max_side, max_side))
+            transformed = (image.size != source_dimensions
+                           or image.getexif().get(ORIENTATION_TAG, 1) != 1)
+            oriented = ImageOps.exif_transpose(image)
+            if max(oriented.size) > max_side:
+                oriented.thumbnail((max_side, max_side))
+                transformed = True
+            if oriented.mode not in ('RGB', 'L'):
+                if 'A' in oriented.getbands() or oriented.mode == 'P':
+                    # Прозрачность JPEG не поддерживает: подкладываем белый фон
+                    rgba = oriented.convert('RGBA')
+                    oriented = Image.new('RGB', rgba.size, 'white')
+                    oriented.paste(rgba, mask=rgba.getchannel('A'))
+                else:
+                    oriented = oriented.convert('RGB')
+            encoded = io.BytesIO()
+            oriented.save(encoded, 'JPEG', quality=quality, optimize=True, progressive=True,
+                          icc_profile=image.info.get('icc_profile'))
+            if source_format == 'JPEG' and not transformed and original_size <= encoded.tell():
+                digest, path, size = put_file(source, store_dir)
+            else:
+                encoded.seek(0)
+                digest, path, size = put_stream(encoded, '.jpg', store_dir)
+            _save_thumbnail(oriented, path, thumbs_dir)
+            hashes = image_hashes(oriented)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return ImportedPhoto(source, error=str(e) or type(e).__name__)
+    return ImportedPhoto(source, digest, path, size, original_size, hashes)
+
+
+def import_photos(sources, progress=None, workers=None, **options):
+    """Обрабатывает файлы в пуле потоков; возвращает ImportedPhoto в порядке sources.
+
+    progress(готово, всего) вызывается по мере обработки; если он вернул False,
+    необработанные файлы пропускаются, а уже начатые дообрабатываются.
+    """
+    sources = list(sources)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        pending = {executor.submit(prepare_photo, source, **options): i for i, source in enumerate(sources)}
+        waiting = set(pending)
+        while waiting:
+            done, waiting = wait(waiting, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                if not future.cancelled():
+                    results[pending[future]] = future.result()
+            if progress is not None and progress(len(results), len(sources)) is False:
+                for future in waiting:
+                    future.cancel()
+                progress = None
+    return [results[i] for i in sorted(results)]
+
+
+def register_blobs(session, photos):
+    """Записывает файлы хранилища и их хэши по результатам импорта (без commit)"""
+    conn = session.connection()
+    accepted = [photo for photo in photos if photo.error is None]
+    for photo in accepted:
+        register_blob(conn, photo.digest, photo.path, photo.size)
+    register_hashes(conn, [(photo.path, *photo.hashes) for photo in accepted])
+    return accepted
+
+
+def register_photos(session, property_id, photos):
+    """Добавляет в сессию фотографии объекта по результатам импорта (без commit)"""
+    added = [PropertyPhoto(property_id=property_id, file_path=photo.path, description="", is_main=0)
+             for photo in register_blobs(session, photos)]
+    session.add_all(added)
+    return added
@@ -0,0 +1,214 @@
+"""Хранилище фотографий с адресацией по содержимому.
+
+Файл хранится один раз под именем SHA-256 своего содержимого в каталоге
+photos/store/ab/cd/<hash>.<ext> (два уровня по первым символам хэша, чтобы
+в одном каталоге не было десятков тысяч файлов). Записи property_photos
+ссылаются на файл через file_path, несколько записей могут ссылаться на один
+файл. Число ссылок хранится в photo_blobs.refcount и поддерживается событиями
+маппера PropertyPhoto; файл без ссылок удаляется purge_unreferenced() после
+commit транзакции, в которой удалена его запись.
+Хэш считается во время копирования, поэтому исходный файл читается один раз.
+Готовая миниатюра файла (если ее создал импорт) лежит в photos/thumbs под тем же
+хэшем и удаляется вместе с файлом.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import event, select, update, delete, func, inspect, exists
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from core.database import PhotoBlob, PropertyPhoto
+
+STORE_DIR = os.path.join('photos', 'store')
+THUMBS_DIR = os.path.join('photos', 'thumbs')
+CHUNK_SIZE = 1024 * 1024
+# Ключ session.info: файлы, записи которых удалены в текущей транзакции сессии
+_PURGED = 'photo_store.purged'
+
+
+def blob_path(digest, extension, store_dir=STORE_DIR):
+    return os.path.join(store_dir, digest[:2], digest[2:4], f"{digest}{extension}")
+
+
+def thumbnail_path(path, thumbs_dir=THUMBS_DIR):
+    """Путь к готовой миниатюре файла хранилища (файла может не быть)"""
+    digest = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(thumbs_dir, digest[:2], digest[2:4], f"{digest}.jpg")
+
+
+def put_stream(stream, extension, store_dir=STORE_DIR):
+    """Копирует поток в хранилище; возвращает (хэш, путь, размер).
+
+    Данные пишутся во временный файл внутри хранилища и одновременно хэшируются;
+    если такой файл уже есть, временный удаляется, иначе переименовывается.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    handle, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=store_dir)
+    try:
+        with os.fdopen(handle, 'wb') as temp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                temp.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+        path = blob_path(digest, extension.lower(), store_dir)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return digest, path.replace(os.sep, '/'), size
+
+
+def put_file(source, store_dir=STORE_DIR):
+    with open(source, 'rb') as stream:
+        return put_stream(stream, os.path.splitext(source)[1], store_dir)
+
+
+def register_blob(conn, digest, path, size):
+    """Добавляет запись о файле хранилища (без ссылок), если ее еще нет"""
+    conn.execute(sqlite_insert(PhotoBlob).values(
+        hash=digest, file_path=path, size=size, refcount=0, created_at=datetime.now()
+    ).on_conflict_do_nothing())
+
+
+def store_photo(session, source, store_dir=STORE_DIR):
+    """Помещает файл в хранилище; возвращает путь для PropertyPhoto.file_path"""
+    digest, path, size = put_file(source, store_dir)
+    register_blob(session.connection(), digest, path, size)
+    return path
+
+
+def add_photo(session, property_id, source, description="", is_main=0):
+    """Фотография объекта из файла: файл - в хранилище, запись - в сессию"""
+    photo = PropertyPhoto(property_id=property_id, file_path=store_photo(session, source),
+                          description=description, is_main=is_main)
+    session.add(photo)
+    return photo
+
+
+def remove_property_photos(session, property_id):
+    """Удаляет фотографии объекта через ORM, чтобы уменьшились счетчики ссылок; возвращает их файлы"""
+    paths = set()
+    for photo in session.query(PropertyPhoto).filter(PropertyPhoto.property_id == property_id):
+        paths.add(photo.file_path)
+        session.delete(photo)
+    return paths
+
+
+# --- счетчики ссылок ---
+
+def _add_reference(connection, path, delta):
+    if path:
+        connection.execute(update(PhotoBlob).where(PhotoBlob.file_path == path)
+                           .values(refcount=PhotoBlob.refcount + delta))
+
+
+def _previous_path(target):
+    history = inspect(target).attrs.file_path.history
+    return history.deleted[0] if history.deleted else target.file_path
+
+
+# Старый путь нужен в after_update даже после commit()
+event.listen(PropertyPhoto.file_path, 'set', lambda target, value, oldvalue, initiator: value,
+             active_history=True)
+
+
+@event.listens_for(PropertyPhoto, 'after_insert')
+def _photo_inserted(mapper, connection, target):
+    _add_reference(connection, target.file_path, 1)
+
+
+@event.listens_for(PropertyPhoto, 'after_update')
+def _photo_updated(mapper, connection, target):
+    old_path = _previous_path(target)
+    if old_path != target.file_path:
+        _add_reference(connection, old_path, -1)
+        _add_reference(connection, target.file_path, 1)
+
+
+@event.listens_for(PropertyPhoto, 'before_delete')
+def _photo_deleted(mapper, connection, target):
+    _add_reference(connection, _previous_path(target), -1)
+
+
+def rebuild_refcounts(conn):
+    """Пересчитывает ссылки по property_photos (после записи через Core)"""
+    references = (select(func.count()).where(PropertyPhoto.file_path == PhotoBlob.file_path)
+                  .scalar_subquery())
+    conn.execute(update(PhotoBlob).values(refcount=references))
+
+
+def purge_unreferenced(session, paths=None):
+    """Удаляет записи хранилища без ссылок (или только из paths); возвращает освобождаемые байты.
+
+    Транзакцией управляет вызывающий: файлы удаляются после ее commit, а при
+    откате остаются вместе с записями.
+    """
+    # Ссылки проверяются и напрямую: счетчик мог отстать после записи через Core
+    query = select(PhotoBlob.hash, PhotoBlob.file_path, PhotoBlob.size).where(
+        PhotoBlob.refcount <= 0, ~exists().where(PropertyPhoto.file_path == PhotoBlob.file_path)
+    )
+    if paths is not None:
+        query = query.where(PhotoBlob.file_path.in_(list(paths)))
+    freed = 0
+    blobs = session.execute(query).all()
+    purged = session.info.setdefault(_PURGED, [])
+    for digest, path, size in blobs:
+        thumbnail = thumbnail_path(path)
+        if os.path.exists(path):
+            freed += size or 0
+        if os.path.exists(thumbnail):
+            freed += os.path.getsize(thumbnail)
+        purged.extend((path, thumbnail))
+    if blobs:
+        session.execute(delete(PhotoBlob).where(PhotoBlob.hash.in_([blob.hash for blob in blobs])))
+    return freed
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_purged_files(session):
+    for path in session.info.pop(_PURGED, ()):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _keep_purged_files(session, previous_transaction):
+    session.info.pop(_PURGED, None)
+
+
+def import_legacy_photos(session, store_dir=STORE_DIR):
+    """Переносит фотографии, сохраненные до появления хранилища, в хранилище.
+
+    Одинаковые файлы превращаются в один; исходные копии удаляются.
+    Возвращает (перенесено записей, освобождено байт).
+    """
+    store_prefix = store_dir.replace(os.sep, '/') + '/'
+    stored_bytes = select(func.coalesce(func.sum(PhotoBlob.size), 0))
+    before = session.execute(stored_bytes).scalar()
+    photos = session.query(PropertyPhoto).filter(~PropertyPhoto.file_path.startswith(store_prefix)).all()
+    moved = 0
+    old_files = set()
+    for photo in photos:
+        if not photo.file_path or not os.path.exists(photo.file_path):
+            continue
+        old_files.add(photo.file_path)
+        photo.file_path = store_photo(session, photo.file_path, store_dir)
+        moved += 1
+    session.commit()
+    freed = 0
+    for path in old_files:
+        freed += os.path.getsize(path)
+        os.remove(path)
+    # Новые файлы хранилища вычитаются: освобождено место только за счет дублей
+    return moved, freed - (session.execute(stored_bytes).scalar() - before)
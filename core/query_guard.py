@@ -0,0 +1,63 @@
+"""Защита от N+1: ограничение количества SQL-запросов и строгий режим загрузки связей"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, raiseload
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Операция выполнила больше запросов, чем разрешено"""
+
+
+class QueryLog:
+    """Список запросов, выполненных внутри assert_max_queries()"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def assert_max_queries(bind, limit, label="операция"):
+    """Падает с QueryBudgetExceeded, если блок выполнил больше limit запросов.
+
+    bind - движок, соединение или сессия.
+    """
+    engine = bind.get_bind() if isinstance(bind, Session) else bind
+    log = QueryLog()
+    event.listen(engine, 'before_cursor_execute', log)
+    try:
+        yield log
+    finally:
+        event.remove(engine, 'before_cursor_execute', log)
+    if len(log) > limit:
+        statements = "\n".join(f"  {s.splitlines()[0]}" for s in log.statements[:10])
+        raise QueryBudgetExceeded(
+            f"{label}: выполнено {len(log)} запросов при лимите {limit}\n{statements}"
+        )
+
+
+def _raise_on_lazy_load(orm_execute_state):
+    if orm_execute_state.is_select and not orm_execute_state.is_column_load:
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*'))
+
+
+def enable_strict_loading(session_factory):
+    """Режим разработки: любая неявная ленивая загрузка связи вызывает ошибку.
+
+    Эквивалент lazy='raise' для всех связей (Contract.tenant, Payment.contract,
+    Property.contracts, Maintenance.property и т.д.). Явные joinedload/selectinload
+    в запросах продолжают работать.
+    """
+    if not event.contains(session_factory, 'do_orm_execute', _raise_on_lazy_load):
+        event.listen(session_factory, 'do_orm_execute', _raise_on_lazy_load)
+
+
+def disable_strict_loading(session_factory):
+    if event.contains(session_factory, 'do_orm_execute', _raise_on_lazy_load):
+        event.remove(session_factory, 'do_orm_execute', _raise_on_lazy_load)
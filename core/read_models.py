@@ -0,0 +1,106 @@
+"""Строки для отображения списков без объектов ORM.
+
+Списку нужны несколько колонок, а объект ORM несет состояние сессии,
+инструментирование атрибутов и связи: на строку платежа это около 1.3 КБ
+против ~0.35 КБ у namedtuple с теми же значениями. Поэтому списки выбирают
+только нужные колонки в namedtuple (без __dict__), а подписи вроде
+"Договор №12 с ..." собираются при отрисовке - свойствами строки или
+функциями форматирования колонок в data() модели, а не при загрузке.
+"""
+from collections import namedtuple
+from operator import attrgetter
+
+from sqlalchemy import select
+
+from core.database import Contract, Payment, Tenant, Property, Maintenance, InventoryItem
+
+# Строки списков core.list_queries: первая колонка - id, она же ключ страниц
+ContractRow = namedtuple('ContractRow', 'id address tenant_name start_date end_date rent_amount deposit status balance')
+PaymentRow = namedtuple('PaymentRow', 'id contract_id amount due_date payment_date status description')
+TenantRow = namedtuple('TenantRow', 'id name contact_info')
+PropertyRow = namedtuple('PropertyRow', 'id')
+
+RentalHistoryRow = namedtuple('RentalHistoryRow', 'id start_date end_date tenant_name rent_amount status')
+InventoryRow = namedtuple('InventoryRow', 'id name description quantity condition notes')
+
+
+class ContractEndEvent(namedtuple('ContractEndEvent', 'date contract_id tenant_name')):
+    __slots__ = ()
+    type = 'contract_end'
+
+    @property
+    def title(self):
+        return f"Окончание договора №{self.contract_id}"
+
+    @property
+    def description(self):
+        return f"Договор с {self.tenant_name or '—'} заканчивается"
+
+
+class PaymentDueEvent(namedtuple('PaymentDueEvent', 'date contract_id amount')):
+    """contract_id is None - договор платежа удален"""
+    __slots__ = ()
+    type = 'payment_due'
+
+    @property
+    def title(self):
+        if self.contract_id is None:
+            return "Срок оплаты (договор удален)"
+        return f"Срок оплаты по договору №{self.contract_id}"
+
+    @property
+    def description(self):
+        return f"Сумма: {self.amount:.2f} ₽"
+
+
+class MaintenanceEvent(namedtuple('MaintenanceEvent', 'date property_name description')):
+    __slots__ = ()
+    type = 'maintenance'
+
+    @property
+    def title(self):
+        return f"Техническое обслуживание: {self.property_name or 'объект удален'}"
+
+
+def calendar_events(conn, start_date, end_date):
+    """События календаря за период (три запроса), упорядоченные по дате.
+
+    Внутри одной даты сначала окончания договоров, затем сроки оплаты и техобслуживание.
+    """
+    events = [ContractEndEvent._make(row) for row in conn.execute(
+        select(Contract.end_date, Contract.id, Tenant.name)
+        .outerjoin(Tenant, Tenant.id == Contract.tenant_id)
+        .where(Contract.end_date.between(start_date, end_date))
+    )]
+    events += [PaymentDueEvent._make(row) for row in conn.execute(
+        select(Payment.due_date, Contract.id, Payment.amount)
+        .outerjoin(Contract, Contract.id == Payment.contract_id)
+        .where(Payment.due_date.between(start_date, end_date))
+    )]
+    events += [MaintenanceEvent._make(row) for row in conn.execute(
+        select(Maintenance.date, Property.name, Maintenance.description)
+        .outerjoin(Property, Property.id == Maintenance.property_id)
+        .where(Maintenance.date.between(start_date, end_date))
+    )]
+    # Сортировка стабильна: внутри одной даты порядок типов событий сохраняется
+    events.sort(key=attrgetter('date'))
+    return events
+
+
+def rental_history(conn, property_id):
+    return [RentalHistoryRow._make(row) for row in conn.execute(
+        select(Contract.id, Contract.start_date, Contract.end_date, Tenant.name, Contract.rent_amount,
+               Contract.status)
+        .outerjoin(Tenant, Tenant.id == Contract.tenant_id)
+        .where(Contract.property_id == property_id)
+        .order_by(Contract.id)
+    )]
+
+
+def inventory(conn, property_id):
+    return [InventoryRow._make(row) for row in conn.execute(
+        select(InventoryItem.id, InventoryItem.name, InventoryItem.description, InventoryItem.quantity,
+               InventoryItem.condition, InventoryItem.notes)
+        .where(InventoryItem.property_id == property_id)
+        .order_by(InventoryItem.id)
+    )]
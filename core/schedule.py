@@ -0,0 +1,262 @@
+"""График ежемесячных платежей по договорам.
+
+График строится векторно сразу для любого числа договоров: периоды всех
+договоров разворачиваются в плоские массивы NumPy, даты и суммы считаются
+без циклов по месяцам. Новые графики записываются одной пакетной вставкой,
+а при изменении договора пересчитанный график применяется как разница
+с уже созданными неоплаченными платежами. Оплаченные платежи не меняются.
+
+Платежи графика помечены флагом payments.scheduled и сопоставляются с
+базой по месяцу срока оплаты: месяц, в котором у договора уже есть
+оплаченный платеж или платеж, внесенный не графиком (вручную, импортом),
+повторно не начисляется. У расторгнутых договоров (TERMINATED) в графике
+остаются только сроки до сегодняшнего дня. День окончания договора нового
+периода не начинает: договор с 15.01.2024 по 15.01.2025 - это 12 платежей.
+"""
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, insert, update, delete, bindparam
+
+from core.database import Contract, Payment, PaymentSchedule, PaymentStatus, ContractStatus
+from core.ledger import rebuild_balances
+
+SCHEDULE_DESCRIPTION = "Ежемесячный платеж"
+BILLING_ANNIVERSARY = 'anniversary'
+BILLING_CALENDAR = 'calendar'
+
+
+class Schedule:
+    """Плоский график: i-й платеж - contract_ids[i], due_dates[i], amounts[i].
+
+    Платежи упорядочены по договору, внутри договора - по сроку оплаты.
+    """
+
+    def __init__(self, contract_ids, due_dates, amounts):
+        self.contract_ids = contract_ids
+        self.due_dates = due_dates
+        self.amounts = amounts
+
+    def __len__(self):
+        return len(self.contract_ids)
+
+    def select(self, keep):
+        """График из платежей, отмеченных в булевом массиве keep"""
+        return Schedule(self.contract_ids[keep], self.due_dates[keep], self.amounts[keep])
+
+    def month_keys(self):
+        return _month_keys(self.contract_ids, self.due_dates)
+
+    def without_months(self, keys):
+        """График без платежей, чьи (договор, месяц) уже заняты; keys - из _month_keys"""
+        return self.select(~np.isin(self.month_keys(), np.fromiter(keys, dtype=np.int64)))
+
+    def for_contract(self, contract_id):
+        mask = self.contract_ids == contract_id
+        return list(zip(self.due_dates[mask].tolist(), self.amounts[mask].tolist()))
+
+    def records(self):
+        """Строки для вставки в payments"""
+        months = np.datetime_as_string(self.due_dates, unit='M')
+        return [{
+            'contract_id': contract_id,
+            'amount': amount,
+            'due_date': due_date,
+            'status': PaymentStatus.PENDING,
+            'description': _description(month),
+            'scheduled': 1,
+        } for contract_id, amount, due_date, month in zip(
+            self.contract_ids.tolist(), self.amounts.tolist(), self.due_dates.tolist(), months)]
+
+
+def _description(month):
+    # month - 'ГГГГ-ММ'
+    return f"{SCHEDULE_DESCRIPTION} за {month[5:7]}.{month[:4]}"
+
+
+def _month_keys(contract_ids, due_dates):
+    """Ключ (договор, месяц срока оплаты) одним целым числом"""
+    months = np.asarray(due_dates, dtype='M8[D]').astype('M8[M]').astype(np.int64)
+    return np.asarray(contract_ids, dtype=np.int64) * 100000 + months
+
+
+def _month_key(contract_id, due_date):
+    return int(_month_keys([contract_id], [due_date])[0])
+
+
+def _due_in_month(months, day_offsets):
+    """Дата в месяце со смещением от 1-го числа, не дальше последнего дня месяца"""
+    first = months.astype('M8[D]')
+    days_in_month = ((months + 1).astype('M8[D]') - first).astype(np.int64)
+    return first + np.minimum(day_offsets, days_in_month - 1).astype('m8[D]')
+
+
+def _expand(counts):
+    """Индекс договора и номер периода для каждого платежа"""
+    counts = np.maximum(counts, 0)
+    index = np.repeat(np.arange(len(counts)), counts)
+    period = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return index, period
+
+
+def build_schedule(contract_ids, start_dates, end_dates, rents, indexation=0.0,
+                   billing=BILLING_ANNIVERSARY, prorate=True):
+    """Считает графики платежей для массива договоров.
+
+    billing - 'anniversary' (платеж в число начала договора) или 'calendar'
+    (первый платеж в дату начала, далее 1-го числа). При prorate неполные периоды
+    оплачиваются пропорционально дням. indexation - ежегодный рост ставки,
+    применяется с каждой годовщины договора. Параметры после rents принимают
+    как скаляр, так и массив по договорам.
+    """
+    contract_ids = np.asarray(contract_ids, dtype=np.int64)
+    start = np.asarray(start_dates, dtype='M8[D]')
+    end = np.asarray(end_dates, dtype='M8[D]')
+    rents = np.asarray(rents, dtype=np.float64)
+    size = len(contract_ids)
+    indexation = np.broadcast_to(np.asarray(indexation, dtype=np.float64), (size,))
+    calendar = np.broadcast_to(np.asarray(billing) == BILLING_CALENDAR, (size,))
+    prorate = np.broadcast_to(np.asarray(prorate, dtype=bool), (size,))
+
+    start_month = start.astype('M8[M]')
+    day_offset = (start - start_month.astype('M8[D]')).astype(np.int64)
+    months = (end.astype('M8[M]') - start_month).astype(np.int64)
+
+    # Число периодов: календарные месяцы или годовщины, попадающие в срок договора.
+    # Период, который начался бы в день окончания, не считается: иначе договор
+    # "на год" (по ту же дату следующего года) получает 13-й платеж за один день
+    last_start = np.where(calendar, end.astype('M8[M]').astype('M8[D]'),
+                          _due_in_month(end.astype('M8[M]'), day_offset))
+    counts = months + 1 - (last_start > end) - ((last_start == end) & (months > 0))
+    counts[end < start] = 0
+    index, period = _expand(counts)
+
+    month = start_month[index] + period.astype('m8[M]')
+    offset = day_offset[index]
+    is_calendar = calendar[index]
+    first_day = month.astype('M8[D]')
+
+    # Для помесячной оплаты период - календарный месяц, обрезанный сроком договора
+    period_start = np.where(is_calendar, np.maximum(first_day, start[index]), _due_in_month(month, offset))
+    next_start = np.where(is_calendar, (month + 1).astype('M8[D]'), _due_in_month(month + 1, offset))
+    period_end = np.minimum(next_start - np.timedelta64(1, 'D'), end[index])
+    full_length = np.where(is_calendar, (next_start - first_day), (next_start - period_start)).astype(np.int64)
+    share = (period_end - period_start).astype(np.int64) + 1
+    factor = np.where(prorate[index], share / full_length, 1.0)
+
+    # Индексация начинается с периода, который начинается после годовщины договора
+    years = np.where(is_calendar, (period - (offset > 0)) // 12, period // 12)
+    years = np.maximum(years, 0)
+    amounts = np.round(rents[index] * (1 + indexation[index]) ** years * factor, 2)
+    return Schedule(contract_ids[index], period_start, amounts)
+
+
+def _schedule_inputs(conn, contract_ids=None):
+    """Параметры договоров и их графиков одним запросом"""
+    query = select(
+        Contract.id, Contract.start_date, Contract.end_date, Contract.rent_amount, Contract.status,
+        PaymentSchedule.billing, PaymentSchedule.prorate, PaymentSchedule.indexation
+    ).outerjoin(PaymentSchedule, PaymentSchedule.contract_id == Contract.id).where(
+        Contract.start_date.isnot(None), Contract.end_date.isnot(None)
+    )
+    if contract_ids is not None:
+        query = query.where(Contract.id.in_(list(contract_ids)))
+    return conn.execute(query).all()
+
+
+def schedule_for(conn, contract_ids=None, today=None):
+    """Строит графики для договоров из базы (все договоры, если contract_ids не заданы).
+
+    Для расторгнутых договоров сроки после today (по умолчанию сегодня) отбрасываются.
+    """
+    rows = _schedule_inputs(conn, contract_ids)
+    if not rows:
+        return Schedule(np.array([], dtype=np.int64), np.array([], dtype='M8[D]'), np.array([]))
+    ids, starts, ends, rents, statuses, billing, prorate, indexation = zip(*rows)
+    schedule = build_schedule(
+        ids, starts, ends, [rent or 0.0 for rent in rents],
+        indexation=[rate or 0.0 for rate in indexation],
+        billing=[mode or BILLING_ANNIVERSARY for mode in billing],
+        prorate=[True if flag is None else bool(flag) for flag in prorate],
+    )
+    terminated = [contract_id for contract_id, status in zip(ids, statuses) if status == ContractStatus.TERMINATED]
+    if terminated:
+        future = np.isin(schedule.contract_ids, terminated) & \
+            (schedule.due_dates > np.datetime64(today or date.today(), 'D'))
+        schedule = schedule.select(~future)
+    return schedule
+
+
+def _payments(conn, contract_ids=None):
+    query = select(Payment.id, Payment.contract_id, Payment.due_date, Payment.amount, Payment.status,
+                   Payment.payment_date, Payment.scheduled).where(Payment.due_date.isnot(None))
+    if contract_ids is not None:
+        query = query.where(Payment.contract_id.in_(list(contract_ids)))
+    return conn.execute(query).all()
+
+
+def generate_payments(conn, contract_ids=None, today=None):
+    """Создает платежи графиков за месяцы, в которых у договора еще нет платежей. Возвращает их число"""
+    # Занятые месяцы выбираются одним проходом по payments, без коррелированного подзапроса
+    occupied = {_month_key(row.contract_id, row.due_date) for row in _payments(conn, contract_ids)
+                if row.contract_id is not None}
+    schedule = schedule_for(conn, contract_ids, today).without_months(occupied)
+    if len(schedule):
+        conn.execute(insert(Payment), schedule.records())
+        rebuild_balances(conn, np.unique(schedule.contract_ids).tolist())
+    return len(schedule)
+
+
+def regenerate_schedule(conn, contract_ids, today=None):
+    """Пересчитывает графики и применяет разницу к неоплаченным платежам.
+
+    Платежи сопоставляются по месяцу срока оплаты: у совпавших неоплаченных
+    платежей графика меняются сумма и дата, лишние неоплаченные удаляются,
+    недостающие добавляются. Месяцы с оплаченным платежом или платежом не из
+    графика не трогаются. Возвращает (добавлено, изменено, удалено).
+    """
+    contract_ids = list(contract_ids)
+    schedule = schedule_for(conn, contract_ids, today)
+
+    occupied = set()
+    open_payments = {}
+    surplus = []  # повторные неоплаченные платежи графика за один месяц
+    for row in _payments(conn, contract_ids):
+        key = _month_key(row.contract_id, row.due_date)
+        if not row.scheduled or row.status == PaymentStatus.PAID or row.payment_date is not None:
+            occupied.add(key)
+        elif key in open_payments:
+            surplus.append(row.id)
+        else:
+            open_payments[key] = (row.id, row.due_date, row.amount)
+    # Открытый платеж графика в месяце, который уже занят другим платежом, - дубль
+    for key in occupied & open_payments.keys():
+        surplus.append(open_payments.pop(key)[0])
+
+    inserts, updates = [], []
+    for key, record in zip(schedule.month_keys().tolist(), schedule.records()):
+        if key in occupied:
+            continue
+        current = open_payments.pop(key, None)
+        if current is None:
+            inserts.append(record)
+        elif current[1] != record['due_date'] or abs(current[2] - record['amount']) >= 0.005:
+            updates.append({'payment_id': current[0], 'new_amount': record['amount'],
+                            'new_due_date': record['due_date'], 'new_description': record['description']})
+    removed = surplus + [payment_id for payment_id, _, _ in open_payments.values()]
+
+    if inserts:
+        conn.execute(insert(Payment), inserts)
+    if updates:
+        conn.execute(
+            update(Payment).where(Payment.id == bindparam('payment_id'))
+            .values(amount=bindparam('new_amount'), due_date=bindparam('new_due_date'),
+                    description=bindparam('new_description'))
+            .execution_options(synchronize_session=False),
+            updates
+        )
+    if removed:
+        conn.execute(delete(Payment).where(Payment.id.in_(removed)))
+    if inserts or updates or removed:
+        rebuild_balances(conn, contract_ids)
+    return len(inserts), len(updates), len(removed)
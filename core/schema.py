@@ -0,0 +1,85 @@
+"""Версия схемы базы и миграции.
+
+Схема описана миграциями Alembic в migrations/ (0001 - исходная схема,
+которую раньше создавал create_all при каждом запуске). Номер последней
+миграции дублируется в PRAGMA user_version файла базы: при обычном запуске
+ensure_schema читает одно число из заголовка файла и не обращается ни к
+Alembic, ни к sqlite_master. Миграции запускаются, только если версия
+базы меньше SCHEMA_VERSION.
+
+Данные мигрируются порциями (update_in_chunks): каждая порция - отдельная
+короткая транзакция, условие отбора делает повторный запуск безопасным.
+"""
+import os
+
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+# Номер последней миграции в migrations/versions; увеличивается вместе с каждой новой миграцией
+SCHEMA_VERSION = 6
+MIGRATION_CHUNK = 5000
+
+
+class SchemaError(Exception):
+    pass
+
+
+def schema_version(conn):
+    """Версия схемы из заголовка файла SQLite"""
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def update_in_chunks(conn, table, assignments, condition, label, chunk_size=MIGRATION_CHUNK, progress=None):
+    """UPDATE table SET assignments WHERE condition порциями по диапазонам id.
+
+    Соединение должно быть в режиме autocommit (op.get_context().autocommit_block()),
+    тогда каждая порция фиксируется сразу. progress(label, сделано, всего) вызывается
+    после каждой порции. Возвращает число измененных строк.
+    """
+    low, high = conn.execute(text(f"SELECT min(id), max(id) FROM {table}")).one()
+    if low is None:
+        return 0
+    updated = 0
+    total = high - low + 1
+    for start in range(low, high + 1, chunk_size):
+        updated += conn.execute(text(
+            f"UPDATE {table} SET {assignments} WHERE id >= :start AND id < :end AND ({condition})"
+        ), {'start': start, 'end': start + chunk_size}).rowcount
+        if progress is not None:
+            progress(label, min(start + chunk_size - low, total), total)
+    return updated
+
+
+def ensure_schema(engine, progress=None, archive=False):
+    """Доводит схему базы до SCHEMA_VERSION; возвращает True, если миграции запускались.
+
+    progress(этап, сделано, всего) получает ход миграций данных. archive=True -
+    файл архива (core.archive): в нем не создается индекс поиска.
+    """
+    sqlite = engine.dialect.name == 'sqlite'
+    if sqlite:
+        with engine.connect() as conn:
+            version = schema_version(conn)
+        if version == SCHEMA_VERSION:
+            return False
+        if version > SCHEMA_VERSION:
+            raise SchemaError(f"База создана более новой версией программы (схема {version}, "
+                              f"поддерживается {SCHEMA_VERSION})")
+        # Новая база сразу создается с инкрементальной очисткой свободных страниц
+        from core.maintenance import enable_auto_vacuum
+        enable_auto_vacuum(engine)
+
+    # Alembic нужен только при обновлении схемы
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    config.set_main_option('sqlalchemy.url', engine.url.render_as_string(hide_password=False).replace('%', '%%'))
+    with engine.connect() as conn:
+        config.attributes.update(connection=conn, progress=progress, archive=archive)
+        command.upgrade(config, 'head')
+        if sqlite:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    return True
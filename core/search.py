@@ -0,0 +1,288 @@
+"""Полнотекстовый поиск по арендаторам, объектам, договорам и документам.
+
+Индекс - виртуальная таблица SQLite FTS5 search_index, одна строка на запись
+любой сущности. rowid кодирует тип и id записи, поэтому триггеры в базе
+обновляют индекс точечно при любой записи (через ORM, импорт или вручную),
+а поиск по префиксам слов с ранжированием bm25 идет только по индексу.
+Строка договора содержит имя арендатора и название объекта, поэтому
+переименование арендатора или объекта переиндексирует и его договоры.
+
+unicode61 не сводит ё к е, поэтому индексируются title и body с ё,
+замененной на е (так же приводится запрос), а для показа хранятся исходные
+title_text и body_text без индекса. Замена посимвольная, поэтому фрагмент,
+найденный snippet() в приведенном тексте, берется из исходного по тем же позициям.
+"""
+import re
+import weakref
+
+from sqlalchemy import text, Engine
+from sqlalchemy.exc import OperationalError
+
+# Тип записи -> код в rowid (rowid = id * 8 + код)
+KINDS = {
+    'tenant': 1,
+    'property': 2,
+    'contract': 3,
+    'document': 4,
+}
+KIND_LABELS = {
+    'tenant': "Арендатор",
+    'property': "Объект",
+    'contract': "Договор",
+    'document': "Документ",
+}
+DEFAULT_LIMIT = 50
+# Больше совпадений не ранжируются: bm25 по сотням тысяч строк занимает секунды
+RANKED_LIMIT = 1000
+# Вес совпадения в заголовке относительно текста; неиндексируемые колонки не учитываются
+_WEIGHTS = "10.0, 1.0, 0.0, 0.0, 0.0, 0.0"
+
+_CREATE_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, body, kind UNINDEXED, ref_id UNINDEXED, title_text UNINDEXED, body_text UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+# Границы совпадения и пропуск во фрагменте snippet(): символы, которых нет в тексте
+_MARKS = {'\x02': '[', '\x03': ']', '\x1f': '…'}
+
+# Строки индекса для каждого типа: (id записи, заголовок, текст, FROM ...)
+_SOURCES = {
+    'tenant': (
+        "t.id", "coalesce(t.name, '')",
+        "coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, '')",
+        "FROM tenants t",
+    ),
+    'property': (
+        "p.id", "coalesce(p.name, '')",
+        "coalesce(p.address, '') || ' ' || coalesce(p.description, '')",
+        "FROM properties p",
+    ),
+    'contract': (
+        "c.id", "'Договор №' || c.id",
+        "coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '')",
+        "FROM contracts c LEFT JOIN tenants t ON t.id = c.tenant_id "
+        "LEFT JOIN properties p ON p.id = c.property_id",
+    ),
+    'document': (
+        "d.id", "'Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, '')",
+        "coalesce(d.description, '') || ' ' || coalesce(d.file_path, '')",
+        "FROM documents d",
+    ),
+}
+# Доступность индекса по движкам: проверяется один раз при открытии базы (init_db)
+_available = weakref.WeakKeyDictionary()
+_INSERT = "INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text) "
+
+
+def _fold(expression):
+    # Только для индексируемых колонок: показывается исходный текст
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fold_text(value):
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def _rows(kind, where):
+    """INSERT строк индекса для записей типа kind, подходящих под условие where"""
+    ref_id, title, body, source = _SOURCES[kind]
+    return (f"{_INSERT}SELECT rowid_, {_fold('title_')}, {_fold('body_')}, '{kind}', ref_id_, title_, body_ "
+            f"FROM (SELECT {ref_id} * 8 + {KINDS[kind]} AS rowid_, {ref_id} AS ref_id_, "
+            f"{title} AS title_, {body} AS body_ {source} WHERE {where})")
+
+
+def _reindex(kind, where, rowids):
+    """Тело триггера: удалить строки индекса rowids и вставить заново по условию where"""
+    return (f"DELETE FROM search_index WHERE rowid IN ({rowids});\n"
+            f"{_rows(kind, where)};")
+
+
+_TRIGGERS = {
+    # Арендаторы: своя строка и строки договоров арендатора
+    'search_tenants_ai': f"""AFTER INSERT ON tenants BEGIN
+        {_rows('tenant', 't.id = new.id')};
+    END""",
+    'search_tenants_au': f"""AFTER UPDATE OF name, legal_info, contact_info ON tenants BEGIN
+        {_reindex('tenant', 't.id = new.id', 'old.id * 8 + 1')}
+        {_reindex('contract', 'c.tenant_id = new.id', 'SELECT id * 8 + 3 FROM contracts WHERE tenant_id = new.id')}
+    END""",
+    'search_tenants_ad': """AFTER DELETE ON tenants BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 1;
+    END""",
+    # Объекты: своя строка и строки договоров по объекту
+    'search_properties_ai': f"""AFTER INSERT ON properties BEGIN
+        {_rows('property', 'p.id = new.id')};
+    END""",
+    'search_properties_au': f"""AFTER UPDATE OF name, address, description ON properties BEGIN
+        {_reindex('property', 'p.id = new.id', 'old.id * 8 + 2')}
+        {_reindex('contract', 'c.property_id = new.id',
+                  'SELECT id * 8 + 3 FROM contracts WHERE property_id = new.id')}
+    END""",
+    'search_properties_ad': """AFTER DELETE ON properties BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 2;
+    END""",
+    'search_contracts_ai': f"""AFTER INSERT ON contracts BEGIN
+        {_rows('contract', 'c.id = new.id')};
+    END""",
+    'search_contracts_au': f"""AFTER UPDATE OF tenant_id, property_id ON contracts BEGIN
+        {_reindex('contract', 'c.id = new.id', 'old.id * 8 + 3')}
+    END""",
+    'search_contracts_ad': """AFTER DELETE ON contracts BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 3;
+    END""",
+    'search_documents_ai': f"""AFTER INSERT ON documents BEGIN
+        {_rows('document', 'd.id = new.id')};
+    END""",
+    'search_documents_au': f"""AFTER UPDATE OF type, contract_id, description, file_path ON documents BEGIN
+        {_reindex('document', 'd.id = new.id', 'old.id * 8 + 4')}
+    END""",
+    'search_documents_ad': """AFTER DELETE ON documents BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 4;
+    END""",
+}
+
+
+class SearchHit:
+    __slots__ = ('kind', 'ref_id', 'title', 'snippet', 'rank')
+
+    def __init__(self, kind, ref_id, title, snippet, rank):
+        self.kind = kind
+        self.ref_id = ref_id
+        self.title = title
+        self.snippet = snippet
+        self.rank = rank
+
+    @property
+    def label(self):
+        return KIND_LABELS.get(self.kind, self.kind)
+
+
+def rebuild_search_index(conn):
+    """Полностью перестраивает индекс по текущим данным"""
+    conn.execute(text("DELETE FROM search_index"))
+    for kind in KINDS:
+        conn.execute(text(_rows(kind, '1')))
+    # Слияние сегментов после массовой вставки ускоряет последующие запросы
+    conn.execute(text("INSERT INTO search_index(search_index) VALUES ('optimize')"))
+
+
+def _index_readable(conn):
+    try:
+        conn.execute(text("SELECT rowid FROM search_index LIMIT 0"))
+    except OperationalError:
+        return False
+    return True
+
+
+def search_available(bind):
+    """Можно ли искать по search_index: индекс создан и SQLite собран с FTS5.
+
+    bind - движок или соединение. База, созданная без FTS5, не имеет индекса,
+    а база с индексом, открытая SQLite без FTS5, не может его читать; в обоих
+    случаях списки и выбор записей ищут по колонкам таблиц (core.list_queries).
+    """
+    engine = bind.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    if engine not in _available:
+        if isinstance(bind, Engine):
+            with engine.connect() as conn:
+                _available[engine] = _index_readable(conn)
+        else:
+            _available[engine] = _index_readable(bind)
+    return _available[engine]
+
+
+def install_search_index(conn):
+    """Создает индекс и триггеры в открытой транзакции, если их нет; False, если FTS5 недоступен"""
+    _available.pop(conn.engine, None)
+    existing = set(conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE name = 'search_index' OR type = 'trigger'"
+    )).scalars())
+    try:
+        conn.execute(text(_CREATE_INDEX))
+    except OperationalError:
+        # SQLite собран без FTS5: поиск отключается, остальное работает как раньше
+        return False
+    for name, body in _TRIGGERS.items():
+        if name not in existing:
+            conn.execute(text(f"CREATE TRIGGER {name} {body}"))
+    if 'search_index' not in existing:
+        rebuild_search_index(conn)
+    return True
+
+
+def drop_search_index(conn):
+    """Удаляет индекс и его триггеры"""
+    _available.pop(conn.engine, None)
+    for name in _TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    conn.execute(text("DROP TABLE IF EXISTS search_index"))
+
+
+def ensure_search_index(engine):
+    """Создает индекс и триггеры, если их нет; возвращает False, если FTS5 недоступен"""
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        return install_search_index(conn)
+
+
+def build_match(query):
+    """Запрос пользователя -> выражение MATCH: все слова, каждое как префикс"""
+    words = re.findall(r'\w+', _fold_text(query.lower()))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _select(columns, where, params, kinds, order, limit):
+    sql = f"SELECT {columns} FROM search_index WHERE {where}"
+    if kinds:
+        sql += " AND kind IN ({})".format(', '.join(f":kind{i}" for i in range(len(kinds))))
+        params = dict(params, **{f"kind{i}": kind for i, kind in enumerate(kinds)})
+    return f"{sql}{order} LIMIT {int(limit)}", params
+
+
+def _original_snippet(snippet, body):
+    """Фрагмент приведенного текста с отметками -> тот же фрагмент исходного текста"""
+    plain = ''.join(ch for ch in snippet if ch not in _MARKS)
+    start = _fold_text(body).find(plain)
+    if start >= 0:
+        original = iter(body[start:start + len(plain)])
+        snippet = ''.join(ch if ch in _MARKS else next(original) for ch in snippet)
+    return ''.join(_MARKS.get(ch, ch) for ch in snippet)
+
+
+def _hit(row):
+    kind, ref_id, title, snippet, body, rank = row
+    return SearchHit(kind, ref_id, title, _original_snippet(snippet, body), rank)
+
+
+def search(conn, query, limit=DEFAULT_LIMIT, kinds=None):
+    """Записи, содержащие все слова запроса (по началу слова), по убыванию релевантности.
+
+    bm25 считается по всем совпадениям, поэтому для слишком общих запросов
+    (больше RANKED_LIMIT совпадений, например "ООО") ранжирование не делается:
+    сначала идут совпадения в заголовке, затем остальные, в порядке индекса.
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    hit = "kind, ref_id, title_text, snippet(search_index, 1, char(2), char(3), char(31), 8), body_text"
+    params = {'match': match}
+    sql, params_k = _select("rowid", "search_index MATCH :match", params, kinds, "", RANKED_LIMIT + 1)
+    matches = conn.execute(text(f"SELECT count(*) FROM ({sql})"), params_k).scalar_one()
+    if matches <= RANKED_LIMIT:
+        sql, params_k = _select(f"{hit}, bm25(search_index, {_WEIGHTS}) AS score",
+                                "search_index MATCH :match", params, kinds, " ORDER BY score", limit)
+        return [_hit(row) for row in conn.execute(text(sql), params_k)]
+
+    hits, seen = [], set()
+    for column_match in (f"title : ({match})", match):
+        sql, params_k = _select(f"{hit}, NULL", "search_index MATCH :match",
+                                {'match': column_match}, kinds, "", limit)
+        for row in conn.execute(text(sql), params_k):
+            if (row.kind, row.ref_id) not in seen and len(hits) < limit:
+                seen.add((row.kind, row.ref_id))
+                hits.append(_hit(row))
+    return hits
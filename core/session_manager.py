@@ -0,0 +1,178 @@
+"""Жизненный цикл сессий SQLAlchemy в приложении.
+
+Общая сессия главного окна (SessionManager.session) живет все время работы
+программы, поэтому в нее не должны попадать объекты, которые нужны один раз:
+- read_session() - короткая сессия для чтения (проверки уведомлений, события
+  календаря); загруженные объекты уходят вместе с ней;
+- read_connection() - то же для запросов списков без объектов ORM;
+- unit_of_work() - короткая сессия для одной операции записи: фиксируется
+  при успехе, откатывается при ошибке и не задевает общую сессию. Копии
+  измененных объектов в общей сессии после фиксации помечаются устаревшими,
+  удаленные - убираются из нее.
+Виджеты получают общую сессию, но читают и пишут через эти функции: она
+передается им как источник движка и держит только объекты, открытые в окне.
+
+Политика устаревания общей сессии (RENTAL_SESSION_EXPIRE):
+- commit (по умолчанию) - как в SQLAlchemy: после каждого commit все объекты
+  перечитываются при следующем обращении;
+- idle - commit ничего не сбрасывает, общая сессия очищается в простое.
+В простое (NotificationManager) общая сессия очищается и при любой политике,
+если в ней больше IDENTITY_LIMIT объектов и нет несохраненных изменений.
+Раз в несколько минут записывается размер резидентной памяти процесса, чтобы
+рост за рабочий день был виден в окне разработчика.
+"""
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm.attributes import instance_state
+
+from core.database import Session
+
+EXPIRE_COMMIT = 'commit'
+EXPIRE_IDLE = 'idle'
+EXPIRE_POLICIES = (EXPIRE_COMMIT, EXPIRE_IDLE)
+EXPIRE_ENV = 'RENTAL_SESSION_EXPIRE'
+# Сколько объектов может держать общая сессия до очистки в простое
+IDENTITY_LIMIT = 2000
+# Замеры памяти за последние сутки при замере раз в 5 минут
+MEMORY_SAMPLES = 288
+
+
+def _engine(bind):
+    return bind.get_bind() if isinstance(bind, OrmSession) else bind
+
+
+@contextmanager
+def read_session(bind):
+    """Короткая сессия для чтения; bind - движок или сессия, с движком которой работать.
+
+    Объекты нужно использовать внутри блока: после выхода они отсоединены.
+    """
+    session = Session(bind=_engine(bind), autoflush=False, expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@contextmanager
+def read_connection(bind):
+    """Соединение короткой сессии чтения - для запросов, возвращающих строки, а не объекты"""
+    with read_session(bind) as session:
+        yield session.connection()
+
+
+@contextmanager
+def unit_of_work(bind):
+    """Короткая сессия для одной операции записи: commit при успехе, rollback при ошибке.
+
+    Если bind - сессия, ее копии измененных и удаленных объектов обновляются после commit.
+    """
+    session = Session(bind=_engine(bind), expire_on_commit=False)
+    changed, deleted = set(), set()
+    if isinstance(bind, OrmSession):
+        event.listen(session, 'after_flush',
+                     lambda s, context: changed.update(instance_state(obj).key for obj in s.dirty))
+        event.listen(session, 'persistent_to_deleted',
+                     lambda s, obj: deleted.add(instance_state(obj).key))
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    if changed or deleted:
+        _refresh_copies(bind, changed, deleted)
+
+
+def _refresh_copies(shared, changed, deleted):
+    """Устаревшие копии объектов в сессии shared: измененные перечитаются при обращении"""
+    for key in changed | deleted:
+        obj = shared.identity_map.get(key)
+        if obj is None or obj in shared.dirty:
+            continue
+        if key in deleted:
+            shared.expunge(obj)
+        else:
+            shared.expire(obj)
+
+
+def current_rss():
+    """Резидентная память процесса в байтах; None, если система ее не сообщает"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemorySample:
+    __slots__ = ('time', 'rss', 'identity')
+
+    def __init__(self, time, rss, identity):
+        self.time = time
+        self.rss = rss
+        self.identity = identity
+
+
+class SessionManager:
+    """Общая сессия главного окна и ее очистка"""
+
+    def __init__(self, engine, expire_policy=None, identity_limit=IDENTITY_LIMIT):
+        self.expire_policy = expire_policy or os.environ.get(EXPIRE_ENV, EXPIRE_COMMIT)
+        if self.expire_policy not in EXPIRE_POLICIES:
+            raise ValueError(f"Неизвестная политика устаревания сессии: {self.expire_policy}")
+        self.engine = engine
+        self.identity_limit = identity_limit
+        self.session = Session(bind=engine, expire_on_commit=self.expire_policy == EXPIRE_COMMIT)
+        self.trims = 0
+        self.samples = deque(maxlen=MEMORY_SAMPLES)
+
+    def read_session(self):
+        return read_session(self.engine)
+
+    def unit_of_work(self):
+        return unit_of_work(self.engine)
+
+    def identity_size(self):
+        return len(self.session.identity_map)
+
+    def trim(self):
+        """Очищает общую сессию, если это нужно и безопасно; возвращает True, если очищена.
+
+        Вызывается в простое без открытых модальных окон: объекты, которые держат
+        виджеты, после очистки отсоединены, но уже загруженные атрибуты доступны.
+        """
+        session = self.session
+        if session.new or session.dirty or session.deleted:
+            return False
+        if self.expire_policy != EXPIRE_IDLE and self.identity_size() <= self.identity_limit:
+            return False
+        # close() также отдает соединение в пул и завершает открытую транзакцию чтения
+        session.close()
+        self.trims += 1
+        return True
+
+    def record_memory(self):
+        sample = MemorySample(time.time(), current_rss(), self.identity_size())
+        self.samples.append(sample)
+        return sample
+
+    def memory_lines(self):
+        """Описание памяти для окна разработчика"""
+        lines = [f"объектов в общей сессии: {self.identity_size()} (лимит {self.identity_limit}), "
+                 f"очисток: {self.trims}, политика: {self.expire_policy}"]
+        measured = [sample for sample in self.samples if sample.rss is not None]
+        if measured:
+            first, last = measured[0], measured[-1]
+            peak = max(sample.rss for sample in measured)
+            hours = (last.time - first.time) / 3600
+            lines.append(f"память: {last.rss / 1024 / 1024:.0f} МБ, максимум {peak / 1024 / 1024:.0f} МБ, "
+                         f"изменение за {hours:.1f} ч: {(last.rss - first.rss) / 1024 / 1024:+.0f} МБ")
+        return lines
@@ -0,0 +1,200 @@
+"""Моделирование Монте-Карло рисков простоя и неплатежей по портфелю договоров.
+
+Все испытания считаются одновременно: состояние портфеля - массивы
+испытания × договоры, цикл идет только по месяцам горизонта. Договоры
+разыгрываются блоками, чтобы память не росла с размером портфеля. В каждом месяце
+разыгрываются неоплата (месяц без поступления), досрочное расторжение и
+продление по окончании срока; освободившийся объект простаивает случайное
+число месяцев до новой сдачи. Вероятности оцениваются по истории базы
+(fit_assumptions) и могут быть изменены перед запуском.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, func, case
+
+from core.database import Contract, ContractStatus
+from core.forecast import (load_inputs, delay_distribution, renewal_rate, indexed_rates,
+                           spread_by_delay, DEFAULT_HORIZON)
+
+DEFAULT_TRIALS = 2000
+DEFAULT_SEED = 0
+DEFAULT_RELET_MONTHS = 2.0
+# Договоров в одном блоке моделирования: состояние блока - массивы испытания × CHUNK_CONTRACTS
+CHUNK_CONTRACTS = 256
+PERCENTILES = (5, 50, 95)
+_DAYS_IN_MONTH = 30.4375
+
+
+class Assumptions:
+    """Параметры модели: вероятности в месяц, вероятность продления и простой в месяцах"""
+
+    def __init__(self, default_rate, termination_rate, renewal_probability, relet_months,
+                 relet_by_property=None, delays=None):
+        self.default_rate = default_rate
+        self.termination_rate = termination_rate
+        self.renewal_probability = renewal_probability
+        self.relet_months = relet_months
+        self.relet_by_property = relet_by_property or {}
+        self.delays = np.asarray(delays if delays is not None else [1.0], dtype=np.float64)
+
+    def replace(self, **changes):
+        values = dict(self.__dict__)
+        values.update(changes)
+        return Assumptions(**values)
+
+    def relet_for(self, property_ids):
+        """Средний простой по объектам; для объектов без истории - общий"""
+        return np.array([self.relet_by_property.get(pid, self.relet_months) for pid in property_ids],
+                        dtype=np.float64)
+
+
+class SimulationResult:
+    """Поступления по испытаниям (испытания × месяцы) и их перцентили"""
+
+    def __init__(self, months, income, vacancy, assumptions):
+        self.months = months
+        self.income = income
+        self.vacancy = vacancy
+        self.assumptions = assumptions
+
+    @property
+    def trials(self):
+        return self.income.shape[0]
+
+    def bands(self):
+        """Перцентили P5/P50/P95 поступлений по месяцам, массив 3 × месяцы"""
+        return np.percentile(self.income, PERCENTILES, axis=0)
+
+    def total_bands(self):
+        """Перцентили суммарных поступлений за весь горизонт"""
+        return np.percentile(self.income.sum(axis=1), PERCENTILES)
+
+
+def _monthly_termination_rate(conn, today):
+    # Доля досрочно расторгнутых договоров на месяц аренды по всем договорам
+    until = func.min(func.julianday(Contract.end_date), func.julianday(today))
+    months = func.max(until - func.julianday(Contract.start_date), 0) / _DAYS_IN_MONTH
+    terminated, exposure = conn.execute(
+        select(func.sum(case((Contract.status == ContractStatus.TERMINATED, 1), else_=0)),
+               func.sum(months))
+        .where(Contract.start_date.isnot(None), Contract.end_date.isnot(None))
+    ).one()
+    return (terminated or 0) / exposure if exposure else 0.0
+
+
+def _relet_months(conn):
+    """Средний разрыв в месяцах между договорами на каждом объекте: (общий, {объект: разрыв})"""
+    next_start = func.lead(Contract.start_date).over(
+        partition_by=Contract.property_id, order_by=Contract.start_date
+    )
+    gaps = select(
+        Contract.property_id,
+        (func.julianday(next_start) - func.julianday(Contract.end_date)).label('gap')
+    ).where(Contract.start_date.isnot(None), Contract.end_date.isnot(None)).subquery()
+    rows = conn.execute(
+        select(gaps.c.property_id, func.avg(func.max(gaps.c.gap, 0)) / _DAYS_IN_MONTH, func.count())
+        .where(gaps.c.gap.isnot(None))
+        .group_by(gaps.c.property_id)
+    ).all()
+    if not rows:
+        return DEFAULT_RELET_MONTHS, {}
+    overall = sum(gap * count for _, gap, count in rows) / sum(count for _, _, count in rows)
+    return overall, {property_id: gap for property_id, gap, _ in rows}
+
+
+def fit_assumptions(conn, today=None):
+    """Оценивает параметры модели по договорам и платежам"""
+    today = today or datetime.now().date()
+    delays = delay_distribution(conn, today)
+    paid_share = delays.sum()
+    relet_months, relet_by_property = _relet_months(conn)
+    return Assumptions(
+        default_rate=float(1.0 - paid_share),
+        termination_rate=_monthly_termination_rate(conn, today),
+        renewal_probability=renewal_rate(conn, today),
+        relet_months=relet_months,
+        relet_by_property=relet_by_property,
+        # Неоплата разыгрывается отдельно, задержка распределяется только среди оплаченного
+        delays=delays / paid_share if paid_share else [1.0],
+    )
+
+
+def _simulate_chunk(rng, assumptions, trials, rates, term, relet_p, until_start, remaining_now, charges, vacant):
+    """Разыгрывает испытания для части договоров, добавляя начисления и число свободных объектов"""
+    size, horizon = rates.shape
+    # Сроки в месяцах помещаются в int32, это вдвое меньше памяти, чем int64 по умолчанию
+    occupied = np.broadcast_to(until_start == 0, (trials, size)).copy()
+    vacancy_left = np.broadcast_to(until_start.astype(np.int32), (trials, size)).copy()
+    remaining = np.broadcast_to(remaining_now.astype(np.int32), (trials, size)).copy()
+    np.copyto(remaining, term, where=~occupied, casting='unsafe')
+
+    def vacate(mask):
+        trial_idx, contract_idx = np.nonzero(mask)
+        occupied[mask] = False
+        # Геометрическое распределение с средним relet_months, простой может быть нулевым
+        vacancy_left[trial_idx, contract_idx] = rng.geometric(relet_p[contract_idx]) - 1
+
+    for m in range(horizon):
+        # Окончание срока: продление на тот же срок или освобождение объекта
+        ending = occupied & (remaining <= 0)
+        renewed = ending & (rng.random((trials, size), dtype=np.float32) < assumptions.renewal_probability)
+        np.copyto(remaining, term, where=renewed, casting='unsafe')
+        vacate(ending & ~renewed)
+
+        # Новая сдача освободившихся объектов
+        relet = ~occupied & (vacancy_left <= 0)
+        occupied |= relet
+        np.copyto(remaining, term, where=relet, casting='unsafe')
+        vacancy_left -= ~occupied
+
+        # Неоплата месяца и досрочное расторжение (месяц расторжения оплачивается)
+        draw = rng.random((trials, size), dtype=np.float32)
+        defaulted = occupied & (draw < assumptions.default_rate)
+        terminated = occupied & ~defaulted & (draw < assumptions.default_rate + assumptions.termination_rate)
+        charges[:, m] += (occupied & ~defaulted).view(np.int8) @ rates[:, m]
+        vacant[m] += occupied.size - np.count_nonzero(occupied)
+        vacate(terminated)
+        remaining -= occupied
+
+
+def simulate(inputs, months, assumptions, trials=DEFAULT_TRIALS, seed=DEFAULT_SEED, chunk=CHUNK_CONTRACTS):
+    """Разыгрывает trials сценариев сразу, возвращает SimulationResult.
+
+    Договоры обрабатываются блоками по chunk: они разыгрываются независимо,
+    а начисления и простой блоков складываются, поэтому память ограничена
+    массивами trials × chunk при любом размере портфеля.
+    """
+    months = np.asarray(months, dtype='M8[M]')
+    rng = np.random.default_rng(seed)
+    size, horizon = len(inputs), len(months)
+    rates, _ = indexed_rates(inputs, months)
+    start_month = inputs.start_dates.astype('M8[M]')
+    end_month = inputs.end_dates.astype('M8[M]')
+    term = np.maximum((end_month - start_month).astype(np.int64) + 1, 1)
+    relet_p = 1.0 / (assumptions.relet_for(inputs.property_ids.tolist()) + 1.0)
+
+    # Договоры, начинающиеся в будущем, до начала считаются свободными с известным сроком простоя
+    until_start = np.maximum((start_month - months[0]).astype(np.int64), 0)
+    remaining = (end_month - months[0]).astype(np.int64) + 1
+
+    charges = np.zeros((trials, horizon))
+    vacant = np.zeros(horizon)
+    for first in range(0, size, chunk):
+        part = slice(first, first + chunk)
+        _simulate_chunk(rng, assumptions, trials, rates[part], term[part], relet_p[part],
+                        until_start[part], remaining[part], charges, vacant)
+    vacancy = vacant / (trials * size) if size else vacant
+
+    return SimulationResult(months, spread_by_delay(charges, assumptions.delays), vacancy, assumptions)
+
+
+def simulate_portfolio(conn, horizon=DEFAULT_HORIZON, trials=DEFAULT_TRIALS, assumptions=None,
+                       today=None, seed=DEFAULT_SEED):
+    """Моделирование по действующим договорам; assumptions по умолчанию оцениваются по истории"""
+    today = today or datetime.now().date()
+    inputs = load_inputs(conn, today)
+    if assumptions is None:
+        assumptions = fit_assumptions(conn, today)
+    months = np.datetime64(today, 'M') + np.arange(horizon).astype('m8[M]')
+    return simulate(inputs, months, assumptions, trials, seed)
@@ -0,0 +1,42 @@
+"""Перевод просроченных платежей из PENDING в OVERDUE одним UPDATE.
+
+Запрос идет по индексу ix_payments_status_due_date и затрагивает только
+платежи, срок которых прошел с прошлого запуска, поэтому время не зависит
+от размера реестра платежей. Измененные строки возвращаются через RETURNING
+в SweepResult: по нему окно обновляет список платежей и показывает уведомление.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from core.database import Payment, PaymentStatus
+
+class SweepResult:
+    """Платежи, переведенные в OVERDUE за один запуск"""
+
+    def __init__(self, rows, today):
+        self.today = today
+        self.payment_ids = [row.id for row in rows]
+        self.contract_ids = sorted({row.contract_id for row in rows if row.contract_id is not None})
+        self.amount = sum(row.amount or 0.0 for row in rows)
+
+    def __len__(self):
+        return len(self.payment_ids)
+
+
+def sweep_overdue(conn, today=None):
+    """Переводит в OVERDUE все неоплаченные платежи со сроком раньше today"""
+    today = today or datetime.now().date()
+    condition = (Payment.status == PaymentStatus.PENDING) & (Payment.due_date < today)
+    values = {'status': PaymentStatus.OVERDUE, 'updated_at': datetime.now()}
+    columns = (Payment.id, Payment.contract_id, Payment.amount)
+
+    if conn.dialect.update_returning:
+        rows = conn.execute(update(Payment).where(condition).values(values).returning(*columns)).all()
+    else:
+        # SQLite до 3.35 не поддерживает RETURNING: сначала выбираем, затем обновляем по id
+        rows = conn.execute(select(*columns).where(condition)).all()
+        if rows:
+            conn.execute(update(Payment).where(Payment.id.in_([row.id for row in rows])).values(values))
+
+    return SweepResult(rows, today)
@@ -3,12 +3,18 @@ import os
 os.environ['QT_API'] = 'pyqt6'
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QStackedWidget,
-                            QFrame, QStyle, QMessageBox)
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QIcon, QFont, QPalette, QColor
+                            QFrame, QStyle, QMessageBox, QProgressDialog)
+from PyQt6.QtCore import Qt, QSize, QUrl, QThreadPool
+from PyQt6.QtGui import QIcon, QFont, QPalette, QColor, QShortcut, QKeySequence, QDesktopServices
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import OperationalError
 import qdarkstyle
-from core.database import init_db, Session
+from core.database import init_db, Session, Document
+from core.instrumentation import install_profiler, action, track_action
+from core.query_guard import enable_strict_loading
+from core.ledger import ensure_balances
+from core.maintenance import optimize
+from core.session_manager import SessionManager
 from ui.property_widget import PropertyWidget
 from ui.contract_widget import ContractWidget
 from ui.payments_widget import PaymentsWidget
@@ -18,13 +24,48 @@ from ui.analytics_widget import AnalyticsWidget
 from ui.tenants_widget import TenantsWidget
 from core.notifications import NotificationManager
 from ui.calendar_widget import CalendarWidget
+from ui.settings_widget import SettingsWidget
+from ui.dev_overlay import SqlProfilerOverlay
+from ui.search_widget import GlobalSearchBar
+
+def migration_progress():
+    """Ход обновления схемы базы; окно появляется, только если миграция данных действительно идет"""
+    dialog = None
+
+    def report(stage, done, total):
+        nonlocal dialog
+        if dialog is None:
+            dialog = QProgressDialog("Обновление базы данных...", None, 0, total)
+            dialog.setWindowTitle("Обновление базы данных")
+            dialog.setMinimumDuration(300)
+        dialog.setLabelText(stage)
+        dialog.setMaximum(total)
+        dialog.setValue(done)
+        if done >= total:
+            dialog.reset()
+        QApplication.processEvents()
+
+    return report
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.session = Session(bind=init_db())
-        self.init_ui()
-        self.init_notifications()
+        engine = init_db(progress=migration_progress())
+        with engine.begin() as conn:
+            ensure_balances(conn)
+        # RENTAL_SQL_PROFILE=1 включает сбор статистики SQL и окно разработчика (Ctrl+Shift+D)
+        self.profiler = install_profiler(engine) if os.environ.get('RENTAL_SQL_PROFILE') == '1' else None
+        # RENTAL_STRICT_LOADING=1 превращает любую неявную ленивую загрузку связи в ошибку
+        if os.environ.get('RENTAL_STRICT_LOADING') == '1':
+            enable_strict_loading(Session)
+        # RENTAL_SESSION_EXPIRE=idle: общая сессия не перечитывает объекты после каждого commit
+        self.sessions = SessionManager(engine)
+        self.session = self.sessions.session
+        with action("startup"):
+            self.init_ui()
+            self.init_notifications()
+        self.init_dev_tools()
 
     def init_ui(self):
         self.setWindowTitle("Система управления арендой")
@@ -71,7 +112,8 @@ class MainWindow(QMainWindow):
             ("Документы", self.show_documents),
             ("Отчеты", self.show_reports),
             ("Аналитика", self.show_analytics),
-            ("Календарь", self.show_calendar)
+            ("Календарь", self.show_calendar),
+            ("Настройки", self.show_settings)
         ]
 
         for text, callback in nav_items:
@@ -85,11 +127,19 @@ class MainWindow(QMainWindow):
         left_panel.addStretch()
         layout.addLayout(left_panel)
 
-        # Правая панель с контентом
+        # Правая панель: глобальный поиск и контент
+        right_panel = QVBoxLayout()
+        self.search_bar = GlobalSearchBar(self.session)
+        self.search_bar.result_activated.connect(self.open_search_result)
+        right_panel.addWidget(self.search_bar)
         self.content_area = QStackedWidget()
-        layout.addWidget(self.content_area, 1)
+        right_panel.addWidget(self.content_area, 1)
+        layout.addLayout(right_panel, 1)
+        search_shortcut = QShortcut(QKeySequence("Ctrl+F"), self)
+        search_shortcut.activated.connect(self.search_bar.search_edit.setFocus)
 
-        # Инициализация виджетов
+        # Инициализация виджетов: общая сессия передается им как источник движка,
+        # списки читаются и изменения сохраняются короткими сессиями (core.session_manager)
         self.properties_widget = PropertyWidget(self.session)
         self.contracts_widget = ContractWidget(self.session)
         self.payments_widget = PaymentsWidget(self.session)
@@ -98,6 +148,7 @@ class MainWindow(QMainWindow):
         self.reports_widget = ReportsWidget(self.session)
         self.analytics_widget = AnalyticsWidget(self.session)
         self.calendar_widget = CalendarWidget(self.session)
+        self.settings_widget = SettingsWidget(self.session)
 
         # Добавляем виджеты в стек
         self.content_area.addWidget(self.properties_widget)
@@ -108,6 +159,7 @@ class MainWindow(QMainWindow):
         self.content_area.addWidget(self.reports_widget)
         self.content_area.addWidget(self.analytics_widget)
         self.content_area.addWidget(self.calendar_widget)
+        self.content_area.addWidget(self.settings_widget)
 
         # Показываем приветственное сообщение
         welcome = QWidget()
@@ -126,55 +178,121 @@ class MainWindow(QMainWindow):
         self.content_area.addWidget(welcome)
 
     def init_notifications(self):
-        self.notification_manager = NotificationManager(self.session)
+        self.notification_manager = NotificationManager(self.session, self.sessions)
         
         # Подключаем сигналы уведомлений
         self.notification_manager.payment_reminder.connect(self.show_notification)
         self.notification_manager.contract_expiry.connect(self.show_notification)
         self.notification_manager.maintenance_reminder.connect(self.show_notification)
+        self.notification_manager.payments_overdue.connect(self.on_payments_overdue)
+        self.notification_manager.database_problem.connect(self.show_notification)
 
         # Передаем менеджер уведомлений в календарь
         self.calendar_widget.notification_manager = self.notification_manager
 
+    def init_dev_tools(self):
+        if not self.profiler:
+            return
+        self.profiler_overlay = SqlProfilerOverlay(self.profiler, self, sessions=self.sessions)
+        shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), self)
+        shortcut.activated.connect(self.toggle_profiler_overlay)
+
+    def toggle_profiler_overlay(self):
+        self.profiler_overlay.setVisible(not self.profiler_overlay.isVisible())
+
     def show_notification(self, title, message):
         QMessageBox.information(self, title, message)
 
+    def on_payments_overdue(self, result):
+        self.payments_widget.load_payments()
+        self.show_notification(
+            "Просроченные платежи",
+            f"Просрочено платежей: {len(result)} на сумму {result.amount:.2f} ₽"
+        )
+
+    @track_action("open_search_result")
+    def open_search_result(self, kind, ref_id):
+        if kind == 'tenant':
+            self.show_tenants()
+            self.tenants_widget.select_tenant(ref_id)
+        elif kind == 'contract':
+            self.show_contracts()
+            self.contracts_widget.select_contract(ref_id)
+        elif kind == 'property':
+            self.show_properties()
+            self.properties_widget.edit_property(ref_id)
+        elif kind == 'document':
+            with self.sessions.read_session() as session:
+                document = session.get(Document, ref_id)
+            if document and document.file_path and os.path.exists(document.file_path):
+                QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(document.file_path)))
+            elif document and document.contract_id:
+                self.open_search_result('contract', document.contract_id)
+            else:
+                self.show_documents()
+
     def _set_active_button(self, button_name):
         for name, button in self.nav_buttons.items():
             button.setChecked(name == button_name)
 
+    @track_action("navigate:properties")
     def show_properties(self):
         self._set_active_button("Объекты")
         self.content_area.setCurrentWidget(self.properties_widget)
 
+    @track_action("navigate:contracts")
     def show_contracts(self):
         self._set_active_button("Договоры")
         self.content_area.setCurrentWidget(self.contracts_widget)
 
+    @track_action("navigate:payments")
     def show_payments(self):
         self._set_active_button("Платежи")
         self.content_area.setCurrentWidget(self.payments_widget)
 
+    @track_action("navigate:tenants")
     def show_tenants(self):
         self._set_active_button("Арендаторы")
         self.content_area.setCurrentWidget(self.tenants_widget)
 
+    @track_action("navigate:documents")
     def show_documents(self):
         self._set_active_button("Документы")
         self.content_area.setCurrentWidget(self.documents_widget)
 
+    @track_action("navigate:reports")
     def show_reports(self):
         self._set_active_button("Отчеты")
         self.content_area.setCurrentWidget(self.reports_widget)
 
+    @track_action("navigate:analytics")
     def show_analytics(self):
         self._set_active_button("Аналитика")
         self.content_area.setCurrentWidget(self.analytics_widget)
 
+    @track_action("navigate:calendar")
     def show_calendar(self):
         self._set_active_button("Календарь")
         self.content_area.setCurrentWidget(self.calendar_widget)
 
+    @track_action("navigate:settings")
+    def show_settings(self):
+        self._set_active_button("Настройки")
+        self.content_area.setCurrentWidget(self.settings_widget)
+
+    def closeEvent(self, event):
+        if self.profiler:
+            self.profiler.dump()
+        # Фоновые загрузки читают базу на своих соединениях: дожидаемся их до закрытия
+        QThreadPool.globalInstance().waitForDone()
+        # Статистика планировщика обновляется при каждом закрытии (обычно за миллисекунды)
+        self.session.close()
+        try:
+            optimize(self.session.get_bind())
+        except OperationalError as e:
+            print(f"PRAGMA optimize не выполнен: {str(e)}")
+        super().closeEvent(event)
+
 def main():
     app = QApplication(sys.argv)
     # Применяем темную тему
@@ -0,0 +1,489 @@
+"""Служебные команды системы управления арендой.
+
+Примеры:
+    python manage.py import tenants tenants.csv --dry-run
+    python manage.py import payments payments.xlsx --errors errors.csv
+    python manage.py schedule --regenerate --contract 12 15
+    python manage.py sweep
+    python manage.py aging --output aging.xlsx
+    python manage.py ledger 12 --from 2024-01-01
+    python manage.py rebuild-balances
+    python manage.py forecast --months 24 --output forecast.xlsx
+    python manage.py simulate --months 24 --trials 5000
+    python manage.py migrate-photos
+    python manage.py import-photos 7 ~/photos/object7 plan.png
+    python manage.py gc --dry-run
+    python manage.py duplicates
+    python manage.py backup
+    python manage.py verify-backup
+    python manage.py restore-backup 20240601_120000 --force
+    python manage.py archive --before 2024-01-01
+    python manage.py maintenance --check
+    python manage.py migrate
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+from core.database import init_db
+
+DEFAULT_DB_URL = 'sqlite:///rental.db'
+
+
+def cmd_import(args):
+    from core.importer import import_file, ImportFormatError
+
+    engine = init_db(args.db)
+    try:
+        result = import_file(engine, args.entity, args.file, dry_run=args.dry_run,
+                             chunk_size=args.chunk_size, sheet=args.sheet)
+    except ImportFormatError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    print(result.summary())
+    if result.errors:
+        if args.errors:
+            result.write_errors(args.errors)
+            print(f"Отчет об ошибках: {args.errors}")
+        else:
+            for line, column, message in sorted(result.errors)[:20]:
+                print(f"  строка {line}, {column}: {message}")
+            if len(result.errors) > 20:
+                print(f"  ... всего ошибок: {len(result.errors)}, используйте --errors для полного отчета")
+        return 1
+    return 0
+
+
+def cmd_schedule(args):
+    from core.schedule import generate_payments, regenerate_schedule
+    from core.database import Contract
+    from sqlalchemy import select
+
+    engine = init_db(args.db)
+    with engine.begin() as conn:
+        if args.regenerate:
+            contract_ids = args.contract or conn.scalars(select(Contract.id)).all()
+            added, changed, removed = regenerate_schedule(conn, contract_ids)
+            print(f"Графики пересчитаны: добавлено {added}, изменено {changed}, удалено {removed}")
+        else:
+            created = generate_payments(conn, args.contract)
+            print(f"Создано платежей по графику: {created}")
+    return 0
+
+
+def cmd_sweep(args):
+    from core.sweeper import sweep_overdue
+
+    engine = init_db(args.db)
+    with engine.begin() as conn:
+        result = sweep_overdue(conn, args.today)
+    print(f"Переведено в просроченные: {len(result)} на сумму {result.amount:.2f} ₽")
+    return 0
+
+
+def cmd_aging(args):
+    from core.aging import compute_aging, BUCKETS
+
+    engine = init_db(args.db)
+    with engine.connect() as conn:
+        report = compute_aging(conn, args.as_of or date.today())
+    if args.output:
+        report.export(args.output, args.level)
+        print(f"Отчет сохранен: {args.output}")
+    else:
+        print(report.to_frame(args.level or 'tenant').to_string(index=False))
+    labels = ", ".join(f"{label}: {amount:.2f}" for (_, _, label), amount in zip(BUCKETS, report.totals()))
+    print(f"Итого на {report.as_of:%d.%m.%Y}: {report.totals().sum():.2f} ₽ ({labels})")
+    return 0
+
+
+def cmd_ledger(args):
+    from core.ledger import contract_ledger, get_balance
+
+    engine = init_db(args.db)
+    with engine.connect() as conn:
+        ledger = contract_ledger(conn, args.contract, args.date_from, args.date_to)
+        charged, paid, balance = get_balance(conn, args.contract)
+    print(f"Договор №{args.contract}, сальдо на начало: {ledger.opening:.2f} ₽")
+    for entry in ledger.entries:
+        operation = "начислено" if entry.debit else "оплачено"
+        amount = entry.debit or entry.credit
+        print(f"  {entry.date:%d.%m.%Y}  {operation:<10} {amount:>12.2f}  сальдо {entry.balance:>12.2f}"
+              f"  {entry.description or ''}")
+    print(f"Сальдо на конец: {ledger.closing:.2f} ₽")
+    print(f"Всего по договору: начислено {charged:.2f}, оплачено {paid:.2f}, задолженность {balance:.2f} ₽")
+    return 0
+
+
+def cmd_rebuild_balances(args):
+    from core.ledger import rebuild_balances
+
+    engine = init_db(args.db)
+    with engine.begin() as conn:
+        rebuild_balances(conn, args.contract)
+    print("Сальдо договоров пересчитано")
+    return 0
+
+
+def cmd_forecast(args):
+    from core.forecast import forecast_cash_flow
+
+    engine = init_db(args.db)
+    with engine.connect() as conn:
+        forecast = forecast_cash_flow(conn, args.months, args.today, args.renewal)
+    if args.output:
+        forecast.export(args.output)
+        print(f"Прогноз сохранен: {args.output}")
+    else:
+        print(forecast.to_frame().to_string(index=False))
+    delays = ", ".join(f"{share:.0%}" for share in forecast.delays)
+    print(f"Договоров: {len(forecast.contract_ids)}, вероятность продления {forecast.renewal_probability:.0%}, "
+          f"оплата по месяцам задержки: {delays}")
+    return 0
+
+
+def cmd_simulate(args):
+    from core.simulation import simulate_portfolio, fit_assumptions
+
+    engine = init_db(args.db)
+    with engine.connect() as conn:
+        assumptions = fit_assumptions(conn)
+        if args.renewal is not None:
+            assumptions = assumptions.replace(renewal_probability=args.renewal)
+        result = simulate_portfolio(conn, args.months, args.trials, assumptions, seed=args.seed)
+    print(f"Неоплата {assumptions.default_rate:.1%} в месяц, расторжение {assumptions.termination_rate:.2%} в месяц, "
+          f"продление {assumptions.renewal_probability:.0%}, простой {assumptions.relet_months:.1f} мес.")
+    for month, (low, median, high), vacancy in zip(result.months, result.bands().T, result.vacancy):
+        print(f"  {month}  P5 {low:>14.2f}  P50 {median:>14.2f}  P95 {high:>14.2f}  простой {vacancy:.1%}")
+    low, median, high = result.total_bands()
+    print(f"Итого за {args.months} мес.: P5 {low:.2f}, P50 {median:.2f}, P95 {high:.2f} ₽")
+    return 0
+
+
+def cmd_migrate_photos(args):
+    from core.database import Session
+    from core.photo_store import import_legacy_photos, rebuild_refcounts
+
+    session = Session(bind=init_db(args.db))
+    moved, freed = import_legacy_photos(session)
+    rebuild_refcounts(session.connection())
+    session.commit()
+    print(f"Перенесено фотографий в хранилище: {moved}, освобождено {freed / 1024 / 1024:.1f} МБ")
+    return 0
+
+
+def cmd_import_photos(args):
+    from core.database import Session, Property
+    from core.photo_import import import_photos, find_images, register_photos
+
+    session = Session(bind=init_db(args.db))
+    if session.get(Property, args.property) is None:
+        print(f"Объект {args.property} не найден", file=sys.stderr)
+        return 1
+    sources = []
+    for path in args.paths:
+        sources.extend(find_images(path) if os.path.isdir(path) else [path])
+    photos = import_photos(sources, workers=args.workers, max_side=args.max_side, quality=args.quality)
+    register_photos(session, args.property, photos)
+    session.commit()
+    imported = [photo for photo in photos if photo.error is None]
+    for photo in photos:
+        if photo.error is not None:
+            print(f"{photo.source}: {photo.error}", file=sys.stderr)
+    before = sum(photo.original_size for photo in imported)
+    after = sum(photo.size for photo in imported)
+    print(f"Загружено фотографий: {len(imported)} из {len(sources)}, "
+          f"{before / 1024 / 1024:.1f} МБ -> {after / 1024 / 1024:.1f} МБ")
+    return 0 if len(imported) == len(sources) else 1
+
+
+def cmd_gc(args):
+    from core.database import Session
+    from core.file_gc import collect_garbage
+
+    session = Session(bind=init_db(args.db))
+    report = collect_garbage(session, delete_files=args.delete, dry_run=args.dry_run)
+    if args.list:
+        for orphan in report.orphans:
+            print(f"{orphan.category}\t{orphan.size}\t{orphan.path}")
+    if not report.orphans:
+        print("Файлов без ссылок не найдено")
+        return 0
+    for line in report.lines():
+        print(line)
+    return 0
+
+
+def cmd_duplicates(args):
+    from core.database import Session
+    from core.photo_duplicates import update_hashes, find_duplicates, photo_usage
+
+    session = Session(bind=init_db(args.db))
+    hashed = update_hashes(session, workers=args.workers)
+    groups = find_duplicates(session.connection(), phash_distance=args.distance)
+    print(f"Посчитано хэшей: {hashed}, групп похожих фотографий: {len(groups)}")
+    for number, group in enumerate(groups, 1):
+        print(f"\nГруппа {number}:")
+        for path, places in photo_usage(session.connection(), group).items():
+            print(f"  {path}\t" + ", ".join(f"#{property_id} {name}" for property_id, name in places))
+    return 0
+
+
+def _find_backup(name):
+    from core.backup import list_backups, BACKUP_DIR
+
+    if name:
+        path = name if os.path.isdir(name) else os.path.join(BACKUP_DIR, name)
+        return path if os.path.isdir(path) else None
+    backups = list_backups()
+    return backups[-1][1] if backups else None
+
+
+def cmd_backup(args):
+    from core.backup import create_backup, apply_retention, database_path
+
+    db_path = database_path(init_db(args.db))
+
+    def report(stage, done, total):
+        if stage == 'database':
+            print(f"\rБаза данных: {done} из {total} страниц", end='', file=sys.stderr)
+        elif done == total:
+            print(f"\nФайлов: {total}", file=sys.stderr)
+
+    result = create_backup(db_path, progress=report)
+    print(f"\nКопия: {result.path}")
+    print(f"База: {result.database_size / 1024 / 1024:.1f} МБ, сжато {result.archive_size / 1024 / 1024:.1f} МБ")
+    print(f"Файлов: {result.files}, без изменений: {result.linked}, "
+          f"скопировано {result.copied_bytes / 1024 / 1024:.1f} МБ")
+    if not args.no_prune:
+        for path in apply_retention():
+            print(f"Удалена старая копия: {path}")
+    return 0
+
+
+def cmd_verify_backup(args):
+    from core.backup import verify_backup
+
+    path = _find_backup(args.name)
+    if path is None:
+        print("Копия не найдена", file=sys.stderr)
+        return 1
+    problems = verify_backup(path, deep=not args.quick)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    print(f"{path}: " + (f"ошибок {len(problems)}" if problems else "копия восстанавливается без ошибок"))
+    return 1 if problems else 0
+
+
+def cmd_restore_backup(args):
+    from sqlalchemy.engine import make_url
+    from core.backup import restore_backup, BackupError
+
+    path = _find_backup(args.name)
+    if path is None:
+        print("Копия не найдена", file=sys.stderr)
+        return 1
+    db_path = make_url(args.db).database
+    try:
+        restored = restore_backup(path, db_path, overwrite=args.force)
+    except BackupError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"База восстановлена в {db_path}, восстановлено файлов: {restored}")
+    return 0
+
+
+def cmd_archive(args):
+    from core.archive import archive_old_records, archive_counts
+
+    engine = init_db(args.db)
+
+    def report(payments, contracts):
+        print(f"\rПеренесено платежей: {payments}, договоров: {contracts}", end='', file=sys.stderr)
+
+    result = archive_old_records(engine, args.before, chunk_size=args.chunk_size, progress=report)
+    print(f"\nДата отсечки: {result.cutoff}. Перенесено платежей: {result.payments}, договоров: {result.contracts}")
+    for table, (hot, archived) in archive_counts(engine).items():
+        print(f"  {table}: рабочих {hot}, в архиве {archived}")
+    return 0
+
+
+def cmd_maintenance(args):
+    from core.maintenance import (database_stats, optimize, incremental_vacuum, full_vacuum, check_integrity,
+                                  maintenance_history)
+
+    engine = init_db(args.db)
+    if args.history:
+        with engine.connect() as conn:
+            for row in maintenance_history(conn, args.history):
+                print(f"{row.started_at:%Y-%m-%d %H:%M:%S}  {row.operation:<18} {row.duration:8.2f} с  "
+                      f"{(row.file_size or 0) / 1024 / 1024:8.1f} МБ  свободно {row.freelist_count}  {row.result}")
+        return 0
+    if args.full_vacuum:
+        full_vacuum(engine)
+        print("Файл базы перепакован")
+    elif not args.stats:
+        print(f"Статистика планировщика: {optimize(engine)}")
+        print(f"Освобождено страниц: {incremental_vacuum(engine)}")
+    problems = check_integrity(engine, quick=not args.integrity) if args.check or args.integrity else []
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if args.check or args.integrity:
+        print("Проверка целостности: " + (f"ошибок {len(problems)}" if problems else "ok"))
+    with engine.connect() as conn:
+        for line in database_stats(conn).lines():
+            print(line)
+    return 1 if problems else 0
+
+
+def cmd_migrate(args):
+    from sqlalchemy import create_engine
+    from core.schema import ensure_schema, schema_version, SchemaError, SCHEMA_VERSION
+
+    engine = create_engine(args.db)
+
+    def report(stage, done, total):
+        print(f"\r{stage}: {done}/{total}", end='\n' if done >= total else '', file=sys.stderr)
+
+    try:
+        migrated = ensure_schema(engine, progress=report)
+    except SchemaError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            version = schema_version(conn)
+    else:
+        version = SCHEMA_VERSION
+    print(f"Схема базы обновлена до версии {version}" if migrated else f"Схема базы актуальна (версия {version})")
+    return 0
+
+
+def build_parser():
+    from core.importer import SPECS, DEFAULT_CHUNK_SIZE
+    from core.photo_import import MAX_SIDE, JPEG_QUALITY
+    from core.photo_duplicates import PHASH_DISTANCE
+    from core.archive import CHUNK_SIZE
+
+    parser = argparse.ArgumentParser(description="Служебные команды системы управления арендой")
+    parser.add_argument('--db', default=DEFAULT_DB_URL, help="URL базы данных SQLAlchemy")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help="массовый импорт из CSV/XLSX")
+    importer.add_argument('entity', choices=sorted(SPECS))
+    importer.add_argument('file', help="путь к .csv или .xlsx")
+    importer.add_argument('--dry-run', action='store_true', help="только проверить файл, ничего не записывая")
+    importer.add_argument('--errors', metavar='CSV', help="сохранить построчный отчет об ошибках")
+    importer.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    importer.add_argument('--sheet', help="лист XLSX (по умолчанию активный)")
+    importer.set_defaults(handler=cmd_import)
+
+    schedule = commands.add_parser('schedule', help="графики ежемесячных платежей по договорам")
+    schedule.add_argument('--contract', type=int, nargs='+', help="номера договоров (по умолчанию все)")
+    schedule.add_argument('--regenerate', action='store_true',
+                          help="пересчитать существующие графики вместо создания недостающих")
+    schedule.set_defaults(handler=cmd_schedule)
+
+    sweep = commands.add_parser('sweep', help="перевести просроченные платежи в OVERDUE")
+    sweep.add_argument('--today', type=date.fromisoformat, help="дата отсечки ГГГГ-ММ-ДД (по умолчанию сегодня)")
+    sweep.set_defaults(handler=cmd_sweep)
+
+    aging = commands.add_parser('aging', help="задолженность по срокам просрочки")
+    aging.add_argument('--as-of', type=date.fromisoformat, help="дата расчета ГГГГ-ММ-ДД (по умолчанию сегодня)")
+    aging.add_argument('--level', choices=['tenant', 'property', 'contract'],
+                       help="уровень сводки (для XLSX по умолчанию все уровни)")
+    aging.add_argument('--output', help="сохранить в .xlsx или .csv")
+    aging.set_defaults(handler=cmd_aging)
+
+    ledger = commands.add_parser('ledger', help="выписка по лицевому счету договора")
+    ledger.add_argument('contract', type=int, help="номер договора")
+    ledger.add_argument('--from', dest='date_from', type=date.fromisoformat, help="начало периода ГГГГ-ММ-ДД")
+    ledger.add_argument('--to', dest='date_to', type=date.fromisoformat, help="конец периода ГГГГ-ММ-ДД")
+    ledger.set_defaults(handler=cmd_ledger)
+
+    rebuild = commands.add_parser('rebuild-balances', help="пересчитать сальдо договоров по платежам")
+    rebuild.add_argument('--contract', type=int, nargs='+', help="номера договоров (по умолчанию все)")
+    rebuild.set_defaults(handler=cmd_rebuild_balances)
+
+    forecast = commands.add_parser('forecast', help="прогноз поступлений по действующим договорам")
+    forecast.add_argument('--months', type=int, default=12, help="горизонт прогноза в месяцах")
+    forecast.add_argument('--renewal', type=float,
+                          help="вероятность продления 0..1 (по умолчанию по истории договоров)")
+    forecast.add_argument('--today', type=date.fromisoformat, help="дата расчета ГГГГ-ММ-ДД (по умолчанию сегодня)")
+    forecast.add_argument('--output', help="сохранить в .xlsx или .csv")
+    forecast.set_defaults(handler=cmd_forecast)
+
+    simulate = commands.add_parser('simulate', help="моделирование рисков поступлений (Монте-Карло)")
+    simulate.add_argument('--months', type=int, default=12, help="горизонт в месяцах")
+    simulate.add_argument('--trials', type=int, default=2000, help="число испытаний")
+    simulate.add_argument('--renewal', type=float, help="вероятность продления 0..1 (по умолчанию по истории)")
+    simulate.add_argument('--seed', type=int, default=0)
+    simulate.set_defaults(handler=cmd_simulate)
+
+    migrate_photos = commands.add_parser('migrate-photos',
+                                         help="перенести фотографии в хранилище без дублей")
+    migrate_photos.set_defaults(handler=cmd_migrate_photos)
+
+    import_photos = commands.add_parser('import-photos', help="загрузить фотографии объекта из файлов и папок")
+    import_photos.add_argument('property', type=int, help="номер объекта")
+    import_photos.add_argument('paths', nargs='+', help="файлы изображений или папки")
+    import_photos.add_argument('--workers', type=int, help="число потоков обработки (по умолчанию по числу ядер)")
+    import_photos.add_argument('--max-side', type=int, default=MAX_SIDE, help="предел большей стороны, пикселей")
+    import_photos.add_argument('--quality', type=int, default=JPEG_QUALITY, help="качество JPEG 1..95")
+    import_photos.set_defaults(handler=cmd_import_photos)
+
+    gc = commands.add_parser('gc', help="убрать файлы фотографий и документов, на которые нет ссылок в базе")
+    gc.add_argument('--delete', action='store_true', help="удалять сразу, без карантина")
+    gc.add_argument('--dry-run', action='store_true', help="только показать, что будет убрано")
+    gc.add_argument('--list', action='store_true', help="вывести найденные файлы")
+    gc.set_defaults(handler=cmd_gc)
+
+    duplicates = commands.add_parser('duplicates', help="найти похожие фотографии (пересжатые и уменьшенные копии)")
+    duplicates.add_argument('--distance', type=int, default=PHASH_DISTANCE,
+                            help="сколько бит pHash могут отличаться")
+    duplicates.add_argument('--workers', type=int, help="число потоков расчета хэшей")
+    duplicates.set_defaults(handler=cmd_duplicates)
+
+    backup = commands.add_parser('backup', help="резервная копия базы, фотографий и документов")
+    backup.add_argument('--no-prune', action='store_true', help="не удалять старые копии")
+    backup.set_defaults(handler=cmd_backup)
+
+    verify = commands.add_parser('verify-backup', help="проверить копию пробным восстановлением")
+    verify.add_argument('name', nargs='?', help="каталог копии (по умолчанию последняя)")
+    verify.add_argument('--quick', action='store_true', help="не сверять контрольные суммы файлов")
+    verify.set_defaults(handler=cmd_verify_backup)
+
+    restore = commands.add_parser('restore-backup', help="восстановить базу и файлы из копии (приложение закрыто)")
+    restore.add_argument('name', nargs='?', help="каталог копии (по умолчанию последняя)")
+    restore.add_argument('--force', action='store_true', help="заменить существующий файл базы")
+    restore.set_defaults(handler=cmd_restore_backup)
+
+    archive = commands.add_parser('archive', help="перенести старые оплаченные платежи и завершенные договоры в архив")
+    archive.add_argument('--before', type=date.fromisoformat,
+                         help="дата отсечки ГГГГ-ММ-ДД (по умолчанию начало года два года назад)")
+    archive.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="строк за одну транзакцию")
+    archive.set_defaults(handler=cmd_archive)
+
+    maintenance = commands.add_parser('maintenance',
+                                      help="обслуживание файла базы: ANALYZE/optimize, очистка свободных страниц")
+    maintenance.add_argument('--stats', action='store_true', help="только показать статистику файла")
+    maintenance.add_argument('--check', action='store_true', help="выполнить PRAGMA quick_check")
+    maintenance.add_argument('--integrity', action='store_true', help="выполнить полный PRAGMA integrity_check")
+    maintenance.add_argument('--full-vacuum', action='store_true',
+                             help="полностью перепаковать файл и включить инкрементальную очистку")
+    maintenance.add_argument('--history', type=int, metavar='N', help="показать N последних операций")
+    maintenance.set_defaults(handler=cmd_maintenance)
+
+    migrate = commands.add_parser('migrate', help="обновить схему базы до текущей версии программы")
+    migrate.set_defaults(handler=cmd_migrate)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
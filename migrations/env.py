@@ -0,0 +1,36 @@
+"""Окружение Alembic: целевая схема описана моделями core.database.
+
+Приложение вызывает миграции через core.schema.ensure_schema и передает
+открытое соединение в config.attributes['connection']; команда alembic из
+корня проекта открывает базу по sqlalchemy.url из alembic.ini.
+"""
+from alembic import context
+from sqlalchemy import create_engine
+
+from core.database import Base
+
+config = context.config
+
+
+def _include_name(name, type_, parent_names):
+    # Таблицы полнотекстового индекса создаются миграцией 0002, моделей у них нет
+    return not (type_ == 'table' and name.startswith('search_index'))
+
+
+def _configure(**kwargs):
+    # render_as_batch: SQLite не умеет ALTER COLUMN, автогенерация пишет пересоздание таблицы
+    context.configure(target_metadata=Base.metadata, render_as_batch=True, transaction_per_migration=True,
+                      include_name=_include_name, **kwargs)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    _configure(url=config.get_main_option('sqlalchemy.url'), literal_binds=True)
+elif config.attributes.get('connection') is not None:
+    _configure(connection=config.attributes['connection'])
+else:
+    engine = create_engine(config.get_main_option('sqlalchemy.url'))
+    with engine.connect() as connection:
+        _configure(connection=connection)
+    engine.dispose()
@@ -0,0 +1,183 @@
+"""Исходная схема
+
+Схема, которую раньше создавал create_all при каждом запуске. Миграция
+идемпотентна: в базе, созданной до перехода на Alembic, создаются только
+недостающие таблицы и индексы.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 12:56:40.058773
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *columns):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+
+def upgrade():
+    _create_table('db_maintenance_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=30), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('result', sa.String(length=500), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('freelist_count', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('photo_blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('refcount', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash'),
+    sa.UniqueConstraint('file_path')
+    )
+    _create_table('photo_hashes',
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('phash', sa.Integer(), nullable=True),
+    sa.Column('dhash', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('file_path')
+    )
+    _create_table('properties',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('address', sa.String(length=200), nullable=True),
+    sa.Column('area', sa.Float(), nullable=True),
+    sa.Column('floor', sa.Integer(), nullable=True),
+    sa.Column('status', sa.Enum('AVAILABLE', 'RENTED', 'MAINTENANCE', name='propertystatus'), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('tenants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('legal_info', sa.String(length=200), nullable=True),
+    sa.Column('contact_info', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('contracts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('tenant_id', sa.Integer(), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=True),
+    sa.Column('end_date', sa.Date(), nullable=False),
+    sa.Column('rent_amount', sa.Float(), nullable=True),
+    sa.Column('deposit', sa.Float(), nullable=True),
+    sa.Column('area', sa.Float(), nullable=True),
+    sa.Column('status', sa.Enum('ACTIVE', 'TERMINATED', 'EXPIRED', name='contractstatus'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_contracts_status', 'contracts', ['status'], if_not_exists=True)
+
+    _create_table('inventory_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=True),
+    sa.Column('condition', sa.String(length=50), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('maintenance',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('cost', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('property_photos',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('description', sa.String(length=200), nullable=True),
+    sa.Column('is_main', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_property_photos_file_path', 'property_photos', ['file_path'], if_not_exists=True)
+    op.create_index('ix_property_photos_property_main', 'property_photos', ['property_id', sa.text('is_main DESC'), 'id'], if_not_exists=True)
+
+    _create_table('contract_balances',
+    sa.Column('contract_id', sa.Integer(), nullable=False),
+    sa.Column('charged', sa.Float(), nullable=True),
+    sa.Column('paid', sa.Float(), nullable=True),
+    sa.Column('balance', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['contract_id'], ['contracts.id'], ),
+    sa.PrimaryKeyConstraint('contract_id')
+    )
+    _create_table('documents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('contract_id', sa.Integer(), nullable=True),
+    sa.Column('type', sa.String(length=50), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['contract_id'], ['contracts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_documents_file_path', 'documents', ['file_path'], if_not_exists=True)
+
+    _create_table('payment_schedules',
+    sa.Column('contract_id', sa.Integer(), nullable=False),
+    sa.Column('billing', sa.String(length=20), nullable=True),
+    sa.Column('prorate', sa.Integer(), nullable=True),
+    sa.Column('indexation', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['contract_id'], ['contracts.id'], ),
+    sa.PrimaryKeyConstraint('contract_id')
+    )
+    _create_table('payments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('contract_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=True),
+    sa.Column('due_date', sa.Date(), nullable=True),
+    sa.Column('payment_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'PAID', 'OVERDUE', name='paymentstatus'), nullable=True),
+    sa.Column('description', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['contract_id'], ['contracts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_payments_contract_id', 'payments', ['contract_id'], if_not_exists=True)
+    op.create_index('ix_payments_status_due_date', 'payments', ['status', 'due_date'], if_not_exists=True)
+
+
+def downgrade():
+    for name in ('payments', 'payment_schedules', 'documents', 'contract_balances', 'property_photos', 'maintenance',
+                 'inventory_items', 'contracts', 'tenants', 'properties', 'photo_hashes', 'photo_blobs',
+                 'db_maintenance_log'):
+        op.drop_table(name)
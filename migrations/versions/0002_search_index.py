@@ -0,0 +1,153 @@
+"""Полнотекстовый индекс поиска и триггеры
+
+Текст индекса и триггеров зафиксирован в миграции в том виде, в каком он был
+при ее создании: core.search с тех пор меняется (см. 0004).
+
+Revision ID: 0002
+Revises: 0001
+"""
+from alembic import op, context
+from sqlalchemy.exc import OperationalError
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+CREATE_INDEX = """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, body, kind UNINDEXED, ref_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+TRIGGERS = {
+    'search_tenants_ai': """AFTER INSERT ON tenants BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT t.id * 8 + 1, replace(replace(coalesce(t.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, ''), 'ё', 'е'), 'Ё', 'Е'), 'tenant', t.id
+            FROM tenants t
+            WHERE t.id = new.id;
+    END""",
+    'search_tenants_au': """AFTER UPDATE OF name, legal_info, contact_info ON tenants BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 1);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT t.id * 8 + 1, replace(replace(coalesce(t.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, ''), 'ё', 'е'), 'Ё', 'Е'), 'tenant', t.id
+            FROM tenants t
+            WHERE t.id = new.id;
+        DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM contracts WHERE tenant_id = new.id);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT c.id * 8 + 3, replace(replace('Договор №' || c.id, 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, ''), 'ё', 'е'), 'Ё', 'Е'), 'contract', c.id
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.tenant_id = new.id;
+    END""",
+    'search_tenants_ad': """AFTER DELETE ON tenants BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 1;
+    END""",
+    'search_properties_ai': """AFTER INSERT ON properties BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT p.id * 8 + 2, replace(replace(coalesce(p.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(p.address, '') || ' ' || coalesce(p.description, ''), 'ё', 'е'), 'Ё', 'Е'), 'property', p.id
+            FROM properties p
+            WHERE p.id = new.id;
+    END""",
+    'search_properties_au': """AFTER UPDATE OF name, address, description ON properties BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 2);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT p.id * 8 + 2, replace(replace(coalesce(p.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(p.address, '') || ' ' || coalesce(p.description, ''), 'ё', 'е'), 'Ё', 'Е'), 'property', p.id
+            FROM properties p
+            WHERE p.id = new.id;
+        DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM contracts WHERE property_id = new.id);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT c.id * 8 + 3, replace(replace('Договор №' || c.id, 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, ''), 'ё', 'е'), 'Ё', 'Е'), 'contract', c.id
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.property_id = new.id;
+    END""",
+    'search_properties_ad': """AFTER DELETE ON properties BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 2;
+    END""",
+    'search_contracts_ai': """AFTER INSERT ON contracts BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT c.id * 8 + 3, replace(replace('Договор №' || c.id, 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, ''), 'ё', 'е'), 'Ё', 'Е'), 'contract', c.id
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.id = new.id;
+    END""",
+    'search_contracts_au': """AFTER UPDATE OF tenant_id, property_id ON contracts BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 3);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT c.id * 8 + 3, replace(replace('Договор №' || c.id, 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, ''), 'ё', 'е'), 'Ё', 'Е'), 'contract', c.id
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.id = new.id;
+    END""",
+    'search_contracts_ad': """AFTER DELETE ON contracts BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 3;
+    END""",
+    'search_documents_ai': """AFTER INSERT ON documents BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT d.id * 8 + 4, replace(replace('Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(d.description, '') || ' ' || coalesce(d.file_path, ''), 'ё', 'е'), 'Ё', 'Е'), 'document', d.id
+            FROM documents d
+            WHERE d.id = new.id;
+    END""",
+    'search_documents_au': """AFTER UPDATE OF type, contract_id, description, file_path ON documents BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 4);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id)
+            SELECT d.id * 8 + 4, replace(replace('Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(d.description, '') || ' ' || coalesce(d.file_path, ''), 'ё', 'е'), 'Ё', 'Е'), 'document', d.id
+            FROM documents d
+            WHERE d.id = new.id;
+    END""",
+    'search_documents_ad': """AFTER DELETE ON documents BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 4;
+    END""",
+}
+
+REBUILD = [
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id)
+        SELECT t.id * 8 + 1, replace(replace(coalesce(t.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, ''), 'ё', 'е'), 'Ё', 'Е'), 'tenant', t.id
+        FROM tenants t
+        WHERE 1""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id)
+        SELECT p.id * 8 + 2, replace(replace(coalesce(p.name, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(p.address, '') || ' ' || coalesce(p.description, ''), 'ё', 'е'), 'Ё', 'Е'), 'property', p.id
+        FROM properties p
+        WHERE 1""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id)
+        SELECT c.id * 8 + 3, replace(replace('Договор №' || c.id, 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, ''), 'ё', 'е'), 'Ё', 'Е'), 'contract', c.id
+        FROM contracts c
+        LEFT JOIN tenants t ON t.id = c.tenant_id
+        LEFT JOIN properties p ON p.id = c.property_id
+        WHERE 1""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id)
+        SELECT d.id * 8 + 4, replace(replace('Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, ''), 'ё', 'е'), 'Ё', 'Е'), replace(replace(coalesce(d.description, '') || ' ' || coalesce(d.file_path, ''), 'ё', 'е'), 'Ё', 'Е'), 'document', d.id
+        FROM documents d
+        WHERE 1""",
+]
+
+
+def upgrade():
+    # В файле архива поиск не нужен: перенесенные строки убираются из индекса
+    if op.get_bind().dialect.name != 'sqlite' or context.config.attributes.get('archive'):
+        return
+    conn = op.get_bind()
+    try:
+        conn.exec_driver_sql(CREATE_INDEX)
+    except OperationalError:
+        # Без FTS5 поиск отключается, миграция все равно считается выполненной
+        return
+    for name, body in TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    conn.exec_driver_sql("DELETE FROM search_index")
+    for statement in REBUILD:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO search_index(search_index) VALUES ('optimize')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS search_index")
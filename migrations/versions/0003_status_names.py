@@ -0,0 +1,39 @@
+"""Статусы договоров и платежей: значения -> имена перечислений
+
+Старые базы хранили статусы строчными значениями ('active'), SQLAlchemy
+читает имена ('ACTIVE'). Раньше это исправлял migrate_contract_statuses.py
+шестью полными UPDATE в одной транзакции; здесь обновление идет порциями
+по диапазонам id, каждая порция фиксируется сразу, повторный запуск
+продолжает с того же места.
+
+Revision ID: 0003
+Revises: 0002
+"""
+from alembic import op, context
+
+from core.schema import update_in_chunks
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# Значения перечислений на момент миграции, не зависят от будущих изменений моделей
+STATUSES = {
+    'contracts': ('active', 'terminated', 'expired'),
+    'payments': ('pending', 'paid', 'overdue'),
+}
+LABELS = {'contracts': "Статусы договоров", 'payments': "Статусы платежей"}
+
+
+def upgrade():
+    progress = context.config.attributes.get('progress')
+    with op.get_context().autocommit_block():
+        for table, values in STATUSES.items():
+            update_in_chunks(op.get_bind(), table, "status = upper(status)",
+                             "status IN ({})".format(", ".join(f"'{value}'" for value in values)),
+                             LABELS[table], progress=progress)
+
+
+def downgrade():
+    pass
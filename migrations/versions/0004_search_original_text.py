@@ -0,0 +1,172 @@
+"""Индекс поиска: исходный текст для показа отдельно от индексируемого
+
+Раньше в индекс попадал только текст с ё, замененной на е, и результаты
+поиска показывали измененные имена. Индекс пересоздается с колонками
+title_text и body_text без индекса и перестраивается. Текст индекса и
+триггеров зафиксирован в миграции.
+
+Revision ID: 0004
+Revises: 0003
+"""
+from alembic import op, context
+from sqlalchemy.exc import OperationalError
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+CREATE_INDEX = """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, body, kind UNINDEXED, ref_id UNINDEXED, title_text UNINDEXED, body_text UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+TRIGGERS = {
+    'search_tenants_ai': """AFTER INSERT ON tenants BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'tenant', ref_id_, title_, body_
+            FROM (SELECT t.id * 8 + 1 AS rowid_, t.id AS ref_id_, coalesce(t.name, '') AS title_, coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, '') AS body_
+            FROM tenants t
+            WHERE t.id = new.id);
+    END""",
+    'search_tenants_au': """AFTER UPDATE OF name, legal_info, contact_info ON tenants BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 1);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'tenant', ref_id_, title_, body_
+            FROM (SELECT t.id * 8 + 1 AS rowid_, t.id AS ref_id_, coalesce(t.name, '') AS title_, coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, '') AS body_
+            FROM tenants t
+            WHERE t.id = new.id);
+        DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM contracts WHERE tenant_id = new.id);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'contract', ref_id_, title_, body_
+            FROM (SELECT c.id * 8 + 3 AS rowid_, c.id AS ref_id_, 'Договор №' || c.id AS title_, coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '') AS body_
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.tenant_id = new.id);
+    END""",
+    'search_tenants_ad': """AFTER DELETE ON tenants BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 1;
+    END""",
+    'search_properties_ai': """AFTER INSERT ON properties BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'property', ref_id_, title_, body_
+            FROM (SELECT p.id * 8 + 2 AS rowid_, p.id AS ref_id_, coalesce(p.name, '') AS title_, coalesce(p.address, '') || ' ' || coalesce(p.description, '') AS body_
+            FROM properties p
+            WHERE p.id = new.id);
+    END""",
+    'search_properties_au': """AFTER UPDATE OF name, address, description ON properties BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 2);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'property', ref_id_, title_, body_
+            FROM (SELECT p.id * 8 + 2 AS rowid_, p.id AS ref_id_, coalesce(p.name, '') AS title_, coalesce(p.address, '') || ' ' || coalesce(p.description, '') AS body_
+            FROM properties p
+            WHERE p.id = new.id);
+        DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM contracts WHERE property_id = new.id);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'contract', ref_id_, title_, body_
+            FROM (SELECT c.id * 8 + 3 AS rowid_, c.id AS ref_id_, 'Договор №' || c.id AS title_, coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '') AS body_
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.property_id = new.id);
+    END""",
+    'search_properties_ad': """AFTER DELETE ON properties BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 2;
+    END""",
+    'search_contracts_ai': """AFTER INSERT ON contracts BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'contract', ref_id_, title_, body_
+            FROM (SELECT c.id * 8 + 3 AS rowid_, c.id AS ref_id_, 'Договор №' || c.id AS title_, coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '') AS body_
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.id = new.id);
+    END""",
+    'search_contracts_au': """AFTER UPDATE OF tenant_id, property_id ON contracts BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 3);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'contract', ref_id_, title_, body_
+            FROM (SELECT c.id * 8 + 3 AS rowid_, c.id AS ref_id_, 'Договор №' || c.id AS title_, coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '') AS body_
+            FROM contracts c
+            LEFT JOIN tenants t ON t.id = c.tenant_id
+            LEFT JOIN properties p ON p.id = c.property_id
+            WHERE c.id = new.id);
+    END""",
+    'search_contracts_ad': """AFTER DELETE ON contracts BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 3;
+    END""",
+    'search_documents_ai': """AFTER INSERT ON documents BEGIN
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'document', ref_id_, title_, body_
+            FROM (SELECT d.id * 8 + 4 AS rowid_, d.id AS ref_id_, 'Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, '') AS title_, coalesce(d.description, '') || ' ' || coalesce(d.file_path, '') AS body_
+            FROM documents d
+            WHERE d.id = new.id);
+    END""",
+    'search_documents_au': """AFTER UPDATE OF type, contract_id, description, file_path ON documents BEGIN
+        DELETE FROM search_index WHERE rowid IN (old.id * 8 + 4);
+        INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+            SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'document', ref_id_, title_, body_
+            FROM (SELECT d.id * 8 + 4 AS rowid_, d.id AS ref_id_, 'Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, '') AS title_, coalesce(d.description, '') || ' ' || coalesce(d.file_path, '') AS body_
+            FROM documents d
+            WHERE d.id = new.id);
+    END""",
+    'search_documents_ad': """AFTER DELETE ON documents BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 8 + 4;
+    END""",
+}
+
+REBUILD = [
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+        SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'tenant', ref_id_, title_, body_
+        FROM (SELECT t.id * 8 + 1 AS rowid_, t.id AS ref_id_, coalesce(t.name, '') AS title_, coalesce(t.legal_info, '') || ' ' || coalesce(t.contact_info, '') AS body_
+        FROM tenants t
+        WHERE 1)""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+        SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'property', ref_id_, title_, body_
+        FROM (SELECT p.id * 8 + 2 AS rowid_, p.id AS ref_id_, coalesce(p.name, '') AS title_, coalesce(p.address, '') || ' ' || coalesce(p.description, '') AS body_
+        FROM properties p
+        WHERE 1)""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+        SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'contract', ref_id_, title_, body_
+        FROM (SELECT c.id * 8 + 3 AS rowid_, c.id AS ref_id_, 'Договор №' || c.id AS title_, coalesce(t.name, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.address, '') AS body_
+        FROM contracts c
+        LEFT JOIN tenants t ON t.id = c.tenant_id
+        LEFT JOIN properties p ON p.id = c.property_id
+        WHERE 1)""",
+    """INSERT INTO search_index(rowid, title, body, kind, ref_id, title_text, body_text)
+        SELECT rowid_, replace(replace(title_, 'ё', 'е'), 'Ё', 'Е'), replace(replace(body_, 'ё', 'е'), 'Ё', 'Е'), 'document', ref_id_, title_, body_
+        FROM (SELECT d.id * 8 + 4 AS rowid_, d.id AS ref_id_, 'Документ ' || coalesce(d.type, '') || ' по договору №' || coalesce(d.contract_id, '') AS title_, coalesce(d.description, '') || ' ' || coalesce(d.file_path, '') AS body_
+        FROM documents d
+        WHERE 1)""",
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite' or context.config.attributes.get('archive'):
+        return
+    conn = op.get_bind()
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(search_index)")]
+    # Индекс уже с этими колонками (база, обновленная прежней версией этой миграции)
+    if 'title_text' in columns:
+        return
+    # Имена триггеров те же, что в 0002: старые удаляются вместе с индексом
+    for name in TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+    try:
+        conn.exec_driver_sql(CREATE_INDEX)
+    except OperationalError:
+        # Без FTS5 поиск отключается, миграция все равно считается выполненной
+        return
+    for name, body in TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER {name} {body}")
+    for statement in REBUILD:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO search_index(search_index) VALUES ('optimize')")
+
+
+def downgrade():
+    # Прежний код читает из индекса только title и body, лишние колонки ему не мешают
+    pass
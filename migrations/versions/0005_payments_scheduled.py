@@ -0,0 +1,32 @@
+"""Флаг платежей графика payments.scheduled
+
+Раньше платежи графика узнавались по началу описания "Ежемесячный платеж",
+и платеж, внесенный вручную с тем же текстом, мог быть изменен или удален
+пересчетом графика. Уже созданные платежи графика отмечаются по точному
+виду описания, который записывал график: "Ежемесячный платеж за ММ.ГГГГ".
+
+Revision ID: 0005
+Revises: 0004
+"""
+from alembic import op, context
+import sqlalchemy as sa
+
+from core.schema import update_in_chunks
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payments', sa.Column('scheduled', sa.Integer(), server_default='0', nullable=True))
+    with op.get_context().autocommit_block():
+        update_in_chunks(op.get_bind(), 'payments', "scheduled = 1",
+                         "description LIKE 'Ежемесячный платеж за __.____' AND scheduled = 0",
+                         "Платежи графика", progress=context.config.attributes.get('progress'))
+
+
+def downgrade():
+    with op.batch_alter_table('payments') as batch_op:
+        batch_op.drop_column('scheduled')
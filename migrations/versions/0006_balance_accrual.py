@@ -0,0 +1,47 @@
+"""Сальдо договоров: начисленное на дату отдельно от будущих платежей графика
+
+В задолженность contract_balances.balance входили все платежи договора,
+включая еще не наступившие сроки графика. Добавляются колонки scheduled
+(будущие начисления) и accrued_on (дата разнесения), сальдо пересчитывается
+на день миграции.
+
+Revision ID: 0006
+Revises: 0005
+"""
+from datetime import date, datetime
+
+from alembic import op, context
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+REBUILD = """
+INSERT INTO contract_balances (contract_id, charged, scheduled, paid, balance, accrued_on, updated_at)
+SELECT contract_id, charged, scheduled, paid, charged - paid, :today, :now FROM (
+    SELECT contract_id,
+           coalesce(sum(CASE WHEN due_date > :today THEN 0.0 ELSE amount END), 0.0) AS charged,
+           coalesce(sum(CASE WHEN due_date > :today THEN amount ELSE 0.0 END), 0.0) AS scheduled,
+           coalesce(sum(CASE WHEN status = 'PAID' THEN amount ELSE 0.0 END), 0.0) AS paid
+    FROM payments WHERE contract_id IS NOT NULL GROUP BY contract_id
+)
+"""
+
+
+def upgrade():
+    op.add_column('contract_balances', sa.Column('scheduled', sa.Float(), server_default='0', nullable=True))
+    op.add_column('contract_balances', sa.Column('accrued_on', sa.Date(), nullable=True))
+    # В архиве сальдо не ведется: перенесенные платежи учтены в рабочей базе
+    if context.config.attributes.get('archive'):
+        return
+    op.execute("DELETE FROM contract_balances")
+    op.get_bind().execute(sa.text(REBUILD), {'today': date.today().isoformat(),
+                                             'now': datetime.now().isoformat(sep=' ')})
+
+
+def downgrade():
+    with op.batch_alter_table('contract_balances') as batch_op:
+        batch_op.drop_column('accrued_on')
+        batch_op.drop_column('scheduled')
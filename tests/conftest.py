@@ -0,0 +1,45 @@
+"""Общие фикстуры: каждая проверка работает со своей базой во временном каталоге"""
+from datetime import date
+
+import pytest
+
+from core.database import init_db, Session, Property, Tenant, Contract, ContractStatus
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Фото, документы и копии создаются относительно текущего каталога
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db_path(workdir):
+    return str(workdir / 'rental.db')
+
+
+@pytest.fixture
+def engine(db_path):
+    engine = init_db(f"sqlite:///{db_path}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = Session(bind=engine)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_contract(session):
+    """Договор с новым объектом и арендатором"""
+    def make(start=date(2024, 1, 1), end=date(2024, 12, 31), rent=1000.0, status=ContractStatus.ACTIVE):
+        contract = Contract(property=Property(name="Офис", address="ул. Ленина, 1"),
+                            tenant=Tenant(name="ООО Ромашка"),
+                            start_date=start, end_date=end, rent_amount=rent, status=status)
+        session.add(contract)
+        session.commit()
+        return contract
+    return make
@@ -0,0 +1,87 @@
+import os
+from datetime import date
+
+from sqlalchemy import select, func
+
+from core.archive import archive_old_records, archive_counts, archive_file, history, is_attached
+from core.database import init_db, Payment, Contract, PaymentSchedule, PaymentStatus, ContractStatus
+from core.ledger import get_balance
+
+
+def _old_contract(session, make_contract):
+    contract = make_contract(start=date(2019, 1, 1), end=date(2019, 12, 31), status=ContractStatus.EXPIRED)
+    session.add(PaymentSchedule(contract_id=contract.id, billing='calendar'))
+    session.add_all([Payment(contract_id=contract.id, amount=1000.0, due_date=date(2019, month, 1),
+                             payment_date=date(2019, month, 5), status=PaymentStatus.PAID)
+                     for month in range(1, 13)])
+    session.commit()
+    return contract
+
+
+def test_archive_round_trip(engine, session, db_path, make_contract):
+    old = _old_contract(session, make_contract)
+    current = make_contract(start=date(2019, 6, 1), end=date(2030, 12, 31))
+    session.add_all([
+        Payment(contract_id=current.id, amount=500.0, due_date=date(2019, 6, 1),
+                payment_date=date(2019, 6, 2), status=PaymentStatus.PAID),
+        Payment(contract_id=current.id, amount=500.0, due_date=date(2019, 7, 1), status=PaymentStatus.PENDING),
+    ])
+    session.commit()
+    with engine.connect() as conn:
+        before = conn.execute(select(Payment.id, Payment.amount, Payment.due_date, Payment.status)
+                              .order_by(Payment.id)).all()
+        debt = get_balance(conn, current.id)[2]
+    old_id, current_id = old.id, current.id
+    session.close()
+
+    result = archive_old_records(engine, cutoff=date(2021, 1, 1), chunk_size=5)
+    assert (result.payments, result.contracts) == (13, 1)
+    assert os.path.exists(archive_file(db_path))
+    assert archive_counts(engine) == {'payments': (1, 13), 'contracts': (1, 1)}
+
+    with engine.connect() as conn:
+        # Вся история видна через представление all_payments с теми же значениями
+        table = history(engine, Payment)
+        after = conn.execute(select(table.c.id, table.c.amount, table.c.due_date, table.c.status)
+                             .order_by(table.c.id)).all()
+        assert after == before
+        # Задолженность не меняется, договор и его график ушли в архив вместе
+        assert get_balance(conn, current_id)[2] == debt
+        assert conn.execute(select(Contract.id)).scalars().all() == [current_id]
+        assert conn.execute(select(func.count()).select_from(PaymentSchedule)).scalar() == 0
+        assert get_balance(conn, old_id) == (0.0, 0.0, 0.0)
+
+    # Повторный перенос ничего не находит
+    result = archive_old_records(engine, cutoff=date(2021, 1, 1))
+    assert (result.payments, result.contracts) == (0, 0)
+
+
+def test_archive_attached_on_reopen(engine, session, db_path, make_contract):
+    _old_contract(session, make_contract)
+    session.close()
+    archive_old_records(engine, cutoff=date(2021, 1, 1))
+    engine.dispose()
+
+    reopened = init_db(f"sqlite:///{db_path}")
+    try:
+        assert is_attached(reopened)
+        with reopened.connect() as conn:
+            table = history(reopened, Contract)
+            assert conn.execute(select(func.count()).select_from(table)).scalar() == 1
+    finally:
+        reopened.dispose()
+
+
+def test_unpaid_and_recent_payments_stay(engine, session, make_contract):
+    contract = make_contract(start=date(2019, 1, 1), end=date(2019, 12, 31), status=ContractStatus.EXPIRED)
+    session.add_all([
+        Payment(contract_id=contract.id, amount=100.0, due_date=date(2019, 1, 1), status=PaymentStatus.PENDING),
+        # Срок до отсечки, а оплата после нее
+        Payment(contract_id=contract.id, amount=100.0, due_date=date(2020, 12, 1),
+                payment_date=date(2021, 2, 1), status=PaymentStatus.PAID),
+    ])
+    session.commit()
+    session.close()
+    result = archive_old_records(engine, cutoff=date(2021, 1, 1))
+    # Договор с рабочими платежами не переносится
+    assert (result.payments, result.contracts) == (0, 0)
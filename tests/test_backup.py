@@ -0,0 +1,101 @@
+import os
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+from core.archive import archive_old_records, archive_file
+from core.backup import create_backup, verify_backup, restore_backup, read_manifest, BackupError, \
+    DATABASE_ARCHIVE
+from core.database import Payment, PaymentStatus, ContractStatus
+from core.photo_store import STORE_DIR
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _rows(db_path, table):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(f'SELECT * FROM "{table}" ORDER BY 1').fetchall()
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def filled(engine, session, make_contract):
+    """База с договором, платежом и двумя файлами"""
+    contract = make_contract()
+    session.add(Payment(contract_id=contract.id, amount=1000.0, due_date=date(2024, 1, 1),
+                        status=PaymentStatus.PENDING))
+    session.commit()
+    _write(os.path.join(STORE_DIR, 'ab', 'photo.jpg'), b'jpeg' * 100)
+    _write(os.path.join(f'documents_{contract.id}', 'contract.docx'), b'docx')
+    session.close()
+    return engine
+
+
+def test_backup_and_restore(filled, db_path, workdir):
+    backup = create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    assert verify_backup(backup.path) == []
+    assert backup.files == 2
+    manifest = read_manifest(backup.path)
+    assert manifest['database']['tables']['payments'] == 1
+
+    restored_db = str(workdir / 'restored' / 'rental.db')
+    os.makedirs(os.path.dirname(restored_db))
+    assert restore_backup(backup.path, restored_db, root=str(workdir / 'restored')) == 2
+    for table in ('contracts', 'payments', 'contract_balances'):
+        assert _rows(restored_db, table) == _rows(db_path, table)
+    with open(workdir / 'restored' / STORE_DIR / 'ab' / 'photo.jpg', 'rb') as f:
+        assert f.read() == b'jpeg' * 100
+
+
+def test_unchanged_files_are_linked(filled, db_path):
+    create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    _write(os.path.join(STORE_DIR, 'cd', 'new.jpg'), b'new')
+    backup = create_backup(db_path, now=datetime(2024, 5, 2, 12, 0))
+    assert (backup.files, backup.linked, backup.copied_bytes) == (3, 2, 3)
+    assert verify_backup(backup.path) == []
+
+
+def test_restore_replaces_only_changed_files(filled, db_path):
+    backup = create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    _write(os.path.join(STORE_DIR, 'ab', 'photo.jpg'), b'damaged')
+    assert restore_backup(backup.path, db_path, overwrite=True) == 1
+    with open(os.path.join(STORE_DIR, 'ab', 'photo.jpg'), 'rb') as f:
+        assert f.read() == b'jpeg' * 100
+
+
+def test_restore_refuses_existing_database(filled, db_path):
+    backup = create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    with pytest.raises(BackupError):
+        restore_backup(backup.path, db_path)
+
+
+def test_damaged_backup_is_not_restored(filled, db_path, workdir):
+    backup = create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    with open(os.path.join(backup.path, DATABASE_ARCHIVE), 'ab') as f:
+        f.write(b'garbage')
+    assert verify_backup(backup.path)
+    with pytest.raises(BackupError):
+        restore_backup(backup.path, str(workdir / 'other.db'))
+    assert not os.path.exists(workdir / 'other.db')
+
+
+def test_backup_includes_archive(engine, session, db_path, workdir, make_contract):
+    contract = make_contract(start=date(2019, 1, 1), end=date(2019, 12, 31), status=ContractStatus.EXPIRED)
+    session.add(Payment(contract_id=contract.id, amount=1000.0, due_date=date(2019, 1, 1),
+                        payment_date=date(2019, 1, 1), status=PaymentStatus.PAID))
+    session.commit()
+    session.close()
+    archive_old_records(engine, cutoff=date(2021, 1, 1))
+
+    backup = create_backup(db_path, now=datetime(2024, 5, 1, 12, 0))
+    assert read_manifest(backup.path)['archive']['tables']['payments'] == 1
+    restored_db = str(workdir / 'copy.db')
+    restore_backup(backup.path, restored_db, root=str(workdir / 'files'))
+    assert _rows(archive_file(restored_db), 'payments') == _rows(archive_file(db_path), 'payments')
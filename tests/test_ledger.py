@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+from core.database import Payment, PaymentStatus, ContractBalance
+from core.ledger import get_balance, rebuild_balances, accrue_balances, balances_by_tenant, contract_ledger
+
+
+def _balance(engine, contract):
+    with engine.connect() as conn:
+        return get_balance(conn, contract.id)
+
+
+def _pay(session, contract, amount, due, paid=None):
+    payment = Payment(contract_id=contract.id, amount=amount, due_date=due, payment_date=paid,
+                      status=PaymentStatus.PAID if paid else PaymentStatus.PENDING)
+    session.add(payment)
+    session.commit()
+    return payment
+
+
+def test_balance_follows_payment_changes(engine, session, make_contract):
+    contract = make_contract()
+    january = _pay(session, contract, 1000.0, date(2024, 1, 1))
+    _pay(session, contract, 1000.0, date(2024, 2, 1))
+    assert _balance(engine, contract) == (2000.0, 0.0, 2000.0)
+
+    january.status = PaymentStatus.PAID
+    january.payment_date = date(2024, 1, 3)
+    session.commit()
+    assert _balance(engine, contract) == (2000.0, 1000.0, 1000.0)
+
+    january.amount = 1200.0
+    session.commit()
+    assert _balance(engine, contract) == (2200.0, 1200.0, 1000.0)
+
+    session.delete(january)
+    session.commit()
+    assert _balance(engine, contract) == (1000.0, 0.0, 1000.0)
+
+
+def test_payment_moved_to_other_contract(engine, session, make_contract):
+    first, second = make_contract(), make_contract()
+    payment = _pay(session, first, 500.0, date(2024, 1, 1), paid=date(2024, 1, 1))
+    payment.contract_id = second.id
+    session.commit()
+    assert _balance(engine, first) == (0.0, 0.0, 0.0)
+    assert _balance(engine, second) == (500.0, 500.0, 0.0)
+
+
+def test_rebuild_matches_incremental(engine, session, make_contract):
+    contracts = [make_contract(), make_contract()]
+    for number, contract in enumerate(contracts, 1):
+        _pay(session, contract, 100.0 * number, date(2024, 1, 1), paid=date(2024, 1, 5))
+        _pay(session, contract, 300.0, date(2024, 2, 1))
+    with engine.connect() as conn:
+        incremental = conn.execute(select(ContractBalance.contract_id, ContractBalance.charged,
+                                          ContractBalance.paid, ContractBalance.balance)).all()
+    with engine.begin() as conn:
+        rebuild_balances(conn)
+    with engine.connect() as conn:
+        rebuilt = conn.execute(select(ContractBalance.contract_id, ContractBalance.charged,
+                                      ContractBalance.paid, ContractBalance.balance)).all()
+        by_tenant = balances_by_tenant(conn)
+    assert sorted(rebuilt) == sorted(incremental)
+    assert by_tenant[contracts[1].tenant_id] == (500.0, 200.0, 300.0)
+
+
+def test_contract_ledger_running_balance(engine, session, make_contract):
+    contract = make_contract()
+    _pay(session, contract, 1000.0, date(2024, 1, 1), paid=date(2024, 1, 10))
+    _pay(session, contract, 1000.0, date(2024, 2, 1), paid=date(2024, 2, 20))
+    _pay(session, contract, 1000.0, date(2024, 3, 1))
+    with engine.connect() as conn:
+        ledger = contract_ledger(conn, contract.id, start=date(2024, 2, 1), end=date(2024, 2, 29))
+    # Январь начислен и оплачен: входящее сальдо нулевое
+    assert ledger.opening == 0.0
+    assert [(entry.date, entry.debit, entry.credit, entry.balance) for entry in ledger.entries] == [
+        (date(2024, 2, 1), 1000.0, 0.0, 1000.0), (date(2024, 2, 20), 0.0, 1000.0, 0.0)]
+    assert (ledger.charged, ledger.paid, ledger.closing) == (1000.0, 1000.0, 0.0)
+
+
+def test_future_schedule_is_not_debt(engine, session, make_contract):
+    today = date.today()
+    contract = make_contract(start=today, end=today + timedelta(days=365))
+    _pay(session, contract, 1000.0, today)
+    future = _pay(session, contract, 1000.0, today + timedelta(days=31))
+    assert _balance(engine, contract) == (1000.0, 0.0, 1000.0)
+    with engine.connect() as conn:
+        assert conn.execute(select(ContractBalance.scheduled)).scalar_one() == 1000.0
+
+    # Перенос срока на сегодня переводит сумму из графика в задолженность
+    future.due_date = today
+    session.commit()
+    assert _balance(engine, contract) == (2000.0, 0.0, 2000.0)
+
+
+def test_accrue_moves_due_instalments(engine, session, make_contract):
+    contract = make_contract()
+    _pay(session, contract, 1000.0, date(2024, 1, 1))
+    _pay(session, contract, 1000.0, date(2024, 2, 1))
+    with engine.begin() as conn:
+        rebuild_balances(conn, today=date(2024, 1, 15))
+    assert _balance(engine, contract) == (1000.0, 0.0, 1000.0)
+    with engine.begin() as conn:
+        assert accrue_balances(conn, today=date(2024, 1, 20)) == 0
+        assert accrue_balances(conn, today=date(2024, 2, 1)) == 1
+        row = conn.execute(select(ContractBalance.scheduled, ContractBalance.accrued_on)).one()
+    assert tuple(row) == (0.0, date(2024, 2, 1))
+    assert _balance(engine, contract) == (2000.0, 0.0, 2000.0)
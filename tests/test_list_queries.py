@@ -0,0 +1,52 @@
+from datetime import date
+
+import pytest
+
+from core.database import Tenant
+from core.list_queries import ListFilter, CONTRACTS, TENANTS, CONTRACT_LOOKUP, TENANT_LOOKUP
+from core.search import drop_search_index, search_available
+
+
+@pytest.fixture(params=['fts', 'like'])
+def search_mode(request, engine):
+    """Один и тот же поиск с индексом search_index и без него (SQLite без FTS5)"""
+    if request.param == 'like':
+        with engine.begin() as conn:
+            drop_search_index(conn)
+    assert search_available(engine) == (request.param == 'fts')
+    return request.param
+
+
+def _ids(engine, list_query, text):
+    with engine.connect() as conn:
+        rows, _ = list_query.fetch_page(conn, ListFilter(text=text))
+    return [row.id for row in rows]
+
+
+def test_contracts_filtered_by_tenant_words(engine, session, make_contract, search_mode):
+    first, second = make_contract(), make_contract()
+    second.tenant.name = "ИП Васильков"
+    session.commit()
+    assert _ids(engine, CONTRACTS, "ромаш") == [first.id]
+    assert _ids(engine, CONTRACTS, "васил") == [second.id]
+    assert _ids(engine, CONTRACTS, "ленина ромашка") == [first.id]
+    assert _ids(engine, CONTRACTS, f"№{second.id}") == [second.id]
+    assert _ids(engine, CONTRACTS, "машка") == []
+
+
+def test_tenants_filtered_by_contacts(engine, session, search_mode):
+    session.add_all([Tenant(name="ООО Ромашка", contact_info="info@romashka.ru"),
+                     Tenant(name="ООО Лютик", contact_info="lutik_office@mail.ru")])
+    session.commit()
+    assert _ids(engine, TENANTS, "romashka") == [1]
+    assert _ids(engine, TENANTS, "lutik_office") == [2]
+
+
+def test_lookup_by_word_prefix(engine, session, make_contract, search_mode):
+    first, second = make_contract(), make_contract()
+    second.tenant.name = "ИП Васильков"
+    session.commit()
+    with engine.connect() as conn:
+        assert CONTRACT_LOOKUP.fetch(conn, "васил")[0] == [
+            (second.id, f"Договор №{second.id} — ИП Васильков (ул. Ленина, 1)")]
+        assert [item[0] for item in TENANT_LOOKUP.fetch(conn, "ооо")[0]] == [first.tenant_id]
@@ -0,0 +1,55 @@
+import os
+
+from core.database import Property
+from core.photo_store import add_photo, store_photo, purge_unreferenced, remove_property_photos
+from core.session_manager import unit_of_work
+
+
+def _source(name, content):
+    with open(name, 'wb') as f:
+        f.write(content)
+    return name
+
+
+def test_purge_removes_files_after_commit(engine, session):
+    property = Property(name="Офис")
+    session.add(property)
+    session.flush()
+    path = add_photo(session, property.id, _source('a.jpg', b'a' * 100)).file_path
+    session.commit()
+
+    with unit_of_work(engine) as work:
+        remove_property_photos(work, property.id)
+        work.flush()
+        assert purge_unreferenced(work, [path]) == 100
+        # До commit файл остается на месте
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_rolled_back_purge_keeps_files(engine, session):
+    path = store_photo(session, _source('a.jpg', b'a' * 100))
+    session.flush()
+    purge_unreferenced(session, [path])
+    session.rollback()
+    assert os.path.exists(path)
+    session.commit()
+    assert os.path.exists(path)
+
+
+def test_delete_property_purges_only_its_files(engine, session):
+    property = Property(name="Офис")
+    session.add(property)
+    session.flush()
+    own = add_photo(session, property.id, _source('a.jpg', b'a' * 100)).file_path
+    # Файл в хранилище без ссылок, например импорт еще не создал записи
+    pending = store_photo(session, _source('b.jpg', b'b' * 100))
+    session.commit()
+
+    paths = remove_property_photos(session, property.id)
+    session.delete(property)
+    session.flush()
+    purge_unreferenced(session, paths)
+    session.commit()
+    assert not os.path.exists(own)
+    assert os.path.exists(pending)
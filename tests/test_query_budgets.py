@@ -0,0 +1,52 @@
+"""Загрузка каждого экрана укладывается в лимит SQL-запросов (QUERY_BUDGETS бенчмарков)"""
+import os
+import shutil
+
+import pytest
+
+from benchmarks.datagen import generate_database
+from benchmarks.run import PATHS, QUERY_BUDGETS
+from core.database import init_db, Session
+from core.query_guard import assert_max_queries, enable_strict_loading, disable_strict_loading
+
+SCALE = 20
+
+
+@pytest.fixture(scope='module')
+def source_db(tmp_path_factory):
+    return generate_database(str(tmp_path_factory.mktemp('budgets') / 'source.db'), SCALE)
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def screen_session(qapp, source_db, workdir):
+    # Некоторые экраны пишут в базу при загрузке, поэтому у каждой проверки своя копия
+    db_path = str(workdir / 'rental.db')
+    shutil.copyfile(source_db, db_path)
+    engine = init_db(f"sqlite:///{db_path}")
+    # Неявная ленивая загрузка связи - тоже N+1, она сразу роняет проверку
+    enable_strict_loading(Session)
+    session = Session(bind=engine)
+    yield session
+    session.close()
+    disable_strict_loading(Session)
+    engine.dispose()
+
+
+def test_every_path_has_budget():
+    assert set(PATHS) <= set(QUERY_BUDGETS)
+
+
+@pytest.mark.parametrize('path', sorted(PATHS))
+def test_load_within_budget(path, screen_session):
+    call = PATHS[path](screen_session)
+    # Как в бенчмарках: загрузка начинается с пустой identity map
+    screen_session.expunge_all()
+    with assert_max_queries(screen_session, QUERY_BUDGETS[path], path):
+        call()
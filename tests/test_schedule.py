@@ -0,0 +1,161 @@
+from datetime import date
+
+from sqlalchemy import select
+
+from core.database import Payment, PaymentSchedule, PaymentStatus, ContractStatus
+from core.ledger import get_balance
+from core.schedule import build_schedule, generate_payments, regenerate_schedule, schedule_for
+
+
+def _payments(session, contract):
+    session.expire_all()
+    return session.scalars(select(Payment).where(Payment.contract_id == contract.id)
+                           .order_by(Payment.due_date)).all()
+
+
+def _balance(engine, contract):
+    with engine.connect() as conn:
+        return get_balance(conn, contract.id)
+
+
+def test_anniversary_billing():
+    schedule = build_schedule([1], [date(2024, 1, 15)], [date(2024, 4, 14)], [1000.0])
+    assert schedule.for_contract(1) == [
+        (date(2024, 1, 15), 1000.0), (date(2024, 2, 15), 1000.0), (date(2024, 3, 15), 1000.0)]
+
+
+def test_anniversary_at_month_end_moves_to_last_day():
+    schedule = build_schedule([1], [date(2024, 1, 31)], [date(2024, 3, 30)], [1000.0])
+    assert [due for due, _ in schedule.for_contract(1)] == [date(2024, 1, 31), date(2024, 2, 29)]
+
+
+def test_calendar_billing_prorates_first_month():
+    schedule = build_schedule([1], [date(2024, 1, 16)], [date(2024, 3, 31)], [1000.0], billing='calendar')
+    assert schedule.for_contract(1) == [
+        (date(2024, 1, 16), 516.13), (date(2024, 2, 1), 1000.0), (date(2024, 3, 1), 1000.0)]
+
+
+def test_indexation_from_anniversary():
+    schedule = build_schedule([1], [date(2024, 1, 1)], [date(2025, 12, 31)], [1000.0], indexation=0.1)
+    amounts = [amount for _, amount in schedule.for_contract(1)]
+    assert amounts == [1000.0] * 12 + [1100.0] * 12
+
+
+def test_one_year_term_has_twelve_payments():
+    # Срок по умолчанию в диалоге договора - по ту же дату следующего года
+    schedule = build_schedule([1], [date(2024, 1, 15)], [date(2025, 1, 15)], [30000.0], indexation=0.05)
+    payments = schedule.for_contract(1)
+    assert len(payments) == 12
+    assert payments[-1] == (date(2024, 12, 15), 30000.0)
+
+
+def test_calendar_term_ending_on_first_day():
+    schedule = build_schedule([1], [date(2024, 1, 1)], [date(2025, 1, 1)], [1000.0], billing='calendar')
+    assert [due for due, _ in schedule.for_contract(1)][-1] == date(2024, 12, 1)
+
+
+def test_one_day_contract_has_payment():
+    schedule = build_schedule([1], [date(2024, 1, 15)], [date(2024, 1, 15)], [3100.0])
+    assert schedule.for_contract(1) == [(date(2024, 1, 15), 100.0)]
+
+
+def test_schedule_of_several_contracts():
+    schedule = build_schedule([1, 2, 3], [date(2024, 1, 1), date(2024, 6, 1), date(2024, 5, 1)],
+                              [date(2024, 3, 31), date(2024, 6, 30), date(2024, 4, 30)], [100.0, 200.0, 300.0])
+    assert schedule.contract_ids.tolist() == [1, 1, 1, 2]
+    assert schedule.for_contract(3) == []
+
+
+def test_generate_payments_once(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 1), end=date(2024, 6, 30))
+    with engine.begin() as conn:
+        assert generate_payments(conn, [contract.id]) == 6
+    with engine.begin() as conn:
+        assert generate_payments(conn, [contract.id]) == 0
+    payments = _payments(session, contract)
+    assert len(payments) == 6
+    assert {payment.status for payment in payments} == {PaymentStatus.PENDING}
+    assert _balance(engine, contract) == (6000.0, 0.0, 6000.0)
+
+
+def test_generate_skips_month_with_manual_payment(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 1), end=date(2024, 3, 31))
+    # Платеж за февраль внесен вручную и с другим числом
+    session.add(Payment(contract_id=contract.id, amount=1000.0, due_date=date(2024, 2, 10),
+                        status=PaymentStatus.PAID, payment_date=date(2024, 2, 9), description="Аренда"))
+    session.commit()
+    with engine.begin() as conn:
+        assert generate_payments(conn, [contract.id]) == 2
+    assert [payment.due_date for payment in _payments(session, contract)] == [
+        date(2024, 1, 1), date(2024, 2, 10), date(2024, 3, 1)]
+
+
+def test_regenerate_keeps_manual_payment_with_schedule_wording(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 1), end=date(2024, 3, 31))
+    session.add(Payment(contract_id=contract.id, amount=700.0, due_date=date(2024, 2, 1),
+                        status=PaymentStatus.PENDING, description="Ежемесячный платеж за 02.2024"))
+    session.commit()
+    with engine.begin() as conn:
+        assert generate_payments(conn, [contract.id]) == 2
+    contract.rent_amount = 1500.0
+    session.commit()
+    with engine.begin() as conn:
+        assert regenerate_schedule(conn, [contract.id]) == (0, 2, 0)
+    assert [(payment.amount, payment.scheduled) for payment in _payments(session, contract)] == [
+        (1500.0, 1), (700.0, 0), (1500.0, 1)]
+
+
+def test_regenerate_changes_only_unpaid(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 1), end=date(2024, 4, 30))
+    with engine.begin() as conn:
+        generate_payments(conn, [contract.id])
+    first = _payments(session, contract)[0]
+    first.status = PaymentStatus.PAID
+    first.payment_date = date(2024, 1, 1)
+    contract.rent_amount = 1500.0
+    contract.end_date = date(2024, 3, 31)
+    session.commit()
+
+    with engine.begin() as conn:
+        assert regenerate_schedule(conn, [contract.id]) == (0, 2, 1)
+    payments = _payments(session, contract)
+    assert [(payment.due_date, payment.amount) for payment in payments] == [
+        (date(2024, 1, 1), 1000.0), (date(2024, 2, 1), 1500.0), (date(2024, 3, 1), 1500.0)]
+    assert _balance(engine, contract) == (4000.0, 1000.0, 3000.0)
+
+
+def test_regenerate_with_new_billing(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 10), end=date(2024, 2, 29))
+    with engine.begin() as conn:
+        generate_payments(conn, [contract.id])
+    session.add(PaymentSchedule(contract_id=contract.id, billing='calendar', prorate=0))
+    session.commit()
+    with engine.begin() as conn:
+        # Сроки сдвигаются в пределах тех же месяцев, новых платежей не появляется
+        assert regenerate_schedule(conn, [contract.id]) == (0, 1, 0)
+    assert [payment.due_date for payment in _payments(session, contract)] == [date(2024, 1, 10), date(2024, 2, 1)]
+
+
+def test_terminated_contract_has_no_future_payments(engine, session, make_contract):
+    contract = make_contract(start=date(2024, 1, 1), end=date(2024, 12, 31))
+    with engine.begin() as conn:
+        generate_payments(conn, [contract.id])
+    contract.status = ContractStatus.TERMINATED
+    session.commit()
+
+    today = date(2024, 4, 15)
+    with engine.connect() as conn:
+        schedule = schedule_for(conn, [contract.id], today=today)
+    assert [due for due, _ in schedule.for_contract(contract.id)][-1] == date(2024, 4, 1)
+    with engine.begin() as conn:
+        assert regenerate_schedule(conn, [contract.id], today=today) == (0, 0, 8)
+    assert len(_payments(session, contract)) == 4
+
+
+def test_schedule_deleted_with_contract(engine, session, make_contract):
+    contract = make_contract()
+    session.add(PaymentSchedule(contract_id=contract.id, billing='calendar'))
+    session.commit()
+    session.delete(contract)
+    session.commit()
+    assert session.scalars(select(PaymentSchedule)).all() == []
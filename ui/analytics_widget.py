@@ -1,10 +1,14 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
                             QTableWidget, QTableWidgetItem, QMessageBox, QDialog,
                             QFormLayout, QLineEdit, QTextEdit, QComboBox, QDateEdit,
-                            QFileDialog)
+                            QFileDialog, QSpinBox, QDoubleSpinBox)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QColor
-from core.database import Contract, Property, Payment, Tenant
+from core.database import Contract, Property, Payment, Tenant, ContractStatus, PaymentStatus
+from core.instrumentation import track_action
+from core.forecast import forecast_cash_flow, DEFAULT_HORIZON
+from core.simulation import simulate_portfolio, fit_assumptions, DEFAULT_TRIALS
+from core.session_manager import read_session, read_connection
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
 from datetime import datetime, timedelta
@@ -17,6 +21,9 @@ class AnalyticsWidget(QWidget):
     def __init__(self, session: Session):
         super().__init__()
         self.session = session
+        # Допущения моделирования оцениваются по истории при первом запуске и правятся в диалоге
+        self.simulation_assumptions = None
+        self.simulation_trials = DEFAULT_TRIALS
         self.init_ui()
 
     def init_ui(self):
@@ -131,7 +138,9 @@ class AnalyticsWidget(QWidget):
             "Доходы по месяцам",
             "Загруженность помещений",
             "Топ арендаторов",
-            "Динамика платежей"
+            "Динамика платежей",
+            "Прогноз поступлений",
+            "Риски поступлений (Монте-Карло)"
         ])
         self.analytics_type.currentTextChanged.connect(self.update_analytics)
         controls.addWidget(QLabel("Тип аналитики:"))
@@ -149,6 +158,21 @@ class AnalyticsWidget(QWidget):
         controls.addWidget(QLabel("По:"))
         controls.addWidget(self.end_date)
 
+        # Горизонт прогноза
+        self.horizon = QSpinBox()
+        self.horizon.setMinimumHeight(35)
+        self.horizon.setRange(1, 120)
+        self.horizon.setValue(DEFAULT_HORIZON)
+        self.horizon.setSuffix(" мес.")
+        self.horizon.valueChanged.connect(self.update_analytics)
+        controls.addWidget(QLabel("Горизонт:"))
+        controls.addWidget(self.horizon)
+
+        self.assumptions_btn = QPushButton("Допущения...")
+        self.assumptions_btn.setMinimumHeight(35)
+        self.assumptions_btn.clicked.connect(self.edit_simulation_assumptions)
+        controls.addWidget(self.assumptions_btn)
+
         # Кнопка экспорта
         export_btn = QPushButton("Экспорт в Excel")
         export_btn.setMinimumHeight(35)
@@ -202,10 +226,13 @@ class AnalyticsWidget(QWidget):
         # Инициализация первого отчета
         self.update_analytics()
 
+    @track_action("update_analytics")
     def update_analytics(self):
         analytics_type = self.analytics_type.currentText()
         start_date = self.start_date.date().toPyDate()
         end_date = self.end_date.date().toPyDate()
+        self.horizon.setEnabled(analytics_type in ("Прогноз поступлений", "Риски поступлений (Монте-Карло)"))
+        self.assumptions_btn.setEnabled(analytics_type == "Риски поступлений (Монте-Карло)")
 
         if analytics_type == "Доходы по месяцам":
             self.show_monthly_income(start_date, end_date)
@@ -215,16 +242,21 @@ class AnalyticsWidget(QWidget):
             self.show_top_tenants(start_date, end_date)
         elif analytics_type == "Динамика платежей":
             self.show_payment_dynamics(start_date, end_date)
+        elif analytics_type == "Прогноз поступлений":
+            self.show_cash_flow_forecast(self.horizon.value())
+        elif analytics_type == "Риски поступлений (Монте-Карло)":
+            self.show_income_risk(self.horizon.value())
 
     def show_monthly_income(self, start_date, end_date):
         # Получаем данные
-        payments = self.session.query(
-            func.strftime('%Y-%m', Payment.payment_date).label('month'),
-            func.sum(Payment.amount).label('total_amount')
-        ).filter(
-            Payment.payment_date.between(start_date, end_date),
-            Payment.status == 'paid'
-        ).group_by('month').all()
+        with read_session(self.session) as session:
+            payments = session.query(
+                func.strftime('%Y-%m', Payment.payment_date).label('month'),
+                func.sum(Payment.amount).label('total_amount')
+            ).filter(
+                Payment.payment_date.between(start_date, end_date),
+                Payment.status == PaymentStatus.PAID
+            ).group_by('month').all()
 
         # Очищаем график
         self.figure.clear()
@@ -253,16 +285,24 @@ class AnalyticsWidget(QWidget):
 
     def show_occupancy_analytics(self):
         # Получаем данные
-        properties = self.session.query(Property).all()
+        # Площадь по активным договорам считается в базе одним запросом по всем объектам
+        with read_session(self.session) as session:
+            rented = session.query(
+                Contract.property_id, func.sum(Contract.area).label('rented_area')
+            ).filter(Contract.status == ContractStatus.ACTIVE).group_by(Contract.property_id).subquery()
+            # Для графика нужны только название и площадь, объекты ORM не загружаются
+            rows = session.query(
+                Property.name, Property.area, func.coalesce(rented.c.rented_area, 0)
+            ).outerjoin(rented, rented.c.property_id == Property.id).all()
         
         # Очищаем график
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
         # Строим график
-        names = [p.name for p in properties]
-        areas = [p.area for p in properties]
-        rented_areas = [sum(c.area for c in p.contracts if c.status == 'active') for p in properties]
+        names = [name for name, _, _ in rows]
+        areas = [area for _, area, _ in rows]
+        rented_areas = [rented_area for _, _, rented_area in rows]
         
         x = range(len(names))
         width = 0.35
@@ -285,27 +325,27 @@ class AnalyticsWidget(QWidget):
         self.table.setHorizontalHeaderLabels([
             "Объект", "Общая площадь", "Арендованная площадь", "Загруженность"
         ])
-        self.table.setRowCount(len(properties))
-        for i, property in enumerate(properties):
-            rented_area = sum(c.area for c in property.contracts if c.status == 'active')
-            occupancy = (rented_area / property.area * 100) if property.area > 0 else 0
+        self.table.setRowCount(len(rows))
+        for i, (name, area, rented_area) in enumerate(rows):
+            occupancy = (rented_area / area * 100) if area > 0 else 0
             
-            self.table.setItem(i, 0, QTableWidgetItem(property.name))
-            self.table.setItem(i, 1, QTableWidgetItem(f"{property.area:.2f} м²"))
+            self.table.setItem(i, 0, QTableWidgetItem(name))
+            self.table.setItem(i, 1, QTableWidgetItem(f"{area:.2f} м²"))
             self.table.setItem(i, 2, QTableWidgetItem(f"{rented_area:.2f} м²"))
             self.table.setItem(i, 3, QTableWidgetItem(f"{occupancy:.1f}%"))
         self.table.resizeColumnsToContents()
 
     def show_top_tenants(self, start_date, end_date):
         # Получаем данные
-        tenants = self.session.query(Tenant, func.sum(Payment.amount)).select_from(Tenant).join(Contract).join(Payment).group_by(Tenant.id).order_by(func.sum(Payment.amount).desc()).all()
+        with read_session(self.session) as session:
+            tenants = session.query(Tenant.name, func.sum(Payment.amount)).select_from(Tenant).join(Contract).join(Payment).group_by(Tenant.id).order_by(func.sum(Payment.amount).desc()).all()
 
         # Очищаем график
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
         # Строим график
-        names = [t[0].name for t in tenants]
+        names = [t[0] for t in tenants]
         amounts = [t[1] for t in tenants]
         ax.bar(names, amounts)
         ax.set_title("Топ арендаторов по платежам")
@@ -319,21 +359,22 @@ class AnalyticsWidget(QWidget):
         self.table.setColumnCount(2)
         self.table.setHorizontalHeaderLabels(["Арендатор", "Сумма платежей"])
         self.table.setRowCount(len(tenants))
-        for i, (tenant, amount) in enumerate(tenants):
-            self.table.setItem(i, 0, QTableWidgetItem(tenant.name))
+        for i, (name, amount) in enumerate(tenants):
+            self.table.setItem(i, 0, QTableWidgetItem(name))
             self.table.setItem(i, 1, QTableWidgetItem(f"{amount:.2f} ₽"))
         self.table.resizeColumnsToContents()
 
     def show_payment_dynamics(self, start_date, end_date):
         # Получаем данные
-        payments = self.session.query(
-            func.strftime('%Y-%m', Payment.due_date).label('month'),
-            func.count(Payment.id).label('total_payments'),
-            func.sum(case((Payment.status == 'paid', Payment.amount), else_=0)).label('paid_amount'),
-            func.sum(case((Payment.status == 'overdue', Payment.amount), else_=0)).label('overdue_amount')
-        ).filter(
-            Payment.due_date.between(start_date, end_date)
-        ).group_by('month').all()
+        with read_session(self.session) as session:
+            payments = session.query(
+                func.strftime('%Y-%m', Payment.due_date).label('month'),
+                func.count(Payment.id).label('total_payments'),
+                func.sum(case((Payment.status == PaymentStatus.PAID, Payment.amount), else_=0)).label('paid_amount'),
+                func.sum(case((Payment.status == PaymentStatus.OVERDUE, Payment.amount), else_=0)).label('overdue_amount')
+            ).filter(
+                Payment.due_date.between(start_date, end_date)
+            ).group_by('month').all()
 
         # Очищаем график
         self.figure.clear()
@@ -373,6 +414,96 @@ class AnalyticsWidget(QWidget):
             self.table.setItem(i, 3, QTableWidgetItem(f"{payment.overdue_amount:.2f} ₽"))
         self.table.resizeColumnsToContents()
 
+    def show_cash_flow_forecast(self, horizon):
+        # Прогноз по действующим договорам с учетом продлений и задержек оплаты
+        with read_connection(self.session) as conn:
+            forecast = forecast_cash_flow(conn, horizon)
+        committed, renewals, income = forecast.totals()
+        months = [datetime.strptime(str(month), '%Y-%m').strftime("%m.%Y") for month in forecast.months]
+
+        # Очищаем график
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+
+        # Строим график
+        x = range(len(months))
+        ax.bar(x, committed, label='По действующим договорам')
+        ax.bar(x, renewals, bottom=committed, label='Ожидаемые продления')
+        ax.plot(x, income, color='#ff9800', marker='o', label='Ожидаемые поступления')
+        ax.set_title(f"Прогноз поступлений (вероятность продления {forecast.renewal_probability:.0%})")
+        ax.set_xlabel("Месяц")
+        ax.set_ylabel("Сумма (₽)")
+        ax.set_xticks(list(x))
+        ax.set_xticklabels(months, rotation=45)
+        ax.legend()
+
+        self.figure.tight_layout()
+        self.canvas.draw()
+
+        # Обновляем таблицу
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels([
+            "Месяц", "По договорам", "Продления", "Поступления", "Нарастающим итогом"
+        ])
+        self.table.setRowCount(len(months))
+        for i, (month, total) in enumerate(zip(months, income.cumsum())):
+            self.table.setItem(i, 0, QTableWidgetItem(month))
+            self.table.setItem(i, 1, QTableWidgetItem(f"{committed[i]:.2f} ₽"))
+            self.table.setItem(i, 2, QTableWidgetItem(f"{renewals[i]:.2f} ₽"))
+            self.table.setItem(i, 3, QTableWidgetItem(f"{income[i]:.2f} ₽"))
+            self.table.setItem(i, 4, QTableWidgetItem(f"{total:.2f} ₽"))
+        self.table.resizeColumnsToContents()
+
+    def edit_simulation_assumptions(self):
+        if self.simulation_assumptions is None:
+            with read_connection(self.session) as conn:
+                self.simulation_assumptions = fit_assumptions(conn)
+        dialog = SimulationDialog(self.simulation_assumptions, self.simulation_trials, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self.simulation_assumptions, self.simulation_trials = dialog.get_values()
+            self.update_analytics()
+
+    def show_income_risk(self, horizon):
+        # Все испытания считаются одновременно, поэтому пересчет после правки допущений занимает доли секунды
+        with read_connection(self.session) as connection:
+            if self.simulation_assumptions is None:
+                self.simulation_assumptions = fit_assumptions(connection)
+            result = simulate_portfolio(connection, horizon, self.simulation_trials, self.simulation_assumptions)
+        low, median, high = result.bands()
+        months = [datetime.strptime(str(month), '%Y-%m').strftime("%m.%Y") for month in result.months]
+
+        # Очищаем график
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+
+        # Строим график
+        x = range(len(months))
+        ax.fill_between(x, low, high, alpha=0.3, label='P5-P95')
+        ax.plot(x, median, marker='o', label='P50')
+        total_low, total_median, total_high = result.total_bands()
+        ax.set_title(f"Поступления за {horizon} мес.: P5 {total_low:,.0f} / P50 {total_median:,.0f} / "
+                     f"P95 {total_high:,.0f} ₽ ({result.trials} испытаний)")
+        ax.set_xlabel("Месяц")
+        ax.set_ylabel("Сумма (₽)")
+        ax.set_xticks(list(x))
+        ax.set_xticklabels(months, rotation=45)
+        ax.legend()
+
+        self.figure.tight_layout()
+        self.canvas.draw()
+
+        # Обновляем таблицу
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["Месяц", "P5", "P50", "P95", "Простой"])
+        self.table.setRowCount(len(months))
+        for i, month in enumerate(months):
+            self.table.setItem(i, 0, QTableWidgetItem(month))
+            self.table.setItem(i, 1, QTableWidgetItem(f"{low[i]:.2f} ₽"))
+            self.table.setItem(i, 2, QTableWidgetItem(f"{median[i]:.2f} ₽"))
+            self.table.setItem(i, 3, QTableWidgetItem(f"{high[i]:.2f} ₽"))
+            self.table.setItem(i, 4, QTableWidgetItem(f"{result.vacancy[i]:.1%}"))
+        self.table.resizeColumnsToContents()
+
     def export_to_excel(self):
         file_name, _ = QFileDialog.getSaveFileName(
             self,
@@ -396,4 +527,63 @@ class AnalyticsWidget(QWidget):
             
             # Сохраняем в Excel
             df.to_excel(file_name, index=False)
-            QMessageBox.information(self, "Успех", "Отчет успешно экспортирован в Excel") 
\ No newline at end of file
+            QMessageBox.information(self, "Успех", "Отчет успешно экспортирован в Excel") 
+
+
+class SimulationDialog(QDialog):
+    def __init__(self, assumptions, trials, parent=None):
+        super().__init__(parent)
+        self.assumptions = assumptions
+        self.setWindowTitle("Допущения моделирования")
+        layout = QFormLayout(self)
+
+        self.default_rate = self._percent(assumptions.default_rate)
+        layout.addRow("Неоплата платежа в месяц:", self.default_rate)
+        self.termination_rate = self._percent(assumptions.termination_rate)
+        layout.addRow("Досрочное расторжение в месяц:", self.termination_rate)
+        self.renewal = self._percent(assumptions.renewal_probability)
+        layout.addRow("Вероятность продления:", self.renewal)
+
+        self.relet_months = QDoubleSpinBox()
+        self.relet_months.setRange(0, 60)
+        self.relet_months.setDecimals(1)
+        self.relet_months.setValue(assumptions.relet_months)
+        self.relet_months.setSuffix(" мес.")
+        layout.addRow("Средний простой до новой сдачи:", self.relet_months)
+
+        self.trials = QSpinBox()
+        self.trials.setRange(100, 20000)
+        self.trials.setSingleStep(500)
+        self.trials.setValue(trials)
+        layout.addRow("Число испытаний:", self.trials)
+
+        buttons = QHBoxLayout()
+        save_btn = QPushButton("Применить")
+        save_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton("Отмена")
+        cancel_btn.clicked.connect(self.reject)
+        buttons.addWidget(save_btn)
+        buttons.addWidget(cancel_btn)
+        layout.addRow(buttons)
+
+    def _percent(self, value):
+        spin = QDoubleSpinBox()
+        spin.setRange(0, 100)
+        spin.setDecimals(2)
+        spin.setSuffix(" %")
+        spin.setValue(value * 100)
+        return spin
+
+    def get_values(self):
+        # Общий простой задается вручную, разбивка по объектам сохраняется только без его изменения
+        relet_months = self.relet_months.value()
+        relet_by_property = (self.assumptions.relet_by_property
+                             if abs(relet_months - self.assumptions.relet_months) < 0.05 else {})
+        assumptions = self.assumptions.replace(
+            default_rate=self.default_rate.value() / 100,
+            termination_rate=self.termination_rate.value() / 100,
+            renewal_probability=self.renewal.value() / 100,
+            relet_months=relet_months,
+            relet_by_property=relet_by_property,
+        )
+        return assumptions, self.trials.value()
@@ -6,6 +6,11 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLa
 from PyQt6.QtCore import Qt, QDate, QTimer, QTime
 from PyQt6.QtGui import QColor, QTextCharFormat
 from core.database import Contract, Property, Payment, Maintenance, PaymentStatus
+from core.instrumentation import track_action
+from core.list_queries import PROPERTY_LOOKUP, CONTRACT_LOOKUP
+from core.read_models import calendar_events
+from core.session_manager import read_session, read_connection, unit_of_work
+from ui.lookup_combo import LookupCombo
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from icalendar import Calendar, Event
@@ -240,21 +245,22 @@ class CalendarWidget(QWidget):
             
             # Показываем уведомления для событий
             for event in events:
-                if event['type'] == 'contract_end':
+                if event.type == 'contract_end':
                     QMessageBox.information(self, "Напоминание", 
-                        f"Сегодня заканчивается договор №{event['contract_id']} с {event['tenant_name']}")
-                elif event['type'] == 'payment_due':
+                        f"Сегодня заканчивается договор №{event.contract_id} с {event.tenant_name}")
+                elif event.type == 'payment_due':
                     QMessageBox.information(self, "Напоминание", 
-                        f"Сегодня срок оплаты по договору №{event['contract_id']}. Сумма: {event['amount']:.2f} ₽")
-                elif event['type'] == 'maintenance':
+                        f"Сегодня срок оплаты по договору №{event.contract_id}. Сумма: {event.amount:.2f} ₽")
+                elif event.type == 'maintenance':
                     QMessageBox.information(self, "Напоминание", 
-                        f"Сегодня запланировано техническое обслуживание: {event['property_name']}")
+                        f"Сегодня запланировано техническое обслуживание: {event.property_name}")
 
     def show_settings_dialog(self):
         dialog = SettingsDialog(self.reminder_time, self)
         if dialog.exec():
             self.reminder_time = dialog.reminder_time
 
+    @track_action("export_to_ical")
     def export_to_ical(self):
         file_name, _ = QFileDialog.getSaveFileName(
             self,
@@ -272,23 +278,21 @@ class CalendarWidget(QWidget):
             start_date = datetime.now().date() - timedelta(days=30)
             end_date = datetime.now().date() + timedelta(days=365)
 
-            # Экспортируем события
-            for date in (start_date + timedelta(n) for n in range((end_date - start_date).days)):
-                events = self.get_events_for_date(date)
-                for event in events:
-                    ical_event = Event()
-                    ical_event.add('summary', event['title'])
-                    ical_event.add('description', event['description'])
-                    ical_event.add('dtstart', date)
-                    ical_event.add('dtend', date)
-                    
-                    # Добавляем напоминание
-                    ical_event.add('alarm', {
-                        'action': 'DISPLAY',
-                        'trigger': timedelta(days=-1)  # За день до события
-                    })
-                    
-                    cal.add_component(ical_event)
+            # Экспортируем события (все события диапазона выбираются тремя запросами)
+            for event in self.get_events_between(start_date, end_date - timedelta(days=1)):
+                ical_event = Event()
+                ical_event.add('summary', event.title)
+                ical_event.add('description', event.description)
+                ical_event.add('dtstart', event.date)
+                ical_event.add('dtend', event.date)
+                
+                # Добавляем напоминание
+                ical_event.add('alarm', {
+                    'action': 'DISPLAY',
+                    'trigger': timedelta(days=-1)  # За день до события
+                })
+                
+                cal.add_component(ical_event)
 
             # Сохраняем файл
             with open(file_name, 'wb') as f:
@@ -297,62 +301,17 @@ class CalendarWidget(QWidget):
             QMessageBox.information(self, "Успех", "Календарь успешно экспортирован")
 
     def get_events_for_date(self, date):
-        events = []
-
-        # Проверяем окончание договоров
-        expiring_contracts = self.session.query(Contract).filter(
-            Contract.end_date == date
-        ).all()
-        for contract in expiring_contracts:
-            events.append({
-                'type': 'contract_end',
-                'contract_id': contract.id,
-                'tenant_name': contract.tenant.name,
-                'title': f"Окончание договора №{contract.id}",
-                'description': f"Договор с {contract.tenant.name} заканчивается"
-            })
-
-        # Проверяем сроки оплаты
-        due_payments = self.session.query(Payment).filter(
-            Payment.due_date == date
-        ).all()
-        for payment in due_payments:
-            # Проверяем, существует ли связанный договор
-            if payment.contract:
-                events.append({
-                    'type': 'payment_due',
-                    'contract_id': payment.contract.id,
-                    'amount': payment.amount,
-                    'title': f"Срок оплаты по договору №{payment.contract.id}",
-                    'description': f"Сумма: {payment.amount:.2f} ₽"
-                })
-            else:
-                # Обрабатываем случай удаленного договора
-                events.append({
-                    'type': 'payment_due',
-                    'contract_id': None,
-                    'amount': payment.amount,
-                    'title': "Срок оплаты (договор удален)",
-                    'description': f"Сумма: {payment.amount:.2f} ₽"
-                })
-
-        # Проверяем техническое обслуживание
-        maintenance = self.session.query(Maintenance).filter(
-            Maintenance.date == date
-        ).all()
-        for maint in maintenance:
-            events.append({
-                'type': 'maintenance',
-                'property_name': maint.property.name,
-                'title': f"Техническое обслуживание: {maint.property.name}",
-                'description': maint.description
-            })
+        return self.get_events_between(date, date)
 
-        return events
+    def get_events_between(self, start_date, end_date):
+        """События за период (core.read_models), упорядоченные по дате"""
+        with read_connection(self.session) as conn:
+            return calendar_events(conn, start_date, end_date)
 
     def date_selected(self, date):
         self.update_events_list()
 
+    @track_action("update_events_list")
     def update_events_list(self):
         self.events_list.clear()
         selected_date = self.calendar.selectedDate().toPyDate()
@@ -361,20 +320,20 @@ class CalendarWidget(QWidget):
         # Фильтруем события
         filtered_events = [
             event for event in events 
-            if self.filters[event['type']].isChecked()
+            if self.filters[event.type].isChecked()
         ]
 
         # Отображаем события в списке
         for event in filtered_events:
             item = QListWidgetItem()
-            item.setText(f"{event['title']}\n{event['description']}")
+            item.setText(f"{event.title}\n{event.description}")
             
             # Устанавливаем цвет в зависимости от типа события
-            if event['type'] == 'contract_end':
+            if event.type == 'contract_end':
                 item.setBackground(QColor(255, 200, 200))  # Красный
-            elif event['type'] == 'payment_due':
+            elif event.type == 'payment_due':
                 item.setBackground(QColor(255, 255, 200))  # Желтый
-            elif event['type'] == 'maintenance':
+            elif event.type == 'maintenance':
                 item.setBackground(QColor(200, 255, 200))  # Зеленый
             
             self.events_list.addItem(item)
@@ -384,6 +343,7 @@ class CalendarWidget(QWidget):
         if dialog.exec():
             self.update_events_list()
 
+    @track_action("update_calendar_colors")
     def update_calendar_colors(self):
         """Обновляет цвета в календаре на основе статусов объектов и событий"""
         # Получаем все даты в текущем месяце
@@ -391,38 +351,44 @@ class CalendarWidget(QWidget):
         first_day = QDate(current_date.year(), current_date.month(), 1)
         last_day = QDate(current_date.year(), current_date.month(), current_date.daysInMonth())
         
-        # Получаем все договоры и их даты
-        contracts = self.session.query(Contract).all()
-        for contract in contracts:
-            start_date = contract.start_date
-            end_date = contract.end_date
-            
-            # Если договор активен в текущем месяце
-            if (start_date <= last_day.toPyDate() and end_date >= first_day.toPyDate()):
-                # Получаем даты для окраски
-                color_start = max(start_date, first_day.toPyDate())
-                color_end = min(end_date, last_day.toPyDate())
-                
-                # Окрашиваем даты в календаре
-                current = color_start
-                while current <= color_end:
-                    qdate = QDate(current.year, current.month, current.day)
-                    self.calendar.setDateTextFormat(qdate, self.get_date_format('occupied'))
-                    current += timedelta(days=1)
+        month_start = first_day.toPyDate()
+        month_end = last_day.toPyDate()
+
+        with read_session(self.session) as session:
+            # Получаем договоры, пересекающиеся с текущим месяцем
+            contract_periods = session.query(Contract.start_date, Contract.end_date).filter(
+                Contract.start_date <= month_end,
+                Contract.end_date >= month_start
+            ).all()
+            # Даты технического обслуживания и платежей в текущем месяце
+            maintenance_dates = session.query(Maintenance.date).filter(
+                Maintenance.date.between(month_start, month_end)
+            ).distinct().all()
+            payment_dates = session.query(Payment.due_date).filter(
+                Payment.due_date.between(month_start, month_end)
+            ).distinct().all()
+
+        occupied = set()
+        for start_date, end_date in contract_periods:
+            # Получаем даты для окраски
+            current = max(start_date, month_start)
+            color_end = min(end_date, month_end)
+            while current <= color_end:
+                occupied.add(current)
+                current += timedelta(days=1)
+
+        # Окрашиваем даты в календаре
+        occupied_format = self.get_date_format('occupied')
+        for date in occupied:
+            self.calendar.setDateTextFormat(QDate(date.year, date.month, date.day), occupied_format)
         
-        # Получаем все даты технического обслуживания
-        maintenance_dates = self.session.query(Maintenance.date).all()
-        for date in maintenance_dates:
-            qdate = QDate(date[0].year, date[0].month, date[0].day)
-            if first_day <= qdate <= last_day:
-                self.calendar.setDateTextFormat(qdate, self.get_date_format('maintenance'))
+        for (date,) in maintenance_dates:
+            qdate = QDate(date.year, date.month, date.day)
+            self.calendar.setDateTextFormat(qdate, self.get_date_format('maintenance'))
         
-        # Получаем все даты платежей
-        payment_dates = self.session.query(Payment.due_date).all()
-        for date in payment_dates:
-            qdate = QDate(date[0].year, date[0].month, date[0].day)
-            if first_day <= qdate <= last_day:
-                self.calendar.setDateTextFormat(qdate, self.get_date_format('payment'))
+        for (date,) in payment_dates:
+            qdate = QDate(date.year, date.month, date.day)
+            self.calendar.setDateTextFormat(qdate, self.get_date_format('payment'))
 
     def get_date_format(self, status):
         """Возвращает формат даты для календаря в зависимости от статуса"""
@@ -505,6 +471,18 @@ class SettingsDialog(QDialog):
         notification_group.setLayout(notification_layout)
         layout.addWidget(notification_group)
 
+        # Файлы без ссылок: по расписанию только отчет, если перенос не включен явно
+        files_group = QGroupBox("Файлы без ссылок")
+        files_layout = QVBoxLayout()
+        self.auto_cleanup = QCheckBox("Ежедневно переносить файлы без ссылок в карантин")
+        self.auto_cleanup.setChecked(self.notification_manager.auto_file_cleanup())
+        files_layout.addWidget(self.auto_cleanup)
+        cleanup_btn = QPushButton("Перенести в карантин сейчас")
+        cleanup_btn.clicked.connect(self.collect_file_garbage)
+        files_layout.addWidget(cleanup_btn)
+        files_group.setLayout(files_layout)
+        layout.addWidget(files_group)
+
         # Кнопки
         buttons = QHBoxLayout()
         save_btn = QPushButton("Сохранить")
@@ -529,6 +507,9 @@ class SettingsDialog(QDialog):
                 'contract_days': [int(x.strip()) for x in self.contract_days.text().split(',')],
                 'maintenance_days': [int(x.strip()) for x in self.maintenance_days.text().split(',')],
                 'notification_time': self.reminder_time.toString('HH:mm')
+            },
+            'files': {
+                'auto_cleanup': self.auto_cleanup.isChecked()
             }
         }
 
@@ -536,6 +517,23 @@ class SettingsDialog(QDialog):
         self.notification_manager.update_settings(new_settings)
         self.accept()
 
+    def collect_file_garbage(self):
+        reply = QMessageBox.question(
+            self,
+            "Подтверждение",
+            "Перенести файлы, на которые нет ссылок в базе, в карантин?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        report = self.notification_manager.collect_file_garbage(move=True)
+        if report is None:
+            QMessageBox.warning(self, "Ошибка", "Не удалось перенести файлы в карантин")
+        elif report.orphans:
+            QMessageBox.information(self, "Файлы без ссылок", "\n".join(report.lines()))
+        else:
+            QMessageBox.information(self, "Файлы без ссылок", "Файлов без ссылок не найдено")
+
 class AddEventDialog(QDialog):
     def __init__(self, session: Session):
         super().__init__()
@@ -563,18 +561,12 @@ class AddEventDialog(QDialog):
         layout.addWidget(self.event_date)
 
         # Объект (для технического обслуживания)
-        self.property_combo = QComboBox()
-        properties = self.session.query(Property).all()
-        for property in properties:
-            self.property_combo.addItem(property.name, property.id)
+        self.property_combo = LookupCombo(self.session, PROPERTY_LOOKUP)
         layout.addWidget(QLabel("Объект:"))
         layout.addWidget(self.property_combo)
 
         # Договор (для платежей и окончания)
-        self.contract_combo = QComboBox()
-        contracts = self.session.query(Contract).all()
-        for contract in contracts:
-            self.contract_combo.addItem(f"Договор №{contract.id}", contract.id)
+        self.contract_combo = LookupCombo(self.session, CONTRACT_LOOKUP)
         layout.addWidget(QLabel("Договор:"))
         layout.addWidget(self.contract_combo)
 
@@ -597,25 +589,25 @@ class AddEventDialog(QDialog):
         event_type = self.event_type.currentText()
         date = self.event_date.date().toPyDate()
 
-        if event_type == "Техническое обслуживание":
-            maintenance = Maintenance(
-                property_id=self.property_combo.currentData(),
-                date=date,
-                description=self.description.toPlainText()
-            )
-            self.session.add(maintenance)
-        elif event_type == "Срок оплаты":
-            payment = Payment(
-                contract_id=self.contract_combo.currentData(),
-                due_date=date,
-                amount=0,  # Сумма будет установлена позже
-                status=PaymentStatus.PENDING
-            )
-            self.session.add(payment)
-        elif event_type == "Окончание договора":
-            contract = self.session.query(Contract).get(self.contract_combo.currentData())
-            if contract:
-                contract.end_date = date
-
-        self.session.commit()
+        with unit_of_work(self.session) as session:
+            if event_type == "Техническое обслуживание":
+                maintenance = Maintenance(
+                    property_id=self.property_combo.currentData(),
+                    date=date,
+                    description=self.description.toPlainText()
+                )
+                session.add(maintenance)
+            elif event_type == "Срок оплаты":
+                payment = Payment(
+                    contract_id=self.contract_combo.currentData(),
+                    due_date=date,
+                    amount=0,  # Сумма будет установлена позже
+                    status=PaymentStatus.PENDING
+                )
+                session.add(payment)
+            elif event_type == "Окончание договора":
+                contract = session.query(Contract).get(self.contract_combo.currentData())
+                if contract:
+                    contract.end_date = date
+
         self.accept() 
\ No newline at end of file
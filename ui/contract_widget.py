@@ -1,11 +1,20 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QLineEdit, QSpinBox, QDoubleSpinBox, 
-                             QComboBox, QTextEdit, QTableWidget, QTableWidgetItem,
-                             QFileDialog, QMessageBox, QDialog, QDateEdit, QFormLayout)
+                             QComboBox, QTextEdit, QTableView, QAbstractItemView,
+                             QFileDialog, QMessageBox, QDialog, QDateEdit, QFormLayout,
+                             QCheckBox, QGroupBox)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QPixmap
-from core.database import Contract, Property, Tenant, Payment, ContractStatus, PropertyStatus, PaymentStatus
-from sqlalchemy.orm import Session
+from core.database import Contract, Property, Tenant, PaymentSchedule, ContractStatus, PropertyStatus
+from core.instrumentation import track_action
+from core.schedule import generate_payments, regenerate_schedule, BILLING_ANNIVERSARY, BILLING_CALENDAR
+from core.list_queries import CONTRACTS, PROPERTY_LOOKUP, TENANT_LOOKUP
+from core.session_manager import read_session, read_connection, unit_of_work
+from ui.table_model import QueryTableModel
+from ui.filter_bar import FilterBar
+from ui.lookup_combo import LookupCombo
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
 import os
 
@@ -131,20 +140,43 @@ class ContractWidget(QWidget):
         controls.addStretch()
         layout.addLayout(controls)
 
-        # Таблица договоров
-        self.table = QTableWidget()
+        # Фильтры применяются запросом к базе, без перебора строк таблицы
+        self.filter_bar = FilterBar(
+            "Поиск: номер договора, арендатор, объект",
+            statuses=[(status.value, status) for status in ContractStatus],
+            with_period=True, amount_label="Аренда:",
+        )
+        layout.addWidget(self.filter_bar)
+
+        # Таблица договоров загружается страницами при прокрутке
+        self.model = QueryTableModel(self.session, CONTRACTS, [
+            ("ID", str),
+            ("Объект", lambda address: address if address is not None else "Объект удален"),
+            ("Арендатор", lambda name: name if name is not None else "Арендатор удален"),
+            ("Начало", lambda value: value.strftime("%d.%m.%Y") if value else ""),
+            ("Окончание", lambda value: value.strftime("%d.%m.%Y") if value else ""),
+            ("Аренда в мес.", lambda value: f"{value or 0:.2f}"),
+            ("Залог", lambda value: f"{value or 0:.2f}"),
+            ("Статус", lambda status: status.value if status else ""),
+            ("Задолженность", lambda value: f"{value or 0:.2f}"),
+        ], self)
+        self.filter_bar.filter_changed.connect(self.model.set_filter)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #2b2b2b;
                 color: #ffffff;
                 gridline-color: #3d3d3d;
                 border: none;
                 border-radius: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 #background-color: #0d47a1; /* Убираем синюю полоску выбора */
             }
             QHeaderView::section {
@@ -159,34 +191,27 @@ class ContractWidget(QWidget):
         """)
         layout.addWidget(self.table)
 
-        # Загружаем данные
-        self.load_contracts()
-
+    @track_action("load_contracts")
     def load_contracts(self):
-        contracts = self.session.query(Contract).all()
-
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Объект", "Арендатор", "Начало", "Окончание", "Аренда в мес.", "Залог", "Статус"
-        ])
-        self.table.setRowCount(len(contracts))
-
-        for row, contract in enumerate(contracts):
-            self.table.setItem(row, 0, QTableWidgetItem(str(contract.id)))
-            # Убедимся, что связанные объекты существуют перед доступом к их атрибутам
-            property_info = contract.property.address if contract.property else "Объект удален"
-            tenant_info = contract.tenant.name if contract.tenant else "Арендатор удален"
-            
-            self.table.setItem(row, 1, QTableWidgetItem(property_info))
-            self.table.setItem(row, 2, QTableWidgetItem(tenant_info))
-            self.table.setItem(row, 3, QTableWidgetItem(contract.start_date.strftime("%d.%m.%Y")))
-            self.table.setItem(row, 4, QTableWidgetItem(contract.end_date.strftime("%d.%m.%Y")))
-            self.table.setItem(row, 5, QTableWidgetItem(f"{contract.rent_amount:.2f}"))
-            self.table.setItem(row, 6, QTableWidgetItem(f"{contract.deposit:.2f}"))
-            self.table.setItem(row, 7, QTableWidgetItem(contract.status.value))
-
+        # Первая страница одним запросом с объектом и арендатором, остальные - при прокрутке
+        self.model.reload()
         self.table.resizeColumnsToContents()
 
+    def selected_contract_id(self):
+        return self.model.row_id(self.table.currentIndex().row())
+
+    def select_contract(self, contract_id):
+        row = self.model.locate(contract_id)
+        if row < 0 and self.model.list_filter:
+            # Запись скрыта фильтром: показываем весь список
+            self.filter_bar.clear()
+            self.model.clear_filter()
+            row = self.model.locate(contract_id)
+        if row >= 0:
+            self.table.selectRow(row)
+            self.table.scrollTo(self.model.index(row, 0))
+
+    @track_action("add_contract")
     def show_add_contract_dialog(self):
         dialog = ContractDialog(self.session)
         if dialog.exec():
@@ -198,71 +223,92 @@ class ContractWidget(QWidget):
                 QMessageBox.warning(self, "Ошибка", "Необходимо выбрать объект и арендатора")
                 return
 
-            # Проверяем, что выбранное имущество доступно
-            property = self.session.query(Property).get(contract_data['property_id'])
-            if not property or property.status != PropertyStatus.AVAILABLE:
+            with unit_of_work(self.session) as session:
+                # Проверяем, что выбранное имущество доступно
+                property = session.get(Property, contract_data['property_id'])
+                available = property is not None and property.status == PropertyStatus.AVAILABLE
+                if available:
+                    # Создаем новый договор
+                    contract = Contract(
+                        property_id=contract_data['property_id'],
+                        tenant_id=contract_data['tenant_id'],
+                        start_date=contract_data['start_date'],
+                        end_date=contract_data['end_date'],
+                        rent_amount=contract_data['rent_amount'],
+                        deposit=contract_data['deposit'],
+                        area=contract_data['area'], # Добавляем площадь в договор
+                        status=contract_data['status']
+                    )
+                    session.add(contract)
+
+                    # Обновляем статус имущества на RENTED
+                    property.status = PropertyStatus.RENTED
+
+                    # Создаем весь график ежемесячных платежей одной пакетной вставкой
+                    contract.schedule = PaymentSchedule(**contract_data['schedule'])
+                    session.flush()
+                    generate_payments(session.connection(), [contract.id])
+
+            if not available:
                 QMessageBox.warning(self, "Ошибка", "Выбранное имущество недоступно для аренды")
                 return
-
-            # Создаем новый договор
-            contract = Contract(
-                property_id=contract_data['property_id'],
-                tenant_id=contract_data['tenant_id'],
-                start_date=contract_data['start_date'],
-                end_date=contract_data['end_date'],
-                rent_amount=contract_data['rent_amount'],
-                deposit=contract_data['deposit'],
-                area=contract_data['area'], # Добавляем площадь в договор
-                status=contract_data['status']
-            )
-            self.session.add(contract)
-
-            # Обновляем статус имущества на RENTED
-            property.status = PropertyStatus.RENTED
-
-            # Создаем первый платеж автоматически
-            first_payment_date = contract.start_date
-            payment = Payment(
-                contract_id=contract.id,
-                amount=contract.rent_amount,
-                due_date=first_payment_date, # Срок оплаты - дата начала договора
-                payment_date=None, # Пока не оплачен
-                status=PaymentStatus.PENDING,
-                description="Первый ежемесячный платеж"
-            )
-            self.session.add(payment)
-
-            self.session.commit()
             self.load_contracts()
 
+    @track_action("edit_contract")
     def edit_contract(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            contract_id = int(self.table.item(current_row, 0).text())
-            contract = self.session.query(Contract).get(contract_id)
+        contract_id = self.selected_contract_id()
+        if contract_id is not None:
+            # Диалог показывает отсоединенную копию; изменения сохраняются отдельной транзакцией
+            with read_session(self.session) as session:
+                contract = session.query(Contract).options(joinedload(Contract.schedule)).get(contract_id)
             if contract:
                 dialog = ContractDialog(self.session, contract)
                 if dialog.exec():
                     # Получаем обновленные данные из диалога
                     contract_data = dialog.get_contract_data()
-
-                    # Обновляем поля существующего договора
-                    # property_id и tenant_id не должны меняться при редактировании договора через этот диалог
-                    contract.start_date = contract_data['start_date']
-                    contract.end_date = contract_data['end_date']
-                    contract.rent_amount = contract_data['rent_amount']
-                    contract.deposit = contract_data['deposit']
-                    contract.area = contract_data['area'] # Обновляем площадь
-                    contract.status = contract_data['status'] # Статус можно менять при редактировании
-
-                    self.session.commit()
+                    with unit_of_work(self.session) as session:
+                        self.save_contract(session, contract_id, contract_data)
                     self.load_contracts()
 
+    def save_contract(self, session, contract_id, contract_data):
+        contract = session.query(Contract).options(joinedload(Contract.schedule)).get(contract_id)
+        if contract is None:
+            return  # договор удален, пока был открыт диалог
+        schedule_before = self.schedule_key(contract)
+
+        # Обновляем поля существующего договора
+        # property_id и tenant_id не должны меняться при редактировании договора через этот диалог
+        contract.start_date = contract_data['start_date']
+        contract.end_date = contract_data['end_date']
+        contract.rent_amount = contract_data['rent_amount']
+        contract.deposit = contract_data['deposit']
+        contract.area = contract_data['area'] # Обновляем площадь
+        contract.status = contract_data['status'] # Статус можно менять при редактировании
+        if contract.schedule is None:
+            contract.schedule = PaymentSchedule()
+        for key, value in contract_data['schedule'].items():
+            setattr(contract.schedule, key, value)
+
+        # График пересчитывается только если изменились влияющие на него поля
+        # (при расторжении из него убираются будущие неоплаченные платежи)
+        if self.schedule_key(contract) != schedule_before:
+            session.flush()
+            regenerate_schedule(session.connection(), [contract.id])
+
+    @staticmethod
+    def schedule_key(contract):
+        schedule = contract.schedule
+        return (contract.start_date, contract.end_date, contract.rent_amount, contract.status,
+                schedule.billing if schedule else None,
+                schedule.prorate if schedule else None,
+                schedule.indexation if schedule else None)
+
+    @track_action("delete_contract")
     def delete_contract(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            contract_id = int(self.table.item(current_row, 0).text())
-            contract = self.session.query(Contract).get(contract_id)
+        contract_id = self.selected_contract_id()
+        if contract_id is not None:
+            with read_session(self.session) as session:
+                contract = session.get(Contract, contract_id)
             if contract:
                 # Проверяем статус договора перед удалением
                 if contract.status == ContractStatus.ACTIVE:
@@ -284,25 +330,26 @@ class ContractWidget(QWidget):
                      if reply == QMessageBox.StandardButton.No:
                          return
 
-                # Сохраняем property_id перед удалением договора
-                property_id = contract.property_id
-
-                self.session.delete(contract)
-                self.session.commit()
-                
-                # Обновляем статус связанного имущества на AVAILABLE, если оно существует и не связано с другими активными договорами
-                if property_id:
-                    property = self.session.query(Property).get(property_id)
-                    if property:
-                        # Проверяем, есть ли другие активные договоры, связанные с этим имуществом
-                        other_active_contracts = self.session.query(Contract).filter(
-                            Contract.property_id == property_id,
-                            Contract.status == ContractStatus.ACTIVE
-                        ).count()
-
-                        if other_active_contracts == 0:
-                             property.status = PropertyStatus.AVAILABLE
-                             self.session.commit()
+                with unit_of_work(self.session) as session:
+                    contract = session.get(Contract, contract_id)
+                    # Сохраняем property_id перед удалением договора
+                    property_id = contract.property_id if contract else None
+                    if contract:
+                        session.delete(contract)
+                        session.flush()
+
+                    # Обновляем статус связанного имущества на AVAILABLE, если оно существует и не связано с другими активными договорами
+                    if property_id:
+                        property = session.get(Property, property_id)
+                        if property:
+                            # Проверяем, есть ли другие активные договоры, связанные с этим имуществом
+                            other_active_contracts = session.query(Contract).filter(
+                                Contract.property_id == property_id,
+                                Contract.status == ContractStatus.ACTIVE
+                            ).count()
+
+                            if other_active_contracts == 0:
+                                property.status = PropertyStatus.AVAILABLE
 
                 self.load_contracts()
 
@@ -382,40 +429,24 @@ class ContractDialog(QDialog):
         form_layout = QFormLayout()
         form_layout.setSpacing(10)
 
-        # Выбор объекта
-        self.property_combo = QComboBox()
-        # Для нового договора показываем только доступные объекты
-        if not self.contract:
-            properties = self.session.query(Property).filter(Property.status == PropertyStatus.AVAILABLE).all()
-        else:
-            # При редактировании показываем текущий объект и все доступные
-            properties = self.session.query(Property).filter(
-                (Property.status == PropertyStatus.AVAILABLE) | 
-                (Property.id == self.contract.property_id if self.contract else None)
-            ).all()
-
-        for property in properties:
-            self.property_combo.addItem(property.address, property.id)
-        
+        # Выбор объекта: для нового договора - только свободные объекты
+        self.property_combo = LookupCombo(
+            self.session, PROPERTY_LOOKUP,
+            conditions=() if self.contract else (Property.status == PropertyStatus.AVAILABLE,),
+        )
         # Если редактируем существующий договор, выбираем текущий объект
         if self.contract:
-            index = self.property_combo.findData(self.contract.property_id)
-            if index != -1:
-                self.property_combo.setCurrentIndex(index)
+            self.property_combo.set_current_id(self.contract.property_id)
             self.property_combo.setEnabled(False) # Нельзя менять объект у существующего договора
 
         form_layout.addRow("Объект:", self.property_combo)
 
         # Выбор арендатора
-        self.tenant_combo = QComboBox()
-        tenants = self.session.query(Tenant).all()
-        for tenant in tenants:
-            self.tenant_combo.addItem(tenant.name, tenant.id)
+        self.tenant_combo = LookupCombo(self.session, TENANT_LOOKUP)
         # Если редактируем существующий договор, выбираем текущего арендатора
+        if self.contract and self.contract.tenant_id is not None:
+            self.tenant_combo.set_current_id(self.contract.tenant_id)
         if self.contract:
-            index = self.tenant_combo.findData(self.contract.tenant_id)
-            if index != -1:
-                self.tenant_combo.setCurrentIndex(index)
             self.tenant_combo.setEnabled(False) # Нельзя менять арендатора у существующего договора
 
         form_layout.addRow("Арендатор:", self.tenant_combo)
@@ -469,6 +500,24 @@ class ContractDialog(QDialog):
 
         layout.addLayout(form_layout)
 
+        # Параметры графика платежей
+        schedule_group = QGroupBox("График платежей")
+        schedule_layout = QFormLayout()
+        self.billing_combo = QComboBox()
+        self.billing_combo.addItem("В число начала договора", BILLING_ANNIVERSARY)
+        self.billing_combo.addItem("С 1-го числа месяца", BILLING_CALENDAR)
+        schedule_layout.addRow("Срок оплаты:", self.billing_combo)
+        self.prorate_check = QCheckBox("Неполный месяц пропорционально дням")
+        self.prorate_check.setChecked(True)
+        schedule_layout.addRow("", self.prorate_check)
+        self.indexation_input = QDoubleSpinBox()
+        self.indexation_input.setRange(0, 100)
+        self.indexation_input.setSuffix(" % в год")
+        self.indexation_input.setDecimals(2)
+        schedule_layout.addRow("Индексация:", self.indexation_input)
+        schedule_group.setLayout(schedule_layout)
+        layout.addWidget(schedule_group)
+
         # Заполняем поля при редактировании
         if self.contract:
             self.populate_fields()
@@ -494,31 +543,44 @@ class ContractDialog(QDialog):
             if property_index != -1:
                 self.property_combo.setCurrentIndex(property_index)
                 # Обновляем площадь для отображения при редактировании
-                property = self.session.query(Property).get(self.contract.property_id)
-                if property:
-                     self.area_label.setText(f"Площадь: {property.area} м²")
+                area = self.property_area(self.contract.property_id)
+                if area is not None:
+                     self.area_label.setText(f"Площадь: {area} м²")
 
             tenant_index = self.tenant_combo.findData(self.contract.tenant_id)
             if tenant_index != -1:
                 self.tenant_combo.setCurrentIndex(tenant_index)
 
-            self.start_date.setDate(QDate.fromisoformat(str(self.contract.start_date)))
-            self.end_date.setDate(QDate.fromisoformat(str(self.contract.end_date)))
+            self.start_date.setDate(QDate.fromString(str(self.contract.start_date), Qt.DateFormat.ISODate))
+            self.end_date.setDate(QDate.fromString(str(self.contract.end_date), Qt.DateFormat.ISODate))
             self.rent_input.setValue(self.contract.rent_amount)
             self.deposit_input.setValue(self.contract.deposit)
 
+            schedule = self.contract.schedule
+            if schedule:
+                index = self.billing_combo.findData(schedule.billing)
+                if index != -1:
+                    self.billing_combo.setCurrentIndex(index)
+                self.prorate_check.setChecked(bool(schedule.prorate))
+                self.indexation_input.setValue((schedule.indexation or 0.0) * 100)
+
     def update_area_label(self, index):
         """Обновляет метку площади при выборе объекта (только при создании)"""
         property_id = self.property_combo.itemData(index)
         if property_id:
-            property = self.session.query(Property).get(property_id)
-            if property:
-                self.area_label.setText(f"Площадь: {property.area} м²")
+            area = self.property_area(property_id)
+            if area is not None:
+                self.area_label.setText(f"Площадь: {area} м²")
             else:
                 self.area_label.setText("Площадь: -")
         else:
             self.area_label.setText("Площадь: -")
 
+    def property_area(self, property_id):
+        """Площадь объекта; None, если объект удален"""
+        with read_connection(self.session) as conn:
+            return conn.execute(select(Property.area).where(Property.id == property_id)).scalar()
+
     def get_contract_data(self):
         """Возвращает данные договора из полей диалога"""
         return {
@@ -528,8 +590,13 @@ class ContractDialog(QDialog):
             'end_date': self.end_date.date().toPyDate(),
             'rent_amount': self.rent_input.value(),
             'deposit': self.deposit_input.value(),
-            'area': self.session.query(Property).get(self.property_combo.currentData()).area if self.property_combo.currentData() else 0.0, # Берем площадь из выбранного объекта
-            'status': ContractStatus(self.status_combo.currentText()) if self.contract else ContractStatus.ACTIVE # Статус берется из комбобокса при редактировании, ACTIVE при создании
+            'area': self.property_area(self.property_combo.currentData()) if self.property_combo.currentData() else 0.0, # Берем площадь из выбранного объекта
+            'status': ContractStatus(self.status_combo.currentText()) if self.contract else ContractStatus.ACTIVE, # Статус берется из комбобокса при редактировании, ACTIVE при создании
+            'schedule': {
+                'billing': self.billing_combo.currentData(),
+                'prorate': 1 if self.prorate_check.isChecked() else 0,
+                'indexation': self.indexation_input.value() / 100,
+            }
         }
 
     # Методы accept() и reject() унаследованы от QDialog и используются для закрытия диалога 
\ No newline at end of file
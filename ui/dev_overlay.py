@@ -0,0 +1,132 @@
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QTableWidget, QTableWidgetItem, QTextEdit, QSplitter)
+from PyQt6.QtCore import Qt, QTimer
+
+
+class SqlProfilerOverlay(QWidget):
+    """Окно разработчика со статистикой SQL-запросов по действиям"""
+
+    def __init__(self, profiler, parent=None, sessions=None):
+        super().__init__(parent, Qt.WindowType.Tool)
+        self.profiler = profiler
+        self.sessions = sessions  # SessionManager: размер общей сессии и память процесса
+        self.init_ui()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def init_ui(self):
+        self.setWindowTitle("SQL-профилировщик")
+        self.resize(900, 600)
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #1e1e1e;
+                color: #ffffff;
+            }
+            QTableWidget {
+                gridline-color: #3d3d3d;
+                border: none;
+            }
+            QHeaderView::section {
+                background-color: #2b2b2b;
+                color: #ffffff;
+                padding: 4px;
+                border: none;
+                border-right: 1px solid #3d3d3d;
+                border-bottom: 1px solid #3d3d3d;
+            }
+            QTextEdit {
+                font-family: monospace;
+                border: 1px solid #3d3d3d;
+            }
+            QPushButton {
+                background-color: #0d47a1;
+                color: white;
+                border: none;
+                padding: 5px 10px;
+                border-radius: 3px;
+            }
+        """)
+        layout = QVBoxLayout(self)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Запросы по действиям (обновляется раз в секунду)"))
+        controls.addStretch()
+        dump_btn = QPushButton("Записать в лог")
+        dump_btn.clicked.connect(self.profiler.dump)
+        controls.addWidget(dump_btn)
+        reset_btn = QPushButton("Сбросить")
+        reset_btn.clicked.connect(self.reset)
+        controls.addWidget(reset_btn)
+        layout.addLayout(controls)
+        self.memory_label = QLabel()
+        layout.addWidget(self.memory_label)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        self.table = QTableWidget()
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([
+            "Действие", "Вызовов", "Запросов", "Коммитов", "Всего, мс", "Макс., мс"
+        ])
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.itemSelectionChanged.connect(self.show_slowest)
+        splitter.addWidget(self.table)
+
+        self.details = QTextEdit()
+        self.details.setReadOnly(True)
+        splitter.addWidget(self.details)
+        layout.addWidget(splitter)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        selected = self.selected_action()
+        stats = self.profiler.snapshot()
+        # Не пересчитываем планы при каждом обновлении таблицы
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(stats))
+        for row, item in enumerate(stats):
+            slowest = item.top()[0][0] * 1000 if item.slowest else 0
+            values = [item.name, str(item.calls), str(item.queries), str(item.commits),
+                      f"{item.total_time * 1000:.1f}", f"{slowest:.1f}"]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
+            if item.name == selected:
+                self.table.selectRow(row)
+        self.table.blockSignals(False)
+        self.table.resizeColumnsToContents()
+        if self.sessions is not None:
+            self.memory_label.setText("\n".join(self.sessions.memory_lines()))
+
+    def selected_action(self):
+        row = self.table.currentRow()
+        item = self.table.item(row, 0) if row >= 0 else None
+        return item.text() if item else None
+
+    def show_slowest(self):
+        name = self.selected_action()
+        stats = self.profiler.stats.get(name)
+        if not stats:
+            self.details.clear()
+            return
+        lines = []
+        for elapsed, _, statement, params in stats.top():
+            lines.append(f"-- {elapsed * 1000:.1f} мс, параметры: {params!r}")
+            lines.append(statement)
+            plan = self.profiler.explain(statement, params)
+            if plan:
+                lines.append("-- план:")
+                lines.append(plan)
+            lines.append("")
+        self.details.setPlainText("\n".join(lines))
+
+    def reset(self):
+        self.profiler.reset()
+        self.details.clear()
+        self.refresh()
@@ -4,7 +4,12 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLa
                             QCheckBox, QLineEdit, QListWidget, QListWidgetItem)
 from PyQt6.QtCore import Qt, QDate
 from core.database import Document, Contract, Property, Tenant, Payment
-from sqlalchemy.orm import Session
+from core.instrumentation import track_action
+from core.list_queries import CONTRACT_LOOKUP
+from ui.lookup_combo import LookupCombo
+from core.ledger import contract_ledger, get_balance, CHARGE
+from core.session_manager import read_session, read_connection
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime
 from docx import Document
 from docx.shared import Pt, Inches
@@ -161,15 +166,16 @@ class BulkGenerateDialog(QDialog):
         layout.addLayout(template_layout)
 
         # Список договоров
+        # Договоры добавляются в список через поиск, а не загружаются все сразу
         layout.addWidget(QLabel("Выберите договоры:"))
+        lookup_layout = QHBoxLayout()
+        self.contract_lookup = LookupCombo(self.session, CONTRACT_LOOKUP)
+        lookup_layout.addWidget(self.contract_lookup, 1)
+        add_btn = QPushButton("Добавить")
+        add_btn.clicked.connect(self.add_contract)
+        lookup_layout.addWidget(add_btn)
+        layout.addLayout(lookup_layout)
         self.contracts_list = QListWidget()
-        contracts = self.session.query(Contract).all()
-        for contract in contracts:
-            item = QListWidgetItem(f"Договор №{contract.id} - {contract.tenant.name if contract.tenant else '—'}")
-            item.setData(Qt.ItemDataRole.UserRole, contract.id)
-            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-            item.setCheckState(Qt.CheckState.Unchecked)
-            self.contracts_list.addItem(item)
         layout.addWidget(self.contracts_list)
 
         # Опции
@@ -193,6 +199,16 @@ class BulkGenerateDialog(QDialog):
         buttons.addWidget(cancel_btn)
         layout.addLayout(buttons)
 
+    def add_contract(self):
+        contract_id = self.contract_lookup.currentData()
+        if contract_id is None or contract_id in self.get_selected_contracts():
+            return
+        item = QListWidgetItem(self.contract_lookup.currentText())
+        item.setData(Qt.ItemDataRole.UserRole, contract_id)
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+        item.setCheckState(Qt.CheckState.Checked)
+        self.contracts_list.addItem(item)
+
     def get_selected_contracts(self):
         return [
             self.contracts_list.item(i).data(Qt.ItemDataRole.UserRole)
@@ -327,13 +343,7 @@ class DocumentsWidget(QWidget):
         controls.addWidget(self.template_combo)
 
         # Выбор договора
-        self.contract_combo = QComboBox()
-        contracts = self.session.query(Contract).all()
-        for contract in contracts:
-            self.contract_combo.addItem(
-                f"Договор №{contract.id} - {contract.tenant.name if contract.tenant else '—'}",
-                contract.id
-            )
+        self.contract_combo = LookupCombo(self.session, CONTRACT_LOOKUP)
         controls.addWidget(QLabel("Договор:"))
         controls.addWidget(self.contract_combo)
 
@@ -414,10 +424,11 @@ class DocumentsWidget(QWidget):
             self.save_templates()
             self.update_templates_list()
 
+    @track_action("generate_document")
     def generate_document(self):
         doc_type = self.doc_type.currentText()
         contract_id = self.contract_combo.currentData()
-        contract = self.session.query(Contract).get(contract_id)
+        contract = self.load_contract(contract_id)
 
         if not contract:
             QMessageBox.warning(self, "Ошибка", "Договор не найден")
@@ -569,18 +580,29 @@ class DocumentsWidget(QWidget):
         doc.add_paragraph('\nАРЕНДАТОР:')
         doc.add_paragraph(contract.tenant.name if contract.tenant else '—')
 
-        # Расчеты
+        # Расчеты: выписка по лицевому счету договора на сегодня
         doc.add_paragraph('\nРасчеты по договору аренды:')
-        payments = self.session.query(Payment).filter(
-            Payment.contract_id == contract.id
-        ).all()
-        
-        total_debt = 0
-        for payment in payments:
-            if payment.status == 'pending' or payment.status == 'overdue':
-                total_debt += payment.amount
-
-        doc.add_paragraph(f'Сумма задолженности: {total_debt:.2f} рублей')
+        with read_connection(self.session) as conn:
+            ledger = contract_ledger(conn, contract.id, contract.start_date, datetime.now().date())
+            # Итог берется из сальдо договора (contract_balances), а не суммируется по строкам
+            debt = get_balance(conn, contract.id)[2]
+        doc.add_paragraph(f'Сальдо на начало периода: {ledger.opening:.2f} рублей')
+
+        table = doc.add_table(rows=1, cols=5)
+        table.style = 'Table Grid'
+        for cell, header in zip(table.rows[0].cells, ['Дата', 'Операция', 'Начислено', 'Оплачено', 'Сальдо']):
+            cell.text = header
+        for entry in ledger.entries:
+            cells = table.add_row().cells
+            cells[0].text = entry.date.strftime('%d.%m.%Y')
+            cells[1].text = entry.description or ('Начисление' if entry.kind == CHARGE else 'Оплата')
+            cells[2].text = f'{entry.debit:.2f}' if entry.debit else ''
+            cells[3].text = f'{entry.credit:.2f}' if entry.credit else ''
+            cells[4].text = f'{entry.balance:.2f}'
+
+        doc.add_paragraph(f'\nНачислено за период: {ledger.charged:.2f} рублей')
+        doc.add_paragraph(f'Оплачено за период: {ledger.paid:.2f} рублей')
+        doc.add_paragraph(f'Сумма задолженности: {debt:.2f} рублей')
         
         # Подписи
         doc.add_paragraph('\nАрендодатель: _________________')
@@ -635,6 +657,7 @@ class DocumentsWidget(QWidget):
             self.email_settings = dialog.get_settings()
             self.save_email_settings()
 
+    @track_action("bulk_generate_documents")
     def show_bulk_generate_dialog(self):
         dialog = BulkGenerateDialog(self.session)
         if dialog.exec():
@@ -654,7 +677,7 @@ class DocumentsWidget(QWidget):
 
             # Генерируем документы
             for contract_id in contract_ids:
-                contract = self.session.query(Contract).get(contract_id)
+                contract = self.load_contract(contract_id)
                 if not contract:
                     continue
 
@@ -686,6 +709,14 @@ class DocumentsWidget(QWidget):
 
             QMessageBox.information(self, "Успех", f"Документы сформированы в папке {folder_name}")
 
+    def load_contract(self, contract_id):
+        """Договор с арендатором и объектом для документа; копия не связана с общей сессией"""
+        if contract_id is None:
+            return None
+        with read_session(self.session) as session:
+            return session.get(Contract, contract_id,
+                               options=[joinedload(Contract.tenant), joinedload(Contract.property)])
+
     def send_document_by_email(self, contract, file_name, doc_type):
         if not self.email_settings:
             return
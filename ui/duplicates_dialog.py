@@ -0,0 +1,164 @@
+import os
+
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem, QLabel,
+                             QPushButton, QMessageBox, QProgressDialog, QApplication, QSplitter)
+from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import QIcon, QImageReader
+from core.photo_duplicates import update_hashes, find_duplicates, photo_usage, merge_duplicates
+from core.photo_store import purge_unreferenced
+from core.session_manager import read_connection, unit_of_work
+from ui.thumbnails import thumbnail_cache
+
+PREVIEW_SIZE = QSize(200, 150)
+
+
+class DuplicatesDialog(QDialog):
+    """Группы похожих фотографий: сотрудник выбирает, какую оставить, остальные заменяются ею"""
+
+    def __init__(self, session, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.groups = []
+        self.merged = 0
+        self.thumbnails = thumbnail_cache()
+        self.init_ui()
+        self.thumbnails.ready.connect(self.update_preview)
+
+    def init_ui(self):
+        self.setWindowTitle("Похожие фотографии")
+        self.setMinimumSize(900, 600)
+        layout = QVBoxLayout(self)
+
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+
+        splitter = QSplitter()
+        self.group_list = QListWidget()
+        self.group_list.currentRowChanged.connect(self.show_group)
+        splitter.addWidget(self.group_list)
+
+        self.photo_list = QListWidget()
+        self.photo_list.setViewMode(QListWidget.ViewMode.IconMode)
+        self.photo_list.setIconSize(PREVIEW_SIZE)
+        self.photo_list.setGridSize(PREVIEW_SIZE + QSize(40, 90))
+        self.photo_list.setResizeMode(QListWidget.ResizeMode.Adjust)
+        self.photo_list.setMovement(QListWidget.Movement.Static)
+        self.photo_list.setWordWrap(True)
+        splitter.addWidget(self.photo_list)
+        splitter.setSizes([250, 650])
+        layout.addWidget(splitter)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        self.merge_btn = QPushButton("Оставить выбранную")
+        self.merge_btn.setToolTip("Остальные фотографии группы заменяются выбранной у всех объектов")
+        self.merge_btn.clicked.connect(self.merge_group)
+        buttons.addWidget(self.merge_btn)
+        self.skip_btn = QPushButton("Пропустить")
+        self.skip_btn.clicked.connect(self.skip_group)
+        buttons.addWidget(self.skip_btn)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+    def load(self):
+        """Досчитывает хэши новых фотографий и ищет похожие"""
+        progress = QProgressDialog("Анализ фотографий...", "Отмена", 0, 0, self)
+        progress.setWindowTitle("Похожие фотографии")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def report(done, total):
+            progress.setMaximum(total)
+            progress.setValue(done)
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+
+        with unit_of_work(self.session) as session:
+            update_hashes(session, report)
+        progress.close()
+        with read_connection(self.session) as conn:
+            self.groups = find_duplicates(conn)
+        self.group_list.clear()
+        for group in self.groups:
+            self.group_list.addItem(f"{len(group)} похожих фото")
+        self.update_summary()
+        if self.groups:
+            self.group_list.setCurrentRow(0)
+        else:
+            self.show_group(-1)
+
+    def update_summary(self):
+        if self.groups:
+            self.summary.setText(f"Найдено групп похожих фотографий: {len(self.groups)}")
+        else:
+            self.summary.setText("Похожих фотографий не найдено")
+
+    def show_group(self, row):
+        self.photo_list.clear()
+        has_group = 0 <= row < len(self.groups)
+        self.merge_btn.setEnabled(has_group)
+        self.skip_btn.setEnabled(has_group)
+        if not has_group:
+            return
+        group = self.groups[row]
+        with read_connection(self.session) as conn:
+            usage = photo_usage(conn, group)
+        best, best_pixels = None, -1
+        for path in group:
+            dimensions = QImageReader(path).size()
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            places = ", ".join(name or f"объект {property_id}" for property_id, name in usage[path])
+            item = QListWidgetItem(f"{dimensions.width()}x{dimensions.height()}, {size // 1024} КБ\n{places}")
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setToolTip(path)
+            self.set_preview(item)
+            self.photo_list.addItem(item)
+            # По умолчанию предлагается снимок с наибольшим разрешением
+            pixels = dimensions.width() * dimensions.height()
+            if pixels > best_pixels:
+                best, best_pixels = item, pixels
+        self.photo_list.setCurrentItem(best)
+
+    def set_preview(self, item):
+        pixmap = self.thumbnails.pixmap(item.data(Qt.ItemDataRole.UserRole), PREVIEW_SIZE)
+        if pixmap is not None:
+            item.setIcon(QIcon(pixmap))
+
+    def update_preview(self, path):
+        for row in range(self.photo_list.count()):
+            item = self.photo_list.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == path:
+                self.set_preview(item)
+
+    def merge_group(self):
+        row = self.group_list.currentRow()
+        item = self.photo_list.currentItem()
+        if not 0 <= row < len(self.groups) or item is None:
+            return
+        keep_path = item.data(Qt.ItemDataRole.UserRole)
+        reply = QMessageBox.question(
+            self,
+            "Подтверждение",
+            f"Заменить остальные фотографии группы ({len(self.groups[row]) - 1}) выбранной?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        with unit_of_work(self.session) as session:
+            replaced = merge_duplicates(session, keep_path, self.groups[row])
+            purge_unreferenced(session, replaced)
+        for path in replaced:
+            self.thumbnails.invalidate(path)
+        self.merged += len(replaced)
+        self.remove_group(row)
+
+    def skip_group(self):
+        self.remove_group(self.group_list.currentRow())
+
+    def remove_group(self, row):
+        del self.groups[row]
+        self.group_list.takeItem(row)
+        self.update_summary()
+        self.show_group(self.group_list.currentRow())
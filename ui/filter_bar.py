@@ -0,0 +1,113 @@
+from PyQt6.QtWidgets import (QWidget, QHBoxLayout, QLineEdit, QComboBox, QDateEdit, QCheckBox,
+                            QDoubleSpinBox, QLabel)
+from PyQt6.QtCore import QDate, QTimer, pyqtSignal
+from core.list_queries import ListFilter
+
+# Пауза после ввода перед запросом
+FILTER_DELAY_MS = 250
+
+
+class FilterBar(QWidget):
+    """Панель фильтров списка: поиск, статус, период и диапазон суммы.
+
+    statuses - список (подпись, значение) или None, если фильтра по статусу нет;
+    with_period и amount_label включают фильтры периода и суммы. Изменения
+    собираются в ListFilter и отправляются сигналом с задержкой после ввода.
+    """
+
+    filter_changed = pyqtSignal(object)
+
+    def __init__(self, placeholder="Поиск", statuses=None, with_period=False, amount_label=None, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(FILTER_DELAY_MS)
+        self.timer.timeout.connect(self.emit_filter)
+
+        self.text_edit = QLineEdit()
+        self.text_edit.setPlaceholderText(placeholder)
+        self.text_edit.setClearButtonEnabled(True)
+        self.text_edit.textChanged.connect(self.timer.start)
+        layout.addWidget(self.text_edit, 2)
+
+        self.status_combo = None
+        if statuses:
+            self.status_combo = QComboBox()
+            self.status_combo.addItem("Все статусы", None)
+            for label, value in statuses:
+                self.status_combo.addItem(label, value)
+            self.status_combo.currentIndexChanged.connect(self.timer.start)
+            layout.addWidget(self.status_combo)
+
+        self.period_check = None
+        if with_period:
+            self.period_check = QCheckBox("Период:")
+            self.period_check.toggled.connect(self.timer.start)
+            self.date_from = QDateEdit(QDate.currentDate().addMonths(-1))
+            self.date_to = QDateEdit(QDate.currentDate().addMonths(1))
+            for edit in (self.date_from, self.date_to):
+                edit.setCalendarPopup(True)
+                edit.dateChanged.connect(self._period_changed)
+            layout.addWidget(self.period_check)
+            layout.addWidget(self.date_from)
+            layout.addWidget(QLabel("—"))
+            layout.addWidget(self.date_to)
+
+        self.amount_min = self.amount_max = None
+        if amount_label:
+            layout.addWidget(QLabel(amount_label))
+            self.amount_min = self._amount_spin("от")
+            self.amount_max = self._amount_spin("до")
+            layout.addWidget(self.amount_min)
+            layout.addWidget(self.amount_max)
+
+    def _amount_spin(self, prefix):
+        spin = QDoubleSpinBox()
+        spin.setRange(0, 1e12)
+        spin.setDecimals(0)
+        spin.setPrefix(f"{prefix} ")
+        # Ноль означает "без ограничения"
+        spin.setSpecialValueText(f"{prefix} —")
+        spin.valueChanged.connect(self.timer.start)
+        return spin
+
+    def _period_changed(self):
+        if self.period_check.isChecked():
+            self.timer.start()
+
+    def clear(self):
+        """Сбрасывает все фильтры без отправки сигнала"""
+        self.timer.stop()
+        widgets = [self.text_edit, self.status_combo, self.period_check, self.amount_min, self.amount_max]
+        for widget in widgets:
+            if widget is not None:
+                widget.blockSignals(True)
+        self.text_edit.clear()
+        if self.status_combo:
+            self.status_combo.setCurrentIndex(0)
+        if self.period_check:
+            self.period_check.setChecked(False)
+        if self.amount_min:
+            self.amount_min.setValue(0)
+            self.amount_max.setValue(0)
+        for widget in widgets:
+            if widget is not None:
+                widget.blockSignals(False)
+
+    def current_filter(self):
+        period = self.period_check is not None and self.period_check.isChecked()
+        return ListFilter(
+            text=self.text_edit.text(),
+            status=self.status_combo.currentData() if self.status_combo else None,
+            date_from=self.date_from.date().toPyDate() if period else None,
+            date_to=self.date_to.date().toPyDate() if period else None,
+            amount_min=(self.amount_min.value() or None) if self.amount_min else None,
+            amount_max=(self.amount_max.value() or None) if self.amount_max else None,
+        )
+
+    def emit_filter(self):
+        self.timer.stop()
+        self.filter_changed.emit(self.current_filter())
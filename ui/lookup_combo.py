@@ -0,0 +1,147 @@
+from collections import deque
+
+from PyQt6.QtWidgets import QComboBox, QCompleter
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from core.list_queries import LOOKUP_PAGE_SIZE
+from core.session_manager import read_connection
+
+# Пауза после ввода перед запросом
+LOOKUP_DELAY_MS = 200
+# Сколько недавно выбранных записей каждого типа показывать первыми
+RECENT_SIZE = 8
+
+# Недавно выбранные id по типу записи (общие для всех диалогов)
+_recent = {}
+
+
+def remember(lookup, record_id):
+    recent = _recent.setdefault(lookup.kind, deque(maxlen=RECENT_SIZE))
+    if record_id in recent:
+        recent.remove(record_id)
+    recent.appendleft(record_id)
+
+
+class LookupModel(QAbstractListModel):
+    """Варианты для введенного текста; следующие страницы догружаются при прокрутке подсказок"""
+
+    def __init__(self, session, lookup, conditions=(), parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.lookup = lookup
+        self.conditions = conditions
+        self.query = None
+        self._items = []
+        self._has_more = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record_id, label = self._items[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return label
+        if role == Qt.ItemDataRole.UserRole:
+            return record_id
+        return None
+
+    # Не canFetchMore/fetchMore: QCompleter вызывает их сам, пока не выберет все записи
+    def load_more(self):
+        if not self._has_more:
+            return
+        with read_connection(self.session) as conn:
+            items, self._has_more = self.lookup.fetch(conn, self.query, self.conditions, offset=len(self._items))
+        if items:
+            self.beginInsertRows(QModelIndex(), len(self._items), len(self._items) + len(items) - 1)
+            self._items.extend(items)
+            self.endInsertRows()
+
+    def set_query(self, query):
+        self.beginResetModel()
+        self.query = query
+        with read_connection(self.session) as conn:
+            self._items, self._has_more = self.lookup.fetch(conn, query, self.conditions)
+        self.endResetModel()
+
+
+class LookupCombo(QComboBox):
+    """Выбор записи с поиском в базе по мере ввода.
+
+    В выпадающем списке - недавно выбранные записи и первая страница вариантов;
+    ввод текста ищет по началу слов (и по номеру записи) через подсказки.
+    currentData() возвращает id выбранной записи, как у обычного QComboBox.
+    conditions - дополнительные условия отбора (например, только свободные объекты).
+    """
+
+    def __init__(self, session, lookup, conditions=(), parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.lookup = lookup
+        self.conditions = tuple(conditions)
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        self.lineEdit().setPlaceholderText("Начните вводить для поиска")
+
+        self.results = LookupModel(session, lookup, self.conditions, self)
+        completer = QCompleter(self.results, self)
+        # Варианты уже отобраны запросом, QCompleter их не фильтрует
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        completer.activated[QModelIndex].connect(self._completion_activated)
+        self.setCompleter(completer)
+        scroll_bar = completer.popup().verticalScrollBar()
+        scroll_bar.valueChanged.connect(
+            lambda value: value == scroll_bar.maximum() and self.results.load_more()
+        )
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(LOOKUP_DELAY_MS)
+        self.timer.timeout.connect(self.run_search)
+        self.lineEdit().textEdited.connect(self.timer.start)
+        self.activated.connect(lambda index: remember(self.lookup, self.itemData(index)))
+
+        self._fill()
+
+    def _fill(self):
+        """Недавние записи и первая страница вариантов"""
+        with read_connection(self.session) as conn:
+            recent = self.lookup.fetch_ids(conn, list(_recent.get(self.lookup.kind, ())), self.conditions)
+            items, _ = self.lookup.fetch(conn, conditions=self.conditions, limit=LOOKUP_PAGE_SIZE)
+        seen = set()
+        for record_id, label in recent + items:
+            if record_id not in seen:
+                seen.add(record_id)
+                self.addItem(label, record_id)
+
+    def run_search(self):
+        self.results.set_query(self.lineEdit().text().strip())
+        if self.results.rowCount():
+            self.completer().complete()
+        else:
+            self.completer().popup().hide()
+
+    def _completion_activated(self, index):
+        self.set_current_id(index.data(Qt.ItemDataRole.UserRole), index.data())
+        remember(self.lookup, self.currentData())
+
+    def set_current_id(self, record_id, label=None):
+        """Выбирает запись; если ее нет в списке, подпись загружается из базы"""
+        index = self.findData(record_id)
+        if index < 0:
+            if label is None:
+                with read_connection(self.session) as conn:
+                    items = self.lookup.fetch_ids(conn, [record_id])
+                if not items:
+                    return
+                label = items[0][1]
+            self.insertItem(0, label, record_id)
+            index = 0
+        self.setCurrentIndex(index)
+
+    def focusOutEvent(self, event):
+        # Недописанный текст не оставляем: показываем выбранную запись
+        self.timer.stop()
+        super().focusOutEvent(event)
+        if self.currentIndex() >= 0 and not self.completer().popup().isVisible():
+            self.setEditText(self.itemText(self.currentIndex()))
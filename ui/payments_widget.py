@@ -1,12 +1,20 @@
 import os # Assuming os is needed based on previous PropertyWidget changes, add if not present
 import shutil # Assuming shutil is needed based on previous PropertyWidget changes, add if not present
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
-                            QTableWidget, QTableWidgetItem, QMessageBox, QDialog,
+                            QTableView, QAbstractItemView, QMessageBox, QDialog,
                             QFormLayout, QLineEdit, QTextEdit, QComboBox, QDateEdit, QDoubleSpinBox, QGroupBox, QScrollArea)
 from PyQt6.QtCore import Qt, QDate, QTimer # Import QTimer
 from PyQt6.QtGui import QColor, QDoubleValidator
 from core.database import Payment, Contract, PaymentStatus, ContractStatus
+from core.instrumentation import track_action
+import core.ledger  # noqa: F401 - сальдо договоров обновляется событиями маппера Payment
+from core.list_queries import PAYMENTS, CONTRACT_LOOKUP
+from core.session_manager import read_session, unit_of_work
+from ui.table_model import QueryTableModel
+from ui.filter_bar import FilterBar
+from ui.lookup_combo import LookupCombo
 from sqlalchemy.orm import Session
+from sqlalchemy import update, exists, case, literal
 from datetime import datetime
 
 class PaymentsWidget(QWidget):
@@ -98,22 +106,43 @@ class PaymentsWidget(QWidget):
         controls.addStretch()
         layout.addLayout(controls)
 
-        # Таблица платежей
-        self.table = QTableWidget()
+        # Фильтры применяются запросом к базе, без перебора строк таблицы
+        self.filter_bar = FilterBar(
+            "Поиск по договору: номер, арендатор, объект",
+            statuses=[(status.value, status) for status in PaymentStatus],
+            with_period=True, amount_label="Сумма:",
+        )
+        layout.addWidget(self.filter_bar)
+
+        # Таблица платежей загружается страницами при прокрутке
+        self.model = QueryTableModel(self.session, PAYMENTS, [
+            ("ID", str),
+            ("Договор", lambda contract_id: f"Договор №{contract_id}" if contract_id else "Договор удален"),
+            ("Сумма", lambda amount: f"{amount or 0:.2f} руб."),
+            ("Срок оплаты", lambda value: value.strftime("%d.%m.%Y") if value else ""),
+            ("Дата платежа", lambda value: value.strftime("%d.%m.%Y") if value else "Не оплачен"),
+            ("Статус", lambda status: status.value if status else ""),
+            ("Комментарий", lambda description: description or ""),
+        ], self)
+        self.filter_bar.filter_changed.connect(self.model.set_filter)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #2b2b2b;
                 color: #ffffff;
                 gridline-color: #3d3d3d;
                 border: none;
                 border-radius: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 background-color: #2b2b2b; /* Фон обычной строки */
                 color: #ffffff;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3d3d3d; /* Фон выбранной строки */
             }
             QHeaderView::section {
@@ -126,103 +155,93 @@ class PaymentsWidget(QWidget):
                 font-weight: bold;
             }
         """)
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Договор", "Сумма", "Дата платежа", "Срок оплаты", "Статус", "Комментарий"
-        ])
         layout.addWidget(self.table)
 
+    @track_action("load_payments")
     def load_payments(self):
-        self.table.setRowCount(0) # Очищаем таблицу перед загрузкой
-        payments = self.session.query(Payment).all()
-        self.table.setRowCount(len(payments))
-        for row, payment in enumerate(payments):
-            self.table.setItem(row, 0, QTableWidgetItem(str(payment.id)))
-            
-            # Проверяем существование договора
-            contract_info = f"Договор №{payment.contract.id}" if payment.contract else "Договор удален"
-            self.table.setItem(row, 1, QTableWidgetItem(contract_info))
-            
-            self.table.setItem(row, 2, QTableWidgetItem(f"{payment.amount:.2f} руб."))
-            self.table.setItem(row, 3, QTableWidgetItem(payment.due_date.strftime("%d.%m.%Y")))
-            
-            # Проверяем дату платежа
-            payment_date = payment.payment_date.strftime("%d.%m.%Y") if payment.payment_date else "Не оплачен"
-            self.table.setItem(row, 4, QTableWidgetItem(payment_date))
-            
-            # Статус платежа
-            # Удаляем цвет фона для статуса, чтобы соответствовать дизайну арендаторов
-            self.table.setItem(row, 5, QTableWidgetItem(payment.status.value))
-            
-            # Описание
-            self.table.setItem(row, 6, QTableWidgetItem(payment.description or ""))
-
-            # Обновляем статус контракта на основе платежей
-            if payment.contract:  # Проверяем существование договора
-                contract = payment.contract
-                all_payments = self.session.query(Payment).filter(Payment.contract_id == contract.id).all()
-                has_overdue = any(p.status == PaymentStatus.OVERDUE for p in all_payments)
-                has_pending = any(p.status == PaymentStatus.PENDING for p in all_payments)
-                
-                if has_overdue:
-                    contract.status = ContractStatus.ACTIVE  # Если есть просроченные платежи, договор все еще Активен
-                elif has_pending:
-                    contract.status = ContractStatus.ACTIVE
-                else:
-                    contract.status = ContractStatus.EXPIRED # Если нет ни просроченных, ни ожидающих
-                
-                self.session.commit() # Сохраняем изменение статуса контракта
-        
+        self.update_contract_statuses()
+
+        # Первая страница одним запросом, остальные - при прокрутке
+        self.model.reload()
         self.table.resizeColumnsToContents() # Устанавливаем эту строку здесь
 
+    def selected_payment_id(self):
+        return self.model.row_id(self.table.currentIndex().row())
+
+    def update_contract_statuses(self):
+        """Обновляет статусы договоров по их платежам одним запросом.
+
+        Договор с просроченными или ожидающими платежами остается активным,
+        договор, по которому все платежи закрыты, считается истекшим.
+        """
+        has_unpaid = exists().where(
+            Payment.contract_id == Contract.id,
+            Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.OVERDUE])
+        )
+        has_payments = exists().where(Payment.contract_id == Contract.id)
+        # Enum хранится в базе по имени, поэтому сравниваем с именами статусов
+        new_status = case(
+            (has_unpaid, literal(ContractStatus.ACTIVE.name)),
+            else_=literal(ContractStatus.EXPIRED.name)
+        )
+        with unit_of_work(self.session) as session:
+            session.execute(
+                update(Contract).where(has_payments, Contract.status != new_status).values(status=new_status),
+                execution_options={'synchronize_session': False}
+            )
+
+    @track_action("add_payment")
     def show_add_payment_dialog(self):
         dialog = PaymentDialog(self.session, parent=self) # Для добавления, payment=None по умолчанию
         if dialog.exec():
             # Получаем данные из диалога и создаем новый платеж
             try:
                 payment_data = dialog.get_payment_data()
-                payment = Payment(
-                    contract_id=payment_data['contract_id'],
-                    amount=payment_data['amount'],
-                    due_date=payment_data['due_date'],
-                    payment_date=payment_data['payment_date'],
-                    status=payment_data['status'],
-                    description=payment_data['description']
-                )
-                self.session.add(payment)
-                self.session.commit()
+                with unit_of_work(self.session) as session:
+                    session.add(Payment(
+                        contract_id=payment_data['contract_id'],
+                        amount=payment_data['amount'],
+                        due_date=payment_data['due_date'],
+                        payment_date=payment_data['payment_date'],
+                        status=payment_data['status'],
+                        description=payment_data['description']
+                    ))
                 self.load_payments()
             except ValueError as e:
                 QMessageBox.warning(self, "Ошибка ввода", str(e))
 
+    @track_action("edit_payment")
     def edit_payment(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            payment_id = int(self.table.item(current_row, 0).text())
-            payment = self.session.query(Payment).get(payment_id)
+        payment_id = self.selected_payment_id()
+        if payment_id is not None:
+            with read_session(self.session) as session:
+                payment = session.get(Payment, payment_id)
             if payment:
-                dialog = PaymentDialog(self.session, payment=payment, parent=self) # Для редактирования, передаем объект payment
+                dialog = PaymentDialog(self.session, payment=payment, parent=self) # Для редактирования, передаем копию платежа
                 if dialog.exec():
                     # Получаем обновленные данные из диалога и сохраняем изменения
                     try:
                         payment_data = dialog.get_payment_data()
-                        # Обновляем поля существующего объекта payment
-                        # payment.contract_id = payment_data['contract_id'] # Нельзя менять договор при редактировании
-                        payment.amount = payment_data['amount']
-                        payment.due_date = payment_data['due_date']
-                        payment.payment_date = payment_data['payment_date']
-                        payment.status = payment_data['status']
-                        payment.description = payment_data['description']
-                        self.session.commit()
+                        with unit_of_work(self.session) as session:
+                            payment = session.get(Payment, payment_id)
+                            if payment:
+                                # Обновляем поля существующего платежа
+                                # payment.contract_id = payment_data['contract_id'] # Нельзя менять договор при редактировании
+                                payment.amount = payment_data['amount']
+                                payment.due_date = payment_data['due_date']
+                                payment.payment_date = payment_data['payment_date']
+                                payment.status = payment_data['status']
+                                payment.description = payment_data['description']
                         self.load_payments()
                     except ValueError as e:
                         QMessageBox.warning(self, "Ошибка ввода", str(e))
 
+    @track_action("delete_payment")
     def delete_payment(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            payment_id = int(self.table.item(current_row, 0).text())
-            payment = self.session.query(Payment).get(payment_id)
+        payment_id = self.selected_payment_id()
+        if payment_id is not None:
+            with read_session(self.session) as session:
+                payment = session.get(Payment, payment_id)
             if payment:
                 reply = QMessageBox.question(
                     self,
@@ -231,8 +250,10 @@ class PaymentsWidget(QWidget):
                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
                 )
                 if reply == QMessageBox.StandardButton.Yes:
-                    self.session.delete(payment)
-                    self.session.commit()
+                    with unit_of_work(self.session) as session:
+                        payment = session.get(Payment, payment_id)
+                        if payment:
+                            session.delete(payment)
                     self.load_payments()
 
 class PaymentDialog(QDialog):
@@ -308,15 +329,10 @@ class PaymentDialog(QDialog):
         layout.setSpacing(10)
 
         # Выбор договора
-        self.contract_combo = QComboBox()
-        contracts = self.session.query(Contract).all()
-        for contract in contracts:
-            # Убедимся, что contract.id не None перед добавлением
-            if contract.id is not None:
-                # Добавляем информацию об имуществе в комбобокс договора
-                property_info = contract.property.name if contract.property else 'Нет имущества'
-                self.contract_combo.addItem(f"Договор №{contract.id} ({property_info})", contract.id)
-       
+        self.contract_combo = LookupCombo(self.session, CONTRACT_LOOKUP)
+        if self.payment and self.payment.contract_id is not None:
+            self.contract_combo.set_current_id(self.payment.contract_id)
+
         # Отключаем комбобокс при редактировании
         if self.payment:
             self.contract_combo.setEnabled(False)
@@ -0,0 +1,52 @@
+import os
+
+from PyQt6.QtWidgets import QFileDialog, QMessageBox, QProgressDialog, QApplication
+from PyQt6.QtCore import Qt
+from core.photo_import import import_photos, find_images, IMAGE_EXTENSIONS
+
+IMAGE_FILTER = "Изображения ({})".format(" ".join(f"*{extension}" for extension in IMAGE_EXTENSIONS))
+# Сколько файлов с ошибками перечислять в сообщении
+ERRORS_SHOWN = 10
+
+
+def choose_photo_files(parent):
+    files, _ = QFileDialog.getOpenFileNames(parent, "Выберите фотографии", "", IMAGE_FILTER)
+    return files
+
+
+def choose_photo_folder(parent):
+    folder = QFileDialog.getExistingDirectory(parent, "Выберите папку с фотографиями")
+    if not folder:
+        return []
+    files = find_images(folder)
+    if not files:
+        QMessageBox.information(parent, "Импорт фотографий", "В папке нет изображений")
+    return files
+
+
+def run_photo_import(parent, sources):
+    """Обрабатывает файлы с окном прогресса; возвращает принятые ImportedPhoto"""
+    if not sources:
+        return []
+    progress = QProgressDialog("Обработка фотографий...", "Отмена", 0, len(sources), parent)
+    progress.setWindowTitle("Импорт фотографий")
+    progress.setWindowModality(Qt.WindowModality.WindowModal)
+    progress.setMinimumDuration(300)
+
+    def report(done, total):
+        progress.setValue(done)
+        progress.setLabelText(f"Обработано {done} из {total}")
+        QApplication.processEvents()
+        return not progress.wasCanceled()
+
+    results = import_photos(sources, report)
+    progress.close()
+
+    failed = [photo for photo in results if photo.error is not None]
+    if failed:
+        lines = [f"{os.path.basename(photo.source)}: {photo.error}" for photo in failed[:ERRORS_SHOWN]]
+        if len(failed) > ERRORS_SHOWN:
+            lines.append(f"... и еще {len(failed) - ERRORS_SHOWN}")
+        QMessageBox.warning(parent, "Импорт фотографий",
+                            f"Не удалось загрузить файлов: {len(failed)}\n\n" + "\n".join(lines))
+    return [photo for photo in results if photo.error is None]
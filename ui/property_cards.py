@@ -0,0 +1,371 @@
+"""Карточки объектов: модель списка и делегат, который их рисует.
+
+Карточки не являются виджетами: QListView в режиме сетки запрашивает у
+делегата отрисовку только видимых карточек, а фотографии берутся из общего
+кэша миниатюр. Кнопки и фотографии на карточке - области, по которым делегат
+определяет клик.
+
+Модель загружает только поля объектов. Главная фотография и число фотографий
+догружаются одним запросом на блок карточек, когда карточки блока впервые
+показываются или попадают в область прокрутки (prefetch); полная лента
+фотографий - когда карточку выделяют или наводят на нее курсор. Фотографии
+загружаются в пуле потоков, как страницы списков (ui.table_model): data() и
+paint() не обращаются к базе, а готовые карточки обновляются через dataChanged.
+"""
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyle
+from PyQt6.QtCore import (Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool, QCoreApplication,
+                          QPoint, QRect, QSize, QEvent, pyqtSignal)
+from PyQt6.QtGui import QColor, QFont, QPainter, QPainterPath
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from core.database import Property, PropertyPhoto, PropertyStatus
+from core.session_manager import read_connection
+from ui.thumbnails import thumbnail_cache
+
+CARD_SIZE = QSize(380, 284)
+THUMBNAIL_SIZE = QSize(108, 81)
+CARD_PHOTOS = 3  # сколько фотографий помещается на карточке
+PADDING = 14
+# Сколько карточек получают главные фотографии одним запросом
+PHOTO_BLOCK = 64
+
+CardRole = Qt.ItemDataRole.UserRole
+
+_BACKGROUND = QColor("#2b2b2b")
+_HOVER = QColor("#3d3d3d")
+_ACCENT = QColor("#0d47a1")
+_ACCENT_HOVER = QColor("#1565c0")
+_BORDER = QColor("#3d3d3d")
+_TEXT = QColor("#ffffff")
+_MUTED = QColor("#b0b0b0")
+_BADGE = QColor(0, 0, 0, 170)
+_AVAILABLE = QColor("#4caf50")
+_RENTED = QColor("#f44336")
+
+
+class PropertyCard:
+    """Данные одной карточки; photo_count is None - фотографии еще не загружались"""
+    __slots__ = ('id', 'name', 'address', 'area', 'floor', 'status', 'description',
+                 'main_photo', 'photo_count', 'photos')
+
+    def __init__(self, id, name, address, area, floor, status, description):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.area = area
+        self.floor = floor
+        self.status = status
+        self.description = description
+        self.main_photo = None
+        self.photo_count = None
+        self.photos = None  # все пути, главная первой; загружаются по требованию
+
+
+def _main_photos(property_ids):
+    """Главная фотография и число фотографий объектов"""
+    main_photo = (select(PropertyPhoto.file_path).where(PropertyPhoto.property_id == Property.id)
+                  .order_by(PropertyPhoto.is_main.desc(), PropertyPhoto.id).limit(1).scalar_subquery())
+    photo_count = select(func.count()).where(PropertyPhoto.property_id == Property.id).scalar_subquery()
+    return select(Property.id, main_photo, photo_count).where(Property.id.in_(property_ids))
+
+
+def _photo_strip(property_id):
+    """Все фотографии объекта, главная первой"""
+    return (select(PropertyPhoto.file_path).where(PropertyPhoto.property_id == property_id)
+            .order_by(PropertyPhoto.is_main.desc(), PropertyPhoto.id))
+
+
+class _PhotoSignals(QObject):
+    finished = pyqtSignal(int, object, object)  # поколение, ключ загрузки, строки (None - ошибка)
+
+
+class _PhotoJob(QRunnable):
+    """Загрузка фотографий карточек в пуле потоков на отдельном соединении"""
+
+    def __init__(self, engine, statement, key, generation):
+        super().__init__()
+        self.engine = engine
+        self.statement = statement
+        self.key = key
+        self.generation = generation
+        self.signals = _PhotoSignals()
+
+    def run(self):
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(self.statement).all()
+        except OperationalError:
+            # База занята записью: карточки запросят фотографии при следующей отрисовке
+            rows = None
+        self.signals.finished.emit(self.generation, self.key, rows)
+
+
+class PropertyCardModel(QAbstractListModel):
+    def __init__(self, session, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self._cards = []
+        self._generation = 0
+        self._jobs = {}  # ключ загрузки -> задание: ('block', номер блока) или ('strip', id объекта)
+        self._pool = QThreadPool.globalInstance()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._cards)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        card = self._cards[index.row()]
+        if role == CardRole:
+            if card.photo_count is None:
+                self._request_block(index.row() // PHOTO_BLOCK)
+            return card
+        if role == Qt.ItemDataRole.DisplayRole:
+            return card.name
+        return None
+
+    def load(self, conditions=()):
+        """Загружает карточки одним запросом, без фотографий"""
+        statement = select(Property.id, Property.name, Property.address, Property.area,
+                           Property.floor, Property.status, Property.description)
+        if conditions:
+            statement = statement.where(*conditions)
+        with read_connection(self.session) as conn:
+            cards = [PropertyCard(*row) for row in conn.execute(statement.order_by(Property.id))]
+        # Фотографии, загружаемые для прежнего списка, отбрасываются по номеру поколения
+        self._generation += 1
+        self._jobs.clear()
+        self.beginResetModel()
+        self._cards = cards
+        self.endResetModel()
+
+    def prefetch(self, first, last):
+        """Запрашивает главные фотографии блоков, в которые попадают карточки first..last"""
+        last = min(last, len(self._cards) - 1)
+        for block in range(max(first, 0) // PHOTO_BLOCK, last // PHOTO_BLOCK + 1):
+            self._request_block(block)
+
+    def photos(self, card):
+        """Фотографии для ленты карточки; пока полная лента загружается - только главная"""
+        if card.photos is None:
+            if card.photo_count is not None and card.photo_count <= 1:
+                card.photos = [card.main_photo] if card.photo_count else []
+            else:
+                if card.photo_count is not None:
+                    self._start(('strip', card.id), _photo_strip(card.id))
+                return [card.main_photo] if card.main_photo else []
+        return card.photos
+
+    def wait(self):
+        """Дожидается фоновой загрузки фотографий (для скриптов и замеров)"""
+        self._pool.waitForDone()
+        # Результат приходит сигналом в поток интерфейса
+        QCoreApplication.processEvents()
+
+    def _request_block(self, block):
+        cards = [card for card in self._cards[block * PHOTO_BLOCK:(block + 1) * PHOTO_BLOCK]
+                 if card.photo_count is None]
+        if cards:
+            self._start(('block', block), _main_photos([card.id for card in cards]))
+
+    def _start(self, key, statement):
+        if key in self._jobs:
+            return
+        job = _PhotoJob(self.session.get_bind(), statement, key, self._generation)
+        job.signals.finished.connect(self._on_loaded)
+        self._jobs[key] = job
+        self._pool.start(job)
+
+    def _on_loaded(self, generation, key, rows):
+        if generation != self._generation:
+            return  # ответ для прежнего списка карточек
+        self._jobs.pop(key, None)
+        if rows is None:
+            return
+        kind, value = key
+        if kind == 'block':
+            first = value * PHOTO_BLOCK
+            cards = {card.id: card for card in self._cards[first:first + PHOTO_BLOCK]}
+            for property_id, path, count in rows:
+                cards[property_id].main_photo = path
+                cards[property_id].photo_count = count
+            for card in cards.values():
+                if card.photo_count is None:  # объект удален после загрузки списка
+                    card.photo_count = 0
+            last = first + len(cards) - 1
+        else:
+            first = last = self.row_of(value)
+            if first < 0:
+                return
+            self._cards[first].photos = [path for path, in rows]
+        self.dataChanged.emit(self.index(first), self.index(last), [CardRole])
+
+    def card(self, row):
+        return self._cards[row] if 0 <= row < len(self._cards) else None
+
+    def row_of(self, property_id):
+        for row, card in enumerate(self._cards):
+            if card.id == property_id:
+                return row
+        return -1
+
+
+class PropertyCardDelegate(QStyledItemDelegate):
+    """Рисует карточку объекта и обрабатывает клики по ее кнопкам и фотографиям"""
+
+    edit_requested = pyqtSignal(int)
+    delete_requested = pyqtSignal(int)
+    photo_clicked = pyqtSignal(int, str)  # id объекта, путь к фото
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnail_cache()
+        self.title_font = QFont()
+        self.title_font.setPointSize(12)
+        self.title_font.setBold(True)
+        self.bold_font = QFont()
+        self.bold_font.setBold(True)
+
+    def sizeHint(self, option, index):
+        return CARD_SIZE
+
+    @staticmethod
+    def _layout(rect):
+        """Области карточки: заголовок, текст, фотографии, кнопки"""
+        inner = rect.adjusted(PADDING, PADDING, -PADDING, -PADDING)
+        left, top, width = inner.left(), inner.top(), inner.width()
+        photos = [QRect(left + i * (THUMBNAIL_SIZE.width() + 8), top + 118,
+                        THUMBNAIL_SIZE.width(), THUMBNAIL_SIZE.height())
+                  for i in range(CARD_PHOTOS)]
+        button_width = (width - 10) // 2
+        buttons_top = inner.bottom() - 30
+        return {
+            'title': QRect(left, top, width, 24),
+            'address': QRect(left, top + 30, width, 18),
+            'details': QRect(left, top + 50, width, 18),
+            'description': QRect(left, top + 72, width, 38),
+            'photos': photos,
+            'edit': QRect(left, buttons_top, button_width, 30),
+            'delete': QRect(left + button_width + 10, buttons_top, button_width, 30),
+        }
+
+    def paint(self, painter, option, index):
+        card = index.data(CardRole)
+        if card is None:
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = option.rect.adjusted(4, 4, -4, -4)
+        areas = self._layout(rect)
+        hovered = bool(option.state & QStyle.StateFlag.State_MouseOver)
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+
+        path = QPainterPath()
+        path.addRoundedRect(rect.toRectF(), 10, 10)
+        painter.fillPath(path, _HOVER if hovered else _BACKGROUND)
+        painter.setPen(_ACCENT if selected else _BORDER)
+        painter.drawPath(path)
+        if selected:
+            painter.setPen(_ACCENT)
+            painter.drawRoundedRect(rect.adjusted(1, 1, -1, -1), 9, 9)
+
+        status = card.status.value if card.status else ""
+        painter.setFont(self.bold_font)
+        status_width = painter.fontMetrics().horizontalAdvance(status)
+        painter.setPen(_AVAILABLE if card.status == PropertyStatus.AVAILABLE else _RENTED)
+        painter.drawText(areas['title'], Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, status)
+
+        painter.setFont(self.title_font)
+        painter.setPen(_TEXT)
+        title = areas['title'].adjusted(0, 0, -status_width - 10, 0)
+        painter.drawText(title, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                         painter.fontMetrics().elidedText(card.name or "", Qt.TextElideMode.ElideRight, title.width()))
+
+        painter.setFont(option.font)
+        metrics = painter.fontMetrics()
+        painter.drawText(areas['address'], Qt.AlignmentFlag.AlignLeft,
+                         metrics.elidedText(f"Адрес: {card.address or ''}", Qt.TextElideMode.ElideRight,
+                                            areas['address'].width()))
+        painter.drawText(areas['details'], Qt.AlignmentFlag.AlignLeft,
+                         f"Площадь: {card.area} м²    Этаж: {card.floor}")
+        if card.description:
+            painter.setPen(_MUTED)
+            painter.drawText(areas['description'], Qt.AlignmentFlag.AlignLeft | Qt.TextFlag.TextWordWrap,
+                             card.description)
+
+        # Лента всех фотографий - только у выделенной карточки или под курсором
+        expanded = hovered or selected
+        photos = index.model().photos(card) if expanded else [card.main_photo] if card.main_photo else []
+        self._paint_photos(painter, photos, areas['photos'])
+        if not expanded and card.photo_count and card.photo_count > 1:
+            self._paint_badge(painter, areas['photos'][0], f"{card.photo_count} фото")
+
+        for key, text in (('edit', "Редактировать"), ('delete', "Удалить")):
+            button = areas[key]
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(_ACCENT_HOVER if hovered else _ACCENT)
+            painter.drawRoundedRect(button, 3, 3)
+            painter.setPen(_TEXT)
+            painter.setFont(self.bold_font)
+            painter.drawText(button, Qt.AlignmentFlag.AlignCenter, text)
+        painter.restore()
+
+    def _paint_photos(self, painter, photos, areas):
+        painter.setFont(self.bold_font)
+        for i, area in enumerate(areas):
+            if i >= len(photos):
+                break
+            if i == len(areas) - 1 and len(photos) > len(areas):
+                # Последняя ячейка - счетчик остальных фотографий
+                painter.setPen(_BORDER)
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawRoundedRect(area, 5, 5)
+                painter.setPen(_TEXT)
+                painter.drawText(area, Qt.AlignmentFlag.AlignCenter, f"+{len(photos) - i}")
+                break
+            pixmap = self.thumbnails.pixmap(photos[i], THUMBNAIL_SIZE)
+            if pixmap is not None:
+                target = QRect(area.topLeft(), pixmap.size().scaled(area.size(), Qt.AspectRatioMode.KeepAspectRatio))
+                target.moveCenter(area.center())
+                painter.drawPixmap(target, pixmap)
+            else:
+                painter.setPen(_BORDER)
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawRoundedRect(area, 5, 5)
+                if self.thumbnails.is_broken(photos[i], THUMBNAIL_SIZE):
+                    painter.setPen(_MUTED)
+                    painter.drawText(area, Qt.AlignmentFlag.AlignCenter, "Нет файла")
+
+    def _paint_badge(self, painter, area, text):
+        """Счетчик фотографий в углу главной фотографии"""
+        painter.setFont(self.bold_font)
+        metrics = painter.fontMetrics()
+        badge = QRect(0, 0, metrics.horizontalAdvance(text) + 10, metrics.height() + 2)
+        badge.moveBottomRight(area.bottomRight() - QPoint(4, 4))
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(_BADGE)
+        painter.drawRoundedRect(badge, 4, 4)
+        painter.setPen(_TEXT)
+        painter.drawText(badge, Qt.AlignmentFlag.AlignCenter, text)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.Type.MouseButtonRelease or event.button() != Qt.MouseButton.LeftButton:
+            return False
+        card = index.data(CardRole)
+        if card is None:
+            return False
+        areas = self._layout(option.rect.adjusted(4, 4, -4, -4))
+        position = event.position().toPoint()
+        if areas['edit'].contains(position):
+            self.edit_requested.emit(card.id)
+            return True
+        if areas['delete'].contains(position):
+            self.delete_requested.emit(card.id)
+            return True
+        # Под курсором лента уже развернута
+        photos = model.photos(card)
+        for i, area in enumerate(areas['photos']):
+            if area.contains(position) and i < len(photos):
+                self.photo_clicked.emit(card.id, photos[i])
+                return True
+        return False
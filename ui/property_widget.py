@@ -1,188 +1,25 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QLineEdit, QSpinBox, QDoubleSpinBox, 
                              QComboBox, QTextEdit, QTableWidget, QTableWidgetItem,
-                             QFileDialog, QMessageBox, QDialog, QScrollArea, QGridLayout, QGroupBox, QFormLayout, QFrame, QSpacerItem, QDialogButtonBox, QListWidget)
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QPixmap, QImage, QColor
-from core.database import Property, PropertyPhoto, InventoryItem, PropertyStatus, Contract
+                             QMessageBox, QDialog, QScrollArea, QGridLayout, QGroupBox, QFormLayout, QListWidget, QListView)
+from PyQt6.QtCore import Qt, QSize, QPoint
+from PyQt6.QtGui import QPixmap
+from core.database import Property, PropertyPhoto, InventoryItem, PropertyStatus, ContractStatus
+from core.instrumentation import track_action
+from core.list_queries import ListFilter, PROPERTIES
+from core.search import search_available
+from core.read_models import inventory, rental_history
+from core.photo_import import register_blobs
+from core.photo_store import purge_unreferenced, remove_property_photos
+from core.session_manager import read_session, read_connection, unit_of_work
+from ui.duplicates_dialog import DuplicatesDialog
+from ui.filter_bar import FilterBar
+from ui.photo_import_dialog import choose_photo_files, choose_photo_folder, run_photo_import
+from ui.property_cards import PropertyCardModel, PropertyCardDelegate, CardRole, CARD_SIZE, PHOTO_BLOCK
+from ui.thumbnails import thumbnail_cache
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import os
-import shutil
-from datetime import datetime
-
-class PhotoDialog(QDialog):
-    def __init__(self, property_id, session):
-        super().__init__()
-        self.property_id = property_id
-        self.session = session
-        self.init_ui()
-
-    def init_ui(self):
-        self.setWindowTitle("Фотографии помещения")
-        self.setMinimumSize(800, 600)
-        layout = QVBoxLayout(self)
-
-        # Область просмотра фотографий
-        scroll = QScrollArea()
-        self.photos_widget = QWidget()
-        self.photos_layout = QGridLayout(self.photos_widget)
-        self.photos_layout.setContentsMargins(0, 0, 0, 0)
-        self.photos_layout.setSpacing(10) # Отступ между фотографиями
-        scroll.setWidget(self.photos_widget)
-        scroll.setWidgetResizable(True)
-        scroll.setStyleSheet("""
-            QScrollArea {
-                border: none;
-            }
-        """)
-        layout.addWidget(scroll)
-
-        # Кнопки управления
-        buttons = QHBoxLayout()
-        buttons.addStretch()
-        add_btn = QPushButton("Добавить фото")
-        add_btn.clicked.connect(self.add_photo)
-        buttons.addWidget(add_btn)
-        layout.addLayout(buttons)
-
-        self.load_photos()
-
-    def load_photos(self):
-        # Очищаем текущие фотографии
-        for i in reversed(range(self.photos_layout.count())): 
-            self.photos_layout.itemAt(i).widget().setParent(None)
-
-        # Загружаем фотографии из базы
-        self.photos = self.session.query(PropertyPhoto).filter(
-            PropertyPhoto.property_id == self.property_id
-        ).all()
-
-        row = 0
-        col = 0
-        for i, photo in enumerate(self.photos):
-            if os.path.exists(photo.file_path):
-                # Создаем виджет для фотографии
-                photo_widget = QWidget()
-                photo_layout = QVBoxLayout(photo_widget)
-                photo_layout.setContentsMargins(0, 0, 0, 0)
-
-                # Отображаем фотографию
-                label = QLabel()
-                pixmap = QPixmap(photo.file_path)
-                label.setPixmap(pixmap.scaled(150, 150, Qt.AspectRatioMode.KeepAspectRatio))
-                label.setCursor(Qt.CursorShape.PointingHandCursor)
-                label.setStyleSheet("""
-                    QLabel {
-                        border: 1px solid #3d3d3d;
-                        border-radius: 5px;
-                        padding: 5px;
-                        background-color: #1e1e1e;
-                    }
-                    QLabel:hover {
-                        border: 1px solid #0d47a1;
-                    }
-                """)
-                label.mousePressEvent = lambda event, path=photo.file_path, index=i: self.show_full_photo(path, index)
-                photo_layout.addWidget(label)
-
-                # Добавляем описание
-                desc_label = QLabel(photo.description)
-                desc_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                desc_label.setStyleSheet("color: #bbbbbb;")
-                photo_layout.addWidget(desc_label)
-
-                # Добавляем кнопки управления
-                buttons = QHBoxLayout()
-                buttons.addStretch()
-                delete_btn = QPushButton("Удалить")
-                delete_btn.clicked.connect(lambda checked, p=photo: self.delete_photo(p))
-                delete_btn.setStyleSheet("""
-                    QPushButton {
-                        background-color: #d32f2f;
-                        color: white;
-                        border: none;
-                        padding: 3px 8px;
-                        border-radius: 3px;
-                        font-weight: normal;
-                        font-size: 10px;
-                    }
-                    QPushButton:hover {
-                        background-color: #e53935;
-                    }
-                """)
-                buttons.addWidget(delete_btn)
-                photo_layout.addLayout(buttons)
-
-                self.photos_layout.addWidget(photo_widget, row, col)
-                col += 1
-                if col > 3:  # 4 фотографии в ряд
-                    col = 0
-                    row += 1
-
-    def add_photo(self):
-        file_name, _ = QFileDialog.getOpenFileName(
-            self,
-            "Выберите фотографию",
-            "",
-            "Images (*.png *.jpg *.jpeg)"
-        )
-        if file_name:
-            # Для PhotoDialog, мы сразу сохраняем фото в папку property_id
-            # (Этот диалог вызывается только для существующих объектов)
-            photos_dir = f"photos/property_{self.property_id}"
-            os.makedirs(photos_dir, exist_ok=True)
-
-            # Копируем файл
-            new_file_name = f"{photos_dir}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(file_name)}"
-            shutil.copy2(file_name, new_file_name)
-
-            # Добавляем запись в базу
-            photo = PropertyPhoto(
-                property_id=self.property_id,
-                file_path=new_file_name,
-                description="",
-                is_main=0 # По умолчанию не главная
-            )
-            self.session.add(photo)
-            self.session.commit()
-
-            self.load_photos()
-
-    def set_main_photo(self, photo):
-        # Сбрасываем флаг главной фотографии у всех фотографий для данного объекта
-        self.session.query(PropertyPhoto).filter(
-            PropertyPhoto.property_id == self.property_id
-        ).update({"is_main": 0})
-
-        # Устанавливаем новую главную фотографию
-        photo.is_main = 1
-        self.session.commit()
-        self.load_photos()
-
-    def delete_photo(self, photo):
-        reply = QMessageBox.question(
-            self,
-            "Подтверждение",
-            "Удалить фотографию?",
-            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-        )
-        if reply == QMessageBox.StandardButton.Yes:
-            # Удаляем файл
-            if os.path.exists(photo.file_path):
-                os.remove(photo.file_path)
-            
-            # Удаляем запись из базы
-            self.session.delete(photo)
-            self.session.commit()
-            self.load_photos()
-
-    def show_full_photo(self, photo_path, current_index):
-        """Открывает фотографию во весь экран с возможностью листания"""
-        photo_paths = [p.file_path for p in self.photos if os.path.exists(p.file_path)]
-        if not photo_paths:
-            return
-        dialog = PhotoViewerDialog(photo_paths, current_index, self)
-        dialog.exec()
 
 class InventoryDialog(QDialog):
     def __init__(self, property_id, session):
@@ -293,9 +130,8 @@ class InventoryDialog(QDialog):
         if not self.property_id:
             return
 
-        items = self.session.query(InventoryItem).filter(
-            InventoryItem.property_id == self.property_id
-        ).all()
+        with read_connection(self.session) as conn:
+            items = inventory(conn, self.property_id)
 
         self.table.setRowCount(len(items))
         for i, item in enumerate(items):
@@ -317,16 +153,15 @@ class InventoryDialog(QDialog):
                 QMessageBox.warning(self, "Ошибка", "Сначала сохраните объект")
                 return
 
-            item = InventoryItem(
-                property_id=self.property_id,
-                name=dialog.name_edit.text(),
-                description=dialog.description_edit.toPlainText(),
-                quantity=int(dialog.quantity_spin.value()),
-                condition=dialog.condition_combo.currentText(),
-                notes=dialog.notes_edit.toPlainText()
-            )
-            self.session.add(item)
-            self.session.commit()
+            with unit_of_work(self.session) as session:
+                session.add(InventoryItem(
+                    property_id=self.property_id,
+                    name=dialog.name_edit.text(),
+                    description=dialog.description_edit.toPlainText(),
+                    quantity=int(dialog.quantity_spin.value()),
+                    condition=dialog.condition_combo.currentText(),
+                    notes=dialog.notes_edit.toPlainText()
+                ))
             self.load_inventory()
 
     def delete_item(self, row):
@@ -341,13 +176,14 @@ class InventoryDialog(QDialog):
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         if reply == QMessageBox.StandardButton.Yes:
-            item = self.session.query(InventoryItem).filter(
-                InventoryItem.property_id == self.property_id,
-                InventoryItem.name == item_name
-            ).first()
+            with unit_of_work(self.session) as session:
+                item = session.query(InventoryItem).filter(
+                    InventoryItem.property_id == self.property_id,
+                    InventoryItem.name == item_name
+                ).first()
+                if item:
+                    session.delete(item)
             if item:
-                self.session.delete(item)
-                self.session.commit()
                 self.load_inventory()
 
 class InventoryItemDialog(QDialog):
@@ -600,9 +436,14 @@ class PropertyDialog(QDialog):
         """)
         photos_layout.addWidget(self.photos_area)
         
+        photo_buttons = QHBoxLayout()
         add_photo_btn = QPushButton("Добавить фото")
-        add_photo_btn.clicked.connect(self.add_photo)
-        photos_layout.addWidget(add_photo_btn)
+        add_photo_btn.clicked.connect(lambda: self.import_photos(choose_photo_files(self)))
+        photo_buttons.addWidget(add_photo_btn)
+        add_folder_btn = QPushButton("Добавить папку")
+        add_folder_btn.clicked.connect(lambda: self.import_photos(choose_photo_folder(self)))
+        photo_buttons.addWidget(add_folder_btn)
+        photos_layout.addLayout(photo_buttons)
         
         layout.addWidget(photos_group)
 
@@ -654,24 +495,16 @@ class PropertyDialog(QDialog):
             'description': self.description_edit.toPlainText()
         }
 
-    def add_photo(self):
-        """Добавление фотографии к объекту недвижимости"""
-        file_name, _ = QFileDialog.getOpenFileName(
-            self,
-            "Выберите фотографию",
-            "",
-            "Images (*.png *.jpg *.jpeg)"
-        )
-        if file_name:
-            # Создаем временную копию файла
-            temp_dir = "temp_photos"
-            os.makedirs(temp_dir, exist_ok=True)
-            temp_file = f"{temp_dir}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(file_name)}"
-            shutil.copy2(file_name, temp_file)
-            
-            # Добавляем во временный список
-            self.temp_photos.append(temp_file)
-            
+    def import_photos(self, files):
+        """Добавление фотографий к объекту недвижимости"""
+        imported = run_photo_import(self, files)
+        if imported:
+            # Файлы сразу попадают в хранилище; записи о фотографиях создаются при сохранении объекта
+            with unit_of_work(self.parent().session) as session:
+                for photo in register_blobs(session, imported):
+                    if photo.path not in self.temp_photos:
+                        self.temp_photos.append(photo.path)
+
             # Обновляем отображение
             self.load_photos()
 
@@ -685,27 +518,29 @@ class PropertyDialog(QDialog):
         # Загружаем фотографии из базы для существующего объекта
         self.db_photos = [] # Храним фотографии из базы отдельно
         if self.property and self.property.id:
-            self.db_photos = self.parent().session.query(PropertyPhoto).filter(
-                PropertyPhoto.property_id == self.property.id
-            ).all()
+            with read_session(self.parent().session) as session:
+                self.db_photos = session.query(PropertyPhoto).filter(
+                    PropertyPhoto.property_id == self.property.id
+                ).all()
             
-        all_photos_paths = [p.file_path for p in self.db_photos if os.path.exists(p.file_path)] + \
-                           [p for p in self.temp_photos if os.path.exists(p)]
+        # Несохраненные фотографии (без записи в базе) нельзя сделать главными до сохранения объекта
+        all_photos = [(p.file_path, p) for p in self.db_photos if os.path.exists(p.file_path)] + \
+                     [(p, None) for p in self.temp_photos if os.path.exists(p)]
 
         # Добавляем все фотографии в сетку
         row = 0
         col = 0
         photos_per_row = 3 # Количество фотографий в одном ряду
 
-        for i, photo_path in enumerate(all_photos_paths):
-            self.add_photo_to_grid(photo_path, row, col)
+        for i, (photo_path, photo) in enumerate(all_photos):
+            self.add_photo_to_grid(photo_path, row, col, photo)
             col += 1
             if col >= photos_per_row:
                 col = 0
                 row += 1
 
-    def add_photo_to_grid(self, photo_path, row, col):
-        """Добавляет фотографию в сетку с кнопкой удаления по заданным координатам"""
+    def add_photo_to_grid(self, photo_path, row, col, photo=None):
+        """Добавляет фотографию в сетку с кнопками "Главная" и "Удалить" по заданным координатам"""
         
         photo_widget = QWidget()
         photo_layout = QVBoxLayout(photo_widget)
@@ -732,6 +567,17 @@ class PropertyDialog(QDialog):
         
         photo_layout.addWidget(photo_label)
 
+        # Главная фотография показывается на карточке объекта
+        if photo is not None and photo.is_main:
+            main_label = QLabel("Главная")
+            main_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            main_label.setStyleSheet("color: #bbbbbb;")
+            photo_layout.addWidget(main_label)
+        elif photo is not None:
+            main_btn = QPushButton("Сделать главной")
+            main_btn.clicked.connect(lambda checked, photo_id=photo.id: self.set_main_photo(photo_id))
+            photo_layout.addWidget(main_btn)
+
         # Кнопка удаления
         delete_btn = QPushButton("Удалить")
         delete_btn.setStyleSheet("""
@@ -756,6 +602,15 @@ class PropertyDialog(QDialog):
         
         self.photos_grid_layout.addWidget(photo_widget, row, col)
 
+    def set_main_photo(self, photo_id):
+        """Делает фотографию главной: флаг снимается с остальных фотографий объекта"""
+        with unit_of_work(self.parent().session) as session:
+            session.query(PropertyPhoto).filter(
+                PropertyPhoto.property_id == self.property.id
+            ).update({"is_main": 0})
+            session.query(PropertyPhoto).filter(PropertyPhoto.id == photo_id).update({"is_main": 1})
+        self.load_photos()
+
     def delete_photo_by_path(self, photo_path):
         """Удаляет фотографию по пути файла"""
         reply = QMessageBox.question(
@@ -766,22 +621,20 @@ class PropertyDialog(QDialog):
         )
         if reply == QMessageBox.StandardButton.Yes:
             # Проверяем, является ли фото временным или из базы
-            if photo_path in self.temp_photos:
-                # Удаляем из временного списка и файла
-                self.temp_photos.remove(photo_path)
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-            elif self.property and self.property.id:
-                # Удаляем из базы и файла
-                photo = self.parent().session.query(PropertyPhoto).filter(
-                    PropertyPhoto.property_id == self.property.id,
-                    PropertyPhoto.file_path == photo_path
-                ).first()
-                if photo:
-                    self.parent().session.delete(photo)
-                    self.parent().session.commit()
-                    if os.path.exists(photo_path):
-                        os.remove(photo_path)
+            with unit_of_work(self.parent().session) as session:
+                if photo_path in self.temp_photos:
+                    # Еще не сохраненное фото: файл хранилища удаляется, если на него никто не ссылается
+                    self.temp_photos.remove(photo_path)
+                    purge_unreferenced(session, [photo_path])
+                elif self.property and self.property.id:
+                    photo = session.query(PropertyPhoto).filter(
+                        PropertyPhoto.property_id == self.property.id,
+                        PropertyPhoto.file_path == photo_path
+                    ).first()
+                    if photo:
+                        session.delete(photo)
+                        session.flush()
+                        purge_unreferenced(session, [photo_path])
             
             # Обновляем отображение
             self.load_photos()
@@ -791,9 +644,10 @@ class PropertyDialog(QDialog):
         # Собираем список всех фотографий (из базы и временные)
         all_photo_paths = []
         if self.property and self.property.id:
-            db_photos = self.parent().session.query(PropertyPhoto).filter(
-                PropertyPhoto.property_id == self.property.id
-            ).all()
+            with read_connection(self.parent().session) as conn:
+                db_photos = conn.execute(select(PropertyPhoto.file_path).where(
+                    PropertyPhoto.property_id == self.property.id
+                )).all()
             all_photo_paths.extend([p.file_path for p in db_photos if os.path.exists(p.file_path)])
 
         all_photo_paths.extend([p for p in self.temp_photos if os.path.exists(p)])
@@ -828,40 +682,31 @@ class PropertyDialog(QDialog):
             self.area_edit.setFocus()
             return
 
-        # Сохраняем объект только если это редактирование
+        # Сохраняем объект только если это редактирование (новый сохраняет PropertyWidget.add_property)
         if self.property:
-            property_data = self.get_property_data()
-            for key, value in property_data.items():
-                setattr(self.property, key, value)
-            self.parent().session.commit()
-
-            # Перемещаем временные фотографии в постоянную папку
-            if self.temp_photos:
-                photos_dir = f"photos/property_{self.property.id}"
-                os.makedirs(photos_dir, exist_ok=True)
-                
-                for temp_photo in self.temp_photos:
-                    new_file_name = f"{photos_dir}/{os.path.basename(temp_photo)}"
-                    shutil.move(temp_photo, new_file_name)
-                    
-                    # Добавляем запись в базу
-                    photo = PropertyPhoto(
-                        property_id=self.property.id,
-                        file_path=new_file_name,
-                        description="",
-                        is_main=0
-                    )
-                    self.parent().session.add(photo)
-                
-                self.parent().session.commit()
+            with unit_of_work(self.parent().session) as session:
+                property = session.get(Property, self.property.id)
+                if property:
+                    for key, value in self.get_property_data().items():
+                        setattr(property, key, value)
+
+                    # Добавленные фотографии уже в хранилище: остается создать записи
+                    for temp_photo in self.temp_photos:
+                        session.add(PropertyPhoto(
+                            property_id=property.id,
+                            file_path=temp_photo,
+                            description="",
+                            is_main=0
+                        ))
+            self.temp_photos = []
             
         super().accept()
 
     def reject(self):
-        # Удаляем временные фотографии при отмене
-        for temp_photo in self.temp_photos:
-            if os.path.exists(temp_photo):
-                os.remove(temp_photo)
+        # Удаляем из хранилища добавленные файлы, на которые никто не ссылается
+        if self.temp_photos:
+            with unit_of_work(self.parent().session) as session:
+                purge_unreferenced(session, self.temp_photos)
         super().reject()
 
     def show_inventory(self):
@@ -921,24 +766,23 @@ class RentalHistoryDialog(QDialog):
 
     def load_rental_history(self):
         self.history_list.clear()
-        contracts = self.session.query(Contract).filter(Contract.property_id == self.property_id).all()
+        with read_connection(self.session) as conn:
+            contracts = rental_history(conn, self.property_id)
 
         if not contracts:
             self.history_list.addItem("Нет данных об аренде для этого объекта.")
             return
 
         for contract in contracts:
-            # Явно обновляем атрибуты объекта из базы данных
-            self.session.refresh(contract)
             item_text = f"Договор №{contract.id} от {contract.start_date.strftime('%Y-%m-%d')} " \
                         f"до {contract.end_date.strftime('%Y-%m-%d')}\n" \
-                        f"Арендатор: {contract.tenant.name}\n" \
+                        f"Арендатор: {contract.tenant_name or '—'}\n" \
                         f"Стоимость: {contract.rent_amount:.2f} ₽/мес"
             
             # Проверяем статус договора и добавляем индикатор
-            if contract.status == 'active':
+            if contract.status == ContractStatus.ACTIVE:
                 item_text += "\nСтатус: Активный"
-            elif contract.status == 'completed':
+            elif contract.status in (ContractStatus.EXPIRED, ContractStatus.TERMINATED):
                  item_text += "\nСтатус: Завершен"
             self.history_list.addItem(item_text)
 
@@ -946,8 +790,7 @@ class PropertyWidget(QWidget):
     def __init__(self, session: Session):
         super().__init__()
         self.session = session
-        self.selected_card = None  # Добавляем переменную для хранения выбранной карточки
-        self.selected_property = None  # Добавляем переменную для хранения выбранного объекта
+        self.list_filter = ListFilter()
         self.init_ui()
         self.load_properties()
 
@@ -1085,234 +928,110 @@ class PropertyWidget(QWidget):
         add_btn.clicked.connect(self.add_property)
         controls.addWidget(add_btn)
 
+        duplicates_btn = QPushButton("Похожие фото")
+        duplicates_btn.setToolTip("Найти одинаковые снимки, загруженные к разным объектам")
+        duplicates_btn.clicked.connect(self.show_duplicates)
+        controls.addWidget(duplicates_btn)
+
         controls.addStretch()
         layout.addLayout(controls)
 
-        # Создаем скролл-область для списка имущества
-        scroll = QScrollArea(self)
-        scroll.setWidgetResizable(True)
-        scroll.setStyleSheet("""
-            QScrollArea {
-                border: none;
-                background-color: transparent;
-            }
-        """)
-        
-        # Контейнер для списка имущества
-        self.properties_container = QWidget()
-        self.properties_layout = QVBoxLayout(self.properties_container)
-        self.properties_layout.setSpacing(20)
-        scroll.setWidget(self.properties_container)
-        
-        layout.addWidget(scroll)
+        self.filter_bar = FilterBar(
+            "Поиск: название, адрес, описание",
+            statuses=[(status.value, status) for status in PropertyStatus],
+            amount_label="Площадь:",
+        )
+        self.filter_bar.filter_changed.connect(self.apply_filter)
+        layout.addWidget(self.filter_bar)
+
+        # Карточки рисует делегат: виджеты на каждый объект не создаются
+        self.cards = PropertyCardModel(self.session, self)
+        self.card_delegate = PropertyCardDelegate(self)
+        self.card_delegate.edit_requested.connect(
+            self.edit_property)
+        self.card_delegate.delete_requested.connect(self.delete_property)
+        self.card_delegate.photo_clicked.connect(self.show_full_photo)
+
+        self.cards_view = QListView()
+        self.cards_view.setModel(self.cards)
+        self.cards_view.setItemDelegate(self.card_delegate)
+        self.cards_view.setViewMode(QListView.ViewMode.IconMode)
+        self.cards_view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.cards_view.setMovement(QListView.Movement.Static)
+        self.cards_view.setUniformItemSizes(True)
+        self.cards_view.setGridSize(CARD_SIZE + QSize(8, 8))
+        self.cards_view.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.cards_view.setSelectionMode(QListView.SelectionMode.SingleSelection)
+        self.cards_view.setMouseTracking(True)
+        self.cards_view.setStyleSheet("QListView { border: none; background-color: #2b2b2b; }")
+        self.cards_view.doubleClicked.connect(
+            lambda index: self.edit_property(index.data(CardRole).id))
+        # Загруженная миниатюра перерисовывает только видимую область
+        thumbnail_cache().ready.connect(self.cards_view.viewport().update)
+        # Главные фотографии запрашиваются в фоне для видимых карточек и блока впереди
+        self.cards_view.verticalScrollBar().valueChanged.connect(self.prefetch_card_photos)
+
+        layout.addWidget(self.cards_view)
+
+    def prefetch_card_photos(self):
+        viewport = self.cards_view.viewport()
+        grid = self.cards_view.gridSize()
+        first = max(self.cards_view.indexAt(QPoint(grid.width() // 2, grid.height() // 2)).row(), 0)
+        visible = max(viewport.width() // grid.width(), 1) * (viewport.height() // grid.height() + 2)
+        self.cards.prefetch(first, first + visible + PHOTO_BLOCK)
+
+    def apply_filter(self, list_filter):
+        if list_filter != self.list_filter:
+            self.list_filter = list_filter
+            self.load_properties()
 
+    @track_action("load_properties")
     def load_properties(self):
-        # Очищаем текущий layout
-        while self.properties_layout.count():
-            item = self.properties_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
-            elif item.layout():
-                # Рекурсивно удаляем все виджеты из вложенного layout
-                while item.layout().count():
-                    nested_item = item.layout().takeAt(0)
-                    if nested_item.widget():
-                        nested_item.widget().deleteLater()
-        
-        # Получаем все объекты
-        properties = self.session.query(Property).all()
-        
-        # Перебираем объекты в стандартном порядке для добавления слева направо
-        for property in properties:
-            # Создаем карточку
-            card = QFrame()
-            card.setFrameShape(QFrame.Shape.StyledPanel)
-            card.setStyleSheet("""
-                QFrame {
-                    background-color: #2b2b2b;
-                    border-radius: 10px;
-                    padding: 15px;
-                }
-                QFrame[selected="true"] {
-                     border: 2px solid #0d47a1;
-                 }
-                QFrame:hover {
-                     background-color: #3d3d3d;
-                 }
-                QLabel {
-                    color: #ffffff;
-                }
-                QPushButton {
-                    background-color: #0d47a1;
-                    color: white;
-                    border: none;
-                    padding: 5px 10px;
-                    border-radius: 3px;
-                }
-                QPushButton:hover {
-                    background-color: #1565c0;
-                }
-            """)
-            # card.setFixedWidth(250) # Удаляем фиксированную ширину карточки
-            # card.setFixedHeight(250) # Удаляем фиксированную высоту карточки
-
-            # Добавляем обработчик клика для выделения
-            card.mousePressEvent = lambda event, card=card, p=property: self.select_property_card(card, p)
-            card.setProperty("property_id", property.id) # Сохраняем ID объекта в свойство виджета
-            
-            # Создаем layout для карточки
-            card_layout = QVBoxLayout(card)
-            card_layout.setSpacing(10)
-            
-            # Верхняя часть с названием и статусом
-            top_layout = QHBoxLayout()
-            name_label = QLabel(property.name)
-            name_label.setStyleSheet("font-size: 16px; font-weight: bold;")
-            top_layout.addWidget(name_label)
-            
-            status_label = QLabel(property.status.value)
-            status_label.setStyleSheet(f"""
-                color: {'#4caf50' if property.status == PropertyStatus.AVAILABLE else '#f44336'};
-                font-weight: bold;
-            """)
-            top_layout.addWidget(status_label)
-            card_layout.addLayout(top_layout)
-            
-            # Информация об объекте
-            info_layout = QVBoxLayout() # Оставляем общий вертикальный layout для информации
-            info_layout.setSpacing(5) # Уменьшаем отступ между элементами информации
-            
-            # Горизонтальный layout для адреса, площади и этажа
-            details_layout = QHBoxLayout()
-            details_layout.setSpacing(10)
-            
-            address_label = QLabel(f"Адрес: {property.address}")
-            area_label = QLabel(f"Площадь: {property.area} м²")
-            floor_label = QLabel(f"Этаж: {property.floor}")
-            
-            details_layout.addWidget(address_label)
-            details_layout.addWidget(area_label)
-            details_layout.addWidget(floor_label)
-            details_layout.addStretch() # Добавляем растягивающийся элемент
-            
-            info_layout.addLayout(details_layout)
+        # Один запрос без загрузки ORM-объектов; фотографии догружаются для видимых карточек
+        self.cards.load(PROPERTIES.conditions(self.list_filter, search_available(self.session.get_bind())))
+        self.prefetch_card_photos()
 
-            if property.description:
-                description_label = QLabel(f"Описание: {property.description}")
-                description_label.setWordWrap(True) # Включаем перенос слов
-                info_layout.addWidget(description_label)
-            
-            card_layout.addLayout(info_layout)
-            
-            # Фотографии
-            photos_layout = QHBoxLayout()
-            photos_layout.setSpacing(10)  # Увеличиваем отступ между фотографиями
-            
-            # Получаем фотографии объекта
-            photos = self.session.query(PropertyPhoto).filter(
-                PropertyPhoto.property_id == property.id
-            ).all()
-            
-            for photo in photos:
-                photo_label = QLabel()
-                pixmap = QPixmap(photo.file_path)
-                photo_label.setPixmap(pixmap.scaled(200, 200, Qt.AspectRatioMode.KeepAspectRatio))  # Увеличиваем размер
-                photo_label.setCursor(Qt.CursorShape.PointingHandCursor)  # Меняем курсор при наведении
-                photo_label.setStyleSheet("""
-                    QLabel {
-                        border: 1px solid #3d3d3d;
-                        border-radius: 5px;
-                        padding: 5px;
-                    }
-                    QLabel:hover {
-                        border: 1px solid #0d47a1;
-                    }
-                """)
-                
-                # Добавляем обработчик клика для открытия фото во весь экран
-                photo_label.mousePressEvent = lambda event, path=photo.file_path: self.show_full_photo(property.id, path)
-                photos_layout.addWidget(photo_label)
-            
-            if photos_layout.count() > 0:
-                card_layout.addLayout(photos_layout)
-            
-            # Кнопки управления (теперь на карточке)
-            buttons_layout = QHBoxLayout()
-
-            edit_btn = QPushButton("Редактировать")
-            edit_btn.clicked.connect(lambda checked, p=property: self.edit_property(p))
-            buttons_layout.addWidget(edit_btn)
-
-            delete_btn = QPushButton("Удалить")
-            delete_btn.clicked.connect(lambda checked, p=property: self.delete_property(p))
-            buttons_layout.addWidget(delete_btn)
-
-            card_layout.addLayout(buttons_layout)
-            
-            # Добавляем карточку в вертикальный layout
-            self.properties_layout.addWidget(card)
-        
-        # Добавляем растягивающийся элемент вниз
-        self.properties_layout.addStretch()
-
-    def select_property_card(self, card, property=None):
-        # Снимаем выделение со всех карточек
-        for widget in self.properties_container.findChildren(QFrame):
-            widget.setProperty("selected", False)
-            widget.setStyleSheet(widget.styleSheet()) # Обновляем стиль, чтобы снять выделение
-        
-        # Выделяем выбранную карточку
-        card.setProperty("selected", True)
-        card.setStyleSheet(card.styleSheet()) # Обновляем стиль, чтобы применить выделение
-        self.selected_card = card  # Сохраняем выбранную карточку
-        self.selected_property = property # Сохраняем выбранный объект
+    def selected_property_id(self):
+        card = self.cards.card(self.cards_view.currentIndex().row())
+        return card.id if card else None
 
+    @track_action("add_property")
     def add_property(self):
         dialog = PropertyDialog(self)
         if dialog.exec():
             # Создаем новый объект
             property_data = dialog.get_property_data()
-            property = Property(**property_data)
-            self.session.add(property)
-            self.session.commit()
-
-            # Перемещаем временные фотографии в постоянную папку
-            if dialog.temp_photos:
-                photos_dir = f"photos/property_{property.id}"
-                os.makedirs(photos_dir, exist_ok=True)
-                
+            with unit_of_work(self.session) as session:
+                property = Property(**property_data)
+                session.add(property)
+                session.flush()
+
+                # Добавленные фотографии уже в хранилище: остается создать записи
                 for temp_photo in dialog.temp_photos:
-                    new_file_name = f"{photos_dir}/{os.path.basename(temp_photo)}"
-                    shutil.move(temp_photo, new_file_name)
-                    
-                    # Добавляем запись в базу
-                    photo = PropertyPhoto(
+                    session.add(PropertyPhoto(
                         property_id=property.id,
-                        file_path=new_file_name,
+                        file_path=temp_photo,
                         description="",
                         is_main=0
-                    )
-                    self.session.add(photo)
-                
-                self.session.commit()
+                    ))
 
             self.load_properties()
 
-    def edit_property(self, property):
-        # Редактируем выбранный объект
+    @track_action("edit_property")
+    def edit_property(self, property_id):
+        # Диалог показывает актуальную копию объекта и сам сохраняет изменения (PropertyDialog.accept)
+        with read_session(self.session) as session:
+            property = session.get(Property, property_id)
         if property:
-            # Получаем актуальный объект из базы перед редактированием
-            property_to_edit = self.session.query(Property).get(property.id)
-            dialog = PropertyDialog(self, property_to_edit)
+            dialog = PropertyDialog(self, property)
             if dialog.exec():
-                property_data = dialog.get_property_data()
-                for key, value in property_data.items():
-                    setattr(property_to_edit, key, value)
-                self.session.commit()
                 self.load_properties() # Обновляем список после сохранения
 
-    def delete_property(self, property):
+    @track_action("delete_property")
+    def delete_property(self, property_id):
         # Удаляем выбранный объект
+        with read_session(self.session) as session:
+            property = session.get(Property, property_id)
         if property:
             # Проверяем, можно ли удалить имущество
             if property.status.value == PropertyStatus.RENTED.value:
@@ -1326,26 +1045,31 @@ class PropertyWidget(QWidget):
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
             if reply == QMessageBox.StandardButton.Yes:
-                self.session.delete(property)
-                self.session.commit()
+                with unit_of_work(self.session) as session:
+                    property = session.get(Property, property_id)
+                    if property:
+                        paths = remove_property_photos(session, property.id)
+                        session.delete(property)
+                        session.flush()
+                        # Только файлы этого объекта: остальные файлы без ссылок убирает сборка мусора
+                        purge_unreferenced(session, paths)
                 self.load_properties() # Обновляем список после удаления
-                self.selected_card = None # Сбрасываем выбранную карточку
-                self.selected_property = None # Сбрасываем выбранный объект
 
-    def show_photos(self, property_id):
-        # Находим объект по ID, так как show_photos вызывается напрямую из карточки
-        property = self.session.query(Property).get(property_id)
-        if property:
-            dialog = PhotoDialog(property.id, self.session)
-            if dialog.exec():
-                self.load_properties()  # Перезагружаем список после изменений
+    @track_action("photo_duplicates")
+    def show_duplicates(self):
+        dialog = DuplicatesDialog(self.session, self)
+        dialog.load()
+        dialog.exec()
+        if dialog.merged:
+            self.load_properties()
 
     def show_full_photo(self, property_id, clicked_photo_path):
         """Открывает фотографию во весь экран для данного имущества с возможностью листания"""
         # Получаем все фотографии для данного имущества из базы
-        photos = self.session.query(PropertyPhoto).filter(
-            PropertyPhoto.property_id == property_id
-        ).all()
+        with read_connection(self.session) as conn:
+            photos = conn.execute(select(PropertyPhoto.file_path).where(
+                PropertyPhoto.property_id == property_id
+            )).all()
         
         all_photo_paths = [p.file_path for p in photos if os.path.exists(p.file_path)]
         
@@ -1,9 +1,14 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
                             QTableWidget, QTableWidgetItem, QMessageBox, QDialog,
-                            QFormLayout, QLineEdit, QTextEdit, QComboBox, QDateEdit, QGroupBox, QScrollArea)
+                            QFormLayout, QLineEdit, QTextEdit, QComboBox, QDateEdit, QGroupBox, QScrollArea,
+                            QCheckBox)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QColor
-from core.database import Contract, Property, Payment
+from core.database import Contract, Property, Payment, PaymentStatus
+from core.instrumentation import track_action
+from core.aging import get_aging, BUCKETS, LEVELS
+from core.archive import history, is_attached
+from core.session_manager import read_session, read_connection
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
@@ -11,6 +16,12 @@ import pandas as pd
 import os
 
 class ReportsWidget(QWidget):
+    AGING_REPORTS = {
+        "Задолженность по арендаторам": 'tenant',
+        "Задолженность по объектам": 'property',
+        "Задолженность по договорам": 'contract',
+    }
+
     def __init__(self, session: Session):
         super().__init__()
         self.session = session
@@ -100,6 +111,9 @@ class ReportsWidget(QWidget):
         self.report_type.addItems([
             "Арендные платежи по объектам",
             "Просроченные платежи",
+            "Задолженность по арендаторам",
+            "Задолженность по объектам",
+            "Задолженность по договорам",
             "Загруженность помещений",
             "Финансовый отчет"
         ])
@@ -119,6 +133,12 @@ class ReportsWidget(QWidget):
         controls.addWidget(QLabel("По:"))
         controls.addWidget(self.end_date)
 
+        # Платежи и договоры прошлых лет хранятся в архиве и по умолчанию в отчеты не входят
+        self.include_archive = QCheckBox("С архивом")
+        self.include_archive.setToolTip("Учитывать оплаченные платежи и завершенные договоры из архива")
+        self.include_archive.toggled.connect(self.update_report)
+        controls.addWidget(self.include_archive)
+
         # Кнопка экспорта
         export_btn = QPushButton("Экспорт в Excel")
         export_btn.setMinimumHeight(35)
@@ -160,30 +180,45 @@ class ReportsWidget(QWidget):
         # Инициализация первого отчета
         self.update_report()
 
+    @track_action("update_report")
     def update_report(self):
         report_type = self.report_type.currentText()
         start_date = self.start_date.date().toPyDate()
         end_date = self.end_date.date().toPyDate()
+        # Архив мог появиться после открытия экрана
+        self.include_archive.setVisible(is_attached(self.session.get_bind()))
 
         if report_type == "Арендные платежи по объектам":
             self.show_rental_payments_report(start_date, end_date)
         elif report_type == "Просроченные платежи":
             self.show_overdue_payments_report()
+        elif report_type in self.AGING_REPORTS:
+            # Задолженность считается на дату окончания периода
+            self.show_aging_report(self.AGING_REPORTS[report_type], end_date)
         elif report_type == "Загруженность помещений":
             self.show_occupancy_report()
         elif report_type == "Финансовый отчет":
             self.show_financial_report(start_date, end_date)
 
+    def history(self, model):
+        """Таблица модели, с архивом, если он включен в отчет"""
+        if self.include_archive.isChecked():
+            return history(self.session.get_bind(), model)
+        return model.__table__
+
     def show_rental_payments_report(self, start_date, end_date):
-        payments = self.session.query(
-            Property.name.label('property_name'),
-            func.sum(Payment.amount).label('total_amount')
-        ).select_from(Property)
-        payments = payments.join(Contract, Contract.property_id == Property.id)
-        payments = payments.join(Payment, Payment.contract_id == Contract.id)
-        payments = payments.filter(
-            Payment.payment_date.between(start_date, end_date)
-        ).group_by(Property.name).all()
+        contracts = self.history(Contract)
+        payment_rows = self.history(Payment)
+        with read_session(self.session) as session:
+            payments = session.query(
+                Property.name.label('property_name'),
+                func.sum(payment_rows.c.amount).label('total_amount')
+            ).select_from(Property)
+            payments = payments.join(contracts, contracts.c.property_id == Property.id)
+            payments = payments.join(payment_rows, payment_rows.c.contract_id == contracts.c.id)
+            payments = payments.filter(
+                payment_rows.c.payment_date.between(start_date, end_date)
+            ).group_by(Property.name).all()
 
         self.table.setColumnCount(2)
         self.table.setHorizontalHeaderLabels(["Объект", "Сумма платежей"])
@@ -196,9 +231,10 @@ class ReportsWidget(QWidget):
         self.table.resizeColumnsToContents()
 
     def show_overdue_payments_report(self):
-        overdue_payments = self.session.query(Payment).filter(
-            Payment.status == 'overdue'
-        ).all()
+        with read_session(self.session) as session:
+            overdue_payments = session.query(Payment).filter(
+                Payment.status == PaymentStatus.OVERDUE
+            ).all()
 
         self.table.setColumnCount(4)
         self.table.setHorizontalHeaderLabels([
@@ -208,15 +244,48 @@ class ReportsWidget(QWidget):
 
         for row, payment in enumerate(overdue_payments):
             days_overdue = (datetime.now().date() - payment.due_date).days
-            self.table.setItem(row, 0, QTableWidgetItem(f"Договор №{payment.contract.id}"))
+            self.table.setItem(row, 0, QTableWidgetItem(f"Договор №{payment.contract_id}"))
             self.table.setItem(row, 1, QTableWidgetItem(f"{payment.amount:.2f} ₽"))
             self.table.setItem(row, 2, QTableWidgetItem(payment.due_date.strftime("%d.%m.%Y")))
             self.table.setItem(row, 3, QTableWidgetItem(str(days_overdue)))
 
         self.table.resizeColumnsToContents()
 
+    def show_aging_report(self, level, as_of):
+        with read_connection(self.session) as conn:
+            report = get_aging(conn, as_of)
+        rows = report.rollup(level)
+
+        self.table.setColumnCount(len(BUCKETS) + 2)
+        self.table.setHorizontalHeaderLabels(
+            [LEVELS[level]] + [f"{label} дн." for _, _, label in BUCKETS] + ["Итого"]
+        )
+        self.table.setRowCount(len(rows) + 1)
+
+        for row, aging_row in enumerate(rows):
+            self.table.setItem(row, 0, QTableWidgetItem(aging_row.name))
+            for col, amount in enumerate(aging_row.buckets, start=1):
+                self.table.setItem(row, col, QTableWidgetItem(f"{amount:.2f} ₽"))
+            self.table.setItem(row, len(BUCKETS) + 1, QTableWidgetItem(f"{aging_row.total:.2f} ₽"))
+
+        # Итоговая строка по всему портфелю
+        totals = report.totals()
+        self.table.setItem(len(rows), 0, QTableWidgetItem("Итого"))
+        for col, amount in enumerate(totals, start=1):
+            self.table.setItem(len(rows), col, QTableWidgetItem(f"{amount:.2f} ₽"))
+        self.table.setItem(len(rows), len(BUCKETS) + 1, QTableWidgetItem(f"{totals.sum():.2f} ₽"))
+
+        self.table.resizeColumnsToContents()
+
     def show_occupancy_report(self):
-        properties = self.session.query(Property).all()
+        # Арендованная площадь считается в базе одним запросом по всем объектам
+        with read_session(self.session) as session:
+            rented = session.query(
+                Contract.property_id, func.sum(Contract.area).label('rented_area')
+            ).group_by(Contract.property_id).subquery()
+            properties = session.query(
+                Property, func.coalesce(rented.c.rented_area, 0)
+            ).outerjoin(rented, rented.c.property_id == Property.id).all()
         
         self.table.setColumnCount(4)
         self.table.setHorizontalHeaderLabels([
@@ -224,8 +293,7 @@ class ReportsWidget(QWidget):
         ])
         self.table.setRowCount(len(properties))
 
-        for row, property in enumerate(properties):
-            rented_area = sum(contract.area for contract in property.contracts)
+        for row, (property, rented_area) in enumerate(properties):
             occupancy = (rented_area / property.area * 100) if property.area > 0 else 0
             
             self.table.setItem(row, 0, QTableWidgetItem(property.name))
@@ -236,12 +304,14 @@ class ReportsWidget(QWidget):
         self.table.resizeColumnsToContents()
 
     def show_financial_report(self, start_date, end_date):
-        payments = self.session.query(
-            func.strftime('%Y-%m', Payment.payment_date).label('month'),
-            func.sum(Payment.amount).label('total_amount')
-        ).filter(
-            Payment.payment_date.between(start_date, end_date)
-        ).group_by('month').all()
+        payment_rows = self.history(Payment)
+        with read_session(self.session) as session:
+            payments = session.query(
+                func.strftime('%Y-%m', payment_rows.c.payment_date).label('month'),
+                func.sum(payment_rows.c.amount).label('total_amount')
+            ).filter(
+                payment_rows.c.payment_date.between(start_date, end_date)
+            ).group_by('month').all()
 
         self.table.setColumnCount(2)
         self.table.setHorizontalHeaderLabels(["Месяц", "Сумма платежей"])
@@ -0,0 +1,113 @@
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from sqlalchemy.orm import Session
+from core.search import search
+from core.session_manager import read_connection
+from core.instrumentation import track_action
+
+# Пауза после ввода перед запросом, чтобы не искать на каждую букву
+SEARCH_DELAY_MS = 150
+MAX_RESULTS = 30
+
+
+class GlobalSearchBar(QWidget):
+    """Строка поиска по всей базе с выпадающим списком результатов"""
+
+    result_activated = pyqtSignal(str, int)  # тип записи, id
+
+    def __init__(self, session: Session):
+        super().__init__()
+        self.session = session
+        self.init_ui()
+
+    def init_ui(self):
+        self.setStyleSheet("""
+            QLineEdit {
+                background-color: #3d3d3d;
+                color: #ffffff;
+                border: 1px solid #555555;
+                border-radius: 4px;
+                padding: 8px;
+            }
+            QListWidget {
+                background-color: #2b2b2b;
+                color: #ffffff;
+                border: 1px solid #3d3d3d;
+                border-radius: 4px;
+            }
+            QListWidget::item {
+                padding: 6px;
+            }
+            QListWidget::item:selected {
+                background-color: #0d47a1;
+            }
+        """)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск: арендатор, ИНН, адрес, номер договора, документ")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.schedule_search)
+        self.search_edit.returnPressed.connect(self.activate_first)
+        layout.addWidget(self.search_edit)
+
+        self.results = QListWidget()
+        self.results.setMaximumHeight(300)
+        self.results.itemActivated.connect(self.activate_item)
+        self.results.itemClicked.connect(self.activate_item)
+        self.results.hide()
+        layout.addWidget(self.results)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+
+    def schedule_search(self):
+        self.search_timer.start()
+
+    @track_action("global_search")
+    def run_search(self):
+        query = self.search_edit.text().strip()
+        hits = []
+        if query:
+            with read_connection(self.session) as conn:
+                hits = search(conn, query, MAX_RESULTS)
+        self.results.clear()
+        for hit in hits:
+            item = QListWidgetItem(f"{hit.label}: {hit.title}\n{hit.snippet}")
+            item.setData(Qt.ItemDataRole.UserRole, (hit.kind, hit.ref_id))
+            self.results.addItem(item)
+        if query and not hits:
+            item = QListWidgetItem("Ничего не найдено")
+            item.setFlags(Qt.ItemFlag.NoItemFlags)
+            self.results.addItem(item)
+        self.results.setVisible(bool(query))
+
+    def activate_first(self):
+        # Enter до окончания паузы ищет сразу
+        if self.search_timer.isActive():
+            self.search_timer.stop()
+            self.run_search()
+        if self.results.count():
+            self.activate_item(self.results.item(0))
+
+    def activate_item(self, item):
+        data = item.data(Qt.ItemDataRole.UserRole)
+        if not data:
+            return
+        self.results.hide()
+        kind, ref_id = data
+        self.result_activated.emit(kind, ref_id)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Escape:
+            self.search_edit.clear()
+            self.results.hide()
+        elif event.key() == Qt.Key.Key_Down and self.results.isVisible():
+            self.results.setFocus()
+            self.results.setCurrentRow(0)
+        else:
+            super().keyPressEvent(event)
@@ -1,9 +1,27 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QComboBox, QMessageBox
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QMessageBox,
+                             QProgressDialog, QApplication)
+from PyQt6.QtCore import Qt
+from sqlalchemy.exc import OperationalError
+from core.backup import (create_backup, apply_retention, verify_backup, list_backups, database_path,
+                         BackupError)
+from core.archive import archive_old_records, archive_counts, default_cutoff
+from core.maintenance import (database_stats, optimize, incremental_vacuum, full_vacuum, check_integrity, last_run,
+                              FREELIST_WARNING)
+
+STAGES = {
+    'database': "Копирование базы данных",
+    'files': "Копирование фотографий и документов",
+}
+
 
 class SettingsWidget(QWidget):
-    def __init__(self):
+    def __init__(self, session):
         super().__init__()
+        self.session = session
         self.init_ui()
+        self.update_backup_info()
+        self.update_archive_info()
+        self.update_database_info()
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -16,9 +34,51 @@ class SettingsWidget(QWidget):
         layout.addWidget(self.lang_combo)
 
         # Резервное копирование
-        backup_btn = QPushButton("Сделать резервную копию базы данных")
+        layout.addWidget(QLabel("Резервное копирование:"))
+        self.backup_info = QLabel()
+        layout.addWidget(self.backup_info)
+        backup_buttons = QHBoxLayout()
+        backup_btn = QPushButton("Сделать резервную копию")
+        backup_btn.setToolTip("База данных, фотографии и документы; работать во время копирования можно")
         backup_btn.clicked.connect(self.backup_db)
-        layout.addWidget(backup_btn)
+        backup_buttons.addWidget(backup_btn)
+        self.verify_btn = QPushButton("Проверить последнюю копию")
+        self.verify_btn.clicked.connect(self.verify_last_backup)
+        backup_buttons.addWidget(self.verify_btn)
+        backup_buttons.addStretch()
+        layout.addLayout(backup_buttons)
+
+        # Архив
+        layout.addWidget(QLabel("Архив:"))
+        self.archive_info = QLabel()
+        layout.addWidget(self.archive_info)
+        archive_buttons = QHBoxLayout()
+        archive_btn = QPushButton("Перенести старые данные в архив")
+        archive_btn.setToolTip("Оплаченные платежи и завершенные договоры, закончившиеся до "
+                               f"{default_cutoff().strftime('%d.%m.%Y')}")
+        archive_btn.clicked.connect(self.archive_old_data)
+        archive_buttons.addWidget(archive_btn)
+        archive_buttons.addStretch()
+        layout.addLayout(archive_buttons)
+
+        # Обслуживание базы данных
+        layout.addWidget(QLabel("Обслуживание базы данных:"))
+        self.database_info = QLabel()
+        layout.addWidget(self.database_info)
+        database_buttons = QHBoxLayout()
+        optimize_btn = QPushButton("Оптимизировать")
+        optimize_btn.setToolTip("Обновить статистику запросов и вернуть свободное место")
+        optimize_btn.clicked.connect(self.optimize_database)
+        database_buttons.addWidget(optimize_btn)
+        check_btn = QPushButton("Проверить целостность")
+        check_btn.clicked.connect(self.check_database)
+        database_buttons.addWidget(check_btn)
+        self.vacuum_btn = QPushButton("Сжать базу")
+        self.vacuum_btn.setToolTip("Полная перепаковка файла; на это время работа с базой блокируется")
+        self.vacuum_btn.clicked.connect(self.vacuum_database)
+        database_buttons.addWidget(self.vacuum_btn)
+        database_buttons.addStretch()
+        layout.addLayout(database_buttons)
 
         # Управление пользователями (заглушка)
         users_btn = QPushButton("Управление пользователями (роль/доступ)")
@@ -27,8 +87,163 @@ class SettingsWidget(QWidget):
 
         layout.addStretch()
 
+    def update_backup_info(self):
+        backups = list_backups()
+        if backups:
+            created, _ = backups[-1]
+            self.backup_info.setText(
+                f"Последняя копия: {created.strftime('%d.%m.%Y %H:%M')}, всего копий: {len(backups)}")
+        else:
+            self.backup_info.setText("Резервных копий еще нет")
+        self.verify_btn.setEnabled(bool(backups))
+
     def backup_db(self):
-        QMessageBox.information(self, "Резервное копирование", "Функция резервного копирования будет реализована позже.")
+        try:
+            db_path = database_path(self.session.get_bind())
+        except BackupError as e:
+            QMessageBox.warning(self, "Резервное копирование", str(e))
+            return
+        # Незафиксированные изменения в копию не попадут
+        self.session.commit()
+
+        progress = QProgressDialog("Подготовка...", None, 0, 0, self)
+        progress.setWindowTitle("Резервное копирование")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def report(stage, done, total):
+            progress.setLabelText(STAGES[stage])
+            progress.setMaximum(total)
+            progress.setValue(done)
+            QApplication.processEvents()
+
+        try:
+            result = create_backup(db_path, progress=report)
+            removed = apply_retention()
+        except (OSError, BackupError, ValueError) as e:
+            progress.close()
+            QMessageBox.critical(self, "Резервное копирование", f"Не удалось создать копию: {e}")
+            return
+        progress.close()
+        self.update_backup_info()
+        QMessageBox.information(
+            self, "Резервное копирование",
+            f"Копия создана: {result.path}\n"
+            f"База: {result.archive_size / 1024 / 1024:.1f} МБ в сжатом виде\n"
+            f"Файлов: {result.files}, из них без изменений: {result.linked}\n"
+            f"Удалено старых копий: {len(removed)}")
+
+    def verify_last_backup(self):
+        backups = list_backups()
+        if not backups:
+            return
+        _, path = backups[-1]
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            problems = verify_backup(path)
+        finally:
+            QApplication.restoreOverrideCursor()
+        if problems:
+            QMessageBox.warning(self, "Проверка копии",
+                                f"Копия {path} повреждена:\n\n" + "\n".join(problems[:10]))
+        else:
+            QMessageBox.information(self, "Проверка копии", f"Копия {path} восстанавливается без ошибок")
+
+    def update_archive_info(self):
+        counts = archive_counts(self.session.get_bind())
+        payments, archived_payments = counts['payments']
+        contracts, archived_contracts = counts['contracts']
+        self.archive_info.setText(f"Платежей: {payments}, в архиве {archived_payments}; "
+                                  f"договоров: {contracts}, в архиве {archived_contracts}")
+
+    def archive_old_data(self):
+        cutoff = default_cutoff()
+        reply = QMessageBox.question(
+            self, "Архив",
+            f"Перенести в архив оплаченные платежи и завершенные договоры до {cutoff.strftime('%d.%m.%Y')}?\n"
+            "В отчетах они будут доступны с отметкой «С архивом».",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        self.session.commit()
+
+        progress = QProgressDialog("Перенос в архив...", "Остановить", 0, 0, self)
+        progress.setWindowTitle("Архив")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def report(payments, contracts):
+            progress.setLabelText(f"Перенесено платежей: {payments}, договоров: {contracts}")
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+
+        try:
+            result = archive_old_records(self.session.get_bind(), cutoff, progress=report)
+        except ValueError as e:
+            progress.close()
+            QMessageBox.warning(self, "Архив", str(e))
+            return
+        progress.close()
+        # Перенесенные строки не должны остаться в сессии
+        self.session.expire_all()
+        self.update_archive_info()
+        QMessageBox.information(self, "Архив", f"Перенесено платежей: {result.payments}, "
+                                               f"договоров: {result.contracts}")
+
+    def update_database_info(self):
+        engine = self.session.get_bind()
+        with engine.connect() as conn:
+            stats = database_stats(conn, top=0)
+            checked = last_run(conn, 'quick_check') or last_run(conn, 'integrity_check')
+        lines = stats.lines()
+        lines.append("последняя проверка: " + (checked.strftime('%d.%m.%Y %H:%M') if checked else "не выполнялась"))
+        self.database_info.setText("\n".join(lines))
+        # Полная перепаковка нужна, только если очистка по частям невозможна или место сильно фрагментировано
+        self.vacuum_btn.setVisible(not stats.incremental or stats.freelist_ratio >= FREELIST_WARNING)
+
+    def optimize_database(self):
+        self.session.commit()
+        engine = self.session.get_bind()
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            optimize(engine)
+            freed = incremental_vacuum(engine)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.update_database_info()
+        QMessageBox.information(self, "Обслуживание базы", f"Статистика обновлена, освобождено страниц: {freed}")
+
+    def check_database(self):
+        self.session.commit()
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            problems = check_integrity(self.session.get_bind(), quick=False)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.update_database_info()
+        if problems:
+            QMessageBox.critical(self, "Проверка базы", "Найдены повреждения:\n\n" + "\n".join(problems[:10]))
+        else:
+            QMessageBox.information(self, "Проверка базы", "Ошибок не найдено")
+
+    def vacuum_database(self):
+        reply = QMessageBox.question(
+            self, "Сжать базу",
+            "Файл базы будет полностью перепакован, это может занять несколько минут. Продолжить?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        self.session.commit()
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            full_vacuum(self.session.get_bind())
+        except OperationalError as e:
+            QMessageBox.warning(self, "Сжать базу", f"База занята, повторите позже: {e}")
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.update_database_info()
 
     def manage_users(self):
-        QMessageBox.information(self, "Пользователи", "Система ролей и управления пользователями будет реализована позже.") 
\ No newline at end of file
+        QMessageBox.information(self, "Пользователи", "Система ролей и управления пользователями будет реализована позже.")
@@ -0,0 +1,196 @@
+from PyQt6.QtCore import (Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool,
+                          QCoreApplication, pyqtSignal)
+from sqlalchemy.exc import OperationalError
+from core.list_queries import ListFilter, PAGE_SIZE
+from core.session_manager import read_connection
+
+
+class _JobSignals(QObject):
+    finished = pyqtSignal(int, bool, object, bool)  # поколение, дозагрузка, строки, есть ли еще
+    failed = pyqtSignal(int, str)
+
+
+class _PageJob(QRunnable):
+    """Загрузка страницы в пуле потоков на отдельном соединении"""
+
+    def __init__(self, engine, list_query, list_filter, after, generation, append):
+        super().__init__()
+        self.engine = engine
+        self.list_query = list_query
+        self.list_filter = list_filter
+        self.after = after
+        self.generation = generation
+        self.append = append
+        self.signals = _JobSignals()
+        self.cancelled = False
+        self._dbapi_connection = None
+
+    def cancel(self):
+        self.cancelled = True
+        # sqlite3.Connection.interrupt() можно вызывать из другого потока: запрос прерывается сразу
+        connection = self._dbapi_connection
+        if connection is not None and hasattr(connection, 'interrupt'):
+            connection.interrupt()
+
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            with self.engine.connect() as conn:
+                self._dbapi_connection = conn.connection.dbapi_connection
+                try:
+                    rows, has_more = self.list_query.fetch_page(conn, self.list_filter, self.after)
+                finally:
+                    self._dbapi_connection = None
+        except OperationalError as e:
+            if not self.cancelled:
+                self.signals.failed.emit(self.generation, str(e.orig))
+            return
+        if not self.cancelled:
+            self.signals.finished.emit(self.generation, self.append, rows, has_more)
+
+
+class QueryTableModel(QAbstractTableModel):
+    """Модель списка, загружаемая страницами по мере прокрутки.
+
+    columns - список (заголовок, функция форматирования значения). Первая колонка
+    строки запроса - id записи, она же ключ страниц. Смена фильтра загружает
+    первую страницу в фоне; ответы устаревших запросов отбрасываются по номеру
+    поколения, а выполняющийся устаревший запрос прерывается. session - источник
+    движка: синхронные загрузки идут через короткие соединения read_connection().
+    """
+
+    loading_changed = pyqtSignal(bool)
+    load_failed = pyqtSignal(str)
+
+    def __init__(self, session, list_query, columns, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.list_query = list_query
+        self.columns = columns
+        self.list_filter = ListFilter()
+        self._rows = []
+        self._has_more = False
+        self._generation = 0
+        self._job = None
+        self._pool = QThreadPool.globalInstance()
+
+    # --- QAbstractTableModel ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        _, formatter = self.columns[index.column()]
+        return formatter(self._rows[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.columns[section][0]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and self._job is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._start_job(after=self._rows[-1][0], append=True)
+
+    # --- загрузка ---
+
+    def row_id(self, row):
+        return self._rows[row][0] if 0 <= row < len(self._rows) else None
+
+    def row_of(self, record_id):
+        for row, values in enumerate(self._rows):
+            if values[0] == record_id:
+                return row
+        return -1
+
+    def reload(self):
+        """Синхронно загружает первую страницу с текущим фильтром (после изменений данных)"""
+        self._cancel_job()
+        self._generation += 1
+        with read_connection(self.session) as conn:
+            rows, has_more = self.list_query.fetch_page(conn, self.list_filter)
+        self._replace(rows, has_more)
+
+    def locate(self, record_id):
+        """Догружает страницы, пока запись не окажется в модели; возвращает номер строки или -1"""
+        self._cancel_job()
+        with read_connection(self.session) as connection:
+            while self.row_of(record_id) < 0 and self._has_more and self._rows[-1][0] < record_id:
+                rows, has_more = self.list_query.fetch_page(
+                    connection, self.list_filter, self._rows[-1][0], max(PAGE_SIZE, len(self._rows))
+                )
+                self._append(rows, has_more)
+        return self.row_of(record_id)
+
+    def clear_filter(self):
+        self.list_filter = ListFilter()
+        self.reload()
+
+    def set_filter(self, list_filter):
+        """Применяет фильтр: первая страница загружается в фоне"""
+        if list_filter == self.list_filter:
+            return
+        self.list_filter = list_filter
+        self._start_job(after=None, append=False)
+
+    def _start_job(self, after, append):
+        self._cancel_job()
+        self._generation += 1
+        job = _PageJob(self.session.get_bind(), self.list_query, self.list_filter,
+                       after, self._generation, append)
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        self._job = job
+        self.loading_changed.emit(True)
+        self._pool.start(job)
+
+    def _cancel_job(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+            self.loading_changed.emit(False)
+
+    def _on_finished(self, generation, append, rows, has_more):
+        if generation != self._generation:
+            return  # ответ на устаревший фильтр
+        self._job = None
+        self.loading_changed.emit(False)
+        if append:
+            self._append(rows, has_more)
+        else:
+            self._replace(rows, has_more)
+
+    def _on_failed(self, generation, message):
+        if generation != self._generation:
+            return
+        self._job = None
+        self.loading_changed.emit(False)
+        self.load_failed.emit(message)
+
+    def _replace(self, rows, has_more):
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._has_more = has_more
+        self.endResetModel()
+
+    def _append(self, rows, has_more):
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self._has_more = has_more
+
+    def wait(self):
+        """Дожидается фоновой загрузки (для скриптов и замеров)"""
+        self._pool.waitForDone()
+        # Результат приходит сигналом в поток интерфейса
+        QCoreApplication.processEvents()
@@ -1,8 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
-                            QTableWidget, QTableWidgetItem, QMessageBox, QDialog,
+                            QTableView, QAbstractItemView, QMessageBox, QDialog,
                             QFormLayout, QLineEdit, QTextEdit, QComboBox)
 from PyQt6.QtCore import Qt
 from core.database import Tenant, Contract, ContractStatus
+from core.instrumentation import track_action
+from core.list_queries import TENANTS
+from core.session_manager import read_session, unit_of_work
+from ui.table_model import QueryTableModel
+from ui.filter_bar import FilterBar
 from sqlalchemy.orm import Session
 
 class TenantsWidget(QWidget):
@@ -72,19 +77,19 @@ class TenantsWidget(QWidget):
                 border: none;
                 background-color: transparent; /* Это важно для согласованного фона скролл-областей */
             }
-            QTableWidget {
+            QTableView {
                 background-color: #2b2b2b;
                 color: #ffffff;
                 gridline-color: #3d3d3d;
                 border: none;
                 border-radius: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 background-color: #2b2b2b; /* Фон обычной строки */
                 color: #ffffff;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3d3d3d; /* Фон выбранной строки */
             }
             QHeaderView::section {
@@ -122,17 +127,17 @@ class TenantsWidget(QWidget):
             QLabel {
                 color: #ffffff;
             }
-            QTableWidget {
+            QTableView {
                 background-color: #2b2b2b;
                 color: #ffffff;
                 gridline-color: #3d3d3d;
                 border: none;
                 border-radius: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #0d47a1; /* Убираем синюю полоску выбора */
             }
             QHeaderView::section {
@@ -174,20 +179,33 @@ class TenantsWidget(QWidget):
         controls.addStretch()
         layout.addLayout(controls)
 
-        # Таблица арендаторов
-        self.table = QTableWidget()
+        # Поиск по названию, ИНН и контактам через индекс полнотекстового поиска
+        self.filter_bar = FilterBar("Поиск: название, ИНН, контакты")
+        layout.addWidget(self.filter_bar)
+
+        # Таблица арендаторов загружается страницами при прокрутке
+        self.model = QueryTableModel(self.session, TENANTS, [
+            ("ID", str),
+            ("Название", lambda name: name or ""),
+            ("Контактная информация", lambda contact_info: contact_info or ""),
+        ], self)
+        self.filter_bar.filter_changed.connect(self.model.set_filter)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #2b2b2b;
                 color: #ffffff;
                 gridline-color: #3d3d3d;
                 border: none;
                 border-radius: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 #background-color: #0d47a1; /* Убираем синюю полоску выбора */
             }
             QHeaderView::section {
@@ -205,58 +223,65 @@ class TenantsWidget(QWidget):
         # Загружаем данные
         self.load_tenants()
 
+    @track_action("load_tenants")
     def load_tenants(self):
-        tenants = self.session.query(Tenant).all()
-        
-        self.table.setColumnCount(3) # ID, Название, Контактная информация
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Название", "Контактная информация"
-        ])
-        self.table.setRowCount(len(tenants))
+        # Первая страница одним запросом, остальные - при прокрутке
+        self.model.reload()
+        self.table.resizeColumnsToContents()
 
-        for row, tenant in enumerate(tenants):
-            self.table.setItem(row, 0, QTableWidgetItem(str(tenant.id)))
-            self.table.setItem(row, 1, QTableWidgetItem(tenant.name))
-            self.table.setItem(row, 2, QTableWidgetItem(tenant.contact_info))
+    def selected_tenant_id(self):
+        return self.model.row_id(self.table.currentIndex().row())
 
-        self.table.resizeColumnsToContents()
+    def select_tenant(self, tenant_id):
+        row = self.model.locate(tenant_id)
+        if row < 0 and self.model.list_filter:
+            # Запись скрыта фильтром: показываем весь список
+            self.filter_bar.clear()
+            self.model.clear_filter()
+            row = self.model.locate(tenant_id)
+        if row >= 0:
+            self.table.selectRow(row)
+            self.table.scrollTo(self.model.index(row, 0))
 
+    @track_action("add_tenant")
     def add_tenant(self):
         dialog = TenantDialog(self)
         if dialog.exec():
-            tenant = Tenant(
-                name=dialog.name_edit.text(),
-                contact_info=dialog.contact_info_edit.toPlainText() # Используем contact_info
-            )
-            self.session.add(tenant)
-            self.session.commit()
+            with unit_of_work(self.session) as session:
+                session.add(Tenant(
+                    name=dialog.name_edit.text(),
+                    contact_info=dialog.contact_info_edit.toPlainText() # Используем contact_info
+                ))
             self.load_tenants()
 
+    @track_action("edit_tenant")
     def edit_tenant(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            tenant_id = int(self.table.item(current_row, 0).text())
-            tenant = self.session.query(Tenant).get(tenant_id)
+        tenant_id = self.selected_tenant_id()
+        if tenant_id is not None:
+            with read_session(self.session) as session:
+                tenant = session.get(Tenant, tenant_id)
             if tenant:
                 dialog = TenantDialog(self, tenant)
                 if dialog.exec():
-                    tenant.name = dialog.name_edit.text()
-                    tenant.contact_info = dialog.contact_info_edit.toPlainText() # Используем contact_info
-                    self.session.commit()
+                    with unit_of_work(self.session) as session:
+                        tenant = session.get(Tenant, tenant_id)
+                        if tenant:
+                            tenant.name = dialog.name_edit.text()
+                            tenant.contact_info = dialog.contact_info_edit.toPlainText() # Используем contact_info
                     self.load_tenants()
 
+    @track_action("delete_tenant")
     def delete_tenant(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            tenant_id = int(self.table.item(current_row, 0).text())
-            tenant = self.session.query(Tenant).get(tenant_id)
-            if tenant:
+        tenant_id = self.selected_tenant_id()
+        if tenant_id is not None:
+            with read_session(self.session) as session:
+                tenant = session.get(Tenant, tenant_id)
                 # Проверяем, есть ли активные договоры
-                active_contracts = self.session.query(Contract).filter(
+                active_contracts = session.query(Contract).filter(
                     Contract.tenant_id == tenant_id,
                     Contract.status == ContractStatus.ACTIVE
                 ).count()
-                
+            if tenant:
                 if active_contracts > 0:
                     QMessageBox.warning(
                         self,
@@ -273,8 +298,10 @@ class TenantsWidget(QWidget):
                 )
                 
                 if reply == QMessageBox.StandardButton.Yes:
-                    self.session.delete(tenant)
-                    self.session.commit()
+                    with unit_of_work(self.session) as session:
+                        tenant = session.get(Tenant, tenant_id)
+                        if tenant:
+                            session.delete(tenant)
                     self.load_tenants()
 
 class TenantDialog(QDialog):
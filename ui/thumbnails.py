@@ -0,0 +1,106 @@
+"""Кэш миниатюр фотографий.
+
+Файлы читаются в пуле потоков через QImageReader сразу в уменьшенном размере
+(полноразмерное изображение в память не попадает), с поворотом по EXIF; если
+импорт уже сохранил миниатюру файла и ее хватает по размеру, читается она.
+Готовые миниатюры хранятся в памяти с вытеснением давно не использованных;
+о загрузке сообщает сигнал ready, по которому представление перерисовывается.
+"""
+import os
+from collections import OrderedDict
+
+from PyQt6.QtCore import QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt6.QtGui import QImageReader, QPixmap
+from core.photo_import import THUMBNAIL_SIDE
+from core.photo_store import thumbnail_path
+
+# Предел памяти под миниатюры
+CACHE_LIMIT_BYTES = 64 * 1024 * 1024
+
+
+class _JobSignals(QObject):
+    loaded = pyqtSignal(object, object)  # ключ, QImage
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, key, path, size):
+        super().__init__()
+        self.key = key
+        self.path = path
+        self.size = size
+        self.signals = _JobSignals()
+
+    def run(self):
+        path = self.path
+        if self.size.width() <= THUMBNAIL_SIDE and self.size.height() <= THUMBNAIL_SIDE:
+            prepared = thumbnail_path(path)
+            if os.path.exists(prepared):
+                path = prepared
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        source_size = reader.size()
+        if source_size.isValid():
+            reader.setScaledSize(source_size.scaled(self.size, Qt.AspectRatioMode.KeepAspectRatio))
+        self.signals.loaded.emit(self.key, reader.read())
+
+
+class ThumbnailCache(QObject):
+    """Миниатюры по пути к файлу и размеру; pixmap() не ждет чтения файла"""
+
+    ready = pyqtSignal(str)  # путь к файлу
+
+    def __init__(self, limit_bytes=CACHE_LIMIT_BYTES, parent=None):
+        super().__init__(parent)
+        self.limit_bytes = limit_bytes
+        self._pixmaps = OrderedDict()
+        self._bytes = 0
+        self._pending = set()
+        self._failed = set()
+        self._pool = QThreadPool.globalInstance()
+
+    def pixmap(self, path, size):
+        """Миниатюра или None, если она еще загружается или файл не читается"""
+        key = (path, size.width(), size.height())
+        cached = self._pixmaps.get(key)
+        if cached is not None:
+            self._pixmaps.move_to_end(key)
+            return cached[0]
+        if key not in self._pending and key not in self._failed:
+            self._pending.add(key)
+            job = _ThumbnailJob(key, path, QSize(size))
+            job.signals.loaded.connect(self._loaded)
+            self._pool.start(job)
+        return None
+
+    def is_broken(self, path, size):
+        return (path, size.width(), size.height()) in self._failed
+
+    def _loaded(self, key, image):
+        self._pending.discard(key)
+        if image.isNull():
+            self._failed.add(key)
+        else:
+            # QPixmap создается только в потоке интерфейса
+            self._pixmaps[key] = (QPixmap.fromImage(image), image.sizeInBytes())
+            self._bytes += image.sizeInBytes()
+            while self._bytes > self.limit_bytes and len(self._pixmaps) > 1:
+                _, (_, size) = self._pixmaps.popitem(last=False)
+                self._bytes -= size
+        self.ready.emit(key[0])
+
+    def invalidate(self, path):
+        """Забывает миниатюры файла (после замены или удаления)"""
+        for key in [key for key in self._pixmaps if key[0] == path]:
+            self._bytes -= self._pixmaps.pop(key)[1]
+        self._failed = {key for key in self._failed if key[0] != path}
+
+
+_cache = None
+
+
+def thumbnail_cache():
+    """Общий кэш миниатюр приложения"""
+    global _cache
+    if _cache is None:
+        _cache = ThumbnailCache()
+    return _cache